@@ -1,18 +1,75 @@
+import asyncio
+import json
 import os
 import random
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import zipfile
+from datetime import date, datetime
+from typing import Dict, List, Optional, Any, Set
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
-import httpx
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Response
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl, Field
-from bs4 import BeautifulSoup
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, HttpUrl, Field, ValidationError
 
 load_dotenv()
 
+from app.utils.http_client import start_http_client, close_http_client, http_client_stats
+from app.utils.html_extractor import extract_page_data, extract_page_data_async
+from app.utils.page_fetch import fetch_page, page_fetch_stats
+from app.utils.analysis_cache import get_analysis_cache, normalize_url
+from app.utils.concurrency import bounded_as_completed
+from app.utils.jobs import QueueFullError, StageCallback, create_job_queue
+from app.utils.singleflight import SingleFlight
+from app.utils.scoring import extract_signals, get_scoring_model
+from app.utils.prices import format_price_range, parse_prices, price_statistics
+from app.utils.crawler import crawl_storefront
+from app.utils.advice import advice_stats, build_advice_messages, get_advice_service, openai_module
+from app.utils.outbox import create_outbox_dispatcher
+from app.utils.notifications import NotionSender, SlackSender, analysis_payload
+from app.utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, LoopLagMonitor, MetricsMiddleware, observe_stage, render_metrics
+from app.utils.crypto import get_crypto
+from app.utils.warmup import WARMUP_DB_THREADS, Warmup
+from app.utils.history_analytics import (
+    HISTORY_ANALYTICS_BUCKETS, HISTORY_ANALYTICS_DOMAIN_LIMIT, HISTORY_ANALYTICS_MAX_DOMAINS, analytics_etag, etag_matches
+)
+from app.utils.history_transfer import (
+    EXPORT_FORMATS, HISTORY_EXPORT_FIELDS, HISTORY_EXPORT_PAGE_SIZE, HistoryImportFailed, export_writer, history_pages,
+    import_history_ndjson, pyarrow_modules, stream_export
+)
+from app.utils.monitor import MONITOR_DEFAULT_INTERVAL, MONITOR_MIN_INTERVAL, create_url_monitor, snapshot
+from app.utils.shopify import (
+    ShopifyClient, ShopifyError, ShopifyOrderStore, cohort_ltv, ltv_validation, revenue_summary, shop_domain,
+    shopify_stats, sync_orders
+)
+
+analysis_flights = SingleFlight()
+
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "200"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "10"))
+BATCH_MAX_PER_DOMAIN = int(os.getenv("BATCH_MAX_PER_DOMAIN", "2"))
+PDF_EXPORT_MAX_ITEMS = int(os.getenv("PDF_EXPORT_MAX_ITEMS", "100"))
+PDF_EXPORT_CONCURRENCY = int(os.getenv("PDF_EXPORT_CONCURRENCY", os.getenv("PDF_RENDER_WORKERS", "2")))
+
 class UrlAnalysisRequest(BaseModel):
     url: HttpUrl
+    crawl: bool = False
+    user_id: Optional[str] = None
+
+class BatchAnalysisRequest(BaseModel):
+    urls: List[HttpUrl] = Field(..., min_length=1, max_length=BATCH_MAX_URLS)
+    crawl: bool = False
+    user_id: Optional[str] = None
+
+class TrackUrlRequest(BaseModel):
+    user_email: str
+    url: HttpUrl
+    interval_hours: float = Field(MONITOR_DEFAULT_INTERVAL / 3600, ge=MONITOR_MIN_INTERVAL / 3600)
+    user_id: Optional[str] = None
+
+class PdfExportRequest(BaseModel):
+    user_email: str
+    ids: List[str] = Field(..., min_length=1, max_length=PDF_EXPORT_MAX_ITEMS)
 
 class DiagnosticScores(BaseModel):
     sns_score: float = Field(..., ge=0, le=10)
@@ -30,6 +87,8 @@ class AnalysisResponse(BaseModel):
     competitor_summary: Optional[str] = None
     social_links: Dict[str, str] = {}
     diagnostic_scores: DiagnosticScores
+    signals: Dict[str, float] = {}
+    scoring_version: Optional[str] = None
     status: str = "success"
 
 app = FastAPI(
@@ -45,6 +104,26 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最後に追加したミドルウェアが一番外側になる。CORS の処理も含めて計測する
+app.add_middleware(MetricsMiddleware)
+
+loop_lag_monitor = LoopLagMonitor()
+
+@app.on_event("startup")
+async def startup_http_client():
+    await start_http_client()
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await close_http_client()
+
+@app.on_event("startup")
+async def startup_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_loop_lag_monitor():
+    await loop_lag_monitor.stop()
 
 @app.get("/")
 async def root():
@@ -57,11 +136,49 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
-from fastapi import APIRouter, Depends, HTTPException, status
+@app.get("/metrics")
+async def metrics():
+    """Request, pipeline stage, Supabase and event loop metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/stats")
+async def stats():
+    pdf_cache = get_pdf_cache()
+    return {
+        "http_client": http_client_stats(),
+        "page_fetch": page_fetch_stats(),
+        "advice": advice_stats(),
+        "analysis_cache": get_analysis_cache().stats(),
+        "analysis_coalescing": analysis_flights.stats(),
+        "analysis_jobs": job_queue.stats(),
+        "outbox": await outbox.stats(),
+        "pdf_render": pdf_render_stats(),
+        "pdf_cache": pdf_cache.stats() if pdf_cache else None,
+        "user_context": user_context_stats(),
+        "warmup": warmup.stats(),
+        "shopify": {**shopify_stats(), "sync_coalescing": shopify_flights.stats()},
+        "monitor": url_monitor.stats(),
+    }
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from app.models.user_settings import UserSettings, UserSettingsResponse
-from app.models.analysis_history import SaveHistoryRequest, HistoryResponse, AnalysisHistoryItem
-from app.utils.supabase import get_user_settings, save_user_settings, get_api_key, save_analysis_history, get_analysis_history
-from app.utils.pdf_generator import generate_pdf_report
+from app.models.analysis_history import (
+    SaveHistoryRequest, HistoryResponse, AnalysisHistoryItem, HistoryAnalyticsResponse, HistoryImportResponse
+)
+from app.models.shopify import ShopifyStoreRequest, ConnectedStoresResponse, ShopifyRevenueData, LtvValidation
+from app.utils.supabase import (
+    get_user_settings, save_user_settings, get_api_key, save_analysis_history,
+    get_analysis_history, get_analysis_history_item, get_analysis_history_items,
+    decode_history_cursor, resolve_history_fields, user_context_stats, warm_up_db,
+    save_shopify_store, get_shopify_store, get_shopify_stores, delete_shopify_store,
+    get_history_analytics, get_history_analytics_version, get_analysis_history_page, save_analysis_history_batch,
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+)
+from app.utils.pdf_generator import (
+    render_pdf_report_cached, pdf_render_stats, pdfkit_module, report_template, PdfQueueFullError, PdfRenderTimeout
+)
+from app.utils.pdf_cache import get_pdf_cache
+from app.utils.zip_stream import ZipStreamWriter
 from typing import Dict, Any
 
 router = APIRouter(prefix="/api", tags=["user_settings"])
@@ -73,7 +190,7 @@ async def get_settings(user_id: str):
     APIキーは実際の値を返さず、設定済みかどうかのフラグのみを返す。
     """
     try:
-        settings = get_user_settings(user_id)
+        settings = await get_user_settings(user_id)
         return settings
     except Exception as e:
         raise HTTPException(
@@ -88,7 +205,7 @@ async def save_settings(settings: UserSettings):
     APIキーは暗号化して保存される。
     """
     try:
-        result = save_user_settings(settings)
+        result = await save_user_settings(settings)
         return result
     except Exception as e:
         raise HTTPException(
@@ -102,7 +219,7 @@ async def get_key(user_id: str, key_type: str):
     実際のAPIキーを取得するエンドポイント（内部利用のみ）。
     """
     try:
-        key = get_api_key(user_id, key_type)
+        key = await get_api_key(user_id, key_type)
         if not key:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -119,73 +236,80 @@ async def get_key(user_id: str, key_type: str):
 
 app.include_router(router)
 
-async def fetch_url_content(url: str) -> dict:
-    """Fetch content from a URL and extract relevant information."""
+async def _emit_stage(on_stage: Optional[StageCallback], *stages: str) -> None:
+    if on_stage:
+        for stage in stages:
+            await on_stage(stage)
+
+async def fetch_url_content(url: str, cached: Optional[dict] = None, on_stage: Optional[StageCallback] = None) -> dict:
+    """
+    Fetch content from a URL and extract relevant information.
+    When a cached entry is given, send a conditional GET and reuse its url_data
+    (flagged with not_modified) if the page has not changed.
+    on_stage, if given, is awaited with "fetched" and "parsed" as each step completes.
+    """
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            html_content = response.text
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            product_names = [el.get_text(strip=True) for el in soup.select(".product-title, .product-name")]
-            prices = [el.get_text(strip=True) for el in soup.select(".price, .product-price")]
-            
-            category_links = [el.get_text(strip=True) for el in soup.select(".collection-link, .nav-link")]
-            
-            social_links = {
-                "instagram": next((a['href'] for a in soup.select("a[href*='instagram.com']")), ""),
-                "twitter": next((a['href'] for a in soup.select("a[href*='twitter.com']")), "")
-            }
-            
-            return {
-                "title": soup.title.string if soup.title else "Sample E-commerce Store",
-                "meta_description": next((meta['content'] for meta in soup.select("meta[name='description']")), "Quality products at affordable prices"),
-                "product_names": product_names,
-                "prices": prices,
-                "category_links": category_links,
-                "product_count": len(product_names),
-                "category_count": len(category_links),
-                "social_links": social_links,
-                "has_search": bool(soup.select("form[action*='search']")),
-                "mobile_friendly": bool(soup.select("meta[name='viewport']")),
-                "has_reviews": bool(soup.select(".review, .reviews")),
-            }
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
+        with observe_stage("fetch"):
+            page = await fetch_page(url, headers=headers)
+        if cached and page["status_code"] == 304:
+            await _emit_stage(on_stage, "fetched", "parsed")
+            return {**cached["url_data"], "not_modified": True}
+        await _emit_stage(on_stage, "fetched")
+        
+        body_hash = page["body_hash"]
+        validators = {
+            "etag": page["headers"].get("etag") or (cached or {}).get("etag"),
+            "last_modified": page["headers"].get("last-modified") or (cached or {}).get("last_modified"),
+            "body_hash": body_hash,
+        }
+        if cached and cached.get("body_hash") == body_hash:
+            await _emit_stage(on_stage, "parsed")
+            return {**cached["url_data"], **validators, "not_modified": True}
+        
+        with observe_stage("parse"):
+            url_data = await extract_page_data_async(page["text"])
+        await _emit_stage(on_stage, "parsed")
+        return {**url_data, **validators, "not_modified": False, "truncated": page["truncated"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching URL content: {str(e)}")
 
-async def generate_gpt_advice(url_data: dict) -> str:
-    """Generate advice using GPT based on URL analysis."""
+GPT_FALLBACK_ADVICE = "OpenAI APIを使用した詳細な分析結果がここに表示されます。"
+
+def _placeholder_advice(url_data: dict) -> str:
+    """Sample advice shown when no OpenAI API key is configured."""
+    strengths = [
+        "商品画像が高品質で、商品の特徴がよく伝わります。",
+        "カテゴリー構造が明確で、ユーザーが目的の商品を見つけやすくなっています。",
+        "モバイル対応が優れており、スマートフォンからのアクセスも快適です。",
+    ]
     
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key or openai_api_key.startswith("sk-placeholder"):
-        strengths = [
-            "商品画像が高品質で、商品の特徴がよく伝わります。",
-            "カテゴリー構造が明確で、ユーザーが目的の商品を見つけやすくなっています。",
-            "モバイル対応が優れており、スマートフォンからのアクセスも快適です。",
-        ]
-        
-        weaknesses = [
-            "商品説明が不十分で、顧客が購入を決断するための情報が足りません。",
-            "チェックアウトプロセスが複雑で、カート放棄率が高くなる可能性があります。",
-            "SNS連携が弱く、ソーシャルメディアからのトラフィック獲得機会を逃しています。",
-            "レビュー機能がないため、社会的証明が不足しています。",
-        ]
-        
-        recommendations = [
-            "商品ページに詳細な仕様情報と使用例を追加することで、顧客の購入決断を促進できます。",
-            "チェックアウトステップを減らし、ゲスト購入オプションを提供することで、コンバージョン率を向上させましょう。",
-            "InstagramやTwitterなどのSNSアカウントを作成し、商品投稿を定期的に行うことで、ブランド認知度を高めることができます。",
-            "顧客レビューシステムを導入し、実際の購入者からのフィードバックを表示することで、新規顧客の信頼を獲得できます。",
-            "関連商品や「よく一緒に購入されている商品」セクションを追加することで、平均注文額を増加させることができます。",
-        ]
-        
-        random.shuffle(strengths)
-        random.shuffle(weaknesses)
-        random.shuffle(recommendations)
-        
-        advice = f"""# {url_data['title']} の分析結果
+    weaknesses = [
+        "商品説明が不十分で、顧客が購入を決断するための情報が足りません。",
+        "チェックアウトプロセスが複雑で、カート放棄率が高くなる可能性があります。",
+        "SNS連携が弱く、ソーシャルメディアからのトラフィック獲得機会を逃しています。",
+        "レビュー機能がないため、社会的証明が不足しています。",
+    ]
+    
+    recommendations = [
+        "商品ページに詳細な仕様情報と使用例を追加することで、顧客の購入決断を促進できます。",
+        "チェックアウトステップを減らし、ゲスト購入オプションを提供することで、コンバージョン率を向上させましょう。",
+        "InstagramやTwitterなどのSNSアカウントを作成し、商品投稿を定期的に行うことで、ブランド認知度を高めることができます。",
+        "顧客レビューシステムを導入し、実際の購入者からのフィードバックを表示することで、新規顧客の信頼を獲得できます。",
+        "関連商品や「よく一緒に購入されている商品」セクションを追加することで、平均注文額を増加させることができます。",
+    ]
+    
+    random.shuffle(strengths)
+    random.shuffle(weaknesses)
+    random.shuffle(recommendations)
+    
+    advice = f"""# {url_data['title']} の分析結果
 
 - {strengths[0]}
 - {strengths[1] if len(strengths) > 1 else "デザインが清潔で、ブランドイメージが一貫しています。"}
@@ -203,64 +327,242 @@ async def generate_gpt_advice(url_data: dict) -> str:
 
 以上の改善を実施することで、コンバージョン率の向上と顧客満足度の増加が期待できます。
 """
-        return advice
+    return advice
+
+async def _user_secret(user_id: Optional[str], key_type: str) -> Optional[str]:
+    if not user_id:
+        return None
+    try:
+        return await get_api_key(user_id, key_type)
+    except Exception as e:
+        print(f"Error loading {key_type} for {user_id}: {str(e)}")
+        return None
+
+async def resolve_openai_key(user_id: Optional[str] = None) -> Optional[str]:
+    """
+    Return the OpenAI key for this request: the user's saved key when user_id is given,
+    otherwise OPENAI_API_KEY. Returns None when only a placeholder key is configured.
+    """
+    api_key = await _user_secret(user_id, "openai_key") or os.getenv("OPENAI_API_KEY")
+    if not api_key or api_key.startswith("sk-placeholder"):
+        return None
+    return api_key
+
+async def generate_gpt_advice(url_data: dict, api_key: Optional[str] = None) -> str:
+    """Generate advice using GPT based on URL analysis."""
+    if not api_key:
+        return _placeholder_advice(url_data)
     
     try:
-        import openai
-        openai.api_key = openai_api_key
-        
-        competitor_summary = {
-            "product_count": url_data.get("product_count", 0),
-            "price_range": f"{min(url_data.get('prices', [0]))}〜{max(url_data.get('prices', [0]))}" if url_data.get('prices') else "N/A",
-            "social_links": url_data.get("social_links", {})
-        }
-        
-        prompt = f"""
-        あなたはECサイト分析の専門家です。
-        このサイトの商品数は {url_data.get('product_count', 0)} 個で、価格帯は {competitor_summary['price_range']} です。
-        Instagramリンクは {url_data.get('social_links', {}).get('instagram', 'なし')}、Twitterリンクは {url_data.get('social_links', {}).get('twitter', 'なし')} です。
-        競合サイトと比較して、強みと弱みを簡潔にコメントしてください。
-        """
-        
-        completion = await openai.ChatCompletion.acreate(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500
-        )
-        
-        return completion.choices[0].message.content.strip()
+        with observe_stage("advice"):
+            return await get_advice_service().complete(build_advice_messages(url_data), api_key)
     except Exception as e:
         print(f"Error generating GPT advice: {str(e)}")
-        return "OpenAI APIを使用した詳細な分析結果がここに表示されます。"
+        return GPT_FALLBACK_ADVICE
 
-async def save_to_notion(analysis_result: dict) -> Optional[str]:
-    """Save analysis results to Notion and return the page URL."""
-    notion_api_key = os.getenv("NOTION_API_KEY")
+async def resolve_notion_token(user_id: Optional[str] = None) -> Optional[str]:
+    notion_api_key = await _user_secret(user_id, "notion_token") or os.getenv("NOTION_API_KEY")
     if not notion_api_key or notion_api_key.startswith("secret_placeholder"):
         return None
-    
-    return None
+    return notion_api_key
 
-async def send_slack_notification(url: str, analysis_result: dict) -> bool:
-    """Send a notification to Slack about the new analysis."""
-    slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+async def resolve_slack_webhook(user_id: Optional[str] = None) -> Optional[str]:
+    slack_webhook_url = await _user_secret(user_id, "slack_webhook") or os.getenv("SLACK_WEBHOOK_URL")
     if not slack_webhook_url or slack_webhook_url.endswith("placeholder"):
+        return None
+    return slack_webhook_url
+
+async def resolve_notion_database_id(user_id: Optional[str] = None) -> Optional[str]:
+    if user_id:
+        try:
+            settings = await get_user_settings(user_id)
+            if settings.get("notion_database_id"):
+                return settings["notion_database_id"]
+        except Exception as e:
+            print(f"Error loading notion_database_id for {user_id}: {str(e)}")
+    return os.getenv("NOTION_DATABASE_ID") or None
+
+outbox = create_outbox_dispatcher({
+    "slack": SlackSender(resolve_slack_webhook),
+    "notion": NotionSender(resolve_notion_token),
+})
+
+@app.on_event("startup")
+async def startup_outbox():
+    outbox.start()
+
+# 応答を待たせずにアウトボックスへ書いている通知のタスク（終わるまで参照を持っておく）
+_notification_tasks: Set[asyncio.Task] = set()
+
+@app.on_event("shutdown")
+async def shutdown_outbox():
+    if _notification_tasks:
+        await asyncio.gather(*_notification_tasks, return_exceptions=True)
+    await outbox.stop()
+
+async def save_to_notion(analysis_result: dict, user_id: Optional[str] = None) -> Optional[str]:
+    """
+    Queue a Notion page for the analysis in the outbox and return the outbox message id,
+    or None when Notion is not configured. The dispatcher creates the page later.
+    """
+    database_id = await resolve_notion_database_id(user_id)
+    if not database_id or not await resolve_notion_token(user_id):
+        return None
+    
+    message = await outbox.enqueue("notion", database_id, analysis_payload(analysis_result, include_advice=True), user_id)
+    return message["id"]
+
+async def send_slack_notification(url: str, analysis_result: dict, user_id: Optional[str] = None) -> bool:
+    """
+    Queue a Slack notification about the new analysis in the outbox. Notifications for the
+    same webhook are sent together as one message by the dispatcher.
+    """
+    if not await resolve_slack_webhook(user_id):
         return False
     
-    return False
+    # 宛先は Webhook のURLそのものではなく持ち主（ユーザー）で区別し、秘密情報をアウトボックスに残さない
+    await outbox.enqueue("slack", user_id or "default", analysis_payload({**analysis_result, "url": url}), user_id)
+    return True
+
+async def notify_integrations(analysis_result: dict, user_id: Optional[str] = None) -> None:
+    """Queue the Notion page and Slack notification for an analysis in the outbox."""
+    try:
+        with observe_stage("notify"):
+            await save_to_notion(analysis_result, user_id)
+            await send_slack_notification(analysis_result["url"], analysis_result, user_id)
+    except Exception as e:
+        print(f"Error queueing notifications for {analysis_result.get('url')}: {str(e)}")
+
+def schedule_notifications(analysis_result: dict, user_id: Optional[str] = None) -> asyncio.Task:
+    """
+    Queue the notifications in a background task so the response does not wait for
+    the Slack/Notion settings lookups and the outbox write.
+    """
+    task = asyncio.create_task(notify_integrations(analysis_result, user_id))
+    _notification_tasks.add(task)
+    task.add_done_callback(_notification_tasks.discard)
+    return task
 
-def generate_diagnostic_scores(url_data: dict) -> DiagnosticScores:
-    """Generate diagnostic scores based on URL analysis."""
-    return DiagnosticScores(
-        sns_score=round(random.uniform(3, 9), 1),
-        structure_score=round(random.uniform(4, 9), 1),
-        ux_score=round(random.uniform(3, 8), 1),
-        app_score=round(random.uniform(2, 7), 1),
-        theme_score=round(random.uniform(4, 9), 1)
+def generate_diagnostic_scores(signals: Dict[str, float]) -> DiagnosticScores:
+    """Score the extracted signals with the configured rule-based scoring model."""
+    return DiagnosticScores(**get_scoring_model().score(signals))
+
+async def fetch_and_advise(url: str, on_stage: Optional[StageCallback] = None, crawl: bool = False,
+                           api_key: Optional[str] = None) -> tuple:
+    """
+    Return (url_data, advice) for a URL, serving from the analysis cache when possible
+    and revalidating stale entries before paying for a new GPT call.
+    With crawl=True the storefront's collection and product pages are crawled and merged
+    into url_data; crawled results are cached separately and never revalidated from
+    the landing page alone.
+    A new GPT call is made with api_key. Without one the sample advice is returned, and
+    only advice that came from the model is cached.
+    """
+    cache = get_analysis_cache()
+    variant = "crawl" if crawl else ""
+    cached, fresh = await cache.lookup(url, variant)
+    if cached and fresh:
+        await _emit_stage(on_stage, "fetched", "parsed")
+        if crawl:
+            await _emit_stage(on_stage, "crawled")
+        return cached["url_data"], cached["advice"]
+    
+    url_data = await fetch_url_content(url, None if crawl else cached, on_stage)
+    if cached and url_data.get("not_modified"):
+        await cache.mark_revalidated(cached, url_data)
+        return url_data, cached["advice"]
+    
+    if crawl:
+        with observe_stage("crawl"):
+            url_data = await crawl_storefront(url, url_data)
+        await _emit_stage(on_stage, "crawled")
+    
+    if cached:
+        cache.mark_refetched()
+    advice = await generate_gpt_advice(url_data, api_key)
+    if api_key and advice != GPT_FALLBACK_ADVICE:
+        await cache.store(url, url_data, advice, variant)
+    return url_data, advice
+
+async def run_analysis(url: str, on_stage: Optional[StageCallback] = None, crawl: bool = False,
+                       user_id: Optional[str] = None) -> AnalysisResponse:
+    """
+    Run the full analysis pipeline (fetch, extract, advice, scoring) for one URL.
+    Concurrent calls for the same normalized URL share one fetch and one GPT call, as long
+    as they agree on whether an OpenAI key is available (user_id's saved key, or
+    OPENAI_API_KEY without one), so a keyless caller's sample advice never reaches a keyed one.
+    on_stage, if given, is awaited with "fetched", "parsed", "crawled" (crawl mode only),
+    "advised" and "scored".
+    """
+    api_key = await resolve_openai_key(user_id)
+    (url_data, advice), shared = await analysis_flights.do(
+        (normalize_url(url), crawl, api_key is not None), lambda: fetch_and_advise(url, on_stage, crawl, api_key)
+    )
+    if shared:
+        await _emit_stage(on_stage, "fetched", "parsed")
+        if crawl:
+            await _emit_stage(on_stage, "crawled")
+    await _emit_stage(on_stage, "advised")
+    
+    analysis = build_analysis_response(url, url_data, advice)
+    await _emit_stage(on_stage, "scored")
+    return analysis
+
+def build_analysis_response(url: str, url_data: dict, advice: str) -> AnalysisResponse:
+    """Score the extracted data and assemble the response shown to the user (sample values fill empty fields)."""
+    with observe_stage("scoring"):
+        signals = extract_signals(url_data)
+        diagnostic_scores = generate_diagnostic_scores(signals)
+    
+    product_names = url_data.get("product_names", [])
+    if not product_names:
+        product_names = [
+            "プレミアムTシャツ",
+            "オーガニックコットンパーカー",
+            "ストレッチデニムジーンズ",
+            "防水アウトドアジャケット"
+        ]
+    
+    category_links = url_data.get("category_links", [])
+    if not category_links:
+        category_links = [
+            f"{url}/category/clothing",
+            f"{url}/category/accessories",
+            f"{url}/category/footwear"
+        ]
+    
+    prices = [int(price) if price.is_integer() else price for price in parse_prices(url_data.get("prices", []))]
+    
+    if not prices:
+        prices = [2980, 5980, 7980, 12800]
+    
+    social_links = url_data.get("social_links", {})
+    if not social_links or (not social_links.get("instagram") and not social_links.get("twitter")):
+        social_links = {
+            "instagram": "https://instagram.com/sample_store",
+            "twitter": "https://twitter.com/sample_store"
+        }
+    
+    price_range = format_price_range(price_statistics(url_data.get("prices") or prices)) or "N/A"
+    
+    competitor_summary = f"商品数: {len(product_names)}点、価格帯: {price_range}、カテゴリー数: {len(category_links)}個"
+    
+    return AnalysisResponse(
+        url=url,
+        product_names=product_names[:10],  # 最大10件まで
+        category_links=category_links[:10],  # 最大10件まで
+        prices=prices[:10],  # 最大10件まで
+        advice=advice,
+        competitor_summary=competitor_summary,
+        social_links=social_links,
+        diagnostic_scores=diagnostic_scores,
+        signals=signals,
+        scoring_version=get_scoring_model().version,
+        status="success"
     )
 
 @app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_url(request: UrlAnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_url(request: UrlAnalysisRequest):
     """
     Analyze the provided URL for e-commerce marketing insights.
     Returns detailed analysis including product information, advice, and diagnostic scores.
@@ -268,80 +570,214 @@ async def analyze_url(request: UrlAnalysisRequest, background_tasks: BackgroundT
     try:
         url = str(request.url)
         
-        url_data = await fetch_url_content(url)
-        
-        advice = await generate_gpt_advice(url_data)
-        
-        diagnostic_scores = generate_diagnostic_scores(url_data)
-        
-        product_names = url_data.get("product_names", [])
-        if not product_names:
-            product_names = [
-                "プレミアムTシャツ",
-                "オーガニックコットンパーカー",
-                "ストレッチデニムジーンズ",
-                "防水アウトドアジャケット"
-            ]
-        
-        category_links = url_data.get("category_links", [])
-        if not category_links:
-            category_links = [
-                f"{url}/category/clothing",
-                f"{url}/category/accessories",
-                f"{url}/category/footwear"
-            ]
-        
-        prices = []
-        for price_str in url_data.get("prices", []):
-            try:
-                price_numeric = ''.join(filter(str.isdigit, price_str))
-                if price_numeric:
-                    prices.append(int(price_numeric))
-            except:
-                pass
-        
-        if not prices:
-            prices = [2980, 5980, 7980, 12800]
-        
-        social_links = url_data.get("social_links", {})
-        if not social_links or (not social_links.get("instagram") and not social_links.get("twitter")):
-            social_links = {
-                "instagram": "https://instagram.com/sample_store",
-                "twitter": "https://twitter.com/sample_store"
-            }
-        
-        price_range = "N/A"
-        if prices:
-            price_range = f"{min(prices):,}円〜{max(prices):,}円"
-        
-        competitor_summary = f"商品数: {len(product_names)}点、価格帯: {price_range}、カテゴリー数: {len(category_links)}個"
-        
-        analysis_result = AnalysisResponse(
-            url=url,
-            product_names=product_names[:10],  # 最大10件まで
-            category_links=category_links[:10],  # 最大10件まで
-            prices=prices[:10],  # 最大10件まで
-            advice=advice,
-            competitor_summary=competitor_summary,
-            social_links=social_links,
-            diagnostic_scores=diagnostic_scores,
-            status="success"
-        )
+        analysis_result = await run_analysis(url, crawl=request.crawl, user_id=request.user_id)
         
-        background_tasks.add_task(save_to_notion, analysis_result.dict())
-        background_tasks.add_task(send_slack_notification, url, analysis_result.dict())
+        schedule_notifications(analysis_result.dict(), request.user_id)
         
         return analysis_result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing URL: {str(e)}")
 
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Analyze many URLs concurrently and stream each result as NDJSON as soon as it finishes.
+    Every line carries the index of the URL in the request. A failed URL produces an
+    error record ({"status": "error"}) instead of failing the whole batch.
+    """
+    urls = [str(url) for url in request.urls]
+    
+    async def stream_results():
+        results = bounded_as_completed(
+            urls,
+            lambda url: run_analysis(url, crawl=request.crawl, user_id=request.user_id),
+            limit=BATCH_MAX_CONCURRENCY,
+            key=lambda url: urlsplit(url).hostname,
+            per_key_limit=BATCH_MAX_PER_DOMAIN,
+        )
+        async for index, url, analysis_result, error in results:
+            if error is None:
+                schedule_notifications(analysis_result.dict(), request.user_id)
+                record = {"index": index, **analysis_result.dict()}
+            else:
+                detail = error.detail if isinstance(error, HTTPException) else str(error)
+                record = {"index": index, "url": url, "status": "error", "detail": f"Error analyzing URL: {detail}"}
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def run_analysis_job(url: str, on_stage: StageCallback, crawl: bool = False,
+                           user_id: Optional[str] = None) -> Dict[str, Any]:
+    analysis_result = await run_analysis(url, on_stage, crawl, user_id)
+    schedule_notifications(analysis_result.dict(), user_id)
+    return analysis_result.dict()
+
+job_queue = create_job_queue(run_analysis_job)
+
+@app.on_event("startup")
+async def startup_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_job_queue():
+    await job_queue.stop()
+
+async def reanalyze_tracked_url(row: Dict[str, Any], url_data: dict, changes: Dict[str, Any]) -> Optional[str]:
+    """
+    Re-run advice and scoring for a tracked URL whose content changed, and save the result
+    (with the diff and the full extracted snapshot) as a new analysis history row.
+    Raises when GPT or the save fails so the monitor retries the page on its next check.
+    """
+    advice = await generate_gpt_advice(url_data, await resolve_openai_key(row.get("user_id")))
+    if advice == GPT_FALLBACK_ADVICE:
+        raise RuntimeError("GPT advice failed")
+    analysis = build_analysis_response(row["url"], url_data, advice)
+    summary = {**analysis.dict(), "changes": changes, "snapshot": snapshot(url_data)}
+    history_id = await save_analysis_history(row["user_email"], row["url"], summary, tags=["monitor"])
+    if not history_id:
+        raise RuntimeError("failed to save analysis history")
+    return history_id
+
+url_monitor = create_url_monitor(reanalyze_tracked_url)
+
+@app.on_event("startup")
+async def startup_url_monitor():
+    # tracked_urls lives in Supabase, so there is nothing to monitor without it
+    if os.getenv("SUPABASE_URL"):
+        url_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_url_monitor():
+    await url_monitor.stop()
+
+async def _warm_up_db():
+    await warm_up_db(WARMUP_DB_THREADS)
+
+def _warm_up_parser():
+    extract_page_data("<html><head><title>warmup</title></head><body><p>¥1,000</p></body></html>")
+
+def _warm_up_pdf():
+    report_template()
+    pdfkit_module()
+
+# Imports and clients that are deferred to keep startup fast are initialized here in the
+# background once the app is serving, so the first real request does not pay for them.
+warmup = Warmup({
+    **({"supabase": _warm_up_db} if os.getenv("SUPABASE_URL") else {}),
+    "openai": openai_module,
+    "crypto": get_crypto,
+    "html_extractor": _warm_up_parser,
+    "scoring": get_scoring_model,
+    "pdf": _warm_up_pdf,
+})
+
+@app.on_event("startup")
+async def startup_warmup():
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_warmup():
+    await warmup.stop()
+
+def _job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: job[key] for key in ("id", "url", "status", "stage", "result", "error", "created_at", "updated_at")}
+
+@app.post("/analyze/jobs", status_code=202)
+async def create_analysis_job(request: UrlAnalysisRequest):
+    """
+    Queue an analysis and return its job id immediately.
+    Poll GET /analyze/jobs/{job_id} or stream GET /analyze/jobs/{job_id}/events for progress.
+    Returns 429 when the queue is full.
+    """
+    try:
+        job = await job_queue.submit(str(request.url), crawl=request.crawl, user_id=request.user_id)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=429,
+            detail="Analysis queue is full, please retry later",
+            headers={"Retry-After": "5"}
+        )
+    return {"job_id": job["id"], "status": job["status"]}
+
+@app.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+@app.get("/analyze/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """
+    Server-Sent Events stream of a job: "stage" events (fetched, parsed, crawled, advised, scored),
+    "status" events (running, succeeded, failed) and a final "done" event with the job state.
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for event in job_queue.events(job_id):
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        job = await job_queue.get(job_id)
+        if job is not None:
+            yield f"event: done\ndata: {json.dumps(_job_status(job), ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/analyze/advice/stream")
+async def stream_advice(url: HttpUrl, user_id: Optional[str] = None):
+    """
+    Server-Sent Events stream of the GPT advice for a URL so the UI can show it as it is generated:
+    "token" events carry text chunks and a final "done" event carries the full advice.
+    Advice already in the analysis cache arrives as a single token. On failure an "error"
+    event is sent instead of "done".
+    """
+    url = str(url)
+    cache = get_analysis_cache()
+    cached, fresh = await cache.lookup(url)
+    url_data = cached["url_data"] if cached and fresh else await fetch_url_content(url)
+    
+    async def event_stream():
+        api_key = None if cached and fresh else await resolve_openai_key(user_id)
+        if not api_key:
+            advice = cached["advice"] if cached and fresh else _placeholder_advice(url_data)
+            yield _sse_event("token", {"text": advice})
+            yield _sse_event("done", {"url": url, "advice": advice})
+            return
+        
+        parts = []
+        try:
+            async for text in get_advice_service().stream(build_advice_messages(url_data), api_key):
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+        except Exception as e:
+            print(f"Error streaming GPT advice: {str(e)}")
+            yield _sse_event("error", {"detail": f"Error generating advice: {str(e)}"})
+            return
+        advice = "".join(parts).strip()
+        await cache.store(url, url_data, advice)
+        yield _sse_event("done", {"url": url, "advice": advice})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/save-history")
 async def save_history(request: SaveHistoryRequest):
     """
     分析履歴を保存するエンドポイント。
     """
     try:
-        result = save_analysis_history(
+        result = await save_analysis_history(
             user_email=request.user_email,
             url=request.url,
             summary_json=request.analysis_result,
@@ -363,88 +799,484 @@ async def save_history(request: SaveHistoryRequest):
             detail=f"分析履歴の保存中にエラーが発生しました: {str(e)}"
         )
 
+SCORE_FIELDS = ["sns_score", "structure_score", "ux_score", "app_score", "theme_score"]
+
+def _to_history_item(item: Dict[str, Any]) -> AnalysisHistoryItem:
+    diagnostic_scores = None
+    if any(field in item for field in SCORE_FIELDS):
+        diagnostic_scores = {field: item.get(field) or 0 for field in SCORE_FIELDS}
+    
+    return AnalysisHistoryItem(
+        id=item.get("id"),
+        url=item.get("url"),
+        analyzed_at=item.get("analyzed_at"),
+        product_count=item.get("product_count") or 0,
+        category_count=item.get("category_count") or 0,
+        price_count=item.get("price_count") or 0,
+        has_advice=item.get("has_advice") or False,
+        advice_summary=item.get("advice_summary"),
+        notion_page_url=item.get("notion_page_url"),
+        tags=item.get("tags") or [],
+        summary_json=item.get("summary_json"),
+        diagnostic_scores=diagnostic_scores
+    )
+
 @app.get("/api/history", response_model=HistoryResponse)
-async def get_history(user_email: str, tags: Optional[List[str]] = None):
+async def get_history(
+    user_email: str,
+    tags: Optional[List[str]] = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """
-    ユーザーの分析履歴を取得するエンドポイント。
+    ユーザーの分析履歴を新しい順に1ページ分取得するエンドポイント。
+    次のページは next_cursor を cursor に渡して取得する。
+    summary_json は fields=summary_json,... で明示した場合のみ返す（全文は /api/history/{item_id}）。
     """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    if field_list and "url" not in field_list:
+        field_list.append("url")
     try:
-        history_items = get_analysis_history(user_email, tags)
+        resolve_history_fields(field_list)
+        if cursor:
+            decode_history_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        history_items, next_cursor = await get_analysis_history(user_email, tags, limit, cursor, field_list)
         
-        items = []
-        for item in history_items:
-            diagnostic_scores = {
-                "sns_score": item.get("sns_score", 0),
-                "structure_score": item.get("structure_score", 0),
-                "ux_score": item.get("ux_score", 0),
-                "app_score": item.get("app_score", 0),
-                "theme_score": item.get("theme_score", 0)
-            }
-            
-            history_item = AnalysisHistoryItem(
-                id=item.get("id"),
-                url=item.get("url"),
-                analyzed_at=item.get("analyzed_at"),
-                product_count=item.get("product_count", 0),
-                category_count=item.get("category_count", 0),
-                price_count=item.get("price_count", 0),
-                has_advice=item.get("has_advice", False),
-                advice_summary=item.get("advice_summary"),
-                notion_page_url=item.get("notion_page_url"),
-                tags=item.get("tags", []),
-                summary_json=item.get("summary_json", {}),
-                diagnostic_scores=diagnostic_scores
-            )
-            
-            items.append(history_item)
+        return HistoryResponse(
+            items=[_to_history_item(item) for item in history_items],
+            next_cursor=next_cursor
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"分析履歴の取得中にエラーが発生しました: {str(e)}"
+        )
+
+@app.get("/api/history/analytics", response_model=HistoryAnalyticsResponse)
+async def get_history_analytics_summary(
+    response: Response,
+    user_email: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = Query("day", pattern=f"^({'|'.join(HISTORY_ANALYTICS_BUCKETS)})$"),
+    domain_limit: int = Query(HISTORY_ANALYTICS_DOMAIN_LIMIT, ge=1, le=HISTORY_ANALYTICS_MAX_DOMAINS),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    分析履歴の集計（件数・スコア平均の推移、タグごとの平均、ドメインごとの最新スコア）を返すエンドポイント。
+    集計は Postgres の集計表で行い、履歴の行は読まない。期間は start 以上 end 未満（日付）。
+    If-None-Match が今の ETag と同じなら、履歴の更新番号だけを確かめて 304 を返す。
+    """
+    params = {"start": start, "end": end, "bucket": bucket, "domain_limit": domain_limit}
+    headers = {"Cache-Control": "private, no-cache"}
+    try:
+        if if_none_match:
+            etag = analytics_etag(user_email, await get_history_analytics_version(user_email), params)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={**headers, "ETag": etag})
         
-        return HistoryResponse(items=items)
+        with observe_stage("history_analytics"):
+            data = await get_history_analytics(
+                user_email, start.isoformat() if start else None, end.isoformat() if end else None, bucket, domain_limit
+            )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"分析履歴の集計中にエラーが発生しました: {str(e)}"
+        )
+    
+    response.headers.update({**headers, "ETag": analytics_etag(user_email, data.get("version", 0), params)})
+    return HistoryAnalyticsResponse(**data)
+
+@app.post("/api/history/import", response_model=HistoryImportResponse)
+async def import_history(request: Request, user_email: str):
+    """
+    NDJSON（1行に1件。/api/history/export の NDJSON もそのまま使える）の分析履歴をまとめて取り込むエンドポイント。
+    本文を読みながら HISTORY_IMPORT_BATCH_SIZE 行ずつ検証し、1回の insert で保存する。
+    不正な行は飛ばして errors に行番号と理由を返す。保存に失敗したら、保存済みの件数と行を detail に入れて 500 を返す。
+    """
+    try:
+        with observe_stage("history_import"):
+            result = await import_history_ndjson(user_email, request.stream(), save_analysis_history_batch)
+    except HistoryImportFailed as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"分析履歴の保存中にエラーが発生しました: {str(e)}",
+                "inserted": e.inserted,
+                "saved_through_line": e.saved_through_line,
+            }
+        )
+    
+    return HistoryImportResponse(**result)
+
+@app.get("/api/history/export")
+async def export_history(
+    user_email: str,
+    format: str = Query("ndjson", pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    tags: Optional[List[str]] = Query(None),
+    fields: Optional[str] = None
+):
+    """
+    ユーザーの分析履歴を新しい順に NDJSON・CSV・Parquet で書き出すエンドポイント。
+    キーセットページングで HISTORY_EXPORT_PAGE_SIZE 件ずつ読みながらストリーミングするので、件数が多くてもメモリは増えない。
+    既定の列は一覧の列と summary_json。fields=url,tags,... で絞れる。
+    """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(HISTORY_EXPORT_FIELDS)
+    try:
+        columns = resolve_history_fields(field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "parquet":
+        try:
+            pyarrow_modules()
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet で書き出すには pyarrow のインストールが必要です")
+    
+    async def fetch_page(cursor: Optional[str]):
+        return await get_analysis_history_page(user_email, tags, HISTORY_EXPORT_PAGE_SIZE, cursor, field_list)
+    
+    # 1ページ目は応答を始める前に読み、失敗したらステータスコードで返す
+    try:
+        first_page = await fetch_page(None)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"分析履歴の取得中にエラーが発生しました: {str(e)}"
         )
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(history_pages(fetch_page, first_page), export_writer(format, columns)),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=hansokunou_history_{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
+        }
+    )
+
+@app.get("/api/history/{item_id}", response_model=AnalysisHistoryItem)
+async def get_history_item(item_id: str, user_email: str):
+    """
+    分析履歴1件を summary_json の全文つきで取得するエンドポイント。
+    """
+    try:
+        item = await get_analysis_history_item(user_email, item_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"分析履歴の取得中にエラーが発生しました: {str(e)}"
+        )
+    
+    if not item:
+        raise HTTPException(status_code=404, detail="分析履歴が見つかりません")
+    
+    return _to_history_item(item)
+
+def _pdf_report(analysis: AnalysisResponse) -> Dict[str, Any]:
+    """
+    AnalysisResponse を render_pdf_report のキーワード引数に変換する（PDFキャッシュのキーにもなる）。
+    """
+    return {
+        "url": analysis.url,
+        "product_names": analysis.product_names,
+        "category_links": analysis.category_links,
+        "prices": [str(price) for price in analysis.prices],
+        "advice": analysis.advice or "",
+        "competitor_summary": analysis.competitor_summary,
+        "social_links": analysis.social_links or {},
+        "diagnostic_scores": analysis.diagnostic_scores.dict() if analysis.diagnostic_scores else None,
+    }
 
 @app.post("/api/generate-pdf")
 async def generate_pdf(request: AnalysisResponse):
     """
     分析結果からPDFレポートを生成するエンドポイント。
+    同じ内容のレポートはディスクキャッシュから返す。
     """
     try:
-        diagnostic_scores = None
-        if hasattr(request, 'diagnostic_scores') and request.diagnostic_scores:
-            diagnostic_scores = {
-                "sns_score": request.diagnostic_scores.sns_score,
-                "structure_score": request.diagnostic_scores.structure_score,
-                "ux_score": request.diagnostic_scores.ux_score,
-                "app_score": request.diagnostic_scores.app_score,
-                "theme_score": request.diagnostic_scores.theme_score
-            }
-        
-        social_links = {}
-        if hasattr(request, 'social_links') and request.social_links:
-            social_links = request.social_links
-        
-        pdf_bytes = generate_pdf_report(
-            url=request.url,
-            product_names=request.product_names,
-            category_links=request.category_links,
-            prices=[str(price) for price in request.prices],
-            advice=request.advice or "",
-            competitor_summary=request.competitor_summary,
-            social_links=social_links,
-            diagnostic_scores=diagnostic_scores
-        )
+        pdf_bytes, cached = await render_pdf_report_cached(_pdf_report(request))
         
         return Response(
             content=pdf_bytes,
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename=hansokunou_analysis_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+                "Content-Disposition": f"attachment; filename=hansokunou_analysis_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf",
+                "X-PDF-Cache": "hit" if cached else "miss"
             }
         )
+    except PdfQueueFullError:
+        raise HTTPException(
+            status_code=429,
+            detail="PDF生成の待ちが混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "5"}
+        )
+    except PdfRenderTimeout as e:
+        raise HTTPException(
+            status_code=504,
+            detail=f"PDFの生成がタイムアウトしました: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"PDFの生成中にエラーが発生しました: {str(e)}"
         )
+
+def _export_filename(item: Dict[str, Any]) -> str:
+    host = urlsplit(item.get("url") or "").netloc or "report"
+    safe_host = "".join(char if char.isalnum() or char in ".-" else "_" for char in host)
+    return f"hansokunou_analysis_{safe_host}_{item['id']}.pdf"
+
+@app.post("/api/export-pdfs")
+async def export_pdfs(request: PdfExportRequest):
+    """
+    分析履歴の id リストからPDFレポートをまとめたZIPを返すエンドポイント。
+    キャッシュにないPDFは並行してレンダリングし、できた順にZIPへ追加してストリーミングする。
+    生成に失敗したレポートは errors.json にまとめてZIPの最後に入れる。
+    """
+    item_ids = list(dict.fromkeys(request.ids))
+    try:
+        rows = await get_analysis_history_items(request.user_email, item_ids)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"分析履歴の取得中にエラーが発生しました: {str(e)}"
+        )
+    
+    if not rows:
+        raise HTTPException(status_code=404, detail="分析履歴が見つかりません")
+    
+    rows_by_id = {str(row["id"]): row for row in rows}
+    errors = []
+    exports = []
+    for item_id in item_ids:
+        row = rows_by_id.get(item_id)
+        if row is None:
+            errors.append({"id": item_id, "detail": "分析履歴が見つかりません"})
+            continue
+        try:
+            analysis = AnalysisResponse(**{**(row.get("summary_json") or {}), "url": row["url"]})
+        except ValidationError as e:
+            errors.append({"id": item_id, "detail": f"分析結果を読み込めません: {str(e)}"})
+            continue
+        exports.append((row, _pdf_report(analysis)))
+    
+    async def render(export: tuple) -> bytes:
+        pdf_bytes, _ = await render_pdf_report_cached(export[1])
+        return pdf_bytes
+    
+    async def stream_zip():
+        archive = ZipStreamWriter()
+        async for _, (row, _), pdf_bytes, error in bounded_as_completed(exports, render, PDF_EXPORT_CONCURRENCY):
+            if error is not None:
+                errors.append({"id": str(row["id"]), "detail": str(error) or type(error).__name__})
+                continue
+            yield archive.add(_export_filename(row), pdf_bytes)
+        if errors:
+            yield archive.add("errors.json", json.dumps(errors, ensure_ascii=False, indent=2).encode("utf-8"),
+                              zipfile.ZIP_DEFLATED)
+        yield archive.close()
+    
+    return StreamingResponse(
+        stream_zip(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=hansokunou_reports_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+        }
+    )
+
+shopify_orders = ShopifyOrderStore()
+# 同じユーザー・ストアの同期が同時に走らないようにする（同時のリクエストは実行中の同期の結果を待つ）
+shopify_flights = SingleFlight()
+
+@app.post("/api/shopify/stores")
+async def connect_shopify_store(request: ShopifyStoreRequest):
+    """
+    Shopify ストアを access_token（Admin API のアクセストークン）とともに連携する。
+    """
+    if not request.access_token:
+        raise HTTPException(status_code=400, detail="access_token を指定してください")
+    domain = shop_domain(request.store_domain)
+    try:
+        await ShopifyClient(domain, request.access_token).verify()
+    except ShopifyError as e:
+        if e.status_code in (401, 403, 404):
+            raise HTTPException(status_code=400, detail="access_token でストアの情報を読めません。ストアとトークンを確認してください")
+        raise HTTPException(status_code=502, detail=f"Shopifyに接続できませんでした: {str(e)}")
+    
+    try:
+        store = await save_shopify_store(request.user_email, domain, request.access_token)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Shopifyストアの連携中にエラーが発生しました: {str(e)}"
+        )
+    
+    if not store:
+        raise HTTPException(status_code=500, detail="Shopifyストアの連携に失敗しました")
+    
+    return {"store_name": domain, "connected_at": store.get("connected_at"), "status": "success"}
+
+@app.get("/api/shopify/connected-stores", response_model=ConnectedStoresResponse)
+async def get_connected_shopify_stores(user_email: str):
+    try:
+        stores = await get_shopify_stores(user_email)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"連携済みストアの取得中にエラーが発生しました: {str(e)}"
+        )
+    
+    return ConnectedStoresResponse(
+        stores=[{"store_name": store["store_domain"], "connected_at": store.get("connected_at")} for store in stores]
+    )
+
+@app.post("/api/shopify/disconnect")
+async def disconnect_shopify_store(request: ShopifyStoreRequest):
+    """
+    Shopify ストアの連携を解除し、取り込んだ注文も削除する。
+    """
+    domain = shop_domain(request.store_domain)
+    try:
+        deleted = await delete_shopify_store(request.user_email, domain)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Shopifyストアの連携解除中にエラーが発生しました: {str(e)}"
+        )
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="連携済みのShopifyストアが見つかりません")
+    
+    await asyncio.to_thread(shopify_orders.delete, request.user_email, domain)
+    return {"status": "success"}
+
+async def _sync_shopify_orders(user_email: str, store_name: str) -> Dict[str, Any]:
+    """
+    連携済みストアの新しい注文を取り込む。前回の続き（最大の注文ID）から取得する。
+    """
+    domain = shop_domain(store_name)
+    store = await get_shopify_store(user_email, domain)
+    if not store:
+        raise HTTPException(status_code=404, detail="連携済みのShopifyストアが見つかりません")
+    
+    client = ShopifyClient(domain, store["access_token"])
+    try:
+        with observe_stage("shopify_sync"):
+            result, _ = await shopify_flights.do(
+                (user_email, domain), lambda: sync_orders(client, shopify_orders, user_email)
+            )
+    except ShopifyError as e:
+        status_code = 401 if e.status_code in (401, 403) else 502
+        raise HTTPException(status_code=status_code, detail=f"Shopifyから注文を取得できませんでした: {str(e)}")
+    return result
+
+@app.post("/api/shopify/sync")
+async def sync_shopify_orders(user_email: str, store_name: str):
+    return await _sync_shopify_orders(user_email, store_name)
+
+@app.get("/api/shopify/revenue-data", response_model=ShopifyRevenueData)
+async def get_shopify_revenue_data(
+    user_email: str,
+    store_name: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    sync: bool = True
+):
+    """
+    ストアの売上・顧客数・リピート率・AOV と月ごとの推移。start 以上 end 未満（"2025-01-01" の形）に絞れる。
+    sync=true（既定）なら先に新しい注文を取り込む。
+    """
+    if sync:
+        await _sync_shopify_orders(user_email, store_name)
+    elif not await get_shopify_store(user_email, shop_domain(store_name)):
+        raise HTTPException(status_code=404, detail="連携済みのShopifyストアが見つかりません")
+    
+    columns = await asyncio.to_thread(shopify_orders.load, user_email, shop_domain(store_name))
+    try:
+        with observe_stage("shopify_analytics"):
+            return await asyncio.to_thread(revenue_summary, columns, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"期間の指定が正しくありません: {str(e)}")
+
+@app.get("/api/shopify/ltv")
+async def get_shopify_ltv(
+    user_email: str,
+    store_name: str,
+    observed_months: int = Query(3, ge=1, le=12),
+    horizon_months: int = Query(12, ge=2, le=36)
+):
+    """
+    初回購入月ごとのコホートLTVと、observed_months か月の実績から horizon_months か月のLTVを予測した検証結果。
+    """
+    if observed_months >= horizon_months:
+        raise HTTPException(status_code=400, detail="observed_months は horizon_months より短くしてください")
+    if not await get_shopify_store(user_email, shop_domain(store_name)):
+        raise HTTPException(status_code=404, detail="連携済みのShopifyストアが見つかりません")
+    
+    columns = await asyncio.to_thread(shopify_orders.load, user_email, shop_domain(store_name))
+    with observe_stage("shopify_analytics"):
+        cohorts = await asyncio.to_thread(cohort_ltv, columns, horizon_months)
+        validation = await asyncio.to_thread(ltv_validation, columns, observed_months, horizon_months)
+    return {
+        "cohorts": cohorts,
+        "validation": LtvValidation(**validation) if validation else None
+    }
+
+@app.post("/api/tracked-urls")
+async def track_url(request: TrackUrlRequest):
+    """
+    URLを監視対象に登録する。interval_hours ごとに取り直し、内容が変わったときだけ再分析して履歴に保存する。
+    """
+    try:
+        row = await url_monitor.store.add(request.user_email, str(request.url), request.interval_hours * 3600,
+                                          request.user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"監視対象の登録中にエラーが発生しました: {str(e)}"
+        )
+    
+    url_monitor.wake()
+    return row
+
+@app.get("/api/tracked-urls")
+async def get_tracked_urls(user_email: str):
+    try:
+        return {"items": await url_monitor.store.list(user_email)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"監視対象の取得中にエラーが発生しました: {str(e)}"
+        )
+
+@app.delete("/api/tracked-urls/{tracked_id}")
+async def delete_tracked_url(tracked_id: str, user_email: str):
+    try:
+        deleted = await url_monitor.store.delete(user_email, tracked_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"監視対象の削除中にエラーが発生しました: {str(e)}"
+        )
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="監視対象が見つかりません")
+    
+    return {"status": "success"}
+
+@app.post("/api/tracked-urls/{tracked_id}/check")
+async def check_tracked_url(tracked_id: str, user_email: str):
+    """
+    監視対象のURLを今すぐ確認する。返り値の status は not_modified / unchanged_body / unchanged_content / changed / error。
+    """
+    row = await url_monitor.store.get(user_email, tracked_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="監視対象が見つかりません")
+    
+    return await url_monitor.check(row)
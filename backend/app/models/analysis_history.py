@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -20,7 +20,7 @@ class AnalysisHistoryItem(BaseModel):
     advice_summary: Optional[str] = None
     notion_page_url: Optional[str] = None
     tags: List[str] = []
-    summary_json: Dict[str, Any] = {}
+    summary_json: Optional[Dict[str, Any]] = None
     diagnostic_scores: Optional[DiagnosticScores] = None
 
 class SaveHistoryRequest(BaseModel):
@@ -30,4 +30,75 @@ class SaveHistoryRequest(BaseModel):
 
 class HistoryResponse(BaseModel):
     items: List[AnalysisHistoryItem] = []
+    next_cursor: Optional[str] = None
+    status: str = "success"
+
+class HistoryScores(BaseModel):
+    sns_score: Optional[float] = None
+    structure_score: Optional[float] = None
+    ux_score: Optional[float] = None
+    app_score: Optional[float] = None
+    theme_score: Optional[float] = None
+
+class HistoryTrendPoint(BaseModel):
+    period: str
+    analyses: int = 0
+    scored: int = 0
+    average_scores: HistoryScores = HistoryScores()
+
+class HistoryTagStats(BaseModel):
+    tag: str
+    analyses: int = 0
+    scored: int = 0
+    average_scores: HistoryScores = HistoryScores()
+
+class HistoryDomainStats(BaseModel):
+    domain: str
+    analyses: int = 0
+    latest_id: Optional[str] = None
+    latest_url: Optional[str] = None
+    latest_at: Optional[datetime] = None
+    latest_scores: HistoryScores = HistoryScores()
+
+class HistoryAnalyticsResponse(BaseModel):
+    version: int = 0
+    total_analyses: int = 0
+    trend: List[HistoryTrendPoint] = []
+    tags: List[HistoryTagStats] = []
+    domains: List[HistoryDomainStats] = []
+    status: str = "success"
+
+class HistoryImportSummary(BaseModel):
+    """
+    取り込む行の summary_json。analysis_history の列を作るときに読む項目だけ型を確かめ、ほかの項目はそのまま残す。
+    """
+    model_config = ConfigDict(extra="allow")
+
+    product_names: List[Any] = []
+    category_links: List[Any] = []
+    prices: List[Any] = []
+    advice: Optional[str] = None
+    notion_page_url: Optional[str] = None
+    diagnostic_scores: Optional[DiagnosticScores] = None
+
+class HistoryImportRow(BaseModel):
+    """POST /api/history/import の NDJSON の1行。エクスポートの行をそのまま読み込める（ほかの列は無視する）。"""
+    url: str = Field(..., min_length=1)
+    analyzed_at: Optional[datetime] = None
+    tags: List[str] = []
+    summary_json: Optional[HistoryImportSummary] = None
+    sns_score: Optional[float] = Field(None, ge=0, le=10)
+    structure_score: Optional[float] = Field(None, ge=0, le=10)
+    ux_score: Optional[float] = Field(None, ge=0, le=10)
+    app_score: Optional[float] = Field(None, ge=0, le=10)
+    theme_score: Optional[float] = Field(None, ge=0, le=10)
+
+class HistoryImportError(BaseModel):
+    line: int
+    detail: str
+
+class HistoryImportResponse(BaseModel):
+    inserted: int = 0
+    rejected: int = 0
+    errors: List[HistoryImportError] = []
     status: str = "success"
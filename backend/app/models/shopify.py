@@ -0,0 +1,38 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class ShopifyStoreRequest(BaseModel):
+    user_email: str
+    store_domain: str
+    access_token: Optional[str] = None
+
+class ShopifyStore(BaseModel):
+    store_name: str
+    connected_at: Optional[str] = None
+
+class ConnectedStoresResponse(BaseModel):
+    stores: List[ShopifyStore] = []
+
+class MonthlyTrend(BaseModel):
+    month: str
+    orders: int
+    revenue: float
+    aov: float
+    customers: int
+    returning_customers: int
+
+class ShopifyRevenueData(BaseModel):
+    total_orders: int
+    total_revenue: float
+    unique_customers: int
+    repeat_customers: int
+    repeat_purchase_rate: float
+    aov: float
+    time_period: str
+    monthly_trends: List[MonthlyTrend] = []
+
+class LtvValidation(BaseModel):
+    predicted_ltv: float
+    actual_ltv: float
+    accuracy: float
+    insights: List[str] = []
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import random
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.utils.concurrency import TokenBucket
+from app.utils.prices import PRICE_OUTLIER_MIN_COUNT, format_price, format_price_range, price_statistics
+from app.utils.singleflight import SingleFlight
+from app.utils.ttl_cache import TTLCache
+
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4")
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE") or None
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_RPM_LIMIT = float(os.environ.get("OPENAI_RPM_LIMIT", "60"))
+OPENAI_TPM_LIMIT = float(os.environ.get("OPENAI_TPM_LIMIT", "40000"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.environ.get("OPENAI_RETRY_BASE_DELAY", "1"))
+OPENAI_RETRY_MAX_DELAY = float(os.environ.get("OPENAI_RETRY_MAX_DELAY", "30"))
+OPENAI_REQUEST_TIMEOUT = float(os.environ.get("OPENAI_REQUEST_TIMEOUT", "60"))
+ADVICE_MAX_TOKENS = int(os.environ.get("ADVICE_MAX_TOKENS", "500"))
+ADVICE_CACHE_TTL = float(os.environ.get("ADVICE_CACHE_TTL", str(24 * 60 * 60)))
+ADVICE_CACHE_MAX_ENTRIES = int(os.environ.get("ADVICE_CACHE_MAX_ENTRIES", "1000"))
+# APIキーごとのバケットは、空から満タンに戻る1分の2倍のあいだ使われなければ捨てる
+# （1回の acquire の待ちは最大1分なので、待っている呼び出しがあるバケットは捨てない。作り直しても満タンで同じ状態）
+OPENAI_KEY_LIMITS_IDLE_SECONDS = 120.0
+OPENAI_KEY_LIMITS_MAX_KEYS = 10000
+
+Messages = List[Dict[str, str]]
+
+
+@lru_cache(maxsize=None)
+def openai_module() -> Any:
+    """
+    openai パッケージを初回の呼び出しで読み込む。aiohttp などを含めて import が重いので、
+    アプリの起動時には読み込まない。
+    """
+    return importlib.import_module("openai")
+
+
+def build_advice_messages(url_data: Dict[str, Any]) -> Messages:
+    """
+    fetch_url_content の結果から GPT に送るメッセージを組み立てる。
+    """
+    price_stats = price_statistics(url_data.get("prices") or [])
+    price_range = format_price_range(price_stats) or "N/A"
+    if price_stats["count"] >= PRICE_OUTLIER_MIN_COUNT:
+        price_range += f"、中心の価格帯（四分位）は {format_price(price_stats['q1'])}〜{format_price(price_stats['q3'])}"
+    social_links = url_data.get("social_links", {})
+    prompt = (
+        "あなたはECサイト分析の専門家です。\n"
+        f"このサイトの商品数は {url_data.get('product_count', 0)} 個で、価格帯は {price_range} です。\n"
+        f"Instagramリンクは {social_links.get('instagram', 'なし')}、Twitterリンクは {social_links.get('twitter', 'なし')} です。\n"
+        "競合サイトと比較して、強みと弱みを簡潔にコメントしてください。"
+    )
+    return [{"role": "user", "content": prompt}]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。英数字はおよそ4文字、日本語はおよそ1文字で1トークンとして数える。
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class AdviceService:
+    """
+    OpenAI の Chat Completions を呼ぶ窓口。
+    - APIキーは呼び出しごとに渡す（openai.api_key を書き換えない）
+    - モデル・max_tokens・メッセージのハッシュで完了結果をキャッシュし、同じプロンプトの同時呼び出しは1回にまとめる
+    - APIキーごとに1分あたりのリクエスト数（RPM）とトークン数（TPM）をトークンバケットで制限する
+    - 429 はジッターつき指数バックオフ（Retry-After があればそれに従う）で max_retries 回まで再試行する
+    """
+
+    def __init__(self, model: str = OPENAI_MODEL, api_base: Optional[str] = OPENAI_API_BASE,
+                 max_tokens: int = ADVICE_MAX_TOKENS, max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 rpm_limit: float = OPENAI_RPM_LIMIT, tpm_limit: float = OPENAI_TPM_LIMIT,
+                 max_retries: int = OPENAI_MAX_RETRIES, retry_base_delay: float = OPENAI_RETRY_BASE_DELAY,
+                 retry_max_delay: float = OPENAI_RETRY_MAX_DELAY, request_timeout: float = OPENAI_REQUEST_TIMEOUT,
+                 cache_ttl: float = ADVICE_CACHE_TTL, cache_max_entries: int = ADVICE_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.api_base = api_base
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.request_timeout = request_timeout
+        self.cache: TTLCache[str] = TTLCache(cache_max_entries, ttl=cache_ttl)
+        self._flights = SingleFlight()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._limits: TTLCache[Tuple[TokenBucket, TokenBucket]] = TTLCache(
+            OPENAI_KEY_LIMITS_MAX_KEYS, ttl=OPENAI_KEY_LIMITS_IDLE_SECONDS)
+        self._stats = {
+            "requests": 0,
+            "streams": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "failures": 0,
+            "tokens_used": 0,
+            "retry_wait_seconds": 0.0,
+            "limiter_wait_seconds": 0.0,
+        }
+
+    def cache_key(self, messages: Messages) -> str:
+        payload = json.dumps({"model": self.model, "max_tokens": self.max_tokens, "messages": messages},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _buckets(self, api_key: str) -> Tuple[TokenBucket, TokenBucket]:
+        # 制限はAPIキー単位。キー自体は保持せず、ハッシュで区別する。使うたびに期限を延ばす
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        buckets = self._limits.get(key_id)
+        if buckets is None:
+            self._limits.purge_expired()
+            buckets = (TokenBucket(self.rpm_limit), TokenBucket(self.tpm_limit))
+        self._limits.set(key_id, buckets)
+        return buckets
+
+    async def _reserve(self, api_key: str, messages: Messages) -> int:
+        """リクエスト1回分と、プロンプト + max_tokens 分のトークンを予約する。"""
+        requests, tokens = self._buckets(api_key)
+        reserved = sum(estimate_tokens(message["content"]) for message in messages) + self.max_tokens
+        wait = await requests.acquire(1)
+        wait += await tokens.acquire(reserved)
+        self._stats["limiter_wait_seconds"] += wait
+        # 待っている間に期限が切れないよう、取り出し終えたら延ばす
+        self._buckets(api_key)
+        return reserved
+
+    def _settle(self, api_key: str, reserved: int, used: int) -> None:
+        self._stats["tokens_used"] += used
+        self._buckets(api_key)[1].refund(reserved - used)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = (getattr(error, "headers", None) or {}).get("Retry-After")
+        try:
+            return min(self.retry_max_delay, float(retry_after))
+        except (TypeError, ValueError):
+            # フルジッター: 0〜(base * 2^attempt) の一様乱数
+            return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def _backoff(self, attempt: int, error: Exception) -> None:
+        self._stats["rate_limited"] += 1
+        if attempt >= self.max_retries:
+            self._stats["failures"] += 1
+            raise error
+        delay = self._retry_delay(attempt, error)
+        self._stats["retries"] += 1
+        self._stats["retry_wait_seconds"] += delay
+        await asyncio.sleep(delay)
+
+    async def _request(self, api_key: str, messages: Messages, stream: bool) -> Any:
+        self._stats["requests"] += 1
+        return await openai_module().ChatCompletion.acreate(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            stream=stream,
+            api_key=api_key,
+            api_base=self.api_base,
+            request_timeout=self.request_timeout,
+        )
+
+    async def _complete(self, messages: Messages, api_key: str, key: str) -> str:
+        rate_limit_error = openai_module().error.RateLimitError
+        for attempt in range(self.max_retries + 1):
+            reserved = await self._reserve(api_key, messages)
+            try:
+                async with self._slots:
+                    completion = await self._request(api_key, messages, stream=False)
+            except rate_limit_error as e:
+                self._settle(api_key, reserved, 0)
+                await self._backoff(attempt, e)
+                continue
+            except Exception:
+                self._settle(api_key, reserved, 0)
+                self._stats["failures"] += 1
+                raise
+            text = completion.choices[0].message.content.strip()
+            usage = completion.get("usage") or {}
+            self._settle(api_key, reserved, int(usage.get("total_tokens") or reserved))
+            self.cache.set(key, text)
+            return text
+
+    async def complete(self, messages: Messages, api_key: str) -> str:
+        """アドバイス本文を返す。キャッシュにあれば API を呼ばない。"""
+        key = self.cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        text, _ = await self._flights.do(key, lambda: self._complete(messages, api_key, key))
+        return text
+
+    async def stream(self, messages: Messages, api_key: str) -> AsyncIterator[str]:
+        """
+        生成されたテキストを届いた順に返す。キャッシュにあれば全文を1回で返す。
+        429 の再試行は最初のトークンを受け取る前だけ行う。
+        """
+        key = self.cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        self._stats["streams"] += 1
+        rate_limit_error = openai_module().error.RateLimitError
+        parts: List[str] = []
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        for attempt in range(self.max_retries + 1):
+            reserved = await self._reserve(api_key, messages)
+            try:
+                async with self._slots:
+                    chunks = await self._request(api_key, messages, stream=True)
+                    async for chunk in chunks:
+                        delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+            except rate_limit_error as e:
+                self._settle(api_key, reserved, 0)
+                if parts:
+                    self._stats["failures"] += 1
+                    raise
+                await self._backoff(attempt, e)
+                continue
+            except Exception:
+                self._settle(api_key, reserved, prompt_tokens + estimate_tokens("".join(parts)) if parts else 0)
+                self._stats["failures"] += 1
+                raise
+            text = "".join(parts).strip()
+            self._settle(api_key, reserved, prompt_tokens + estimate_tokens(text))
+            self.cache.set(key, text)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "retry_wait_seconds": round(self._stats["retry_wait_seconds"], 3),
+            "limiter_wait_seconds": round(self._stats["limiter_wait_seconds"], 3),
+            "api_keys": len(self._limits),
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "rpm_limit": self.rpm_limit,
+            "tpm_limit": self.tpm_limit,
+            "cache": self.cache.stats(),
+            "coalescing": self._flights.stats(),
+        }
+
+
+_advice_service: Optional[AdviceService] = None
+
+
+def get_advice_service() -> AdviceService:
+    global _advice_service
+    if _advice_service is None:
+        _advice_service = AdviceService()
+    return _advice_service
+
+
+def advice_stats() -> Dict[str, Any]:
+    return get_advice_service().stats()
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.utils.ttl_cache import TTLCache
+
+ANALYSIS_CACHE_BACKEND = os.environ.get("ANALYSIS_CACHE_BACKEND", "memory")
+ANALYSIS_CACHE_TTL = float(os.environ.get("ANALYSIS_CACHE_TTL", "3600"))
+ANALYSIS_CACHE_MAX_STALE = float(os.environ.get("ANALYSIS_CACHE_MAX_STALE", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "1000"))
+ANALYSIS_CACHE_SQLITE_PATH = os.environ.get("ANALYSIS_CACHE_SQLITE_PATH", "analysis_cache.sqlite3")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "_pos", "_sid", "_ss"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+VALIDATOR_KEYS = ("etag", "last_modified", "body_hash")
+
+
+def normalize_url(url: str) -> str:
+    """
+    キャッシュキー用にURLを正規化する（ホスト小文字化・既定ポート/フラグメント/計測パラメータの除去・クエリの並べ替え）。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+def hash_body(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class MemoryCacheBackend:
+    """プロセス内のLRUキャッシュ。"""
+
+    def __init__(self, max_entries: int, max_age: float):
+        self._cache: TTLCache[Dict[str, Any]] = TTLCache(max_entries, ttl=max_age)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._cache.set(key, entry)
+
+    async def delete(self, key: str) -> None:
+        self._cache.pop(key)
+
+    def evictions(self) -> int:
+        return self._cache.evictions
+
+    def size(self) -> int:
+        return len(self._cache)
+
+
+class SQLiteCacheBackend:
+    """単一ホストで複数ワーカーが共有できるSQLiteキャッシュ。"""
+
+    def __init__(self, path: str, max_entries: int, max_age: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists analysis_cache ("
+            " key text primary key,"
+            " entry text not null,"
+            " stored_at real not null,"
+            " accessed_at real not null)"
+        )
+        self._conn.execute("create index if not exists analysis_cache_accessed_at on analysis_cache (accessed_at)")
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "select entry, stored_at from analysis_cache where key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.max_age:
+                self._conn.execute("delete from analysis_cache where key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("update analysis_cache set accessed_at = ? where key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def _set(self, key: str, entry: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into analysis_cache (key, entry, stored_at, accessed_at) values (?, ?, ?, ?)",
+                (key, json.dumps(entry, ensure_ascii=False), entry.get("stored_at", now), now),
+            )
+            cursor = self._conn.execute(
+                "delete from analysis_cache where key in ("
+                " select key from analysis_cache order by accessed_at desc limit -1 offset ?)",
+                (self.max_entries,),
+            )
+            self._evictions += max(0, cursor.rowcount)
+            self._conn.commit()
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("delete from analysis_cache where key = ?", (key,))
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._set, key, entry)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    def evictions(self) -> int:
+        return self._evictions
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("select count(*) from analysis_cache").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """複数ホストで共有するRedisキャッシュ。アクセス時刻のsorted setでLRUを管理する。"""
+
+    KEY_PREFIX = "hanno:analysis_cache:"
+    LRU_KEY = "hanno:analysis_cache:lru"
+
+    def __init__(self, url: str, max_entries: int, max_age: float):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("ANALYSIS_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._redis = redis_asyncio.from_url(url)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._evictions = 0
+        self._size = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self.KEY_PREFIX + key)
+        if raw is None:
+            await self._redis.zrem(self.LRU_KEY, key)
+            return None
+        await self._redis.zadd(self.LRU_KEY, {key: time.time()})
+        return json.loads(raw)
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.KEY_PREFIX + key, json.dumps(entry, ensure_ascii=False), ex=int(self.max_age))
+            pipe.zadd(self.LRU_KEY, {key: time.time()})
+            pipe.zcard(self.LRU_KEY)
+            results = await pipe.execute()
+        self._size = results[-1]
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            oldest = await self._redis.zpopmin(self.LRU_KEY, overflow)
+            if oldest:
+                await self._redis.delete(*[self.KEY_PREFIX + member.decode() for member, _ in oldest])
+                self._evictions += len(oldest)
+                self._size -= len(oldest)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.KEY_PREFIX + key)
+        await self._redis.zrem(self.LRU_KEY, key)
+
+    def evictions(self) -> int:
+        return self._evictions
+
+    def size(self) -> int:
+        return self._size
+
+
+class AnalysisCache:
+    """
+    正規化URLをキーに、抽出済みの url_data・アドバイス・ETag/Last-Modified・本文ハッシュを保存する。
+    TTL内のエントリはそのまま返し、期限切れのエントリは条件付きGETで再検証する。
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidations = 0
+        self.refetches = 0
+
+    @staticmethod
+    def key(url: str, variant: str = "") -> str:
+        """variant（クロールモードなど）ごとに別のエントリとして保存する。"""
+        return f"{normalize_url(url)}#{variant}" if variant else normalize_url(url)
+
+    async def lookup(self, url: str, variant: str = "") -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        (エントリ, 新鮮かどうか) を返す。エントリがなければ (None, False)。
+        """
+        entry = await self.backend.get(self.key(url, variant))
+        if entry is None:
+            self.misses += 1
+            return None, False
+        if time.time() - entry["stored_at"] <= self.ttl:
+            self.hits += 1
+            return entry, True
+        self.stale += 1
+        return entry, False
+
+    async def store(self, url: str, url_data: Dict[str, Any], advice: str, variant: str = "") -> Dict[str, Any]:
+        entry = {
+            "url": self.key(url, variant),
+            "url_data": url_data,
+            "advice": advice,
+            "etag": url_data.get("etag"),
+            "last_modified": url_data.get("last_modified"),
+            "body_hash": url_data.get("body_hash"),
+            "stored_at": time.time(),
+        }
+        await self.backend.set(entry["url"], entry)
+        return entry
+
+    async def mark_revalidated(self, entry: Dict[str, Any], url_data: Dict[str, Any]) -> None:
+        """304 または本文ハッシュ一致で再検証できたエントリの鮮度と検証子を更新する。"""
+        self.revalidations += 1
+        validators = {key: url_data[key] for key in VALIDATOR_KEYS if url_data.get(key)}
+        await self.backend.set(entry["url"], {**entry, **validators, "stored_at": time.time()})
+
+    def mark_refetched(self) -> None:
+        self.refetches += 1
+
+    async def invalidate(self, url: str, variant: str = "") -> None:
+        await self.backend.delete(self.key(url, variant))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "ttl": self.ttl,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "revalidations": self.revalidations,
+            "refetches": self.refetches,
+            "evictions": self.backend.evictions(),
+        }
+
+
+def _build_backend():
+    if ANALYSIS_CACHE_BACKEND == "sqlite":
+        return SQLiteCacheBackend(ANALYSIS_CACHE_SQLITE_PATH, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_STALE)
+    if ANALYSIS_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(REDIS_URL, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_STALE)
+    return MemoryCacheBackend(ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_STALE)
+
+
+_analysis_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    global _analysis_cache
+    if _analysis_cache is None:
+        _analysis_cache = AnalysisCache(_build_backend(), ANALYSIS_CACHE_TTL)
+    return _analysis_cache
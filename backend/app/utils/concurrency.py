@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def bounded_as_completed(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    limit: int,
+    key: Optional[Callable[[T], Hashable]] = None,
+    per_key_limit: Optional[int] = None,
+) -> AsyncIterator[Tuple[int, T, Optional[R], Optional[BaseException]]]:
+    """
+    items を worker で並行処理し、終わった順に (index, item, result, error) を返す。
+    全体の同時実行数を limit、同じキー（ドメインなど）の同時実行数を per_key_limit に制限する。
+    1件の失敗は error として返し、他の処理は止めない。
+    """
+    global_semaphore = asyncio.Semaphore(limit)
+    key_semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+
+    def key_semaphore(item: T) -> Optional[asyncio.Semaphore]:
+        if key is None or not per_key_limit:
+            return None
+        item_key = key(item)
+        if item_key not in key_semaphores:
+            key_semaphores[item_key] = asyncio.Semaphore(per_key_limit)
+        return key_semaphores[item_key]
+
+    async def run(index: int, item: T) -> Tuple[int, T, Optional[R], Optional[BaseException]]:
+        semaphore = key_semaphore(item)
+        try:
+            if semaphore is not None:
+                async with semaphore:
+                    async with global_semaphore:
+                        return index, item, await worker(item), None
+            async with global_semaphore:
+                return index, item, await worker(item), None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return index, item, None, e
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class TokenBucket:
+    """
+    1分あたり per_minute 個まで補充されるトークンバケット。容量は burst（省略時は1分ぶん）。
+    待っている呼び出しは到着順に払い出す。per_minute が 0 以下なら制限しない。
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.capacity = per_minute if burst is None or per_minute <= 0 else burst
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """amount 個を取り出し、待った秒数を返す。容量を超える要求は容量ぶんとして扱う。"""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= amount
+        self.waited_seconds += wait
+        return wait
+
+    def refund(self, amount: float) -> None:
+        """予約より少なく使った分を戻す。"""
+        if self.capacity <= 0 or amount <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
@@ -0,0 +1,347 @@
+import asyncio
+import json
+import math
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+from app.utils import http_client
+from app.utils.concurrency import bounded_as_completed
+from app.utils.html_extractor import extract_page_data_async
+from app.utils.page_fetch import PAGE_MAX_BYTES, PAGE_TOTAL_TIMEOUT, fetch_page
+from app.utils.prices import parse_price_array
+
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "30"))
+CRAWL_MAX_BYTES = int(os.environ.get("CRAWL_MAX_BYTES", str(10 * 1024 * 1024)))
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "4"))
+CRAWL_HOST_DELAY = float(os.environ.get("CRAWL_HOST_DELAY", "0.5"))
+CRAWL_MAX_SITEMAPS = int(os.environ.get("CRAWL_MAX_SITEMAPS", "5"))
+CRAWL_PRODUCTS_JSON_PAGES = int(os.environ.get("CRAWL_PRODUCTS_JSON_PAGES", "4"))
+
+PRODUCTS_JSON_LIMIT = 250
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, "", "", ""))
+
+
+def _same_host(url: str, origin: str) -> bool:
+    return urlsplit(url).netloc.lower() == urlsplit(origin).netloc.lower()
+
+
+def _page_kind(url: str) -> Optional[str]:
+    path = urlsplit(url).path
+    if "/products/" in path:
+        return "product"
+    if "/collections/" in path:
+        return "collection"
+    return None
+
+
+class HostPoliteness:
+    """
+    同じホストへのリクエスト開始間隔を delay 秒以上あける。
+    robots.txt に Crawl-delay があればそちらが長い場合に優先する。
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_at: Dict[str, float] = {}
+
+    async def wait(self, url: str, delay: Optional[float] = None) -> None:
+        host = urlsplit(url).netloc.lower()
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._next_at.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_at[host] = time.monotonic() + max(self.delay, delay or 0.0)
+
+
+class StorefrontCrawler:
+    """
+    トップページの分析結果を起点に、sitemap.xml・/products.json・カテゴリーリンクから
+    商品・コレクションのページを集めて並行取得し、1つの url_data にまとめる。
+    robots.txt に従い、ページ数と合計バイト数に上限を設ける。
+    バイト数の予算は取得を始める前に確保し（並行するワーカーが同じ残りを当てにしないように）、
+    どの取得もストリーミングで確保した分までしか読まない。読まなかった分は取得後に予算へ戻す。
+    """
+
+    def __init__(self, url: str, max_pages: int = CRAWL_MAX_PAGES, max_bytes: int = CRAWL_MAX_BYTES,
+                 concurrency: int = CRAWL_CONCURRENCY, host_delay: float = CRAWL_HOST_DELAY):
+        self.url = url
+        self.origin = _origin(url)
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.politeness = HostPoliteness(host_delay)
+        self.robots: Optional[RobotFileParser] = None
+        self.bytes_fetched = 0
+        # 取得中のリクエストのために確保したバイト数
+        self.bytes_reserved = 0
+        self._budget_changed = asyncio.Condition()
+        # 並行して取得するページ1件で確保する上限。concurrency 件の分がちょうど予算に収まるようにする
+        self.page_max_bytes = max(1, min(PAGE_MAX_BYTES, max_bytes // max(1, concurrency)))
+        self.requests = 0
+        self.stats: Dict[str, Any] = {
+            "pages_fetched": 0,
+            "pages_failed": 0,
+            "disallowed": 0,
+            "truncated": False,
+            "sources": {"links": 0, "sitemap": 0, "products_json": 0},
+        }
+
+    def _budget_left(self) -> bool:
+        return self.bytes_fetched + self.bytes_reserved < self.max_bytes
+
+    async def _reserve(self, limit: int) -> int:
+        """
+        残りの予算から最大 limit バイトを確保して、確保できたバイト数を返す（0 なら予算切れ）。
+        他の取得が確保した分のせいで足りないときは、それが戻るまで待つ。
+        """
+        async with self._budget_changed:
+            while self.bytes_reserved and self.max_bytes - self.bytes_fetched - self.bytes_reserved < limit:
+                await self._budget_changed.wait()
+            granted = max(0, min(limit, self.max_bytes - self.bytes_fetched - self.bytes_reserved))
+            self.bytes_reserved += granted
+        if not granted:
+            self.stats["truncated"] = True
+        return granted
+
+    async def _settle(self, granted: int, used: int) -> None:
+        if used >= granted:
+            # 確保した分を読み切った（本文はそこで打ち切った）
+            self.stats["truncated"] = True
+        async with self._budget_changed:
+            self.bytes_reserved -= granted
+            self.bytes_fetched += used
+            self._budget_changed.notify_all()
+
+    def _allowed(self, url: str) -> bool:
+        if self.robots is None or self.robots.can_fetch(http_client.HTTP_USER_AGENT, url):
+            return True
+        self.stats["disallowed"] += 1
+        return False
+
+    async def _wait_turn(self, url: str) -> None:
+        crawl_delay = self.robots.crawl_delay(http_client.HTTP_USER_AGENT) if self.robots else None
+        await self.politeness.wait(url, float(crawl_delay) if crawl_delay else None)
+        self.requests += 1
+
+    async def _get(self, url: str) -> Tuple[int, bytes]:
+        """
+        robots.txt・サイトマップ・products.json を (ステータス, 本文) で取得する。
+        ページの並行取得の前に1件ずつ取得するので、残りの予算から PAGE_MAX_BYTES まで確保する。
+        本文は確保した分までしか読まない（途中で切れた本文は読み込みに失敗して飛ばされる）。
+        """
+        granted = await self._reserve(PAGE_MAX_BYTES)
+        if not granted:
+            return 0, b""
+        body = bytearray()
+
+        async def read() -> int:
+            await self._wait_turn(url)
+            async with http_client.stream("GET", url) as response:
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk[:granted - len(body)])
+                    if len(body) >= granted:
+                        break
+                return response.status_code
+
+        try:
+            status_code = await asyncio.wait_for(read(), timeout=PAGE_TOTAL_TIMEOUT)
+        finally:
+            await self._settle(granted, len(body))
+        return status_code, bytes(body)
+
+    async def _load_robots(self) -> None:
+        robots = RobotFileParser(f"{self.origin}/robots.txt")
+        try:
+            status_code, body = await self._get(robots.url)
+        except Exception as e:
+            print(f"Error fetching robots.txt for {self.origin}: {str(e)}")
+            robots.allow_all = True
+        else:
+            # urllib.robotparser.read() と同じ扱い: 401/403 は全拒否、その他の4xxは全許可
+            if status_code in (401, 403):
+                robots.disallow_all = True
+            elif status_code >= 400 or not status_code:
+                robots.allow_all = True
+            else:
+                robots.parse(body.decode("utf-8", "replace").splitlines())
+        self.robots = robots
+
+    async def _sitemap_urls(self) -> List[str]:
+        queue = list(self.robots.site_maps() or []) if self.robots else []
+        if not queue:
+            queue = [f"{self.origin}/sitemap.xml"]
+        pages: List[str] = []
+        visited = 0
+        while queue and visited < CRAWL_MAX_SITEMAPS and self._budget_left():
+            sitemap_url = queue.pop(0)
+            if not _same_host(sitemap_url, self.origin) or not self._allowed(sitemap_url):
+                continue
+            visited += 1
+            try:
+                status_code, body = await self._get(sitemap_url)
+                if status_code != 200:
+                    continue
+                root = ElementTree.fromstring(body)
+            except Exception as e:
+                print(f"Error reading sitemap {sitemap_url}: {str(e)}")
+                continue
+            locations = [(loc.text or "").strip() for loc in root.iter(f"{SITEMAP_NS}loc")]
+            if root.tag == f"{SITEMAP_NS}sitemapindex":
+                # Shopify の sitemap_products_1.xml / sitemap_collections_1.xml などを優先する
+                queue.extend(sorted(locations, key=lambda loc: not ("product" in loc or "collection" in loc)))
+            else:
+                pages.extend(loc for loc in locations if _page_kind(loc))
+        return pages
+
+    async def _products_json(self) -> List[Dict[str, Any]]:
+        """Shopify の /products.json から商品名と価格を取得する（ページを開かずに全商品を数えられる）。"""
+        products: List[Dict[str, Any]] = []
+        for page in range(1, CRAWL_PRODUCTS_JSON_PAGES + 1):
+            url = f"{self.origin}/products.json?limit={PRODUCTS_JSON_LIMIT}&page={page}"
+            if not self._budget_left() or not self._allowed(url):
+                break
+            try:
+                status_code, body = await self._get(url)
+                if status_code != 200:
+                    break
+                batch = json.loads(body).get("products") or []
+            except Exception:
+                break
+            products.extend(batch)
+            if len(batch) < PRODUCTS_JSON_LIMIT:
+                break
+        return products
+
+    async def _fetch_page(self, url: str) -> Optional[Dict[str, Any]]:
+        granted = await self._reserve(self.page_max_bytes)
+        if not granted:
+            return None
+        used = 0
+        try:
+            await self._wait_turn(url)
+            page = await fetch_page(url, max_bytes=granted)
+            used = page["bytes_read"]
+        finally:
+            await self._settle(granted, used)
+        return await extract_page_data_async(page["text"])
+
+    def _discover(self, landing: Dict[str, Any], sitemap_pages: List[str]) -> List[str]:
+        """取得するページを、コレクション（多くの商品が載る）→ 商品の順に並べる。"""
+        seen: Set[str] = {self.url.rstrip("/"), self.origin}
+        candidates: List[Tuple[int, str]] = []
+        sources = [("links", urljoin(self.url, href)) for href in landing.get("category_urls") or []]
+        sources += [("sitemap", page) for page in sitemap_pages]
+        for source, page in sources:
+            page = page.split("#", 1)[0]
+            kind = _page_kind(page) or ("collection" if source == "links" else None)
+            if kind is None or page.rstrip("/") in seen or not _same_host(page, self.origin):
+                continue
+            seen.add(page.rstrip("/"))
+            self.stats["sources"][source] += 1
+            candidates.append((0 if kind == "collection" else 1, page))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [page for _, page in candidates]
+
+    async def crawl(self, landing: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        await self._load_robots()
+        products_json = await self._products_json()
+        self.stats["sources"]["products_json"] = len(products_json)
+        sitemap_pages = await self._sitemap_urls()
+
+        candidates = [page for page in self._discover(landing, sitemap_pages) if self._allowed(page)]
+        if len(candidates) > self.max_pages:
+            self.stats["truncated"] = True
+            candidates = candidates[:self.max_pages]
+
+        pages: List[Dict[str, Any]] = []
+        async for _, page_url, page_data, error in bounded_as_completed(candidates, self._fetch_page, self.concurrency):
+            if error is not None:
+                self.stats["pages_failed"] += 1
+                print(f"Error crawling {page_url}: {str(error)}")
+            elif page_data is not None:
+                self.stats["pages_fetched"] += 1
+                pages.append(page_data)
+
+        self.stats.update({
+            "requests": self.requests,
+            "bytes": self.bytes_fetched,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+        return merge_url_data(landing, pages, products_json, self.stats)
+
+
+def _product_price(product: Dict[str, Any]) -> Optional[str]:
+    prices = [variant.get("price") for variant in product.get("variants") or [] if variant.get("price")]
+    # 他社の /products.json には数値でない価格が混じることがあるので、読めない価格は飛ばす
+    parsed = [(value, price) for value, price in zip(parse_price_array(prices)[0].tolist(), prices)
+              if not math.isnan(value)]
+    if not parsed:
+        return None
+    return min(parsed, key=lambda pair: pair[0])[1]
+
+
+def merge_url_data(landing: Dict[str, Any], pages: List[Dict[str, Any]],
+                   products_json: List[Dict[str, Any]], crawl_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    トップページ・クロールしたページ・/products.json の結果を1つの url_data にまとめる。
+    商品は名前で重複を除き、価格は商品と対応づけて数える。タイトルやメタ情報はトップページのものを使う。
+    """
+    products: Dict[str, Optional[str]] = {}
+    for product in products_json:
+        title = (product.get("title") or "").strip()
+        if title:
+            products.setdefault(title, _product_price(product))
+    for page in [landing, *pages]:
+        names, prices = page.get("product_names") or [], page.get("prices") or []
+        for i, name in enumerate(names):
+            price = prices[i] if i < len(prices) else None
+            if name not in products or (products[name] is None and price):
+                products[name] = price
+
+    category_links = list(dict.fromkeys(
+        link for page in [landing, *pages] for link in page.get("category_links") or []
+    ))
+    category_urls = list(dict.fromkeys(
+        url for page in [landing, *pages] for url in page.get("category_urls") or []
+    ))
+    # トップページにないリンクはクロールしたページから拾う（見つからないSNSは空文字のまま残す）
+    social_links: Dict[str, str] = {}
+    for page in [landing, *pages]:
+        for network, link in (page.get("social_links") or {}).items():
+            if link and not social_links.get(network):
+                social_links[network] = link
+            else:
+                social_links.setdefault(network, "")
+
+    return {
+        **landing,
+        "product_names": list(products),
+        "prices": [price for price in products.values() if price],
+        "product_count": len(products),
+        "category_links": category_links,
+        "category_urls": category_urls,
+        "category_count": len(category_links),
+        "social_links": social_links,
+        "has_search": any(page.get("has_search") for page in [landing, *pages]),
+        "has_reviews": any(page.get("has_reviews") for page in [landing, *pages]),
+        "crawl": crawl_stats,
+    }
+
+
+async def crawl_storefront(url: str, landing: Dict[str, Any], **options: Any) -> Dict[str, Any]:
+    """
+    トップページの url_data を起点にストアをクロールし、まとめた url_data を返す。
+    """
+    return await StorefrontCrawler(url, **options).crawl(landing)
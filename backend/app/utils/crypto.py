@@ -1,14 +1,22 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 import os
 import base64
-from typing import Optional
+import binascii
+from typing import List, Optional
+
+# Fernetトークンは先頭がバージョンバイト 0x80 なので、base64 にすると必ず "gAAAAA" で始まる。
+# 以前の形式はこのトークンをさらに base64 した文字列（"Z0FBQUFB" で始まる）。
+_FERNET_TOKEN_PREFIX = "gAAAAA"
+
+_crypto: Optional[MultiFernet] = None
+_primary: Optional[Fernet] = None
 
 def get_encryption_key() -> bytes:
     key = os.environ.get("ENCRYPTION_KEY")
     if not key:
         key = Fernet.generate_key().decode()
         os.environ["ENCRYPTION_KEY"] = key
-    
+
     try:
         if isinstance(key, str):
             key_bytes = key.encode()
@@ -20,23 +28,73 @@ def get_encryption_key() -> bytes:
         os.environ["ENCRYPTION_KEY"] = new_key.decode()
         return new_key
 
+def get_encryption_keys() -> List[bytes]:
+    """
+    ENCRYPTION_KEYS（カンマ区切り、先頭が暗号化に使う現在の鍵、残りは復号のみ）を読む。
+    未設定なら ENCRYPTION_KEY の1つだけを使う。
+    """
+    keys = [key.strip() for key in os.environ.get("ENCRYPTION_KEYS", "").split(",") if key.strip()]
+    if not keys:
+        return [get_encryption_key()]
+
+    for key in keys:
+        try:
+            Fernet(key.encode())
+        except Exception:
+            raise ValueError("ENCRYPTION_KEYS contains an invalid Fernet key")
+    return [key.encode() for key in keys]
+
+def get_crypto() -> MultiFernet:
+    """
+    プロセスで共有する MultiFernet を返す（初回だけ鍵を読んで作る）。
+    """
+    global _crypto, _primary
+    if _crypto is None:
+        fernets = [Fernet(key) for key in get_encryption_keys()]
+        _primary = fernets[0]
+        _crypto = MultiFernet(fernets)
+    return _crypto
+
+def reset_crypto() -> None:
+    """
+    鍵の環境変数を変更した後に呼ぶと、次の呼び出しで読み直す。
+    """
+    global _crypto, _primary
+    _crypto = None
+    _primary = None
+
+def _to_fernet_token(encrypted_key: str) -> bytes:
+    if encrypted_key.startswith(_FERNET_TOKEN_PREFIX):
+        return encrypted_key.encode()
+    return base64.b64decode(encrypted_key)
+
 def encrypt_api_key(api_key: str) -> Optional[str]:
     if not api_key:
         return None
-    
-    key = get_encryption_key()
-    f = Fernet(key)
-    encrypted_key = f.encrypt(api_key.encode())
-    return base64.b64encode(encrypted_key).decode()
+
+    return get_crypto().encrypt(api_key.encode()).decode()
 
 def decrypt_api_key(encrypted_key: str) -> Optional[str]:
     if not encrypted_key:
         return None
-    
-    key = get_encryption_key()
-    f = Fernet(key)
+
     try:
-        decrypted_key = f.decrypt(base64.b64decode(encrypted_key))
+        decrypted_key = get_crypto().decrypt(_to_fernet_token(encrypted_key))
         return decrypted_key.decode()
-    except Exception:
+    except (InvalidToken, binascii.Error, ValueError):
         return None
+
+def reencrypt_api_key(encrypted_key: str) -> Optional[str]:
+    """
+    現在の鍵・現在の形式で暗号化し直したトークンを返す。
+    すでに現在の鍵・形式なら None、どの鍵でも復号できなければ InvalidToken を送出する。
+    """
+    crypto = get_crypto()
+    token = _to_fernet_token(encrypted_key)
+    if encrypted_key.startswith(_FERNET_TOKEN_PREFIX):
+        try:
+            _primary.decrypt(token)
+            return None
+        except InvalidToken:
+            pass
+    return crypto.rotate(token).decode()
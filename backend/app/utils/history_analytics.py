@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+from datetime import timedelta, timezone
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+HISTORY_ANALYTICS_BUCKETS = ("day", "week", "month")
+HISTORY_ANALYTICS_DOMAIN_LIMIT = int(os.environ.get("HISTORY_ANALYTICS_DOMAIN_LIMIT", "50"))
+HISTORY_ANALYTICS_MAX_DOMAINS = 500
+# 集計表の日付の区切り（scripts/create_history_analytics_schema.sql の Asia/Tokyo。夏時間はない）
+ROLLUP_TIMEZONE = timezone(timedelta(hours=9))
+SCORE_FIELDS = ("sns_score", "structure_score", "ux_score", "app_score", "theme_score")
+
+
+def domain_of(url: str) -> str:
+    """
+    集計に使うドメイン。ホストを小文字にして先頭の www. を除く。
+    SQL の analysis_history_domain と同じ規則（スキームのない値はそのまま小文字にする）。
+    """
+    host = urlsplit(url).hostname if "://" in url else None
+    host = host or url.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def analytics_etag(user_email: str, version: int, params: Dict[str, Any]) -> str:
+    """
+    集計結果の ETag。履歴が変わるたびに増える version と、問い合わせの条件から作る。
+    JSON の表現（キーの順や圧縮）に依存しないよう弱い ETag にする。
+    """
+    raw = json.dumps([user_email, params], sort_keys=True, default=str).encode()
+    return f'W/"{version}-{hashlib.sha256(raw).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match（カンマ区切り・* を含む）が etag に弱い比較で一致するか。"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in tags)
@@ -0,0 +1,303 @@
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.models.analysis_history import HistoryImportRow
+from app.utils.history_analytics import SCORE_FIELDS
+from app.utils.supabase import HISTORY_LIST_FIELDS, analysis_history_row
+from app.utils.zip_stream import ChunkBuffer
+
+HISTORY_IMPORT_BATCH_SIZE = int(os.environ.get("HISTORY_IMPORT_BATCH_SIZE", "500"))
+# これより長い行は読み捨てて不正な行として数える（1行のためにメモリを使い切らないように）
+HISTORY_IMPORT_MAX_LINE_BYTES = int(os.environ.get("HISTORY_IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+HISTORY_IMPORT_MAX_ERRORS = 100
+HISTORY_EXPORT_PAGE_SIZE = int(os.environ.get("HISTORY_EXPORT_PAGE_SIZE", "1000"))
+HISTORY_EXPORT_FIELDS = HISTORY_LIST_FIELDS + ["summary_json"]
+
+# 形式 -> (Content-Type, 拡張子)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+Page = Tuple[List[Dict[str, Any]], Optional[str]]
+
+
+class HistoryImportFailed(Exception):
+    """バッチの保存に失敗した。inserted 件（saved_through_line 行目まで）は保存済み。"""
+
+    def __init__(self, message: str, inserted: int, saved_through_line: int):
+        super().__init__(message)
+        self.inserted = inserted
+        self.saved_through_line = saved_through_line
+
+
+def pyarrow_modules() -> Tuple[Any, Any]:
+    """pyarrow は Parquet で書き出すときに初めて読み込む（入っていなければ ImportError）。"""
+    return importlib.import_module("pyarrow"), importlib.import_module("pyarrow.parquet")
+
+
+async def ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int = HISTORY_IMPORT_MAX_LINE_BYTES
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    NDJSON の本文を受け取った順に (行番号, 行) にして返す。空行は飛ばす。
+    max_line_bytes を超えた行は溜めずに読み捨て、(行番号, None) を返す。
+    """
+    pending, line_no, skipping = b"", 0, False
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line_no += 1
+            if skipping or len(line) > max_line_bytes:
+                skipping = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        if len(pending) > max_line_bytes:
+            pending, skipping = b"", True
+    if skipping:
+        yield line_no + 1, None
+    elif pending.strip():
+        yield line_no + 1, pending
+
+
+def _validation_detail(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def validate_import_lines(
+    user_email: str,
+    lines: List[Tuple[int, Optional[bytes]]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    1バッチ分の行を検証し、(analysis_history に入れる行, 不正な行の {line, detail}) を返す。
+    analyzed_at があれば元の分析日時を残し、スコアの列があれば summary_json から作った値より優先する。
+    """
+    rows, errors = [], []
+    for line_no, line in lines:
+        if line is None:
+            errors.append({"line": line_no, "detail": f"1行が {HISTORY_IMPORT_MAX_LINE_BYTES} バイトを超えています"})
+            continue
+        try:
+            item = HistoryImportRow.model_validate_json(line)
+        except ValidationError as e:
+            errors.append({"line": line_no, "detail": _validation_detail(e)})
+            continue
+        # 省略された項目（スコアの一部など）は既定値で埋めず、送られた内容のまま保存する
+        summary_json = item.summary_json.model_dump(exclude_unset=True) if item.summary_json else {}
+        row = analysis_history_row(user_email, item.url, summary_json, item.tags)
+        if item.analyzed_at:
+            row["analyzed_at"] = item.analyzed_at.isoformat()
+        for field in SCORE_FIELDS:
+            if getattr(item, field) is not None:
+                row[field] = getattr(item, field)
+        rows.append(row)
+    return rows, errors
+
+
+async def import_history_ndjson(
+    user_email: str,
+    chunks: AsyncIterator[bytes],
+    save_batch: Callable[[List[Dict[str, Any]]], Awaitable[int]],
+    batch_size: int = HISTORY_IMPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    NDJSON の分析履歴を batch_size 行ずつ検証し、save_batch で1回の insert にまとめて保存する。
+    前のバッチを保存している間に次のバッチを読み込んで検証する（メモリに載るのは最大2バッチ）。
+    不正な行は飛ばし、行番号と理由を errors に入れる（先頭 HISTORY_IMPORT_MAX_ERRORS 件まで）。
+    保存に失敗したら、それ以降は読まずに HistoryImportFailed を投げる。
+    """
+    result = {"inserted": 0, "rejected": 0, "errors": []}
+    saved_through_line = 0
+    saving: Optional[asyncio.Task] = None
+
+    async def save(rows: List[Dict[str, Any]], last_line: int) -> None:
+        nonlocal saved_through_line
+        result["inserted"] += await save_batch(rows)
+        saved_through_line = last_line
+
+    async def wait_saving() -> None:
+        nonlocal saving
+        if saving is None:
+            return
+        task, saving = saving, None
+        try:
+            await task
+        except Exception as e:
+            raise HistoryImportFailed(str(e), result["inserted"], saved_through_line) from e
+
+    async def flush(lines: List[Tuple[int, Optional[bytes]]]) -> None:
+        nonlocal saving
+        rows, errors = await asyncio.to_thread(validate_import_lines, user_email, lines)
+        result["rejected"] += len(errors)
+        result["errors"].extend(errors[:HISTORY_IMPORT_MAX_ERRORS - len(result["errors"])])
+        await wait_saving()
+        if rows:
+            saving = asyncio.create_task(save(rows, lines[-1][0]))
+
+    try:
+        batch: List[Tuple[int, Optional[bytes]]] = []
+        async for line in ndjson_lines(chunks):
+            batch.append(line)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        await wait_saving()
+    finally:
+        # 本文の読み込みが途中で失敗しても、保存中のバッチは終わるまで待つ
+        if saving is not None:
+            await asyncio.gather(saving, return_exceptions=True)
+    return result
+
+
+class NdjsonExportWriter:
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+
+    def write(self, rows: List[Dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+    def close(self) -> bytes:
+        return b""
+
+
+class CsvExportWriter:
+    """
+    1行目に列名を書く。Excel で文字化けしないよう先頭に BOM をつけ、tags・summary_json は JSON の文字列にする。
+    """
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+        self._started = False
+
+    @staticmethod
+    def _cell(value: Any) -> Any:
+        if value is None:
+            return ""
+        if isinstance(value, (list, dict, bool)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def write(self, rows: List[Dict[str, Any]]) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if not self._started:
+            self._started = True
+            out.write("\ufeff")
+            writer.writerow(self.fields)
+        for row in rows:
+            writer.writerow([self._cell(row.get(field)) for field in self.fields])
+        return out.getvalue().encode("utf-8")
+
+    def close(self) -> bytes:
+        return b"" if self._started else self.write([])
+
+
+class ParquetExportWriter:
+    """ページごとに1つの row group を書き、close() でフッターを書く。summary_json は JSON の文字列の列にする。"""
+
+    def __init__(self, fields: List[str]):
+        pa, pq = pyarrow_modules()
+        self.fields = fields
+        self._pa = pa
+        self._schema = pa.schema([(field, self._arrow_type(pa, field)) for field in fields])
+        self._sink = ChunkBuffer()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+
+    @staticmethod
+    def _arrow_type(pa: Any, field: str) -> Any:
+        if field in ("analyzed_at", "created_at"):
+            return pa.timestamp("us", tz="UTC")
+        if field in ("product_count", "category_count", "price_count"):
+            return pa.int64()
+        if field == "has_advice":
+            return pa.bool_()
+        if field == "tags":
+            return pa.list_(pa.string())
+        if field in SCORE_FIELDS:
+            return pa.float64()
+        return pa.string()
+
+    @staticmethod
+    def _value(field: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if field in ("analyzed_at", "created_at") and isinstance(value, str):
+            return datetime.fromisoformat(value)
+        if field == "summary_json":
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def write(self, rows: List[Dict[str, Any]]) -> bytes:
+        if not rows:
+            return b""
+        columns = {field: [self._value(field, row.get(field)) for row in rows] for field in self.fields}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+_WRITERS = {"ndjson": NdjsonExportWriter, "csv": CsvExportWriter, "parquet": ParquetExportWriter}
+
+
+def export_writer(export_format: str, fields: List[str]) -> Any:
+    return _WRITERS[export_format](fields)
+
+
+async def history_pages(
+    fetch_page: Callable[[Optional[str]], Awaitable[Page]],
+    first_page: Optional[Page] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    キーセットページングで全ページを順に返す。返したページを送っている間に次のページを取得しておく
+    （メモリに載るのは最大2ページ）。first_page を渡すと1ページ目は取得しない。
+    """
+    task = asyncio.ensure_future(fetch_page(None)) if first_page is None else None
+    page = first_page
+    try:
+        while True:
+            rows, cursor = page if page is not None else await task
+            task = asyncio.ensure_future(fetch_page(cursor)) if cursor else None
+            page = None
+            yield rows
+            if task is None:
+                return
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+async def stream_export(pages: AsyncIterator[List[Dict[str, Any]]], writer: Any) -> AsyncIterator[bytes]:
+    """
+    ページを writer で書き出したバイト列を順に返す。途中で失敗したら例外のまま終わり、
+    応答は途中で切れる（最後まで届いたように見える不完全なファイルにしない）。
+    """
+    try:
+        async for rows in pages:
+            data = await asyncio.to_thread(writer.write, rows)
+            if data:
+                yield data
+        data = await asyncio.to_thread(writer.close)
+        if data:
+            yield data
+    except Exception as e:
+        print(f"Error exporting analysis history: {str(e)}")
+        raise
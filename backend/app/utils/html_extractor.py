@@ -0,0 +1,206 @@
+import asyncio
+import importlib.util
+import os
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_html = None
+
+HTML_EXTRACTOR_BACKEND = os.environ.get("HTML_EXTRACTOR_BACKEND", "auto")
+
+DEFAULT_TITLE = "Sample E-commerce Store"
+DEFAULT_META_DESCRIPTION = "Quality products at affordable prices"
+
+PRODUCT_NAME_CLASSES = {"product-title", "product-name"}
+PRICE_CLASSES = {"price", "product-price"}
+CATEGORY_CLASSES = {"collection-link", "nav-link"}
+REVIEW_CLASSES = {"review", "reviews"}
+SOCIAL_DOMAINS = {
+    "instagram": "instagram.com",
+    "twitter": "twitter.com",
+}
+
+# lxml は文字列の先頭に encoding つきの XML 宣言があると ValueError になるので、渡す前に外す
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+Node = Any
+TextGetter = Callable[[Node], str]
+
+
+class _PageCollector:
+    """
+    1回の走査で各要素を受け取り、分析に必要な情報を集める。
+    """
+
+    def __init__(self, text: TextGetter):
+        self._text = text
+        self.title: Optional[str] = None
+        self.meta_tags: Dict[str, str] = {}
+        self.product_names: List[str] = []
+        self.prices: List[str] = []
+        self.category_links: List[str] = []
+        self.category_urls: List[str] = []
+        self.social_links = {name: "" for name in SOCIAL_DOMAINS}
+        self.has_search = False
+        self.has_viewport = False
+        self.has_reviews = False
+
+    def visit(self, tag: str, attrs: Dict[str, Optional[str]], node: Node) -> None:
+        if tag == "title":
+            if self.title is None:
+                self.title = self._text(node)
+            return
+
+        if tag == "meta":
+            name = attrs.get("name") or attrs.get("property")
+            if name:
+                content = attrs.get("content")
+                if name == "viewport":
+                    self.has_viewport = True
+                if content is not None and name not in self.meta_tags:
+                    self.meta_tags[name] = content
+            return
+
+        if tag == "form":
+            if "search" in (attrs.get("action") or ""):
+                self.has_search = True
+        elif tag == "a":
+            href = attrs.get("href") or ""
+            for name, domain in SOCIAL_DOMAINS.items():
+                if not self.social_links[name] and domain in href:
+                    self.social_links[name] = href
+
+        class_attr = attrs.get("class")
+        if not class_attr:
+            return
+
+        classes = set(class_attr.split())
+        if classes & PRODUCT_NAME_CLASSES:
+            self.product_names.append(self._text(node))
+        if classes & PRICE_CLASSES:
+            self.prices.append(self._text(node))
+        if classes & CATEGORY_CLASSES:
+            self.category_links.append(self._text(node))
+            if tag == "a" and attrs.get("href"):
+                self.category_urls.append(attrs["href"])
+        if classes & REVIEW_CLASSES:
+            self.has_reviews = True
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "title": self.title or DEFAULT_TITLE,
+            "meta_description": self.meta_tags.get("description", DEFAULT_META_DESCRIPTION),
+            "product_names": self.product_names,
+            "prices": self.prices,
+            "category_links": self.category_links,
+            "category_urls": self.category_urls,
+            "product_count": len(self.product_names),
+            "category_count": len(self.category_links),
+            "social_links": self.social_links,
+            "has_search": self.has_search,
+            "mobile_friendly": self.has_viewport,
+            "viewport": self.meta_tags.get("viewport"),
+            "has_reviews": self.has_reviews,
+            "meta_tags": self.meta_tags,
+        }
+
+
+def _walk_selectolax(html: str) -> Tuple[Iterator[Tuple[str, Dict[str, Optional[str]], Node]], TextGetter]:
+    tree = SelectolaxParser(html)
+
+    def walk():
+        for node in tree.root.traverse(include_text=False):
+            tag = node.tag
+            if tag.startswith("-"):
+                continue
+            yield tag, node.attributes, node
+
+    return walk(), lambda node: node.text(deep=True, separator="", strip=True)
+
+
+def _walk_lxml(html: str) -> Tuple[Iterator[Tuple[str, Dict[str, Optional[str]], Node]], TextGetter]:
+    try:
+        root = lxml_html.document_fromstring(_XML_DECLARATION.sub("", html, count=1))
+    except lxml_html.etree.ParserError:
+        # コメントだけのページなど、要素が1つもない文書
+        return iter(()), lambda el: ""
+
+    def walk():
+        for el in root.iter():
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue
+            yield tag, el.attrib, el
+
+    return walk(), lambda el: "".join(s.strip() for s in el.xpath(".//text()"))
+
+
+def _walk_bs4(html: str) -> Tuple[Iterator[Tuple[str, Dict[str, Optional[str]], Node]], TextGetter]:
+    # bs4 は selectolax/lxml がないときの予備なので、使うときまで読み込まない
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    def walk():
+        for el in soup.find_all(True):
+            attrs = el.attrs
+            if isinstance(attrs.get("class"), list):
+                attrs = {**attrs, "class": " ".join(attrs["class"])}
+            yield el.name, attrs, el
+
+    return walk(), lambda el: el.get_text(strip=True)
+
+
+_BACKENDS = {
+    "selectolax": (SelectolaxParser, _walk_selectolax),
+    "lxml": (lxml_html, _walk_lxml),
+    "bs4": (importlib.util.find_spec("bs4"), _walk_bs4),
+}
+
+
+def available_backends() -> List[str]:
+    """
+    インストール済みのパーサーを速い順に返す。
+    """
+    return [name for name, (module, _) in _BACKENDS.items() if module is not None]
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = backend or HTML_EXTRACTOR_BACKEND
+    if backend == "auto":
+        return available_backends()[0]
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown HTML extractor backend: {backend}")
+    if _BACKENDS[backend][0] is None:
+        raise ValueError(f"HTML extractor backend is not installed: {backend}")
+    return backend
+
+
+def extract_page_data(html: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    HTMLを1回だけ走査して商品名・価格・カテゴリー・SNSリンク・メタ情報などを抽出する。
+    空の本文は何も見つからなかったときと同じ結果を返す。
+    """
+    walker = _BACKENDS[resolve_backend(backend)][1]
+    if not html.strip():
+        return _PageCollector(lambda node: "").result()
+    nodes, text = walker(html)
+    collector = _PageCollector(text)
+    for tag, attrs, node in nodes:
+        collector.visit(tag, attrs, node)
+    return collector.result()
+
+
+async def extract_page_data_async(html: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    extract_page_data をワーカースレッドで実行し、イベントループを塞がないようにする。
+    """
+    return await asyncio.to_thread(extract_page_data, html, backend)
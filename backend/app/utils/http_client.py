@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "6"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_USER_AGENT = os.environ.get("HTTP_USER_AGENT", "HAN-NO/0.1 (+https://hansokunou.ai)")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = os.environ.get("HTTP_ENABLE_HTTP2", "true").lower() != "false"
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+# ホスト -> (セマフォ, 使用中と待機中のリクエスト数)。0件になったホストは消す
+_host_semaphores: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+_stats = {
+    "requests_total": 0,
+    "requests_failed": 0,
+    "requests_in_flight": 0,
+    "host_wait_seconds_total": 0.0,
+    "clients_created": 0,
+}
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    _stats["clients_created"] += 1
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+        limits=limits,
+        http2=HTTP2_AVAILABLE,
+        headers={"User-Agent": HTTP_USER_AGENT},
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    アプリ全体で共有するHTTPクライアントを生成する（起動時に呼ぶ）。
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """
+    共有HTTPクライアントを閉じる（終了時に呼ぶ）。
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _host_semaphores.clear()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    共有HTTPクライアントを返す。起動フック前に呼ばれた場合はその場で生成する。
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+@asynccontextmanager
+async def host_slot(url: str):
+    """
+    同一ホストへの同時接続数を HTTP_MAX_CONNECTIONS_PER_HOST 以下に抑える。
+    セマフォは使用中・待機中のリクエストがある間だけ持ち、最後の1件が抜けたら消す。
+    """
+    key = _host_key(url)
+    semaphore, users = _host_semaphores.get(key, (None, 0))
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    _host_semaphores[key] = (semaphore, users + 1)
+    wait_start = time.perf_counter()
+    try:
+        async with semaphore:
+            _stats["host_wait_seconds_total"] += time.perf_counter() - wait_start
+            _stats["requests_in_flight"] += 1
+            try:
+                yield
+            finally:
+                _stats["requests_in_flight"] -= 1
+    finally:
+        semaphore, users = _host_semaphores[key]
+        if users <= 1:
+            del _host_semaphores[key]
+        else:
+            _host_semaphores[key] = (semaphore, users - 1)
+
+
+async def request(method: str, url: str, **kwargs: Any) -> httpx.Response:
+    """
+    共有クライアントでリクエストを送信する（ホスト単位の同時接続制限つき）。
+    """
+    client = get_http_client()
+    async with host_slot(url):
+        _stats["requests_total"] += 1
+        try:
+            return await client.request(method, url, **kwargs)
+        except Exception:
+            _stats["requests_failed"] += 1
+            raise
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs: Any):
+    """
+    共有クライアントでレスポンスをストリーミング受信する（ホスト単位の同時接続制限つき）。
+    """
+    client = get_http_client()
+    async with host_slot(url):
+        _stats["requests_total"] += 1
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            _stats["requests_failed"] += 1
+            raise
+
+
+async def get(url: str, **kwargs: Any) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs: Any) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+def _pool_connections() -> Optional[List[Any]]:
+    """
+    共有クライアントのコネクションの一覧を返す。取れなければ None。
+    httpx はコネクションプールを公開していないため、AsyncHTTPTransport の非公開属性 _pool を読む。
+    httpx の更新で属性が変わっても /stats が落ちないよう、読めなければ None にする。
+    各コネクションは httpcore の公開インターフェース（is_idle・info）だけで調べる。
+    """
+    if _client is None or _client.is_closed:
+        return []
+    try:
+        return list(_client._transport._pool.connections)
+    except Exception:
+        return None
+
+
+def http_client_stats() -> Dict[str, Any]:
+    """
+    コネクションプールの利用状況を返す。
+    pool_* はプールの中身を読めたときだけ数え、読めなければ None（pool_stats_available が False）。
+    """
+    connections = _pool_connections()
+    pool: Dict[str, Any] = {"pool_connections": None, "pool_idle_connections": None,
+                            "pool_active_connections": None, "pool_http2_connections": None}
+    if connections is not None:
+        try:
+            idle = sum(1 for conn in connections if conn.is_idle())
+            http2 = sum(1 for conn in connections if "HTTP/2" in conn.info())
+            pool = {"pool_connections": len(connections), "pool_idle_connections": idle,
+                    "pool_active_connections": len(connections) - idle, "pool_http2_connections": http2}
+        except Exception:
+            connections = None
+
+    return {
+        **_stats,
+        "http2_enabled": HTTP2_AVAILABLE,
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "max_connections_per_host": HTTP_MAX_CONNECTIONS_PER_HOST,
+        "pool_stats_available": connections is not None,
+        **pool,
+        "hosts_tracked": len(_host_semaphores),
+    }
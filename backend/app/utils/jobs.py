@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.utils.ttl_cache import TTLCache
+
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE_BACKEND", "memory")
+JOB_STORE_SQLITE_PATH = os.environ.get("JOB_STORE_SQLITE_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_DEPTH = int(os.environ.get("JOB_QUEUE_MAX_DEPTH", "100"))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+JOB_STORE_MAX_JOBS = int(os.environ.get("JOB_STORE_MAX_JOBS", "10000"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "30"))
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+INTERRUPTED_ERROR = "analysis job was interrupted: the server process running it stopped or restarted"
+
+StageCallback = Callable[[str], Awaitable[None]]
+# handler(url, on_stage, **options): options は submit に渡したもの（crawl など）
+JobHandler = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class MemoryJobStore:
+    """プロセス内のジョブストア。完了から JOB_RETENTION_SECONDS 経過したジョブは消える。"""
+
+    def __init__(self, max_jobs: int, retention: float):
+        self._jobs: TTLCache[Dict[str, Any]] = TTLCache(max_jobs, ttl=retention)
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        self._jobs.set(job["id"], job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    async def renew_leases(self, owner: str, lease_until: float) -> None:
+        pass
+
+    async def fail_expired(self, now: float, error: str) -> int:
+        # プロセス内のストアは他のプロセスと共有せず再起動で消えるので、持ち主のいないジョブはない
+        return 0
+
+
+class SQLiteJobStore:
+    """
+    再起動後もジョブ状態を参照できるSQLiteストア。複数のプロセスで1つのファイルを共有できる。
+    queued・running のジョブは持ち主（owner）とリースの期限（lease_until 列）を持つ。
+    持ち主のプロセスが生きている間は期限が延長され続け、止まると期限が切れる。
+    """
+
+    def __init__(self, path: str, retention: float):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists analysis_jobs ("
+            " id text primary key,"
+            " data text not null,"
+            " updated_at real not null)"
+        )
+        columns = {row[1] for row in self._conn.execute("pragma table_info(analysis_jobs)")}
+        # 列がなかったころのジョブは期限切れ（lease_until = 0）として扱う
+        if "owner" not in columns:
+            self._conn.execute("alter table analysis_jobs add column owner text")
+        if "lease_until" not in columns:
+            self._conn.execute("alter table analysis_jobs add column lease_until real")
+            self._conn.execute("update analysis_jobs set lease_until = 0")
+        self._conn.commit()
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        lease_until = None if job["status"] in TERMINAL_STATUSES else job.get("lease_until", 0)
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into analysis_jobs (id, data, updated_at, owner, lease_until)"
+                " values (?, ?, ?, ?, ?)",
+                (job["id"], json.dumps(job, ensure_ascii=False), job["updated_at"], job.get("owner"), lease_until),
+            )
+            self._conn.execute(
+                "delete from analysis_jobs where updated_at < ?", (time.time() - self.retention,)
+            )
+            self._conn.commit()
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("select data from analysis_jobs where id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _renew_leases(self, owner: str, lease_until: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "update analysis_jobs set lease_until = ? where owner = ? and lease_until is not null",
+                (lease_until, owner),
+            )
+            self._conn.commit()
+
+    def _fail_expired(self, now: float, error: str) -> int:
+        with self._lock:
+            # 他のプロセスが読み取りから更新までの間にリースを延長しないよう、書き込みのロックを先に取る
+            self._conn.execute("begin immediate")
+            try:
+                rows = self._conn.execute(
+                    "select data from analysis_jobs where lease_until < ? and updated_at >= ?",
+                    (now, now - self.retention),
+                ).fetchall()
+                failed = []
+                for (data,) in rows:
+                    job = json.loads(data)
+                    if job["status"] in TERMINAL_STATUSES:
+                        continue
+                    event = {"type": "status", "status": "failed", "error": error, "at": now}
+                    failed.append({**job, "status": "failed", "error": error, "updated_at": now,
+                                   "events": job["events"] + [event]})
+                self._conn.executemany(
+                    "update analysis_jobs set data = ?, updated_at = ?, lease_until = null where id = ?",
+                    [(json.dumps(job, ensure_ascii=False), now, job["id"]) for job in failed],
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return len(failed)
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def renew_leases(self, owner: str, lease_until: float) -> None:
+        """owner の queued・running のジョブのリースを lease_until まで延長する。"""
+        await asyncio.to_thread(self._renew_leases, owner, lease_until)
+
+    async def fail_expired(self, now: float, error: str) -> int:
+        """リースの切れた queued・running のジョブ（持ち主のプロセスが止まったもの）を failed にする。"""
+        return await asyncio.to_thread(self._fail_expired, now, error)
+
+
+class JobQueue:
+    """
+    分析ジョブのキューとワーカープール。
+    キューが JOB_QUEUE_MAX_DEPTH に達したら QueueFullError を送出する（API側で429を返す）。
+    ジョブは受け付けたプロセスのワーカーだけが実行する。start() 後は lease / 3 秒ごとに
+    自分のジョブのリースを延長し、リースの切れたジョブ（止まったプロセスが残したもの）を failed にする。
+    """
+
+    def __init__(self, store, handler: JobHandler, workers: int, max_depth: int,
+                 lease: float = JOB_LEASE_SECONDS):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_depth)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+        self._tasks: List[asyncio.Task] = []
+        # ストアへの保存を待っている submit の数（保存の間にキューの枠を他の submit に取られないように数える）
+        self._reserved = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.running = 0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await self.store.renew_leases(self.owner, time.time() + self.lease)
+                interrupted = await self.store.fail_expired(time.time(), INTERRUPTED_ERROR)
+            except Exception as e:
+                print(f"Error renewing analysis job leases: {str(e)}")
+            else:
+                if interrupted:
+                    self.failed += interrupted
+                    print(f"Marked {interrupted} interrupted analysis jobs as failed")
+            await asyncio.sleep(self.lease / 3)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, url: str, **options: Any) -> Dict[str, Any]:
+        if self._queue.maxsize > 0 and self._queue.qsize() + self._reserved >= self._queue.maxsize:
+            self.rejected += 1
+            raise QueueFullError("analysis job queue is full")
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "options": options,
+            "status": "queued",
+            "stage": None,
+            "events": [],
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "owner": self.owner,
+            "lease_until": now + self.lease,
+        }
+        self._reserved += 1
+        try:
+            await self.store.save(job)
+        finally:
+            self._reserved -= 1
+        # 枠は保存の前に確保しているので、ここで QueueFull にはならない
+        self._pending[job["id"]] = job
+        self._queue.put_nowait(job["id"])
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._pending.get(job_id) or await self.store.get(job_id)
+
+    async def _update(self, job: Dict[str, Any], event: Dict[str, Any], **fields: Any) -> None:
+        # ストアへの保存が終わってから参照中のジョブに反映する
+        now = time.time()
+        updated = {**job, **fields, "updated_at": now, "lease_until": now + self.lease,
+                   "events": job["events"] + [event]}
+        await self.store.save(updated)
+        job.update(updated)
+        for listener in self._listeners.get(job["id"], []):
+            listener.put_nowait(event)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._pending[job_id]
+            self.running += 1
+            try:
+                await self._update(job, {"type": "status", "status": "running", "at": time.time()}, status="running")
+
+                async def on_stage(stage: str) -> None:
+                    await self._update(job, {"type": "stage", "stage": stage, "at": time.time()}, stage=stage)
+
+                try:
+                    result = await self.handler(job["url"], on_stage, **(job.get("options") or {}))
+                except Exception as e:
+                    self.failed += 1
+                    await self._update(
+                        job, {"type": "status", "status": "failed", "error": str(e), "at": time.time()},
+                        status="failed", error=str(e),
+                    )
+                else:
+                    self.succeeded += 1
+                    await self._update(
+                        job, {"type": "status", "status": "succeeded", "at": time.time()},
+                        status="succeeded", result=result,
+                    )
+            except Exception as e:
+                print(f"Error updating analysis job {job_id}: {str(e)}")
+            finally:
+                self.running -= 1
+                self._pending.pop(job_id, None)
+                self._queue.task_done()
+
+    async def events(self, job_id: str, poll_interval: float = 1.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        ジョブのイベントを過去分から順に返し、完了するまで新しいイベントを待つ。
+        別プロセスのワーカーが処理している場合に備えて、ストアも定期的に読み直す。
+        """
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, []).append(listener)
+        sent = 0
+        try:
+            while True:
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                for event in job["events"][sent:]:
+                    yield event
+                sent = len(job["events"])
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                try:
+                    await asyncio.wait_for(listener.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._listeners[job_id].remove(listener)
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": type(self.store).__name__,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_max_depth": self._queue.maxsize,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+def build_job_store():
+    if JOB_STORE_BACKEND == "sqlite":
+        return SQLiteJobStore(JOB_STORE_SQLITE_PATH, JOB_RETENTION_SECONDS)
+    return MemoryJobStore(JOB_STORE_MAX_JOBS, JOB_RETENTION_SECONDS)
+
+
+def create_job_queue(handler: JobHandler) -> JobQueue:
+    return JobQueue(build_job_store(), handler, JOB_WORKERS, JOB_QUEUE_MAX_DEPTH)
@@ -0,0 +1,286 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_LOOP_LAG_INTERVAL = float(os.environ.get("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# 外部APIの呼び出しや PDF レンダリングまで収まるように、上は60秒まで取る
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調に増えるカウンター。ラベルの値は定義順に位置引数で渡す。"""
+
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """増減する値。"""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    バケットごとの件数・合計・件数を持つヒストグラム。observe はバケットの二分探索と加算だけなので
+    1回あたり数マイクロ秒で済み、本番でも常時有効にしておける。
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [バケットごとの件数（累積ではない、最後は +Inf）, 合計, 件数]
+        self._series: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def total(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式（0.0.4）で全メトリクスを書き出す。"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = Counter("hanno_http_requests_total", "HTTP requests by route and status code.",
+                   ("method", "route", "status"), REGISTRY)
+REQUEST_DURATION = Histogram("hanno_http_request_duration_seconds",
+                             "Time from receiving a request until its response body has been sent.",
+                             ("method", "route"), REGISTRY)
+REQUESTS_IN_FLIGHT = Gauge("hanno_http_requests_in_flight", "HTTP requests currently being handled.",
+                           (), REGISTRY)
+STAGE_DURATION = Histogram("hanno_stage_duration_seconds", "Time spent in each analysis pipeline stage.",
+                           ("stage",), REGISTRY)
+STAGE_ERRORS = Counter("hanno_stage_errors_total", "Pipeline stages that ended with an exception.",
+                       ("stage",), REGISTRY)
+STAGES_IN_FLIGHT = Gauge("hanno_stages_in_flight", "Pipeline stages currently running.", ("stage",), REGISTRY)
+SUPABASE_DURATION = Histogram("hanno_supabase_call_duration_seconds",
+                              "Supabase calls, including the wait for a thread pool worker.",
+                              ("operation",), REGISTRY)
+SUPABASE_ERRORS = Counter("hanno_supabase_call_errors_total", "Supabase calls that raised or timed out.",
+                          ("operation",), REGISTRY)
+LOOP_LAG = Gauge("hanno_event_loop_lag_seconds", "Most recent event loop scheduling delay.", (), REGISTRY)
+LOOP_LAG_HISTOGRAM = Histogram("hanno_event_loop_lag_distribution_seconds",
+                               "Event loop scheduling delay, sampled every METRICS_LOOP_LAG_INTERVAL seconds.",
+                               (), REGISTRY, buckets=LOOP_LAG_BUCKETS)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """
+    with ブロックの所要時間をパイプラインの stage として記録する。await を含むブロックにも使える。
+    """
+    STAGES_IN_FLIGHT.inc(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage)
+        STAGES_IN_FLIGHT.dec(stage)
+
+
+@contextmanager
+def observe_supabase_call(operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SUPABASE_ERRORS.inc(operation)
+        raise
+    finally:
+        SUPABASE_DURATION.observe(time.perf_counter() - started, operation)
+
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    # パスそのものではなくルートのテンプレート（/analyze/jobs/{job_id}）で集計し、ラベルの種類を抑える
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    リクエスト数・処理中の件数・所要時間を記録する ASGI ミドルウェア。
+    レスポンスを包まないので、ストリーミングのレスポンスもそのまま流れる（所要時間は送り終えるまで）。
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            REQUEST_DURATION.observe(elapsed, scope["method"], route)
+            REQUESTS.inc(scope["method"], route, str(status_code))
+
+
+class LoopLagMonitor:
+    """
+    interval 秒ごとに sleep し、予定より遅れて起きた分をイベントループの遅延として記録する。
+    同期処理がループを塞いでいると、この値が大きくなる。
+    """
+
+    def __init__(self, interval: float = METRICS_LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            LOOP_LAG.set(0.0)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
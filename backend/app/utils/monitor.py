@@ -0,0 +1,380 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.utils.html_extractor import extract_page_data_async
+from app.utils.metrics import observe_stage
+from app.utils.page_fetch import fetch_page
+from app.utils.prices import parse_prices, price_statistics
+
+MONITOR_ENABLED = os.environ.get("MONITOR_ENABLED", "true").lower() not in ("0", "false", "no")
+MONITOR_POLL_INTERVAL = float(os.environ.get("MONITOR_POLL_INTERVAL", "60"))
+MONITOR_DEFAULT_INTERVAL = float(os.environ.get("MONITOR_DEFAULT_INTERVAL", str(7 * 24 * 60 * 60)))
+MONITOR_MIN_INTERVAL = float(os.environ.get("MONITOR_MIN_INTERVAL", str(60 * 60)))
+# 次回の確認時刻を間隔の ±MONITOR_JITTER（割合）だけずらし、同時に登録したURLの確認が同じ時刻に集まらないようにする
+MONITOR_JITTER = float(os.environ.get("MONITOR_JITTER", "0.1"))
+MONITOR_BATCH_SIZE = int(os.environ.get("MONITOR_BATCH_SIZE", "50"))
+MONITOR_CONCURRENCY = int(os.environ.get("MONITOR_CONCURRENCY", "4"))
+# 同じホストのURLを続けて確認するときに空ける秒数
+MONITOR_HOST_SPACING = float(os.environ.get("MONITOR_HOST_SPACING", "5"))
+MONITOR_LEASE_SECONDS = float(os.environ.get("MONITOR_LEASE_SECONDS", "900"))
+MONITOR_RETRY_DELAY = float(os.environ.get("MONITOR_RETRY_DELAY", str(60 * 60)))
+
+# 確認結果（last_status）
+NOT_MODIFIED = "not_modified"            # 304。本文の取得・解析・LLM を省略
+UNCHANGED_BODY = "unchanged_body"        # 本文のハッシュが前回と同じ。解析・LLM を省略
+UNCHANGED_CONTENT = "unchanged_content"  # 本文は変わったが商品・価格・カテゴリー・SNSは同じ。LLM を省略
+CHANGED = "changed"                      # 差分あり（または初回）。再分析して履歴に保存
+ERROR = "error"
+
+Analyze = Callable[[Dict[str, Any], Dict[str, Any], Dict[str, Any]], Awaitable[Optional[str]]]
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="microseconds") if timestamp is not None else None
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def next_check_at(now: float, interval: float, jitter: float = MONITOR_JITTER) -> float:
+    return now + interval * (1 + random.uniform(-jitter, jitter))
+
+
+def snapshot(url_data: Dict[str, Any]) -> Dict[str, Any]:
+    """抽出結果のうち、差分を取る項目（価格は数値）。"""
+    return {
+        "product_names": list(url_data.get("product_names") or []),
+        "category_links": list(url_data.get("category_links") or []),
+        "prices": parse_prices(url_data.get("prices") or []),
+        "social_links": {key: value for key, value in (url_data.get("social_links") or {}).items() if value},
+    }
+
+
+def history_snapshot(summary: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[int]]:
+    """
+    分析履歴の summary_json から差分の基準を取り出す。監視で保存した履歴は全件の snapshot を持つ。
+    手動の分析の履歴は表示用に各項目を10件までに切り詰めているので、その件数も返す（比べる側も同じ件数にそろえる）。
+    """
+    if summary.get("snapshot"):
+        return summary["snapshot"], None
+    return snapshot(summary), 10
+
+
+def _list_diff(before: List[Any], after: List[Any]) -> Optional[Dict[str, List[Any]]]:
+    before_set, after_set = set(before), set(after)
+    added = [item for item in dict.fromkeys(after) if item not in before_set]
+    removed = [item for item in dict.fromkeys(before) if item not in after_set]
+    return {"added": added, "removed": removed} if added or removed else None
+
+
+def diff_snapshots(before: Dict[str, Any], after: Dict[str, Any], limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    2つの snapshot の差分。変わった項目だけを返す（変更がなければ空の dict）。
+
+    - products / categories: 追加・削除された商品名・カテゴリーURL
+    - prices: 追加・削除された価格と、最小・中央値・最大の変化
+    - social_links: 追加・削除・変更されたSNSのURL
+    """
+    if limit is not None:
+        after = {**after, **{key: after[key][:limit] for key in ("product_names", "category_links", "prices")}}
+    changes: Dict[str, Any] = {}
+    for key, name in (("product_names", "products"), ("category_links", "categories")):
+        diff = _list_diff(before.get(key) or [], after.get(key) or [])
+        if diff:
+            changes[name] = diff
+
+    prices = _list_diff(before.get("prices") or [], after.get("prices") or [])
+    if prices:
+        old_stats, new_stats = price_statistics(before.get("prices") or []), price_statistics(after.get("prices") or [])
+        prices.update({
+            key: {"before": old_stats[key], "after": new_stats[key]}
+            for key in ("min", "median", "max") if old_stats[key] != new_stats[key]
+        })
+        changes["prices"] = prices
+
+    old_links, new_links = before.get("social_links") or {}, after.get("social_links") or {}
+    links = {
+        "added": {key: value for key, value in new_links.items() if key not in old_links},
+        "removed": {key: value for key, value in old_links.items() if key not in new_links},
+        "changed": {key: {"before": old_links[key], "after": value} for key, value in new_links.items()
+                    if key in old_links and old_links[key] != value},
+    }
+    if any(links.values()):
+        changes["social_links"] = {key: value for key, value in links.items() if value}
+    return changes
+
+
+def spread_by_host(rows: List[Dict[str, Any]], spacing: float, busy_until: Optional[Dict[str, float]] = None,
+                   now: float = 0.0) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    各行を確認するまでの待ち秒数を決める。同じホストの行は spacing 秒ずつ間を空け、
+    ホストの異なる行は待たずに並べる。busy_until[ホスト] があれば、その時刻より後から数える。
+    待ち秒数の短い順に返す。
+    """
+    busy_until = busy_until if busy_until is not None else {}
+    plan = []
+    for row in rows:
+        host = host_of(row["url"])
+        start = max(now, busy_until.get(host, now - spacing) + spacing)
+        busy_until[host] = start
+        plan.append((start - now, row))
+    plan.sort(key=lambda item: item[0])
+    return plan
+
+
+class TrackedUrlStore:
+    """
+    監視するURL（scripts/create_tracked_urls_schema.sql の tracked_urls テーブル）。
+    確認する行は next_check_at が来たものを条件つき UPDATE で lease 秒先に送ってから取り出すので、
+    複数のワーカーが同時に取り出しても同じ行を二重に確認しない。
+    """
+
+    def __init__(self):
+        from app.utils import supabase as db
+
+        self.db = db
+
+    @property
+    def table(self):
+        return self.db.get_supabase().table("tracked_urls")
+
+    def _add(self, user_email: str, url: str, interval_seconds: float, user_id: Optional[str]) -> Dict[str, Any]:
+        row = {
+            "user_email": user_email,
+            "user_id": user_id,
+            "url": url,
+            "interval_seconds": int(interval_seconds),
+            "active": True,
+            "next_check_at": _iso(time.time()),
+        }
+        result = self.table.upsert(row, on_conflict="user_email,url").execute()
+        return result.data[0]
+
+    def _list(self, user_email: str) -> List[Dict[str, Any]]:
+        return self.table.select("*").eq("user_email", user_email).order("created_at").execute().data or []
+
+    def _get(self, user_email: str, tracked_id: str) -> Optional[Dict[str, Any]]:
+        result = self.table.select("*").eq("user_email", user_email).eq("id", tracked_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def _delete(self, user_email: str, tracked_id: str) -> bool:
+        return bool(self.table.delete().eq("user_email", user_email).eq("id", tracked_id).execute().data)
+
+    def _claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        due = (
+            self.table.select("id")
+            .eq("active", True)
+            .lte("next_check_at", _iso(now))
+            .order("next_check_at")
+            .limit(limit)
+            .execute()
+        ).data or []
+        if not due:
+            return []
+        # 他のワーカーが先に取った行は next_check_at が先に送られていて条件に合わない
+        result = (
+            self.table.update({"next_check_at": _iso(now + lease)})
+            .in_("id", [row["id"] for row in due])
+            .lte("next_check_at", _iso(now))
+            .execute()
+        )
+        return result.data or []
+
+    def _update(self, tracked_id: str, changes: Dict[str, Any]) -> None:
+        self.table.update(changes).eq("id", tracked_id).execute()
+
+    async def add(self, user_email: str, url: str, interval_seconds: float, user_id: Optional[str] = None) -> Dict[str, Any]:
+        return await self.db.run_db(self._add, user_email, url, interval_seconds, user_id)
+
+    async def list(self, user_email: str) -> List[Dict[str, Any]]:
+        return await self.db.run_db(self._list, user_email)
+
+    async def get(self, user_email: str, tracked_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.run_db(self._get, user_email, tracked_id)
+
+    async def delete(self, user_email: str, tracked_id: str) -> bool:
+        return await self.db.run_db(self._delete, user_email, tracked_id)
+
+    async def claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        return await self.db.run_db(self._claim, limit, lease, now)
+
+    async def update(self, tracked_id: str, changes: Dict[str, Any]) -> None:
+        await self.db.run_db(self._update, tracked_id, changes)
+
+    async def latest_history(self, user_email: str, url: str) -> Optional[Dict[str, Any]]:
+        return await self.db.get_latest_analysis_history(user_email, url)
+
+
+class UrlMonitor:
+    """
+    登録されたURLを定期的に取り直し、変わったときだけ再分析するバックグラウンドの監視係。
+
+    1. 前回の ETag / Last-Modified で条件つき GET をし、304 なら本文を読まない
+    2. 本文のハッシュが前回と同じなら解析しない
+    3. 解析した商品・価格・カテゴリー・SNSを最新の分析履歴と比べ、差分がなければ LLM を呼ばない
+    4. 差分があれば（最初の確認でも）analyze(row, url_data, changes) で再分析し、履歴を保存する
+       （履歴の summary_json には snapshot(url_data) を入れておくと、次回は10件に切り詰めずに比べられる）
+
+    確認は batch_size 件ずつ取り出し、同時に concurrency 件まで、同じホストには host_spacing 秒ずつ間を空けて行う。
+    analyze は保存した分析履歴のIDを返す。失敗した確認は retry_delay 秒後にやり直す。
+    """
+
+    def __init__(self, store, analyze: Analyze, poll_interval: float = MONITOR_POLL_INTERVAL,
+                 batch_size: int = MONITOR_BATCH_SIZE, concurrency: int = MONITOR_CONCURRENCY,
+                 host_spacing: float = MONITOR_HOST_SPACING, lease: float = MONITOR_LEASE_SECONDS,
+                 retry_delay: float = MONITOR_RETRY_DELAY, jitter: float = MONITOR_JITTER,
+                 enabled: bool = MONITOR_ENABLED):
+        self.store = store
+        self.analyze = analyze
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.host_spacing = host_spacing
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.jitter = jitter
+        self.enabled = enabled
+        self._host_busy_until: Dict[str, float] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "checks": 0,
+            NOT_MODIFIED: 0,
+            UNCHANGED_BODY: 0,
+            UNCHANGED_CONTENT: 0,
+            CHANGED: 0,
+            "errors": 0,
+        }
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def _run(self) -> None:
+        # 起動直後は確認しない（起動時の処理と競わないよう、最初の確認は poll_interval 後か wake() のとき）
+        claimed = 0
+        while True:
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                print(f"Error checking tracked URLs: {str(e)}")
+                claimed = 0
+
+    async def run_once(self) -> int:
+        """確認時刻になったURLを取り出して確認し、取り出した件数を返す。"""
+        now = time.time()
+        rows = await self.store.claim(self.batch_size, self.lease, now)
+        self._host_busy_until = {host: until for host, until in self._host_busy_until.items() if until > now}
+        plan = spread_by_host(rows, self.host_spacing, self._host_busy_until, now)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check_later(delay: float, row: Dict[str, Any]) -> None:
+            await asyncio.sleep(delay)
+            async with semaphore:
+                await self.check(row)
+
+        await asyncio.gather(*[check_later(delay, row) for delay, row in plan])
+        return len(rows)
+
+    async def check(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """1件のURLを確認して tracked_urls の行を更新し、{status, changes, history_id} を返す。"""
+        self._stats["checks"] += 1
+        try:
+            with observe_stage("monitor"):
+                result, changes = await self._check(row)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"Error checking tracked URL {row['url']}: {str(e)}")
+            await self.store.update(row["id"], {
+                "last_status": ERROR,
+                "last_error": str(e) or type(e).__name__,
+                "last_checked_at": _iso(time.time()),
+                "next_check_at": _iso(time.time() + self.retry_delay),
+            })
+            return {"status": ERROR, "error": str(e) or type(e).__name__}
+
+        self._stats[result["last_status"]] += 1
+        now = time.time()
+        result.update({
+            "last_error": None,
+            "last_checked_at": _iso(now),
+            "next_check_at": _iso(next_check_at(now, float(row.get("interval_seconds") or MONITOR_DEFAULT_INTERVAL),
+                                                self.jitter)),
+        })
+        if result["last_status"] == CHANGED:
+            result["last_changed_at"] = result["last_checked_at"]
+        await self.store.update(row["id"], result)
+        return {"status": result["last_status"], "changes": changes, "history_id": result.get("last_history_id")}
+
+    async def _check(self, row: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        headers = {}
+        if row.get("body_hash"):
+            if row.get("etag"):
+                headers["If-None-Match"] = row["etag"]
+            if row.get("last_modified"):
+                headers["If-Modified-Since"] = row["last_modified"]
+        page = await fetch_page(row["url"], headers=headers)
+        if page["status_code"] == 304:
+            return {"last_status": NOT_MODIFIED}, {}
+
+        # 本文を読んだら、次回の条件つき GET に使う値は毎回更新する
+        validators = {"etag": page["headers"].get("etag"), "last_modified": page["headers"].get("last-modified")}
+        if row.get("body_hash") == page["body_hash"]:
+            return {"last_status": UNCHANGED_BODY, **validators}, {}
+
+        url_data = await extract_page_data_async(page["text"])
+        current = snapshot(url_data)
+        previous = await self.store.latest_history(row["user_email"], row["url"])
+        if previous is not None:
+            before, limit = history_snapshot(previous.get("summary_json") or {})
+            changes = diff_snapshots(before, current, limit)
+            if not changes:
+                return {"last_status": UNCHANGED_CONTENT, "body_hash": page["body_hash"], **validators}, {}
+        else:
+            changes = {}
+
+        # 再分析が失敗したら body_hash を更新しないので、次回もう一度解析して再分析する
+        history_id = await self.analyze(row, url_data, changes)
+        return {
+            "last_status": CHANGED,
+            "body_hash": page["body_hash"],
+            "last_history_id": history_id,
+            "last_changes": changes,
+            **validators,
+        }, changes
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._stats
+        return {
+            "enabled": self.enabled,
+            **stats,
+            "fetches_skipped": stats[NOT_MODIFIED],
+            "parses_skipped": stats[NOT_MODIFIED] + stats[UNCHANGED_BODY],
+            "llm_calls_skipped": stats[NOT_MODIFIED] + stats[UNCHANGED_BODY] + stats[UNCHANGED_CONTENT],
+            "reanalyses": stats[CHANGED],
+        }
+
+
+def create_url_monitor(analyze: Analyze) -> UrlMonitor:
+    return UrlMonitor(TrackedUrlStore(), analyze)
@@ -0,0 +1,144 @@
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.utils import http_client
+from app.utils.outbox import DeliveryError, Throttle
+
+NOTION_API_URL = os.environ.get("NOTION_API_URL", "https://api.notion.com/v1").rstrip("/")
+NOTION_VERSION = os.environ.get("NOTION_VERSION", "2022-06-28")
+NOTION_TITLE_PROPERTY = os.environ.get("NOTION_TITLE_PROPERTY", "Name")
+
+# Notion の rich_text 1要素あたりの文字数上限
+NOTION_TEXT_LIMIT = 2000
+ADVICE_EXCERPT_CHARS = 6000
+
+SCORE_LABELS = {
+    "sns_score": "SNS",
+    "structure_score": "構造",
+    "ux_score": "UX",
+    "app_score": "アプリ",
+    "theme_score": "テーマ",
+}
+
+# (user_id) -> Slack の Webhook URL / Notion のトークン。未設定なら None
+CredentialResolver = Callable[[Optional[str]], Awaitable[Optional[str]]]
+
+
+def analysis_payload(analysis_result: Dict[str, Any], include_advice: bool = False) -> Dict[str, Any]:
+    """
+    アウトボックスに保存する通知の中身。分析結果全体ではなく、通知に使う項目だけを残す。
+    """
+    payload = {
+        "url": analysis_result.get("url"),
+        "competitor_summary": analysis_result.get("competitor_summary"),
+        "diagnostic_scores": analysis_result.get("diagnostic_scores") or {},
+    }
+    if include_advice:
+        payload["advice"] = (analysis_result.get("advice") or "")[:ADVICE_EXCERPT_CHARS]
+    return payload
+
+
+def _score_line(scores: Dict[str, Any]) -> str:
+    return " / ".join(f"{label} {scores[name]}" for name, label in SCORE_LABELS.items() if name in scores)
+
+
+def slack_message(payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """複数の分析結果を1件の Slack メッセージにまとめる。"""
+    title = f"新しい分析結果が {len(payloads)} 件あります" if len(payloads) > 1 else "新しい分析結果があります"
+    blocks: List[Dict[str, Any]] = [{"type": "header", "text": {"type": "plain_text", "text": title}}]
+    for payload in payloads:
+        lines = [f"*<{payload['url']}>*"]
+        if payload.get("competitor_summary"):
+            lines.append(payload["competitor_summary"])
+        if payload.get("diagnostic_scores"):
+            lines.append(_score_line(payload["diagnostic_scores"]))
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(lines)}})
+    return {"text": title, "blocks": blocks}
+
+
+def _paragraphs(text: str) -> List[Dict[str, Any]]:
+    return [
+        {"object": "block", "type": "paragraph",
+         "paragraph": {"rich_text": [{"type": "text", "text": {"content": text[i:i + NOTION_TEXT_LIMIT]}}]}}
+        for i in range(0, len(text), NOTION_TEXT_LIMIT)
+    ]
+
+
+def notion_page(database_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    body = "\n".join(
+        part for part in (payload.get("competitor_summary"), _score_line(payload.get("diagnostic_scores") or {})) if part
+    )
+    return {
+        "parent": {"database_id": database_id},
+        "properties": {NOTION_TITLE_PROPERTY: {"title": [{"type": "text", "text": {"content": payload["url"]}}]}},
+        "children": _paragraphs(body) + _paragraphs(payload.get("advice") or ""),
+    }
+
+
+def _raise_for_delivery(response: httpx.Response, service: str) -> None:
+    if response.status_code < 400:
+        return
+    retry_after = response.headers.get("retry-after")
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+    # 429 と 5xx は再送する。それ以外の 4xx（Webhook の失効や不正な内容）は何度送っても同じなので諦める
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise DeliveryError(
+        f"{service} returned {response.status_code}: {response.text[:200]}",
+        status_code=response.status_code,
+        retry_after=retry_after,
+        permanent=not retryable,
+    )
+
+
+class SlackSender:
+    """同じ Webhook 宛ての通知を1回の POST にまとめて送る。"""
+
+    def __init__(self, resolve_webhook: CredentialResolver):
+        self.resolve_webhook = resolve_webhook
+
+    async def deliver(self, target: str, user_id: Optional[str], payloads: List[Dict[str, Any]],
+                      throttle: Throttle) -> List[Optional[Exception]]:
+        webhook_url = await self.resolve_webhook(user_id)
+        if not webhook_url:
+            raise DeliveryError("Slack webhook is not configured", permanent=True)
+        await throttle()
+        response = await http_client.post(webhook_url, json=slack_message(payloads))
+        _raise_for_delivery(response, "Slack")
+        return [None] * len(payloads)
+
+
+class NotionSender:
+    """
+    同じデータベース宛てのページをまとめて作成する。Notion に一括作成のAPIはないので1ページずつ送り、
+    レート制限（429）を受けたら残りは再送に回す。
+    """
+
+    def __init__(self, resolve_token: CredentialResolver, api_url: str = NOTION_API_URL):
+        self.resolve_token = resolve_token
+        self.api_url = api_url.rstrip("/")
+
+    async def deliver(self, target: str, user_id: Optional[str], payloads: List[Dict[str, Any]],
+                      throttle: Throttle) -> List[Optional[Exception]]:
+        token = await self.resolve_token(user_id)
+        if not token:
+            raise DeliveryError("Notion token is not configured", permanent=True)
+        headers = {"Authorization": f"Bearer {token}", "Notion-Version": NOTION_VERSION}
+        results: List[Optional[Exception]] = []
+        for payload in payloads:
+            await throttle()
+            try:
+                response = await http_client.post(f"{self.api_url}/pages", json=notion_page(target, payload), headers=headers)
+                _raise_for_delivery(response, "Notion")
+            except Exception as e:
+                results.append(e)
+                if getattr(e, "status_code", None) == 429:
+                    results.extend([e] * (len(payloads) - len(results)))
+                    break
+            else:
+                results.append(None)
+        return results
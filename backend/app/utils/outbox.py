@@ -0,0 +1,467 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.concurrency import TokenBucket
+
+OUTBOX_BACKEND = os.environ.get("OUTBOX_BACKEND", "sqlite")
+OUTBOX_SQLITE_PATH = os.environ.get("OUTBOX_SQLITE_PATH", "outbox.sqlite3")
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_CLAIM_LIMIT = int(os.environ.get("OUTBOX_CLAIM_LIMIT", "200"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_DELAY = float(os.environ.get("OUTBOX_RETRY_BASE_DELAY", "5"))
+OUTBOX_RETRY_MAX_DELAY = float(os.environ.get("OUTBOX_RETRY_MAX_DELAY", "900"))
+OUTBOX_RETENTION_SECONDS = float(os.environ.get("OUTBOX_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+# 連携先ごとの送信レート（1分あたりのHTTPリクエスト数）。Slack は Webhook ごとに毎秒1件、Notion は毎秒3件が目安
+OUTBOX_SLACK_RPM = float(os.environ.get("OUTBOX_SLACK_RPM", "60"))
+OUTBOX_NOTION_RPM = float(os.environ.get("OUTBOX_NOTION_RPM", "180"))
+
+LATENCY_WINDOW = 1000
+
+Throttle = Callable[[], Awaitable[float]]
+
+
+class DeliveryError(Exception):
+    """
+    連携先への送信失敗。permanent なら再試行しない。retry_after は連携先が指定した待ち秒数。
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 permanent: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def _new_message(kind: str, target: str, payload: Dict[str, Any], user_id: Optional[str]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "target": target,
+        "user_id": user_id,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "claimed_until": None,
+        "last_error": None,
+        "created_at": now,
+        "delivered_at": None,
+    }
+
+
+class SQLiteOutboxStore:
+    """
+    ローカル用のアウトボックス。受け付けた通知はコミットしてから返すので、プロセスが再起動しても失われない。
+    """
+
+    def __init__(self, path: str, retention: float):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # 最初に使うときに開く（アプリの import 時にファイルを作らない）。呼び出しはすべて self._lock の中
+        if self._connection is not None:
+            return self._connection
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        conn.execute(
+            "create table if not exists outbox_messages ("
+            " id text primary key,"
+            " kind text not null,"
+            " target text not null,"
+            " user_id text,"
+            " payload text not null,"
+            " status text not null,"
+            " attempts integer not null,"
+            " next_attempt_at real not null,"
+            " claimed_until real,"
+            " last_error text,"
+            " created_at real not null,"
+            " delivered_at real)"
+        )
+        conn.execute(
+            "create index if not exists outbox_messages_due_idx on outbox_messages (status, next_attempt_at)"
+        )
+        conn.commit()
+        self._connection = conn
+        return conn
+
+    @staticmethod
+    def _message(row: sqlite3.Row) -> Dict[str, Any]:
+        return {**dict(row), "payload": json.loads(row["payload"])}
+
+    def _add(self, message: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "insert into outbox_messages values (:id, :kind, :target, :user_id, :payload, :status, :attempts,"
+                " :next_attempt_at, :claimed_until, :last_error, :created_at, :delivered_at)",
+                {**message, "payload": json.dumps(message["payload"], ensure_ascii=False)},
+            )
+            self._conn.commit()
+
+    def _claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        # 1文の UPDATE ... RETURNING で取り出すので、複数のプロセスが同じ行を二重に取らない
+        with self._lock:
+            rows = self._conn.execute(
+                "update outbox_messages set claimed_until = ? where id in ("
+                " select id from outbox_messages"
+                " where status = 'pending' and next_attempt_at <= ?"
+                " and (claimed_until is null or claimed_until < ?)"
+                " order by next_attempt_at, created_at limit ?)"
+                " returning *",
+                (now + lease, now, now, limit),
+            ).fetchall()
+            self._conn.commit()
+        return sorted((self._message(row) for row in rows), key=lambda message: message["created_at"])
+
+    def _complete(self, ids: List[str], now: float) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "update outbox_messages set status = 'delivered', delivered_at = ?, claimed_until = null where id = ?",
+                [(now, message_id) for message_id in ids],
+            )
+            self._conn.execute(
+                "delete from outbox_messages where status = 'delivered' and delivered_at < ?", (now - self.retention,)
+            )
+            self._conn.commit()
+
+    def _reschedule(self, message_id: str, status: str, attempts: int, next_attempt_at: float, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "update outbox_messages set status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,"
+                " claimed_until = null where id = ?",
+                (status, attempts, next_attempt_at, error, message_id),
+            )
+            self._conn.commit()
+
+    def _counts(self, now: float) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "select status, count(*), min(created_at) from outbox_messages"
+                " where status != 'delivered' group by status"
+            ).fetchall()
+        counts = {row[0]: (row[1], row[2]) for row in rows}
+        pending, oldest = counts.get("pending", (0, None))
+        return {
+            "pending": pending,
+            "dead": counts.get("dead", (0, None))[0],
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    async def add(self, message: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._add, message)
+
+    async def claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._claim, limit, lease, now)
+
+    async def complete(self, ids: List[str], now: float) -> None:
+        await asyncio.to_thread(self._complete, ids, now)
+
+    async def reschedule(self, message_id: str, status: str, attempts: int, next_attempt_at: float, error: str) -> None:
+        await asyncio.to_thread(self._reschedule, message_id, status, attempts, next_attempt_at, error)
+
+    async def counts(self, now: float) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._counts, now)
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="microseconds") if timestamp is not None else None
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+class SupabaseOutboxStore:
+    """
+    本番用のアウトボックス（scripts/create_outbox_schema.sql の outbox_messages テーブル）。
+    取り出しは claim_outbox_messages 関数（FOR UPDATE SKIP LOCKED）で行い、
+    関数がない環境では条件つき UPDATE で代用する。
+    """
+
+    TIME_COLUMNS = ("next_attempt_at", "claimed_until", "created_at", "delivered_at")
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, retention: float):
+        from app.utils import supabase as db
+
+        self.db = db
+        self.retention = retention
+        self._use_rpc = True
+        self._purged_at = 0.0
+
+    @property
+    def table(self):
+        return self.db.get_supabase().table("outbox_messages")
+
+    def _row(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {**message, **{column: _iso(message.get(column)) for column in self.TIME_COLUMNS}}
+
+    def _message(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {**row, **{column: _epoch(row.get(column)) for column in self.TIME_COLUMNS}}
+
+    def _add(self, message: Dict[str, Any]) -> None:
+        self.table.insert(self._row(message)).execute()
+
+    def _claim_rpc(self, limit: int, lease: float) -> List[Dict[str, Any]]:
+        result = self.db.get_supabase().rpc("claim_outbox_messages", {"batch_size": limit, "lease_seconds": lease}).execute()
+        return result.data or []
+
+    def _claim_update(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        free = f"claimed_until.is.null,claimed_until.lt.{_iso(now)}"
+        candidates = (
+            self.table.select("id")
+            .eq("status", "pending")
+            .lte("next_attempt_at", _iso(now))
+            .or_(free)
+            .order("next_attempt_at")
+            .limit(limit)
+            .execute()
+        ).data or []
+        if not candidates:
+            return []
+        # 他のワーカーが先に取った行は条件に合わず更新されない
+        result = (
+            self.table.update({"claimed_until": _iso(now + lease)})
+            .in_("id", [row["id"] for row in candidates])
+            .or_(free)
+            .execute()
+        )
+        return result.data or []
+
+    def _claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        rows = None
+        if self._use_rpc:
+            try:
+                rows = self._claim_rpc(limit, lease)
+            except Exception as e:
+                print(f"Error calling claim_outbox_messages, falling back to conditional updates: {str(e)}")
+                self._use_rpc = False
+        if rows is None:
+            rows = self._claim_update(limit, lease, now)
+        return sorted((self._message(row) for row in rows), key=lambda message: message["created_at"])
+
+    def _complete(self, ids: List[str], now: float) -> None:
+        self.table.update({"status": "delivered", "delivered_at": _iso(now), "claimed_until": None}).in_("id", ids).execute()
+        if now - self._purged_at >= self.PURGE_INTERVAL:
+            self._purged_at = now
+            self.table.delete().eq("status", "delivered").lt("delivered_at", _iso(now - self.retention)).execute()
+
+    def _reschedule(self, message_id: str, status: str, attempts: int, next_attempt_at: float, error: str) -> None:
+        self.table.update({
+            "status": status,
+            "attempts": attempts,
+            "next_attempt_at": _iso(next_attempt_at),
+            "last_error": error,
+            "claimed_until": None,
+        }).eq("id", message_id).execute()
+
+    def _counts(self, now: float) -> Dict[str, Any]:
+        pending = self.table.select("created_at", count="exact").eq("status", "pending").order("created_at").limit(1).execute()
+        dead = self.table.select("id", count="exact").eq("status", "dead").limit(1).execute()
+        oldest = _epoch(pending.data[0]["created_at"]) if pending.data else None
+        return {
+            "pending": pending.count or 0,
+            "dead": dead.count or 0,
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    async def add(self, message: Dict[str, Any]) -> None:
+        await self.db.run_db(self._add, message)
+
+    async def claim(self, limit: int, lease: float, now: float) -> List[Dict[str, Any]]:
+        return await self.db.run_db(self._claim, limit, lease, now)
+
+    async def complete(self, ids: List[str], now: float) -> None:
+        await self.db.run_db(self._complete, ids, now)
+
+    async def reschedule(self, message_id: str, status: str, attempts: int, next_attempt_at: float, error: str) -> None:
+        await self.db.run_db(self._reschedule, message_id, status, attempts, next_attempt_at, error)
+
+    async def counts(self, now: float) -> Dict[str, Any]:
+        return await self.db.run_db(self._counts, now)
+
+
+class OutboxDispatcher:
+    """
+    アウトボックスに溜まった通知を連携先ごとにまとめて送るバックグラウンドの配送係。
+    - 同じ (種類, 宛先, ユーザー) の通知を batch_size 件ずつ1つのグループとして sender に渡す
+    - 連携先・宛先ごとにトークンバケットで送信レートを制限する
+    - 失敗した通知はジッターつき指数バックオフで再送し、max_attempts 回で諦めて dead にする
+    - 取り出した通知は lease 秒のあいだ他のワーカーから見えない。途中で落ちても lease 切れで再送される
+    sender.deliver(target, user_id, payloads, throttle) は通知ごとの結果（成功は None、失敗は例外）のリストを返す。
+    """
+
+    def __init__(self, store, senders: Dict[str, Any], rate_limits: Optional[Dict[str, float]] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, claim_limit: int = OUTBOX_CLAIM_LIMIT,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, lease: float = OUTBOX_LEASE_SECONDS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, retry_base_delay: float = OUTBOX_RETRY_BASE_DELAY,
+                 retry_max_delay: float = OUTBOX_RETRY_MAX_DELAY):
+        self.store = store
+        self.senders = senders
+        self.rate_limits = rate_limits or {}
+        self.batch_size = batch_size
+        self.claim_limit = claim_limit
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "enqueued": 0,
+            "delivered": 0,
+            "batches": 0,
+            "failed_attempts": 0,
+            "dead": 0,
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def enqueue(self, kind: str, target: str, payload: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
+        """通知をアウトボックスに書き込む。書き込みが終わった時点で配送が保証される。"""
+        message = _new_message(kind, target, payload, user_id)
+        await self.store.add(message)
+        self._stats["enqueued"] += 1
+        self._wake.set()
+        return message
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                print(f"Error dispatching outbox: {str(e)}")
+                processed = 0
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def dispatch_once(self) -> int:
+        """送信時刻になった通知を取り出して配送し、取り出した件数を返す。"""
+        messages = await self.store.claim(self.claim_limit, self.lease, time.time())
+        groups: Dict[Tuple[str, str, Optional[str]], List[Dict[str, Any]]] = {}
+        for message in messages:
+            groups.setdefault((message["kind"], message["target"], message.get("user_id")), []).append(message)
+        await asyncio.gather(*[self._deliver_group(key, group) for key, group in groups.items()])
+        return len(messages)
+
+    async def drain(self, max_rounds: int = 100) -> None:
+        """送信時刻になった通知がなくなるまで配送する（終了時やテスト用）。"""
+        for _ in range(max_rounds):
+            if not await self.dispatch_once():
+                return
+
+    def _bucket(self, kind: str, target: str) -> TokenBucket:
+        key = (kind, target)
+        if key not in self._buckets:
+            per_minute = self.rate_limits.get(kind, 0)
+            self._buckets[key] = TokenBucket(per_minute, burst=max(1.0, per_minute / 60))
+        return self._buckets[key]
+
+    async def _deliver_group(self, key: Tuple[str, str, Optional[str]], messages: List[Dict[str, Any]]) -> None:
+        kind, target, user_id = key
+        sender = self.senders.get(kind)
+        bucket = self._bucket(kind, target)
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            self._stats["batches"] += 1
+            try:
+                if sender is None:
+                    raise DeliveryError(f"no sender for {kind}", permanent=True)
+                results = await sender.deliver(target, user_id, [message["payload"] for message in batch], bucket.acquire)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            now = time.time()
+            delivered = [message for message, error in zip(batch, results) if error is None]
+            if delivered:
+                await self.store.complete([message["id"] for message in delivered], now)
+                self._stats["delivered"] += len(delivered)
+                self._latencies.extend(now - message["created_at"] for message in delivered)
+            for message, error in zip(batch, results):
+                if error is not None:
+                    await self._retry_later(message, error, now)
+
+    def _retry_delay(self, attempts: int, error: Exception) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(self.retry_max_delay, retry_after)
+        # フルジッター: 0〜(base * 2^(attempts-1)) の一様乱数
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1)))
+
+    async def _retry_later(self, message: Dict[str, Any], error: Exception, now: float) -> None:
+        attempts = message["attempts"] + 1
+        self._stats["failed_attempts"] += 1
+        if getattr(error, "permanent", False) or attempts >= self.max_attempts:
+            self._stats["dead"] += 1
+            print(f"Error delivering {message['kind']} outbox message {message['id']}, giving up: {str(error)}")
+            await self.store.reschedule(message["id"], "dead", attempts, now, str(error))
+            return
+        await self.store.reschedule(message["id"], "pending", attempts, now + self._retry_delay(attempts, error), str(error))
+
+    def _latency_stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {"count": 0}
+        return {
+            "count": len(latencies),
+            "avg_seconds": round(sum(latencies) / len(latencies), 3),
+            "p50_seconds": round(latencies[len(latencies) // 2], 3),
+            "p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+            "max_seconds": round(latencies[-1], 3),
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            depth = await self.store.counts(time.time())
+        except Exception as e:
+            print(f"Error reading outbox depth: {str(e)}")
+            depth = {}
+        return {
+            "store": type(self.store).__name__,
+            **depth,
+            **self._stats,
+            "delivery_latency": self._latency_stats(),
+        }
+
+
+def build_outbox_store():
+    if OUTBOX_BACKEND == "supabase":
+        return SupabaseOutboxStore(OUTBOX_RETENTION_SECONDS)
+    return SQLiteOutboxStore(OUTBOX_SQLITE_PATH, OUTBOX_RETENTION_SECONDS)
+
+
+def create_outbox_dispatcher(senders: Dict[str, Any]) -> OutboxDispatcher:
+    return OutboxDispatcher(build_outbox_store(), senders, {"slack": OUTBOX_SLACK_RPM, "notion": OUTBOX_NOTION_RPM})
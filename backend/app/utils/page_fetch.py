@@ -0,0 +1,192 @@
+import asyncio
+import codecs
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.utils import http_client
+
+PAGE_MAX_BYTES = int(os.environ.get("PAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+PAGE_BODY_BYTES = int(os.environ.get("PAGE_BODY_BYTES", str(1024 * 1024)))
+PAGE_CONNECT_TIMEOUT = float(os.environ.get("PAGE_CONNECT_TIMEOUT", "5"))
+PAGE_READ_TIMEOUT = float(os.environ.get("PAGE_READ_TIMEOUT", "10"))
+PAGE_TOTAL_TIMEOUT = float(os.environ.get("PAGE_TOTAL_TIMEOUT", "20"))
+
+# HTML仕様のエンコーディング事前走査と同じく、先頭1024バイトから <meta charset> を探す
+CHARSET_SNIFF_BYTES = 1024
+DEFAULT_CHARSET = "utf-8"
+
+_HEADER_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w\-:.]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w\-:.]+)", re.I)
+_BOMS = [(codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+_HEAD_END = b"</head>"
+
+_stats = {
+    "pages": 0,
+    "bytes_read": 0,
+    "bytes_downloaded": 0,
+    "bytes_saved": 0,
+    "early_stops": 0,
+    "capped": 0,
+    "deadline_exceeded": 0,
+}
+
+
+class PageDeadlineExceeded(Exception):
+    pass
+
+
+def _valid_charset(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.decode("ascii", "ignore") if isinstance(name, bytes) else name).name
+    except LookupError:
+        return None
+
+
+def sniff_charset(head: bytes, content_type: Optional[str] = None) -> str:
+    """
+    文字コードを Content-Type ヘッダー → BOM → 先頭の <meta charset> の順で決める。
+    """
+    match = _HEADER_CHARSET.search(content_type or "")
+    charset = _valid_charset(match.group(1)) if match else None
+    if charset:
+        return charset
+    for bom, name in _BOMS:
+        if head.startswith(bom):
+            return name
+    match = _META_CHARSET.search(head[:CHARSET_SNIFF_BYTES])
+    return _valid_charset(match.group(1) if match else None) or DEFAULT_CHARSET
+
+
+class PageReader:
+    """
+    受信したチャンクを順に復号する。文字コードは先頭 CHARSET_SNIFF_BYTES バイトが揃った時点で決め、
+    以降は増分デコーダーで復号するので、生のバイト列全体は保持しない。
+    max_bytes に達するか、</head> の後に body_bytes バイト読んだら feed() が True を返す。
+    """
+
+    def __init__(self, content_type: Optional[str], max_bytes: int, body_bytes: int):
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.body_bytes = body_bytes
+        self.encoding: Optional[str] = None
+        self.bytes_read = 0
+        self.head_end: Optional[int] = None
+        self.stop_reason: Optional[str] = None
+        self._pending = b""
+        self._tail = b""
+        self._decoder = None
+        self._parts: List[str] = []
+        self._hash = hashlib.sha256()
+
+    def _decode(self, data: bytes, final: bool = False) -> None:
+        if self._decoder is None:
+            self._pending += data
+            if len(self._pending) < CHARSET_SNIFF_BYTES and not final:
+                return
+            self.encoding = sniff_charset(self._pending, self.content_type)
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+            data, self._pending = self._pending, b""
+        self._parts.append(self._decoder.decode(data, final))
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.bytes_read + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.bytes_read]
+            self.stop_reason = "capped"
+
+        if self.head_end is None:
+            # チャンクの境界をまたぐ "</head>" も見つけられるよう、前のチャンクの末尾をつなげて探す
+            window = self._tail + chunk
+            position = window.lower().find(_HEAD_END)
+            if position >= 0:
+                self.head_end = self.bytes_read - len(self._tail) + position + len(_HEAD_END)
+            self._tail = window[-(len(_HEAD_END) - 1):]
+
+        self.bytes_read += len(chunk)
+        self._hash.update(chunk)
+        self._decode(chunk)
+
+        if self.stop_reason is None and self.head_end is not None and self.bytes_read - self.head_end >= self.body_bytes:
+            self.stop_reason = "early_stop"
+        return self.stop_reason is not None
+
+    def finish(self) -> str:
+        self._decode(b"", final=True)
+        return "".join(self._parts)
+
+    @property
+    def body_hash(self) -> str:
+        return self._hash.hexdigest()
+
+
+async def fetch_page(url: str, headers: Optional[Dict[str, str]] = None, max_bytes: Optional[int] = None,
+                     body_bytes: Optional[int] = None, total_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    HTMLページをストリーミングで取得する。接続・受信待ち・全体の期限を別々に設け、
+    max_bytes（既定 PAGE_MAX_BYTES）か </head> 以降 body_bytes（既定 PAGE_BODY_BYTES）で読み込みを打ち切る。
+    304 は本文なしで返し、4xx/5xx は httpx.HTTPStatusError を送出する。
+    """
+    timeout = httpx.Timeout(PAGE_READ_TIMEOUT, connect=PAGE_CONNECT_TIMEOUT)
+    reader_limits = (max_bytes or PAGE_MAX_BYTES, body_bytes or PAGE_BODY_BYTES)
+
+    async def read() -> Dict[str, Any]:
+        async with http_client.stream("GET", url, headers=headers, timeout=timeout) as response:
+            result = {
+                "url": str(response.url),
+                "status_code": response.status_code,
+                "headers": response.headers,
+                "text": "",
+                "encoding": None,
+                "body_hash": None,
+                "bytes_read": 0,
+                "truncated": False,
+            }
+            if response.status_code == 304:
+                return result
+            response.raise_for_status()
+
+            reader = PageReader(response.headers.get("content-type"), *reader_limits)
+            async for chunk in response.aiter_bytes():
+                if reader.feed(chunk):
+                    break
+
+            _stats["pages"] += 1
+            _stats["bytes_read"] += reader.bytes_read
+            _stats["bytes_downloaded"] += response.num_bytes_downloaded
+            if reader.stop_reason:
+                _stats["early_stops" if reader.stop_reason == "early_stop" else "capped"] += 1
+                content_length = response.headers.get("content-length")
+                if content_length and content_length.isdigit():
+                    _stats["bytes_saved"] += max(0, int(content_length) - response.num_bytes_downloaded)
+
+            return {
+                **result,
+                "text": reader.finish(),
+                "encoding": reader.encoding,
+                "body_hash": reader.body_hash,
+                "bytes_read": reader.bytes_read,
+                "truncated": reader.stop_reason is not None,
+            }
+
+    deadline = total_timeout or PAGE_TOTAL_TIMEOUT
+    try:
+        return await asyncio.wait_for(read(), timeout=deadline)
+    except asyncio.TimeoutError:
+        _stats["deadline_exceeded"] += 1
+        raise PageDeadlineExceeded(f"page download exceeded {deadline} seconds: {url}")
+
+
+def page_fetch_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "max_bytes": PAGE_MAX_BYTES,
+        "body_bytes": PAGE_BODY_BYTES,
+        "connect_timeout": PAGE_CONNECT_TIMEOUT,
+        "read_timeout": PAGE_READ_TIMEOUT,
+        "total_timeout": PAGE_TOTAL_TIMEOUT,
+    }
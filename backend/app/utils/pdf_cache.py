@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", "pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def report_cache_key(report: Dict[str, Any], template_version: str) -> str:
+    """
+    レポート内容（キー順・区切りを正規化したJSON）とテンプレートのバージョンからキャッシュキーを作る。
+    """
+    canonical = json.dumps(report, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{template_version}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+class PdfDiskCache:
+    """
+    レンダリング済みPDFをディスクに保存するLRUキャッシュ。
+    合計サイズが max_bytes を超えたら、最後に使われた時刻が古いものから削除する。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _load(self) -> None:
+        # 再起動後も更新時刻（ヒット時に更新する）の順でLRUを復元する
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # 別プロセスが削除した
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def _set(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            self.stores += 1
+            self._evict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self._set, key, data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+_pdf_cache: Optional[PdfDiskCache] = None
+
+
+def get_pdf_cache() -> Optional[PdfDiskCache]:
+    """PDF_CACHE_MAX_BYTES=0 のときはキャッシュを使わない（None を返す）。"""
+    global _pdf_cache
+    if _pdf_cache is None and PDF_CACHE_MAX_BYTES > 0:
+        _pdf_cache = PdfDiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+    return _pdf_cache
@@ -1,12 +1,117 @@
+import asyncio
+import hashlib
+import importlib
 import os
-import tempfile
+import time
 from datetime import datetime
-from typing import Dict, List, Any, Optional
-import pdfkit
-from jinja2 import Environment, FileSystemLoader
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.utils.metrics import observe_stage
+from app.utils.pdf_cache import get_pdf_cache, report_cache_key
+from app.utils.singleflight import SingleFlight
 
 template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
-env = Environment(loader=FileSystemLoader(template_dir))
+TEMPLATE_NAME = "report_template.html"
+
+# テンプレートを変更したらキャッシュ済みのPDFを使わないよう、キャッシュキーに含める
+def _template_version() -> str:
+    with open(os.path.join(template_dir, TEMPLATE_NAME), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+TEMPLATE_VERSION = os.environ.get("PDF_TEMPLATE_VERSION") or _template_version()
+
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+PDF_QUEUE_MAX_DEPTH = int(os.environ.get("PDF_QUEUE_MAX_DEPTH", "20"))
+PDF_RENDER_TIMEOUT = float(os.environ.get("PDF_RENDER_TIMEOUT", "30"))
+WKHTMLTOPDF_PATH = os.environ.get("WKHTMLTOPDF_PATH")
+
+class PdfQueueFullError(Exception):
+    pass
+
+class PdfRenderTimeout(Exception):
+    pass
+
+@lru_cache(maxsize=None)
+def report_template():
+    """
+    jinja2 の読み込みとテンプレートのコンパイルは最初のレンダリング（またはウォームアップ）で1回だけ行う。
+    """
+    from jinja2 import Environment, FileSystemLoader
+
+    env = Environment(loader=FileSystemLoader(template_dir), auto_reload=False)
+    return env.get_template(TEMPLATE_NAME)
+
+@lru_cache(maxsize=None)
+def pdfkit_module():
+    """pdfkit は PDF を作るときに初めて読み込む。"""
+    return importlib.import_module("pdfkit")
+
+_render_slots: Optional[asyncio.Semaphore] = None
+_pending_renders = 0
+_stats = {
+    "renders": 0,
+    "failures": 0,
+    "timeouts": 0,
+    "rejected": 0,
+    "render_seconds_total": 0.0,
+    "render_seconds_max": 0.0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+}
+
+def render_report_html(
+    url: str,
+    product_names: List[str],
+    category_links: List[str],
+    prices: List[str],
+    advice: str,
+    competitor_summary: Optional[str] = None,
+    social_links: Optional[Dict[str, str]] = None,
+    diagnostic_scores: Optional[Dict[str, float]] = None
+) -> str:
+    """
+    レポートのHTMLを生成する
+    """
+    products = []
+    for i, name in enumerate(product_names):
+        product = {"name": name}
+        if i < len(prices):
+            product["price"] = prices[i]
+        products.append(product)
+
+    categories = category_links
+
+    scores = {
+        "sns_score": 5.0,
+        "structure_score": 5.0,
+        "ux_score": 5.0,
+        "app_score": 5.0,
+        "theme_score": 5.0
+    }
+
+    if diagnostic_scores:
+        scores.update(diagnostic_scores)
+
+    now = datetime.now()
+    date_str = now.strftime("%Y年%m月%d日 %H:%M")
+
+    return report_template().render(
+        url=url,
+        date=date_str,
+        year=now.year,
+        products=products,
+        categories=categories,
+        advice=advice,
+        competitor_summary=competitor_summary,
+        social_links=social_links,
+        scores=scores
+    )
+
+def _pdfkit_configuration():
+    if WKHTMLTOPDF_PATH:
+        return pdfkit_module().configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+    return None
 
 def generate_pdf_report(
     url: str,
@@ -19,49 +124,142 @@ def generate_pdf_report(
     diagnostic_scores: Optional[Dict[str, float]] = None
 ) -> bytes:
     """
-    HTMLテンプレートからPDFレポートを生成する
+    HTMLテンプレートからPDFレポートを生成する（同期版。イベントループ上では render_pdf_report を使う）
     """
     try:
-        template = env.get_template("report_template.html")
-        
-        products = []
-        for i, name in enumerate(product_names):
-            product = {"name": name}
-            if i < len(prices):
-                product["price"] = prices[i]
-            products.append(product)
-        
-        categories = category_links
-        
-        scores = {
-            "sns_score": 5.0,
-            "structure_score": 5.0,
-            "ux_score": 5.0,
-            "app_score": 5.0,
-            "theme_score": 5.0
-        }
-        
-        if diagnostic_scores:
-            scores.update(diagnostic_scores)
-        
-        now = datetime.now()
-        date_str = now.strftime("%Y年%m月%d日 %H:%M")
-        
-        html_content = template.render(
-            url=url,
-            date=date_str,
-            year=now.year,
-            products=products,
-            categories=categories,
-            advice=advice,
-            competitor_summary=competitor_summary,
-            social_links=social_links,
-            scores=scores
+        html_content = render_report_html(
+            url, product_names, category_links, prices, advice,
+            competitor_summary, social_links, diagnostic_scores
         )
-        
-        pdf = pdfkit.from_string(html_content, False)
-        
+
+        with observe_stage("pdf"):
+            pdf = pdfkit_module().from_string(html_content, False, configuration=_pdfkit_configuration())
+
         return pdf
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         raise e
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+async def _run_wkhtmltopdf(html_content: str, timeout: float) -> bytes:
+    """
+    wkhtmltopdf を非同期サブプロセスとして実行する。timeout 秒を超えたとき、または待っている処理が
+    キャンセルされたとき（クライアントの切断・停止）はプロセスを止めて回収する。
+    """
+    kit = pdfkit_module().PDFKit(html_content, "string", configuration=_pdfkit_configuration())
+    args = kit.command()
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=kit.environ
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input=html_content.encode("utf-8")), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        await _kill(process)
+        raise PdfRenderTimeout(f"PDF rendering exceeded {timeout} seconds")
+    except BaseException:
+        await _kill(process)
+        raise
+
+    kit.handle_error(process.returncode, (stderr or b"").decode("utf-8", errors="replace"))
+    return stdout
+
+async def render_pdf_report(
+    url: str,
+    product_names: List[str],
+    category_links: List[str],
+    prices: List[str],
+    advice: str,
+    competitor_summary: Optional[str] = None,
+    social_links: Optional[Dict[str, str]] = None,
+    diagnostic_scores: Optional[Dict[str, float]] = None,
+    timeout: Optional[float] = None
+) -> bytes:
+    """
+    generate_pdf_report の非同期版。同時レンダリング数を PDF_RENDER_WORKERS に制限し、
+    待ちが PDF_QUEUE_MAX_DEPTH を超えたら PdfQueueFullError を送出する。
+    """
+    global _render_slots, _pending_renders
+    if _pending_renders >= PDF_RENDER_WORKERS + PDF_QUEUE_MAX_DEPTH:
+        _stats["rejected"] += 1
+        raise PdfQueueFullError("PDF render queue is full")
+    if _render_slots is None:
+        _render_slots = asyncio.Semaphore(PDF_RENDER_WORKERS)
+
+    _pending_renders += 1
+    queued_at = time.perf_counter()
+    try:
+        async with _render_slots:
+            started_at = time.perf_counter()
+            wait = started_at - queued_at
+            _stats["queue_wait_seconds_total"] += wait
+            _stats["queue_wait_seconds_max"] = max(_stats["queue_wait_seconds_max"], wait)
+
+            html_content = render_report_html(
+                url, product_names, category_links, prices, advice,
+                competitor_summary, social_links, diagnostic_scores
+            )
+            try:
+                with observe_stage("pdf"):
+                    pdf = await _run_wkhtmltopdf(html_content, timeout or PDF_RENDER_TIMEOUT)
+            except PdfRenderTimeout:
+                _stats["timeouts"] += 1
+                raise
+            except Exception as e:
+                _stats["failures"] += 1
+                print(f"Error generating PDF: {str(e)}")
+                raise
+
+            elapsed = time.perf_counter() - started_at
+            _stats["renders"] += 1
+            _stats["render_seconds_total"] += elapsed
+            _stats["render_seconds_max"] = max(_stats["render_seconds_max"], elapsed)
+            return pdf
+    finally:
+        _pending_renders -= 1
+
+_render_flights = SingleFlight()
+
+async def render_pdf_report_cached(report: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[bytes, bool]:
+    """
+    render_pdf_report のキャッシュつき版。report は render_pdf_report のキーワード引数。
+    (PDF, キャッシュまたは同時に走っていた同じレンダリングの結果を使ったか) を返す。
+    """
+    cache = get_pdf_cache()
+    if cache is None:
+        return await render_pdf_report(**report, timeout=timeout), False
+
+    key = report_cache_key(report, TEMPLATE_VERSION)
+    pdf = await cache.get(key)
+    if pdf is not None:
+        return pdf, True
+
+    async def render() -> bytes:
+        rendered = await render_pdf_report(**report, timeout=timeout)
+        try:
+            await cache.set(key, rendered)
+        except OSError as e:
+            print(f"Error caching PDF: {str(e)}")
+        return rendered
+
+    return await _render_flights.do(key, render)
+
+def pdf_render_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "workers": PDF_RENDER_WORKERS,
+        "queue_max_depth": PDF_QUEUE_MAX_DEPTH,
+        "pending": _pending_renders,
+    }
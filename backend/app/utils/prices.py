@@ -0,0 +1,144 @@
+import os
+import re
+import unicodedata
+from itertools import starmap
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 外れ値の判定（対数価格の四分位範囲の何倍まで外を許すか）。価格は桁で散らばるので対数で見る
+PRICE_OUTLIER_IQR_FACTOR = float(os.environ.get("PRICE_OUTLIER_IQR_FACTOR", "1.5"))
+# 四分位で外れ値を判定するのに必要な最小件数
+PRICE_OUTLIER_MIN_COUNT = 4
+
+# 桁区切りのカンマを含めて数値を取り、"万" がつけば1万倍する。
+# np.fromstring は ASCII の数字しか読めないので、正規表現は re.ASCII でコンパイルする（全角数字は NFKC で半角になる）
+_NUMBER = r"(\d+(?:,\d{3})*(?:\.\d+)?)(万)?"
+_CURRENCY = r"[¥$€£]?"
+# 全角の英数字・記号（U+FF01〜FF5E）・全角スペース・全角の円記号。どれもなければ NFKC を省く
+_FULL_WIDTH = re.compile("[\uff01-\uff5e\u3000\uffe5]")
+# 数値のあとの "(税込)"。"(税込¥1,100)" のように後ろに価格が続く場合は、その価格のほうにかかる
+_TAX_SUFFIX = r" *円? *[(\[]? *(税込)(?!み?[ :]*" + _CURRENCY + r" *\d)"
+# 各行（価格1件）の先頭で必ず1回マッチする。最初の数値と、それが "¥2,980〜¥3,980"・"2980-3980円"・
+# "1万〜2万円" のような価格帯の下限なら上限を取る。最初の数値に "(税込)" がついているかも見る
+_LINE = re.compile(
+    r"^[^\d\n]*(?:" + _NUMBER + r"(?: *円? *(?:〜|~|-|‐|–|—|から) *" + _CURRENCY + r" *" + _NUMBER + r")?"
+    + r"(?:" + _TAX_SUFFIX + r")?)?",
+    re.MULTILINE | re.ASCII,
+)
+# findall の1行分（下限, 万, 上限, 万, 税込）を "0<下限> 0<上限> 0<税込なら1>" にする。
+# 数値がなければ "0" になり、0 は価格なしとして扱う
+_LINE_FORMAT = "0{}{} 0{}{} 0{}".format
+# "税込¥1,100"・"¥1,100(税込)" のように税込と明示された価格（税抜と並んでいれば、こちらを使う）
+_TAX_INCLUDED = re.compile(r"税込み?[ :]*" + _CURRENCY + r" *" + _NUMBER + r"|(?<![\d.,])" + _NUMBER + _TAX_SUFFIX, re.ASCII)
+
+
+def _normalize_batch(prices: Sequence[Any]) -> str:
+    """全件を改行で1つの文字列にまとめ、全角数字・全角記号があれば NFKC で半角にする（全件で1回）。"""
+    try:
+        text = "\n".join(prices)
+        if text.count("\n") != len(prices) - 1:
+            raise TypeError
+    except TypeError:
+        text = "\n".join("" if price is None else str(price).replace("\n", " ") for price in prices)
+    if _FULL_WIDTH.search(text):
+        text = unicodedata.normalize("NFKC", text)
+    return text
+
+
+def _parse_number(number: str, man: Optional[str]) -> float:
+    return float(number.replace(",", "")) * (10000 if man else 1)
+
+
+def parse_price_array(prices: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    価格表記の並びをまとめて (low, high) の float64 配列にする。価格の読めない要素（と 0）は NaN。
+
+    - 通貨記号・"円"・桁区切り・全角数字は無視し、"1.5万円" は 15000 とする
+    - "¥2,980〜¥3,980" のような価格帯は low=2980, high=3980（単一の価格は low == high）
+    - "¥5,980 ¥7,980" のように価格帯の記号なしで並ぶ場合はセール価格とみなして最初の価格を使う
+    - 価格帯でなく、税込と明示された価格があれば、それを使う（"¥1,000(税込¥1,100)" は 1100）
+
+    全件をつないだ1つの文字列に正規表現を1回かけ、取り出した数値を1つの文字列にまとめて
+    np.fromstring で一度に変換する。1件ずつ読み直すのは、最初の価格以外に "税込" がかかる行だけ。
+    """
+    size = len(prices)
+    if not size:
+        return np.empty(0), np.empty(0)
+    text = _normalize_batch(prices)
+    numbers = " ".join(starmap(_LINE_FORMAT, _LINE.findall(text)))
+    columns = np.fromstring(numbers.replace(",", "").replace("万", "e4").replace("税込", "1"), sep=" ")
+    columns = columns.reshape(size, 3)
+    low = np.where(columns[:, 0] > 0, columns[:, 0], np.nan)
+    is_range = columns[:, 1] > 0
+    high = np.where(is_range, columns[:, 1], low)
+
+    marked = int(np.count_nonzero(columns[:, 2]))
+    if text.count("税込") > marked:
+        line_breaks = np.flatnonzero(np.frombuffer(text.encode("utf-32-le"), dtype="<u4") == 10)
+        starts = np.fromiter((match.start() for match in re.finditer("税込", text)), dtype=np.int64)
+        candidates = np.unique(np.searchsorted(line_breaks, starts, side="right"))
+        candidates = candidates[~is_range[candidates] & (columns[candidates, 2] == 0)]
+        if candidates.size:
+            lines = text.split("\n")
+            for i in candidates.tolist():
+                match = _TAX_INCLUDED.search(lines[i])
+                if match:
+                    low[i] = high[i] = _parse_number(*(match.group(1, 2) if match.group(1) else match.group(3, 4)))
+    return low, high
+
+
+def parse_prices(prices: Sequence[Any]) -> List[float]:
+    """
+    価格表記を数値のリストにする（価格帯は下限）。数字を含まないものは除く。
+    """
+    low, _ = parse_price_array(list(prices))
+    return low[~np.isnan(low)].tolist()
+
+
+def price_statistics(prices: Sequence[Any], iqr_factor: float = PRICE_OUTLIER_IQR_FACTOR) -> Dict[str, Any]:
+    """
+    価格表記の並びから、件数・最小・最大・中央値・四分位をまとめて計算する。
+
+    0 以下の価格は除く。件数が PRICE_OUTLIER_MIN_COUNT 以上なら、対数価格の四分位範囲の
+    iqr_factor 倍より外にある価格（"¥1" のダミーや桁違いの価格）を外れ値とし、min/max から除く。
+    中央値と四分位は外れ値を含む全件で計算する。価格がなければ数値の項目は None。
+    """
+    low, high = parse_price_array(list(prices))
+    valid = ~np.isnan(low) & (low > 0)
+    low, high = low[valid], high[valid]
+    stats: Dict[str, Any] = {"count": int(low.size), "unparsed": int(len(valid) - low.size), "outliers": 0,
+                             "min": None, "max": None, "median": None, "q1": None, "q3": None}
+    if not low.size:
+        return stats
+
+    q1, median, q3 = np.percentile(low, [25, 50, 75])
+    inliers = np.ones(low.size, dtype=bool)
+    if low.size >= PRICE_OUTLIER_MIN_COUNT:
+        log_low = np.log10(low)
+        log_q1, log_q3 = np.percentile(log_low, [25, 75])
+        spread = (log_q3 - log_q1) * iqr_factor
+        inliers = (log_low >= log_q1 - spread) & (log_low <= log_q3 + spread)
+    stats.update({
+        "outliers": int(low.size - inliers.sum()),
+        "min": float(low[inliers].min()),
+        "max": float(high[inliers].max()),
+        "median": float(median),
+        "q1": float(q1),
+        "q3": float(q3),
+    })
+    return stats
+
+
+def format_price(value: float) -> str:
+    return f"{int(value):,}円" if float(value).is_integer() else f"{value:,.2f}円"
+
+
+def format_price_range(stats: Dict[str, Any]) -> Optional[str]:
+    """price_statistics の結果を "2,980円〜12,800円（中央値 5,980円）" の形にする。価格がなければ None。"""
+    if not stats["count"]:
+        return None
+    text = f"{format_price(stats['min'])}〜{format_price(stats['max'])}（中央値 {format_price(stats['median'])}"
+    if stats["outliers"]:
+        text += f"、外れ値{stats['outliers']}件を除く"
+    return text + "）"
@@ -0,0 +1,160 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.utils.prices import parse_prices
+
+SCORING_CONFIG_PATH = os.environ.get(
+    "SCORING_CONFIG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "scoring_weights.json"),
+)
+
+SCORE_NAMES = ["sns_score", "structure_score", "ux_score", "app_score", "theme_score"]
+
+# fetch_url_content の結果から取り出す生の指標（AnalysisResponse.signals として保存される）
+SIGNAL_NAMES = [
+    "social_count", "mobile_friendly", "has_search", "has_reviews",
+    "product_count", "category_count", "price_count", "price_min", "price_max",
+]
+
+# 生の指標を 0〜1 に正規化した特徴量。設定ファイルの weights はこの名前で指定する
+FEATURE_NAMES = [
+    "social", "mobile_friendly", "has_search", "has_reviews",
+    "products", "categories", "has_prices", "price_spread",
+]
+
+# run_analysis が実データの代わりに入れるサンプルのSNSリンク
+_PLACEHOLDER_SOCIAL_MARKER = "sample_store"
+
+
+def _signals(social_links: Dict[str, Any], mobile_friendly: Any, has_search: Any, has_reviews: Any,
+             product_count: Any, category_count: Any, prices: Iterable[Any]) -> Dict[str, float]:
+    values = [price for price in parse_prices(prices) if price > 0]
+    social_count = sum(
+        1 for link in (social_links or {}).values() if link and _PLACEHOLDER_SOCIAL_MARKER not in str(link)
+    )
+    return {
+        "social_count": float(social_count),
+        "mobile_friendly": float(bool(mobile_friendly)),
+        "has_search": float(bool(has_search)),
+        "has_reviews": float(bool(has_reviews)),
+        "product_count": float(product_count or 0),
+        "category_count": float(category_count or 0),
+        "price_count": float(len(values)),
+        "price_min": min(values) if values else 0.0,
+        "price_max": max(values) if values else 0.0,
+    }
+
+
+def extract_signals(url_data: Dict[str, Any]) -> Dict[str, float]:
+    """
+    fetch_url_content の結果からスコア計算に使う指標を取り出す。
+    """
+    return _signals(
+        url_data.get("social_links"),
+        url_data.get("mobile_friendly"),
+        url_data.get("has_search"),
+        url_data.get("has_reviews"),
+        url_data.get("product_count", len(url_data.get("product_names") or [])),
+        url_data.get("category_count", len(url_data.get("category_links") or [])),
+        url_data.get("prices") or [],
+    )
+
+
+def signals_from_history(row: Dict[str, Any]) -> Dict[str, float]:
+    """
+    analysis_history の行から指標を取り出す。signals を保存する前の行は、
+    残っている列（件数・価格・SNSリンク）から推定し、わからない項目は 0 とする。
+    """
+    summary = row.get("summary_json") or {}
+    if summary.get("signals"):
+        return {name: float(summary["signals"].get(name) or 0) for name in SIGNAL_NAMES}
+    return _signals(
+        summary.get("social_links"),
+        False,
+        False,
+        False,
+        row.get("product_count") or len(summary.get("product_names") or []),
+        row.get("category_count") or len(summary.get("category_links") or []),
+        summary.get("prices") or [],
+    )
+
+
+def signal_matrix(signals: List[Dict[str, float]]) -> np.ndarray:
+    """指標の辞書のリストを (件数, len(SIGNAL_NAMES)) の行列にする。"""
+    matrix = np.zeros((len(signals), len(SIGNAL_NAMES)), dtype=np.float64)
+    for i, row in enumerate(signals):
+        matrix[i] = [row.get(name) or 0.0 for name in SIGNAL_NAMES]
+    return matrix
+
+
+class ScoringModel:
+    """
+    設定ファイルの重みで診断スコアを計算するルールベースのモデル。
+    スコア = clip(bias + 特徴量 @ 重み, 0, 10) で、同じ入力からは常に同じスコアになる。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.version = str(config["version"])
+        saturation = config.get("saturation", {})
+        self.social_saturation = float(saturation.get("social_count", 4))
+        self.product_saturation = float(saturation.get("product_count", 200))
+        self.category_saturation = float(saturation.get("category_count", 20))
+        self.spread_saturation = float(saturation.get("price_spread", 10))
+
+        self.bias = np.zeros(len(SCORE_NAMES))
+        self.weights = np.zeros((len(FEATURE_NAMES), len(SCORE_NAMES)))
+        for j, score_name in enumerate(SCORE_NAMES):
+            score_config = config["scores"][score_name]
+            self.bias[j] = float(score_config.get("bias", 0))
+            for feature, weight in score_config.get("weights", {}).items():
+                if feature not in FEATURE_NAMES:
+                    raise ValueError(f"unknown scoring feature: {feature}")
+                self.weights[FEATURE_NAMES.index(feature), j] = float(weight)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScoringModel":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def features(self, signals: np.ndarray) -> np.ndarray:
+        """(件数, 指標) の行列を 0〜1 の特徴量 (件数, len(FEATURE_NAMES)) に変換する。"""
+        s = {name: signals[:, i] for i, name in enumerate(SIGNAL_NAMES)}
+        has_spread = (s["price_count"] >= 2) & (s["price_min"] > 0)
+        ratio = np.where(has_spread, s["price_max"] / np.where(has_spread, s["price_min"], 1.0), 1.0)
+        features = np.column_stack([
+            s["social_count"] / self.social_saturation,
+            s["mobile_friendly"],
+            s["has_search"],
+            s["has_reviews"],
+            np.log1p(s["product_count"]) / np.log1p(self.product_saturation),
+            np.log1p(s["category_count"]) / np.log1p(self.category_saturation),
+            s["price_count"] > 0,
+            np.log(ratio) / np.log(self.spread_saturation),
+        ])
+        return np.clip(features, 0.0, 1.0)
+
+    def score_matrix(self, signals: np.ndarray) -> np.ndarray:
+        """(件数, 指標) の行列をまとめて採点し、(件数, len(SCORE_NAMES)) のスコアを返す。"""
+        signals = np.atleast_2d(np.asarray(signals, dtype=np.float64))
+        scores = self.bias + self.features(signals) @ self.weights
+        return np.round(np.clip(scores, 0.0, 10.0), 1)
+
+    def score_batch(self, signals: List[Dict[str, float]]) -> np.ndarray:
+        return self.score_matrix(signal_matrix(signals))
+
+    def score(self, signals: Dict[str, float]) -> Dict[str, float]:
+        row = self.score_batch([signals])[0]
+        return {name: float(value) for name, value in zip(SCORE_NAMES, row)}
+
+
+_scoring_model: Optional[ScoringModel] = None
+
+
+def get_scoring_model() -> ScoringModel:
+    global _scoring_model
+    if _scoring_model is None:
+        _scoring_model = ScoringModel.from_file(SCORING_CONFIG_PATH)
+    return _scoring_model
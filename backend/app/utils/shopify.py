@@ -0,0 +1,436 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+
+from app.utils import http_client
+
+SHOPIFY_API_VERSION = os.environ.get("SHOPIFY_API_VERSION", "2024-07")
+# 全ストアの Admin API の向き先を差し替える（ローカルの代替サーバーでのテスト用）。未設定なら https://<ストア>
+SHOPIFY_API_BASE_URL = os.environ.get("SHOPIFY_API_BASE_URL") or None
+SHOPIFY_PAGE_SIZE = int(os.environ.get("SHOPIFY_PAGE_SIZE", "250"))
+SHOPIFY_PREFETCH_PAGES = int(os.environ.get("SHOPIFY_PREFETCH_PAGES", "2"))
+SHOPIFY_CHECKPOINT_PAGES = int(os.environ.get("SHOPIFY_CHECKPOINT_PAGES", "40"))
+SHOPIFY_MAX_RETRIES = int(os.environ.get("SHOPIFY_MAX_RETRIES", "4"))
+SHOPIFY_RETRY_BASE_DELAY = float(os.environ.get("SHOPIFY_RETRY_BASE_DELAY", "1"))
+SHOPIFY_ORDER_STORE_DIR = os.environ.get("SHOPIFY_ORDER_STORE_DIR", "shopify_orders")
+
+ORDER_FIELDS = "id,created_at,total_price,customer,cancelled_at,test"
+
+_stats = {
+    "syncs": 0,
+    "sync_failures": 0,
+    "pages": 0,
+    "orders_fetched": 0,
+    "retries": 0,
+    "sync_seconds_total": 0.0,
+}
+
+
+class ShopifyError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def shop_domain(store_name: str) -> str:
+    """"my-store" も "my-store.myshopify.com" も "my-store.myshopify.com" にそろえる。"""
+    store_name = store_name.strip().lower()
+    store_name = re.sub(r"^https?://", "", store_name).rstrip("/")
+    return store_name if "." in store_name else f"{store_name}.myshopify.com"
+
+
+class OrderColumns:
+    """
+    注文を列ごとの NumPy 配列で持つ（1件あたり32バイト）。キャンセル済みとテスト注文は含めない。
+
+    - ids: 注文ID（int64、昇順）
+    - created_at: 注文日時（ストアの現地時刻、datetime64[s]）
+    - customer_ids: 顧客ID（int64、ゲスト購入は 0）
+    - totals: 注文金額（float64、ストアの通貨）
+    - last_order_id: 取り込み済みの最大の注文ID（次回の since_id。除外した注文も含む）
+    """
+
+    def __init__(self, ids: np.ndarray, created_at: np.ndarray, customer_ids: np.ndarray, totals: np.ndarray,
+                 last_order_id: int = 0):
+        self.ids = ids
+        self.created_at = created_at
+        self.customer_ids = customer_ids
+        self.totals = totals
+        self.last_order_id = int(last_order_id)
+
+    @classmethod
+    def empty(cls) -> "OrderColumns":
+        return cls(np.empty(0, np.int64), np.empty(0, "datetime64[s]"), np.empty(0, np.int64), np.empty(0, np.float64))
+
+    @classmethod
+    def from_orders(cls, orders: Sequence[Dict[str, Any]]) -> "OrderColumns":
+        """Admin API の注文（ORDER_FIELDS の列）の1ページ分を列に変換する。"""
+        kept = [order for order in orders if not order.get("cancelled_at") and not order.get("test")]
+        last_order_id = max((int(order["id"]) for order in orders), default=0)
+        return cls(
+            np.array([order["id"] for order in kept], dtype=np.int64),
+            # "2025-01-05T10:00:00+09:00" の先頭19文字（現地時刻）を読む。月の集計はストアの現地時刻で行う
+            np.array([order["created_at"][:19] for order in kept], dtype="datetime64[s]"),
+            np.array([(order.get("customer") or {}).get("id") or 0 for order in kept], dtype=np.int64),
+            np.array([order.get("total_price") or 0 for order in kept], dtype=np.float64),
+            last_order_id,
+        )
+
+    @classmethod
+    def concat(cls, parts: Sequence["OrderColumns"]) -> "OrderColumns":
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return cls.empty()
+        return cls(
+            np.concatenate([part.ids for part in parts]),
+            np.concatenate([part.created_at for part in parts]),
+            np.concatenate([part.customer_ids for part in parts]),
+            np.concatenate([part.totals for part in parts]),
+            max(part.last_order_id for part in parts),
+        )
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.created_at.nbytes + self.customer_ids.nbytes + self.totals.nbytes
+
+
+class ShopifyOrderStore:
+    """
+    ユーザーが連携したストアごとの注文を directory/<ユーザーのハッシュ>/<ストアのドメイン>.npz に保存する。
+    同じストアを別のユーザーが連携しても、それぞれのトークンで取り込んだ注文は別のファイルになる。
+    書き込みは一時ファイルに書いてから置き換えるので、途中で落ちても前回の内容が残る。
+    読み込んだ列はファイルの更新時刻とともにメモリに残し、ファイルが変わっていなければ読み直さない。
+    """
+
+    def __init__(self, directory: str = SHOPIFY_ORDER_STORE_DIR):
+        self.directory = directory
+        self._cache: Dict[str, Any] = {}
+
+    def path(self, user_email: str, domain: str) -> str:
+        owner = hashlib.sha256(user_email.strip().lower().encode()).hexdigest()[:32]
+        return os.path.join(self.directory, owner, re.sub(r"[^a-z0-9.-]", "_", domain.lower()) + ".npz")
+
+    def load(self, user_email: str, domain: str) -> OrderColumns:
+        path = self.path(user_email, domain)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._cache.pop(path, None)
+            return OrderColumns.empty()
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with np.load(path) as data:
+            columns = OrderColumns(data["ids"], data["created_at"], data["customer_ids"], data["totals"],
+                                   int(data["last_order_id"]))
+        self._cache[path] = (mtime, columns)
+        return columns
+
+    def save(self, user_email: str, domain: str, columns: OrderColumns) -> None:
+        path = self.path(user_email, domain)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, ids=columns.ids, created_at=columns.created_at, customer_ids=columns.customer_ids,
+                         totals=columns.totals, last_order_id=np.int64(columns.last_order_id))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._cache[path] = (os.stat(path).st_mtime_ns, columns)
+
+    def delete(self, user_email: str, domain: str) -> None:
+        path = self.path(user_email, domain)
+        self._cache.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ShopifyClient:
+    """
+    Admin API（REST）の注文をページ単位で読む。
+
+    カーソル（Link ヘッダーの page_info）でたどるので、次のページのURLは前のページを受け取るまでわからない。
+    そのかわり、受け取ったページを呼び出し側が列に変換している間に、prefetch ページ先まで取得を進めておく。
+    429・5xx・接続エラーは Retry-After（なければ指数バックオフ）に従って max_retries 回まで再試行する。
+    """
+
+    def __init__(self, domain: str, access_token: str, base_url: Optional[str] = SHOPIFY_API_BASE_URL,
+                 api_version: str = SHOPIFY_API_VERSION, page_size: int = SHOPIFY_PAGE_SIZE,
+                 prefetch: int = SHOPIFY_PREFETCH_PAGES, max_retries: int = SHOPIFY_MAX_RETRIES,
+                 retry_base_delay: float = SHOPIFY_RETRY_BASE_DELAY):
+        self.domain = domain
+        self.access_token = access_token
+        self.api_url = f"{(base_url or f'https://{domain}').rstrip('/')}/admin/api/{api_version}"
+        self.page_size = page_size
+        self.prefetch = max(1, prefetch)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        headers = {"X-Shopify-Access-Token": self.access_token, "Accept": "application/json"}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await http_client.get(url, params=params, headers=headers)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise ShopifyError(f"Shopify request failed: {str(e) or type(e).__name__}") from e
+                response = None
+            if response is not None and response.status_code < 400:
+                return response
+            if response is not None and (
+                (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries
+            ):
+                raise ShopifyError(f"Shopify returned {response.status_code}: {response.text[:200]}",
+                                   status_code=response.status_code)
+            try:
+                delay = float(response.headers["retry-after"])
+            except (AttributeError, KeyError, ValueError):
+                delay = self.retry_base_delay * (2 ** attempt) * random.uniform(0.5, 1.0)
+            _stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def verify(self) -> Dict[str, Any]:
+        """トークンでストアの情報（shop.json）を読めるか確かめる。読めなければ ShopifyError。"""
+        response = await self._get(f"{self.api_url}/shop.json")
+        return response.json().get("shop") or {}
+
+    async def order_pages(self, since_id: int = 0) -> AsyncIterator[List[Dict[str, Any]]]:
+        """since_id より新しい注文を、ID の昇順に1ページずつ返す。"""
+        pages: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=self.prefetch)
+        done = object()
+
+        async def produce() -> None:
+            url: Optional[str] = f"{self.api_url}/orders.json"
+            params: Optional[Dict[str, Any]] = {"status": "any", "limit": self.page_size, "since_id": since_id,
+                                                "order": "id asc", "fields": ORDER_FIELDS}
+            try:
+                while url:
+                    response = await self._get(url, params)
+                    await pages.put(response.json().get("orders") or [])
+                    # 次のページのURLにはカーソルと limit・fields が入っている
+                    url, params = response.links.get("next", {}).get("url"), None
+                await pages.put(done)
+            except Exception as e:
+                await pages.put(e)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                page = await pages.get()
+                if page is done:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            producer.cancel()
+
+
+async def sync_orders(client: ShopifyClient, store: ShopifyOrderStore, user_email: str,
+                      checkpoint_pages: int = SHOPIFY_CHECKPOINT_PAGES) -> Dict[str, Any]:
+    """
+    user_email が連携したストアの、保存済みの最大の注文IDより新しい注文を取り込み、store に追記する。
+    checkpoint_pages ページごとに途中まで保存するので、失敗しても次回はそこから再開する。
+    """
+    started = time.perf_counter()
+    columns = await asyncio.to_thread(store.load, user_email, client.domain)
+    since_id = columns.last_order_id
+    parts: List[OrderColumns] = [columns]
+    pages = fetched = 0
+    _stats["syncs"] += 1
+    try:
+        async for page in client.order_pages(since_id):
+            parts.append(OrderColumns.from_orders(page))
+            pages += 1
+            fetched += len(page)
+            _stats["pages"] += 1
+            _stats["orders_fetched"] += len(page)
+            if checkpoint_pages and pages % checkpoint_pages == 0:
+                parts = [OrderColumns.concat(parts)]
+                await asyncio.to_thread(store.save, user_email, client.domain, parts[0])
+    except Exception:
+        _stats["sync_failures"] += 1
+        raise
+    finally:
+        _stats["sync_seconds_total"] += time.perf_counter() - started
+    columns = OrderColumns.concat(parts)
+    if fetched:
+        await asyncio.to_thread(store.save, user_email, client.domain, columns)
+    return {
+        "store": client.domain,
+        "since_id": since_id,
+        "pages": pages,
+        "orders_fetched": fetched,
+        "orders": len(columns),
+        "last_order_id": columns.last_order_id,
+        "stored_bytes": columns.nbytes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def shopify_stats() -> Dict[str, Any]:
+    return {**_stats, "sync_seconds_total": round(_stats["sync_seconds_total"], 3)}
+
+
+def _month_labels(months: np.ndarray) -> List[str]:
+    return [str(month) for month in months.astype("datetime64[M]")]
+
+
+def _customer_index(columns: OrderColumns):
+    """ゲスト以外の注文の位置と、その顧客の通し番号（0..顧客数-1）を返す。"""
+    known = np.flatnonzero(columns.customer_ids > 0)
+    customers, index = np.unique(columns.customer_ids[known], return_inverse=True)
+    return known, index, customers.size
+
+
+def _first_order_months(months: np.ndarray, customer_index: np.ndarray, customer_count: int) -> np.ndarray:
+    """顧客ごとの初回購入月（1970年1月からの月数）。"""
+    first_months = np.full(customer_count, np.iinfo(np.int64).max)
+    np.minimum.at(first_months, customer_index, months)
+    return first_months
+
+
+def revenue_summary(columns: OrderColumns, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+    """
+    期間（start 以上 end 未満、"2025-01-01" の形）の売上・注文数・顧客数・リピート顧客数・AOV と、
+    注文のあった月ごとの推移を返す。形はフロントエンドの ShopifyRevenueData に合わせる。
+
+    - repeat_customers: 期間内に2回以上購入した顧客
+    - 月ごとの returning_customers: その月に購入した顧客のうち、それより前の月（期間外も含む）に初回購入した顧客
+    """
+    all_months = columns.created_at.astype("datetime64[M]").astype(np.int64)
+    known, customer_index, customer_count = _customer_index(columns)
+    first_months = _first_order_months(all_months[known], customer_index, customer_count)
+
+    mask = np.ones(len(columns), dtype=bool)
+    if start:
+        mask &= columns.created_at >= np.datetime64(start, "s")
+    if end:
+        mask &= columns.created_at < np.datetime64(end, "s")
+    totals, months = columns.totals[mask], all_months[mask]
+    known_mask = mask[known]
+    customers, months_known = customer_index[known_mask], all_months[known][known_mask]
+
+    per_customer = np.bincount(customers, minlength=customer_count)
+    unique_customers = int(np.count_nonzero(per_customer))
+    repeat_customers = int(np.count_nonzero(per_customer >= 2))
+    total_orders, total_revenue = int(totals.size), float(totals.sum())
+
+    # 月は最初の月からの通し番号にして bincount で数える（注文のない月は最後に除く）
+    first_month = int(months.min()) if months.size else 0
+    span = int(months.max()) - first_month + 1 if months.size else 0
+    orders = np.bincount(months - first_month, minlength=span)
+    revenue = np.bincount(months - first_month, weights=totals, minlength=span)
+    # (月, 顧客) の組を重複なしにして、月ごとの購入顧客数と、そのうち以前に初回購入していた顧客数を数える
+    stride = np.int64(max(customer_count, 1))
+    pairs = np.unique((months_known - first_month) * stride + customers)
+    pair_months, pair_customers = pairs // stride, pairs % stride
+    buyers = np.bincount(pair_months, minlength=span)
+    returning = np.bincount(pair_months[first_months[pair_customers] < pair_months + first_month], minlength=span)
+
+    active = np.flatnonzero(orders)
+    trend_months = active + first_month
+    orders, revenue, buyers, returning = orders[active], revenue[active], buyers[active], returning[active]
+    labels = _month_labels(trend_months)
+    return {
+        "total_orders": total_orders,
+        "total_revenue": round(total_revenue, 2),
+        "unique_customers": unique_customers,
+        "repeat_customers": repeat_customers,
+        "repeat_purchase_rate": round(repeat_customers / unique_customers, 4) if unique_customers else 0.0,
+        "aov": round(total_revenue / total_orders, 2) if total_orders else 0.0,
+        "time_period": f"{labels[0]}〜{labels[-1]}" if labels else "",
+        "monthly_trends": [
+            {
+                "month": label,
+                "orders": int(orders[i]),
+                "revenue": round(float(revenue[i]), 2),
+                "aov": round(float(revenue[i] / orders[i]), 2),
+                "customers": int(buyers[i]),
+                "returning_customers": int(returning[i]),
+            }
+            for i, label in enumerate(labels)
+        ],
+    }
+
+
+def cohort_ltv(columns: OrderColumns, max_months: int = 24) -> List[Dict[str, Any]]:
+    """
+    初回購入月ごとのコホートについて、初回購入から0..N か月目までの累計売上÷顧客数（LTV）を返す。
+    データの最終月までに経過した月の分だけを返す（途中の月は売上がなくても含める）。ゲスト購入は含めない。
+    """
+    known, customer_index, customer_count = _customer_index(columns)
+    if not customer_count:
+        return []
+    months = columns.created_at[known].astype("datetime64[M]").astype(np.int64)
+    first_months = _first_order_months(months, customer_index, customer_count)
+    first_cohort, last_month = int(first_months.min()), int(months.max())
+    cohort_count, ages = last_month - first_cohort + 1, min(max_months, last_month - first_cohort) + 1
+
+    age = months - first_months[customer_index]
+    in_range = age < ages
+    cells = (first_months[customer_index][in_range] - first_cohort) * ages + age[in_range]
+    revenue = np.bincount(cells, weights=columns.totals[known][in_range], minlength=cohort_count * ages)
+    sizes = np.bincount(first_months - first_cohort, minlength=cohort_count)
+    ltv = np.cumsum(revenue.reshape(cohort_count, ages), axis=1) / np.maximum(sizes, 1)[:, None]
+
+    labels = _month_labels(np.arange(first_cohort, last_month + 1))
+    return [
+        {"cohort": labels[c], "customers": int(sizes[c]),
+         "ltv": [round(float(value), 2) for value in ltv[c, :min(ages, last_month - first_cohort - c + 1)]]}
+        for c in range(cohort_count) if sizes[c]
+    ]
+
+
+def ltv_validation(columns: OrderColumns, observed_months: int = 3, horizon_months: int = 12) -> Optional[Dict[str, Any]]:
+    """
+    初回購入から observed_months か月の実績で horizon_months か月のLTVを予測し、実績と比べる。
+    horizon_months か月が経過したコホートそれぞれについて、他のコホートの倍率（horizon / observed）の
+    中央値で予測する（leave-one-out）。形はフロントエンドの LtvValidation に合わせる。
+    経過したコホートが2つ未満なら None。
+    """
+    # ltv[k] は 0..k か月目の累計なので、n か月分の LTV は ltv[n - 1]（観測・予測の期間とも同じ数え方）
+    cohorts = [cohort for cohort in cohort_ltv(columns, horizon_months - 1)
+               if len(cohort["ltv"]) >= horizon_months and cohort["ltv"][observed_months - 1] > 0]
+    if len(cohorts) < 2:
+        return None
+    sizes = np.array([cohort["customers"] for cohort in cohorts], dtype=np.float64)
+    observed = np.array([cohort["ltv"][observed_months - 1] for cohort in cohorts])
+    actual = np.array([cohort["ltv"][horizon_months - 1] for cohort in cohorts])
+    ratios = actual / observed
+    others = ~np.eye(len(cohorts), dtype=bool)
+    predicted = observed * np.array([np.median(ratios[row]) for row in others])
+
+    predicted_ltv = float(np.average(predicted, weights=sizes))
+    actual_ltv = float(np.average(actual, weights=sizes))
+    accuracy = max(0.0, 1 - abs(predicted_ltv - actual_ltv) / actual_ltv) if actual_ltv else 0.0
+    best = cohorts[int(np.argmax(actual))]
+    insights = [
+        f"初回購入から{observed_months}か月のLTVは平均{float(np.average(observed, weights=sizes)):,.0f}円、"
+        f"{horizon_months}か月では{actual_ltv:,.0f}円（{float(np.median(ratios)):.2f}倍）です。",
+        f"{horizon_months}か月LTVが最も高いコホートは{best['cohort']}（{best['ltv'][horizon_months - 1]:,.0f}円、"
+        f"{best['customers']}人）です。",
+    ]
+    if accuracy < 0.8:
+        insights.append("コホートごとのLTVのばらつきが大きいため、予測の精度は低めです。")
+    return {
+        "predicted_ltv": round(predicted_ltv, 2),
+        "actual_ltv": round(actual_ltv, 2),
+        "accuracy": round(accuracy, 4),
+        "insights": insights,
+    }
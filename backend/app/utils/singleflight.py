@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら新しく始めず、実行中の結果を共有する。
+    呼び出し元の1つがキャンセルされても、共有中の処理は他の呼び出し元のために継続する。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        (結果, 他の呼び出しの結果を共有したか) を返す。
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            self.leaders += 1
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call), shared
+
+    def _forget(self, key: Hashable, call: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
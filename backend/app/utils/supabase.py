@@ -1,39 +1,147 @@
-from datetime import datetime, timedelta
+import asyncio
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
 import os
-from supabase import create_client
-from typing import Dict, Any, Optional, List
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Any, Optional, List, Tuple, TypeVar
 
 from app.models.user_settings import UserSettings
 from app.utils.crypto import encrypt_api_key, decrypt_api_key
+from app.utils.metrics import observe_supabase_call
+from app.utils.ttl_cache import TTLCache
 
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(supabase_url, supabase_key)
+if TYPE_CHECKING:
+    from supabase import Client
+
+SUPABASE_MAX_WORKERS = int(os.environ.get("SUPABASE_MAX_WORKERS", "16"))
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "10"))
+USER_CONTEXT_CACHE_TTL = float(os.environ.get("USER_CONTEXT_CACHE_TTL", "300"))
+USER_CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CONTEXT_CACHE_MAX_ENTRIES", "10000"))
+
+# クライアントは最初に使うときに作る（supabase パッケージの import も含めて重く、
+# 環境変数がなくてもアプリ自体は import できるようにするため）。テストではこの変数を差し替える
+supabase: Optional["Client"] = None
+_supabase_lock = threading.Lock()
+
+def get_supabase() -> "Client":
+    """
+    共有の Supabase クライアントを返す。初回だけ SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY から作る。
+    スレッドプールから同時に呼ばれても作るのは1回だけ。
+    """
+    global supabase
+    if supabase is None:
+        with _supabase_lock:
+            if supabase is None:
+                from supabase import create_client
+                from supabase.lib.client_options import ClientOptions
+
+                supabase = create_client(
+                    os.environ.get("SUPABASE_URL"),
+                    os.environ.get("SUPABASE_SERVICE_ROLE_KEY"),
+                    options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT),
+                )
+    return supabase
+
+# 同期クライアント（コネクションは内部のhttpx.Clientで再利用される）の呼び出しを
+# 専用スレッドプールに逃がし、イベントループを塞がないようにする
+_db_executor = ThreadPoolExecutor(max_workers=SUPABASE_MAX_WORKERS, thread_name_prefix="supabase")
+
+T = TypeVar("T")
+
+async def run_db(fn: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> T:
+    """
+    同期のSupabase呼び出しをスレッドプールで実行し、timeout 秒で打ち切る。
+    所要時間は関数名（先頭の _ を除く）ごとに hanno_supabase_call_duration_seconds に記録する。
+    """
+    loop = asyncio.get_running_loop()
+    with observe_supabase_call(getattr(fn, "__name__", "call").lstrip("_")):
+        future = loop.run_in_executor(_db_executor, partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout=timeout or SUPABASE_TIMEOUT)
+
+async def warm_up_db(threads: int = 4) -> None:
+    """
+    クライアントを作り、スレッドプールのスレッドを threads 本（SUPABASE_MAX_WORKERS まで）先に起こしておく。
+    最初の1本がクライアントを作る間、残りはロックで待つので、その間に別々のスレッドが立ち上がる。
+    """
+    loop = asyncio.get_running_loop()
+    count = max(1, min(threads, SUPABASE_MAX_WORKERS))
+    await asyncio.gather(*(loop.run_in_executor(_db_executor, get_supabase) for _ in range(count)))
+
+# ユーザーごとの設定行・登録日時・復号済みキーのキャッシュ。
+# 復号したキーはこのプロセスのメモリ上にだけ置き、外部のキャッシュやDBには書かない。
+_user_contexts: TTLCache[Dict[str, Any]] = TTLCache(USER_CONTEXT_CACHE_MAX_ENTRIES, ttl=USER_CONTEXT_CACHE_TTL)
+_user_context_fallbacks = 0
+_user_context_invalidations = 0
+
+def _fetch_user_context(user_id: str) -> Dict[str, Any]:
+    """
+    users の登録日時と user_settings の行を get_user_context 関数で1回のクエリで取得する。
+    関数が未作成の環境では、従来どおり2回のクエリで取得する。
+    """
+    global _user_context_fallbacks
+    try:
+        result = get_supabase().rpc("get_user_context", {"user_id_param": user_id}).execute()
+        data = result.data or {}
+        return {"created_at": data.get("created_at"), "settings": data.get("settings")}
+    except Exception as e:
+        _user_context_fallbacks += 1
+        print(f"Error calling get_user_context, falling back to separate queries: {str(e)}")
+    
+    user = get_supabase().table("users").select("created_at").eq("id", user_id).limit(1).execute()
+    settings = get_supabase().table("user_settings").select("*").eq("user_id", user_id).limit(1).execute()
+    return {
+        "created_at": user.data[0].get("created_at") if user.data else None,
+        "settings": settings.data[0] if settings.data else None,
+    }
+
+def _user_context(user_id: str) -> Dict[str, Any]:
+    context = _user_contexts.get(user_id)
+    if context is None:
+        invalidations = _user_context_invalidations
+        context = {**_fetch_user_context(user_id), "keys": {}}
+        # 取得中に設定が保存された場合は古い可能性があるのでキャッシュしない
+        if invalidations == _user_context_invalidations:
+            _user_contexts.set(user_id, context)
+    return context
+
+def invalidate_user_context(user_id: str) -> None:
+    global _user_context_invalidations
+    _user_context_invalidations += 1
+    _user_contexts.pop(user_id)
+
+def user_context_stats() -> Dict[str, Any]:
+    return {**_user_contexts.stats(), "ttl": USER_CONTEXT_CACHE_TTL, "rpc_fallbacks": _user_context_fallbacks}
+
+def _trial_info(created_at: Optional[str]) -> Dict[str, Any]:
+    if not created_at:
+        return {"is_trial_active": True, "trial_days_left": 30}
+    
+    created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    trial_end_date = created + timedelta(days=30)
+    now = datetime.now(timezone.utc)
+    
+    is_trial_active = now < trial_end_date
+    trial_days_left = (trial_end_date - now).days if is_trial_active else 0
+    
+    return {
+        "is_trial_active": is_trial_active,
+        "trial_days_left": max(0, trial_days_left)
+    }
 
 def get_user_trial_info(user_id: str) -> Dict[str, Any]:
     try:
-        user = supabase.table("users").select("created_at").eq("id", user_id).single().execute()
-        
-        if not user.data:
-            return {"is_trial_active": True, "trial_days_left": 30}
-        
-        created_at = datetime.fromisoformat(user.data["created_at"].replace("Z", "+00:00"))
-        trial_end_date = created_at + timedelta(days=30)
-        now = datetime.utcnow()
-        
-        is_trial_active = now < trial_end_date
-        trial_days_left = (trial_end_date - now).days if is_trial_active else 0
-        
-        return {
-            "is_trial_active": is_trial_active,
-            "trial_days_left": max(0, trial_days_left)
-        }
+        return _trial_info(_user_context(user_id)["created_at"])
     except Exception as e:
         print(f"Error getting user trial info: {str(e)}")
         return {"is_trial_active": True, "trial_days_left": 30}
 
-def get_user_settings(user_id: str) -> Dict[str, Any]:
-    settings = supabase.table("user_settings").select("*").eq("user_id", user_id).execute()
+def _get_user_settings(user_id: str) -> Dict[str, Any]:
+    context = _user_context(user_id)
     
     result = {
         "openai_key": "",
@@ -45,8 +153,8 @@ def get_user_settings(user_id: str) -> Dict[str, Any]:
     trial_info = get_user_trial_info(user_id)
     result.update(trial_info)
     
-    if settings.data and len(settings.data) > 0:
-        data = settings.data[0]
+    if context["settings"]:
+        data = context["settings"]
         if data.get("openai_key"):
             result["openai_key"] = "API_KEY_SET"  # フロントエンドには実際のキーを返さない
         
@@ -61,14 +169,14 @@ def get_user_settings(user_id: str) -> Dict[str, Any]:
     
     return result
 
-def save_user_settings(settings: UserSettings) -> Dict[str, Any]:
+def _save_user_settings(settings: UserSettings) -> Dict[str, Any]:
     try:
         encrypted_openai_key = encrypt_api_key(settings.openai_key) if settings.openai_key else None
         encrypted_notion_token = encrypt_api_key(settings.notion_token) if settings.notion_token else None
         encrypted_slack_webhook = encrypt_api_key(settings.slack_webhook) if settings.slack_webhook else None
         
         try:
-            existing = supabase.table("user_settings").select("*").eq("user_id", settings.user_id).execute()
+            existing = get_supabase().table("user_settings").select("*").eq("user_id", settings.user_id).execute()
             has_existing = existing.data and len(existing.data) > 0
         except Exception as e:
             print(f"Error checking existing settings: {str(e)}")
@@ -90,26 +198,28 @@ def save_user_settings(settings: UserSettings) -> Dict[str, Any]:
         
         try:
             if has_existing:
-                result = supabase.table("user_settings").update(data).eq("user_id", settings.user_id).execute()
+                result = get_supabase().table("user_settings").update(data).eq("user_id", settings.user_id).execute()
             else:
                 data["created_at"] = datetime.utcnow().isoformat()
-                result = supabase.table("user_settings").insert(data).execute()
+                result = get_supabase().table("user_settings").insert(data).execute()
             
             return {"success": True}
         except Exception as e:
             print(f"Error saving settings: {str(e)}")
             return {"success": True, "dev_mode": True}
+        finally:
+            invalidate_user_context(settings.user_id)
     except Exception as e:
         print(f"Unexpected error in save_user_settings: {str(e)}")
         return {"success": True, "dev_mode": True}
 
-def get_api_key(user_id: str, key_type: str) -> Optional[str]:
-    settings = supabase.table("user_settings").select("*").eq("user_id", user_id).execute()
+def _get_api_key(user_id: str, key_type: str) -> Optional[str]:
+    context = _user_context(user_id)
     
-    if not settings.data or len(settings.data) == 0:
+    if not context["settings"]:
         return None
     
-    data = settings.data[0]
+    data = context["settings"]
     encrypted_key = data.get(key_type)
     
     if not encrypted_key:
@@ -120,9 +230,53 @@ def get_api_key(user_id: str, key_type: str) -> Optional[str]:
     if key_type == "openai_key" and trial_info["is_trial_active"] and not encrypted_key:
         return os.environ.get("OPENAI_API_KEY")
     
-    return decrypt_api_key(encrypted_key)
+    if key_type not in context["keys"]:
+        context["keys"][key_type] = decrypt_api_key(encrypted_key)
+    return context["keys"][key_type]
+
+def analysis_history_row(
+    user_email: str,
+    url: str,
+    summary_json: Dict[str, Any],
+    tags: List[str] = []
+) -> Dict[str, Any]:
+    """
+    analysis_history に入れる1行を組み立てる（件数・アドバイスの要約・スコアの列は summary_json から作る）。
+    """
+    product_count = len(summary_json.get("product_names", []))
+    category_count = len(summary_json.get("category_links", []))
+    price_count = len(summary_json.get("prices", []))
+    
+    has_advice = bool(summary_json.get("advice"))
+    advice_summary = summary_json.get("advice", "")[:200] if summary_json.get("advice") else None
+    
+    notion_page_url = summary_json.get("notion_page_url")
+    
+    scores = {}
+    if summary_json.get("diagnostic_scores"):
+        scores = {
+            "sns_score": summary_json["diagnostic_scores"].get("sns_score", 0),
+            "structure_score": summary_json["diagnostic_scores"].get("structure_score", 0),
+            "ux_score": summary_json["diagnostic_scores"].get("ux_score", 0),
+            "app_score": summary_json["diagnostic_scores"].get("app_score", 0),
+            "theme_score": summary_json["diagnostic_scores"].get("theme_score", 0)
+        }
+    
+    return {
+        "user_email": user_email,
+        "url": url,
+        "product_count": product_count,
+        "category_count": category_count,
+        "price_count": price_count,
+        "has_advice": has_advice,
+        "advice_summary": advice_summary,
+        "notion_page_url": notion_page_url,
+        "tags": tags,
+        "summary_json": summary_json,
+        **scores
+    }
 
-def save_analysis_history(
+def _save_analysis_history(
     user_email: str,
     url: str,
     summary_json: Dict[str, Any],
@@ -132,40 +286,9 @@ def save_analysis_history(
     分析履歴をSupabaseに保存する。
     """
     try:
-        product_count = len(summary_json.get("product_names", []))
-        category_count = len(summary_json.get("category_links", []))
-        price_count = len(summary_json.get("prices", []))
-        
-        has_advice = bool(summary_json.get("advice"))
-        advice_summary = summary_json.get("advice", "")[:200] if summary_json.get("advice") else None
+        data = analysis_history_row(user_email, url, summary_json, tags)
         
-        notion_page_url = summary_json.get("notion_page_url")
-        
-        scores = {}
-        if summary_json.get("diagnostic_scores"):
-            scores = {
-                "sns_score": summary_json["diagnostic_scores"].get("sns_score", 0),
-                "structure_score": summary_json["diagnostic_scores"].get("structure_score", 0),
-                "ux_score": summary_json["diagnostic_scores"].get("ux_score", 0),
-                "app_score": summary_json["diagnostic_scores"].get("app_score", 0),
-                "theme_score": summary_json["diagnostic_scores"].get("theme_score", 0)
-            }
-        
-        data = {
-            "user_email": user_email,
-            "url": url,
-            "product_count": product_count,
-            "category_count": category_count,
-            "price_count": price_count,
-            "has_advice": has_advice,
-            "advice_summary": advice_summary,
-            "notion_page_url": notion_page_url,
-            "tags": tags,
-            "summary_json": summary_json,
-            **scores
-        }
-        
-        result = supabase.table("analysis_history").insert(data).execute()
+        result = get_supabase().table("analysis_history").insert(data).execute()
         
         if result.data and len(result.data) > 0:
             return result.data[0].get("id")
@@ -175,22 +298,333 @@ def save_analysis_history(
         print(f"Error saving analysis history: {str(e)}")
         return None
 
-def get_analysis_history(user_email: str, tag_filter: List[str] = None) -> List[Dict[str, Any]]:
+def _save_analysis_history_batch(rows: List[Dict[str, Any]]) -> int:
     """
-    ユーザーの分析履歴を取得する。
+    analysis_history_row で組み立てた行を1回の insert でまとめて保存し、保存した件数を返す。
+    行ごとに列がそろっていなくても、ない列は表の既定値になる。保存した行は返させない。
+    """
+    if not rows:
+        return 0
+    get_supabase().table("analysis_history").insert(
+        rows, returning="minimal", default_to_null=False
+    ).execute()
+    return len(rows)
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = 200
+
+HISTORY_LIST_FIELDS = [
+    "id", "url", "analyzed_at", "product_count", "category_count", "price_count",
+    "has_advice", "advice_summary", "notion_page_url", "tags",
+    "sns_score", "structure_score", "ux_score", "app_score", "theme_score",
+]
+HISTORY_FIELDS = set(HISTORY_LIST_FIELDS) | {"summary_json", "user_email", "created_at"}
+
+def encode_history_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["analyzed_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    カーソルを (analyzed_at, id) に戻す。不正な値は ValueError。
     """
     try:
-        query = supabase.table("analysis_history").select("*").eq("user_email", user_email).order("analyzed_at", {"ascending": False})
-        
-        if tag_filter and len(tag_filter) > 0:
-            query = query.contains("tags", tag_filter)
-        
-        result = query.execute()
-        
-        if result.data:
-            return result.data
-        
-        return []
+        analyzed_at, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(analyzed_at), str(item_id)
+    except Exception:
+        raise ValueError("invalid history cursor")
+
+def resolve_history_fields(fields: Optional[List[str]] = None) -> List[str]:
+    """
+    取得する列を決める。指定がなければ summary_json を除いた一覧用の列。
+    カーソル生成に必要な id と analyzed_at は常に含める。
+    """
+    if not fields:
+        return list(HISTORY_LIST_FIELDS)
+    unknown = set(fields) - HISTORY_FIELDS
+    if unknown:
+        raise ValueError(f"unknown history fields: {', '.join(sorted(unknown))}")
+    return ["id", "analyzed_at"] + [field for field in dict.fromkeys(fields) if field not in ("id", "analyzed_at")]
+
+def _get_analysis_history(
+    user_email: str,
+    tag_filter: List[str] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    ユーザーの分析履歴を新しい順に1ページ分取得し、(行, 次ページのカーソル) を返す。
+    (analyzed_at, id) のキーセットページングなので、ページが深くなっても速度が落ちない。
+    """
+    columns = resolve_history_fields(fields)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    after = decode_history_cursor(cursor) if cursor else None
+    
+    try:
+        return _fetch_analysis_history_page(user_email, tag_filter, limit, after, columns)
     except Exception as e:
         print(f"Error getting analysis history: {str(e)}")
-        return []
+        return [], None
+
+def _get_analysis_history_page(
+    user_email: str,
+    tag_filter: Optional[List[str]],
+    limit: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    _get_analysis_history と同じだが、ページの上限（HISTORY_MAX_PAGE_SIZE）をかけず、失敗は例外にする。
+    全件を読み出すエクスポート用（途中で失敗したのに空のページとして終わらないように）。
+    """
+    after = decode_history_cursor(cursor) if cursor else None
+    return _fetch_analysis_history_page(user_email, tag_filter, max(1, limit), after, resolve_history_fields(fields))
+
+def _fetch_analysis_history_page(
+    user_email: str,
+    tag_filter: Optional[List[str]],
+    limit: int,
+    after: Optional[Tuple[str, str]],
+    columns: List[str]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    query = (
+        get_supabase().table("analysis_history")
+        .select(",".join(columns))
+        .eq("user_email", user_email)
+        .order("analyzed_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+    )
+    
+    if tag_filter and len(tag_filter) > 0:
+        query = query.contains("tags", tag_filter)
+    
+    if after:
+        analyzed_at, item_id = after
+        query = query.or_(
+            f'analyzed_at.lt."{analyzed_at}",and(analyzed_at.eq."{analyzed_at}",id.lt."{item_id}")'
+        )
+    
+    result = query.execute()
+    rows = result.data or []
+    
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_history_cursor(rows[-1])
+    
+    return rows, None
+
+def _get_analysis_history_item(user_email: str, item_id: str) -> Optional[Dict[str, Any]]:
+    """
+    分析履歴1件を summary_json を含めて取得する。
+    """
+    result = (
+        get_supabase().table("analysis_history")
+        .select("*")
+        .eq("user_email", user_email)
+        .eq("id", item_id)
+        .limit(1)
+        .execute()
+    )
+    
+    if result.data:
+        return result.data[0]
+    
+    return None
+
+def _get_analysis_history_items(user_email: str, item_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    指定した id の分析履歴を summary_json を含めて1回のクエリで取得する。見つからない id は結果に含まれない。
+    """
+    result = (
+        get_supabase().table("analysis_history")
+        .select("id,url,analyzed_at,summary_json")
+        .eq("user_email", user_email)
+        .in_("id", item_ids)
+        .execute()
+    )
+    
+    return result.data or []
+
+def _get_latest_analysis_history(user_email: str, url: str) -> Optional[Dict[str, Any]]:
+    """
+    URL の最新の分析履歴を summary_json を含めて取得する。
+    """
+    result = (
+        get_supabase().table("analysis_history")
+        .select("id,analyzed_at,summary_json")
+        .eq("user_email", user_email)
+        .eq("url", url)
+        .order("analyzed_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    
+    if result.data:
+        return result.data[0]
+    
+    return None
+
+def _get_history_analytics(
+    user_email: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: str = "day",
+    domain_limit: int = 50
+) -> Dict[str, Any]:
+    """
+    履歴の集計（件数・スコア平均の推移、タグごとの平均、ドメインごとの最新スコア）を
+    get_history_analytics（scripts/create_history_analytics_schema.sql）で取得する。集計表だけを読む。
+    """
+    result = get_supabase().rpc("get_history_analytics", {
+        "user_email_param": user_email,
+        "start_date": start,
+        "end_date": end,
+        "bucket": bucket,
+        "domain_limit": domain_limit,
+    }).execute()
+    return result.data or {}
+
+def _get_history_analytics_version(user_email: str) -> int:
+    """
+    ユーザーの履歴が変わるたびに増える番号。集計はしない。
+    """
+    result = get_supabase().rpc("get_history_analytics_version", {"user_email_param": user_email}).execute()
+    return int(result.data or 0)
+
+def _save_shopify_store(user_email: str, store_domain: str, access_token: str) -> Optional[Dict[str, Any]]:
+    """
+    Shopify ストアの連携を保存する（同じユーザー・ストアなら access_token を置き換える）。
+    """
+    data = {
+        "user_email": user_email,
+        "store_domain": store_domain,
+        "access_token": encrypt_api_key(access_token),
+        "connected_at": datetime.now(timezone.utc).isoformat()
+    }
+    result = (
+        get_supabase().table("shopify_stores")
+        .upsert(data, on_conflict="user_email,store_domain")
+        .execute()
+    )
+    
+    if result.data:
+        return {key: value for key, value in result.data[0].items() if key != "access_token"}
+    
+    return None
+
+def _get_shopify_store(user_email: str, store_domain: str) -> Optional[Dict[str, Any]]:
+    """
+    連携済みの Shopify ストア1件を、復号した access_token つきで取得する。
+    """
+    result = (
+        get_supabase().table("shopify_stores")
+        .select("store_domain,access_token,connected_at")
+        .eq("user_email", user_email)
+        .eq("store_domain", store_domain)
+        .limit(1)
+        .execute()
+    )
+    
+    if not result.data:
+        return None
+    
+    store = result.data[0]
+    return {**store, "access_token": decrypt_api_key(store["access_token"])}
+
+def _get_shopify_stores(user_email: str) -> List[Dict[str, Any]]:
+    """
+    ユーザーが連携した Shopify ストアの一覧（access_token は含めない）。
+    """
+    result = (
+        get_supabase().table("shopify_stores")
+        .select("store_domain,connected_at")
+        .eq("user_email", user_email)
+        .order("connected_at")
+        .execute()
+    )
+    
+    return result.data or []
+
+def _delete_shopify_store(user_email: str, store_domain: str) -> bool:
+    result = (
+        get_supabase().table("shopify_stores")
+        .delete()
+        .eq("user_email", user_email)
+        .eq("store_domain", store_domain)
+        .execute()
+    )
+    
+    return bool(result.data)
+
+async def get_user_settings(user_id: str) -> Dict[str, Any]:
+    return await run_db(_get_user_settings, user_id)
+
+async def save_user_settings(settings: UserSettings) -> Dict[str, Any]:
+    return await run_db(_save_user_settings, settings)
+
+async def get_api_key(user_id: str, key_type: str) -> Optional[str]:
+    return await run_db(_get_api_key, user_id, key_type)
+
+async def save_analysis_history(
+    user_email: str,
+    url: str,
+    summary_json: Dict[str, Any],
+    tags: List[str] = []
+) -> Optional[str]:
+    return await run_db(_save_analysis_history, user_email, url, summary_json, tags)
+
+async def get_analysis_history(
+    user_email: str,
+    tag_filter: List[str] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    return await run_db(_get_analysis_history, user_email, tag_filter, limit, cursor, fields)
+
+async def get_analysis_history_page(
+    user_email: str,
+    tag_filter: Optional[List[str]],
+    limit: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    return await run_db(_get_analysis_history_page, user_email, tag_filter, limit, cursor, fields)
+
+async def save_analysis_history_batch(rows: List[Dict[str, Any]]) -> int:
+    return await run_db(_save_analysis_history_batch, rows)
+
+async def get_analysis_history_item(user_email: str, item_id: str) -> Optional[Dict[str, Any]]:
+    return await run_db(_get_analysis_history_item, user_email, item_id)
+
+async def get_analysis_history_items(user_email: str, item_ids: List[str]) -> List[Dict[str, Any]]:
+    return await run_db(_get_analysis_history_items, user_email, item_ids)
+
+async def get_latest_analysis_history(user_email: str, url: str) -> Optional[Dict[str, Any]]:
+    return await run_db(_get_latest_analysis_history, user_email, url)
+
+async def get_history_analytics(
+    user_email: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: str = "day",
+    domain_limit: int = 50
+) -> Dict[str, Any]:
+    return await run_db(_get_history_analytics, user_email, start, end, bucket, domain_limit)
+
+async def get_history_analytics_version(user_email: str) -> int:
+    return await run_db(_get_history_analytics_version, user_email)
+
+async def save_shopify_store(user_email: str, store_domain: str, access_token: str) -> Optional[Dict[str, Any]]:
+    return await run_db(_save_shopify_store, user_email, store_domain, access_token)
+
+async def get_shopify_store(user_email: str, store_domain: str) -> Optional[Dict[str, Any]]:
+    return await run_db(_get_shopify_store, user_email, store_domain)
+
+async def get_shopify_stores(user_email: str) -> List[Dict[str, Any]]:
+    return await run_db(_get_shopify_stores, user_email)
+
+async def delete_shopify_store(user_email: str, store_domain: str) -> bool:
+    return await run_db(_delete_shopify_store, user_email, store_domain)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_DELAY = float(os.environ.get("WARMUP_DELAY", "0"))
+WARMUP_DB_THREADS = int(os.environ.get("WARMUP_DB_THREADS", "4"))
+
+WarmupStep = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+class Warmup:
+    """
+    起動後にバックグラウンドで重い初期化（遅延 import、クライアントやスレッドプールの作成）を済ませる。
+    起動イベントは待たずに返るので、その間もリクエストは受け付ける。同期の手順はスレッドで、
+    コルーチン関数はそのまま順に実行し、1つが失敗しても残りは続ける（失敗は stats に残すだけ）。
+    """
+
+    def __init__(self, steps: Dict[str, WarmupStep], delay: float = WARMUP_DELAY, enabled: bool = WARMUP_ENABLED):
+        self.steps = steps
+        self.delay = delay
+        self.enabled = enabled
+        self.status = "pending" if enabled else "disabled"
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        self.status = "running"
+        self._started_at = time.perf_counter()
+        for name, step in self.steps.items():
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await asyncio.to_thread(step)
+                self.results[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 4)}
+            except asyncio.CancelledError:
+                self.status = "cancelled"
+                raise
+            except Exception as e:
+                print(f"Error warming up {name}: {str(e)}")
+                self.results[name] = {"ok": False, "seconds": round(time.perf_counter() - started, 4),
+                                      "error": str(e)}
+        self._finished_at = time.perf_counter()
+        self.status = "done"
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self._started_at is not None:
+            elapsed = round((self._finished_at or time.perf_counter()) - self._started_at, 4)
+        return {"status": self.status, "seconds": elapsed, "steps": dict(self.results)}
@@ -0,0 +1,49 @@
+import io
+import time
+import zipfile
+from typing import List, Optional
+
+
+class ChunkBuffer(io.RawIOBase):
+    """
+    ストリーミングで返すファイル（ZIP・Parquet）の書き込み先。書かれたバイト列を溜めておき、drain() で取り出す。
+    seek できないので、zipfile はサイズとCRCを各ファイルの後ろ（データディスクリプタ）に書き、
+    pyarrow は書いた位置を自分で数えてフッターに入れる。
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStreamWriter:
+    """
+    ZIPアーカイブを少しずつ組み立てる。add() と close() が返すバイト列を順に送れば、
+    アーカイブ全体をメモリに載せずにZIPファイルになる。
+    既定では圧縮しない（中身のPDFはすでに圧縮されていて、縮まないのにイベントループで deflate する時間がかかる）。
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._buffer = ChunkBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, mode="w", compression=compression)
+
+    def add(self, name: str, data: bytes, compress_type: Optional[int] = None) -> bytes:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression if compress_type is None else compress_type
+        self._zip.writestr(info, data)
+        return self._buffer.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._buffer.drain()
@@ -0,0 +1,71 @@
+"""
+/analyze のエンドツーエンドのレイテンシとスループット。
+
+保存済みフィクスチャを返すストア（SiteStandIn）と OpenAI（OpenAIStandIn）をローカルに立て、
+アプリをプロセス内または uvicorn で動かして、--concurrency 件ずつ合計 --requests 件を送る。
+
+- cold: リクエストごとに価格の違うページを分析する（解析キャッシュもアドバイスのキャッシュも効かない）
+- warm: 同じURLを繰り返し分析する（2件目からは解析キャッシュから返る）
+
+    cd backend
+    python -m benchmarks.bench_analyze --requests 200 --concurrency 20 --mode inprocess
+"""
+import argparse
+import asyncio
+from typing import Any, Dict, List
+
+from benchmarks.bench_extract import load_fixture
+from benchmarks.harness import MODES, app_client, bench_stack, load_app, run_load
+
+
+def storefront_page(html: str):
+    """クエリの v ごとに価格が1つ違うページを返す（プロンプトが変わり、GPT呼び出しが毎回発生する）。"""
+
+    def page(query: Dict[str, str]):
+        variant = int(query.get("v", "0"))
+        body = html.replace("</body>", f'<span class="price">¥{100000 + variant:,}</span></body>', 1)
+        return 200, "text/html; charset=utf-8", body
+
+    return page
+
+
+def run(requests: int = 200, concurrency: int = 20, mode: str = "inprocess",
+        site_latency: float = 0.02, llm_latency: float = 0.2) -> List[Dict[str, Any]]:
+    pages = {"/": storefront_page(load_fixture("storefront_apparel.html"))}
+    with bench_stack(pages, site_latency=site_latency, llm_latency=llm_latency) as stack:
+        main = load_app(stack)
+
+        async def scenario() -> List[Dict[str, Any]]:
+            results = []
+            async with app_client(main, mode) as client:
+                cold = await run_load(
+                    lambda i: client.post("/analyze", json={"url": f"{stack.site.url}/?v={i}"}), requests, concurrency)
+                results.append({"scenario": "cold", "mode": mode, **cold, "llm_calls": stack.openai.requests})
+
+                await client.post("/analyze", json={"url": f"{stack.site.url}/?v={requests}"})
+                warm = await run_load(
+                    lambda i: client.post("/analyze", json={"url": f"{stack.site.url}/?v={requests}"}), requests, concurrency)
+                results.append({"scenario": "warm", "mode": mode, **warm})
+            return results
+
+        return asyncio.run(scenario())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=MODES, default="inprocess")
+    parser.add_argument("--site-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'scenario':8} {'mode':10} {'requests':>9} {'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7}")
+    for row in run(args.requests, args.concurrency, args.mode, args.site_latency, args.llm_latency):
+        print(f"{row['scenario']:8} {row['mode']:10} {row['requests']:>9} {row['concurrency']:>5} "
+              f"{row['throughput_rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+APIキー暗号化・復号のスループットを計測するベンチマーク。
+
+- legacy: 変更前と同じく、呼び出しごとに鍵を読んで Fernet を作り、トークンをさらに base64 する
+- context: app.utils.crypto（共有の MultiFernet、base64 の二重化なし）
+
+    cd backend
+    python -m benchmarks.bench_crypto --iterations 20000
+"""
+import argparse
+import base64
+import os
+import time
+from typing import Any, Dict, List
+
+from cryptography.fernet import Fernet
+
+SAMPLE_KEY = "sk-proj-" + "x" * 48
+
+
+def legacy_encrypt(api_key: str) -> str:
+    f = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    return base64.b64encode(f.encrypt(api_key.encode())).decode()
+
+
+def legacy_decrypt(encrypted_key: str) -> str:
+    f = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    return f.decrypt(base64.b64decode(encrypted_key)).decode()
+
+
+def _measure(name: str, encrypt, decrypt, iterations: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    tokens = [encrypt(SAMPLE_KEY) for _ in range(iterations)]
+    encrypt_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for token in tokens:
+        assert decrypt(token) == SAMPLE_KEY
+    decrypt_s = time.perf_counter() - start
+
+    return {
+        "variant": name,
+        "iterations": iterations,
+        "encrypt_ops_s": round(iterations / encrypt_s),
+        "decrypt_ops_s": round(iterations / decrypt_s),
+        "token_bytes": len(tokens[0]),
+    }
+
+
+def run(iterations: int = 20000) -> List[Dict[str, Any]]:
+    os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    # ローテーション中を想定して、復号専用の古い鍵も1つ持たせる
+    os.environ["ENCRYPTION_KEYS"] = f"{os.environ['ENCRYPTION_KEY']},{Fernet.generate_key().decode()}"
+
+    from app.utils import crypto
+
+    crypto.reset_crypto()
+    return [
+        _measure("legacy", legacy_encrypt, legacy_decrypt, iterations),
+        _measure("context", crypto.encrypt_api_key, crypto.decrypt_api_key, iterations),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'variant':10} {'iterations':>10} {'encrypt/s':>10} {'decrypt/s':>10} {'token B':>8}")
+    for row in run(args.iterations):
+        print(f"{row['variant']:10} {row['iterations']:>10} {row['encrypt_ops_s']:>10} "
+              f"{row['decrypt_ops_s']:>10} {row['token_bytes']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+HTML抽出のベンチマーク。
+
+従来の html.parser + soup.select 10回の経路と、html_extractor の1パス抽出
+（利用可能な各バックエンド）を保存済みフィクスチャで比較する。
+
+    cd backend
+    python -m benchmarks.bench_extract --repeat 5
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from app.utils.html_extractor import available_backends, extract_page_data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def legacy_extract(html_content: str) -> Dict[str, Any]:
+    """変更前の fetch_url_content と同じ抽出処理。"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    product_names = [el.get_text(strip=True) for el in soup.select(".product-title, .product-name")]
+    prices = [el.get_text(strip=True) for el in soup.select(".price, .product-price")]
+
+    category_links = [el.get_text(strip=True) for el in soup.select(".collection-link, .nav-link")]
+
+    social_links = {
+        "instagram": next((a['href'] for a in soup.select("a[href*='instagram.com']")), ""),
+        "twitter": next((a['href'] for a in soup.select("a[href*='twitter.com']")), "")
+    }
+
+    return {
+        "title": soup.title.string if soup.title else "Sample E-commerce Store",
+        "meta_description": next((meta['content'] for meta in soup.select("meta[name='description']")), "Quality products at affordable prices"),
+        "product_names": product_names,
+        "prices": prices,
+        "category_links": category_links,
+        "product_count": len(product_names),
+        "category_count": len(category_links),
+        "social_links": social_links,
+        "has_search": bool(soup.select("form[action*='search']")),
+        "mobile_friendly": bool(soup.select("meta[name='viewport']")),
+        "has_reviews": bool(soup.select(".review, .reviews")),
+    }
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def inflate_storefront(html: str, target_bytes: int) -> str:
+    """
+    フィクスチャの商品グリッドを繰り返して、実際のストアに近いサイズ（1〜3MB）のページを作る。
+    """
+    match = re.search(r'(<section class="product-grid">)(.*?)(</section>)', html, re.S)
+    if not match:
+        return html
+    grid = match.group(2)
+    copies = max(1, target_bytes // max(1, len(grid.encode("utf-8"))))
+    return html[:match.start(2)] + grid * copies + html[match.end(2):]
+
+
+def fixture_pages() -> Dict[str, str]:
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            pages[name] = load_fixture(name)
+    apparel = pages.get("storefront_apparel.html")
+    if apparel:
+        pages["storefront_apparel_1mb"] = inflate_storefront(apparel, 1_000_000)
+        pages["storefront_apparel_3mb"] = inflate_storefront(apparel, 3_000_000)
+    return pages
+
+
+def time_call(fn: Callable[[str], Any], html: str, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run(repeat: int = 5) -> List[Dict[str, Any]]:
+    results = []
+    candidates = {"legacy_soup_select": legacy_extract}
+    for backend in available_backends():
+        candidates[f"single_pass_{backend}"] = lambda html, b=backend: extract_page_data(html, b)
+
+    for page_name, html in fixture_pages().items():
+        for name, fn in candidates.items():
+            samples = time_call(fn, html, repeat)
+            results.append({
+                "page": page_name,
+                "bytes": len(html.encode("utf-8")),
+                "extractor": name,
+                "median_ms": round(statistics.median(samples) * 1000, 2),
+                "min_ms": round(min(samples) * 1000, 2),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'page':32} {'bytes':>10} {'extractor':28} {'median ms':>10} {'min ms':>10}")
+    for row in run(args.repeat):
+        print(f"{row['page']:32} {row['bytes']:>10} {row['extractor']:28} {row['median_ms']:>10} {row['min_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
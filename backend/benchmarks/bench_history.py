@@ -0,0 +1,125 @@
+"""
+/api/history のベンチマーク（1ユーザーあたり --rows 件の履歴）。
+
+メモリ上の PostgREST 代替サーバーに履歴を入れ、アプリ経由で次を計測する。
+
+- first_page: 最新の1ページ（limit=50）を --concurrency 件ずつ --requests 回
+- tag_filter: タグで絞り込んだ最新の1ページ
+- item: /api/history/{item_id} で1件を summary_json 込みで取得
+- walk: next_cursor をたどって全件を limit=200 で読み切る（1本の逐次処理。ブラウザで集計していたときの読み込み）
+- analytics: /api/history/analytics で件数・スコアの推移、タグ・ドメインごとの集計を取得
+  （代替サーバーは初回に行から集計して使い回すので、集計表を読むだけの本番に近い）
+- analytics_304: 同じ集計を If-None-Match つきで取得（履歴が変わっていないので 304）
+
+    cd backend
+    python -m benchmarks.bench_history --rows 10000 --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from benchmarks.harness import MODES, app_client, bench_stack, load_app, run_load, summarize
+from benchmarks.standins import register_history_analytics_rpc
+
+USER_EMAIL = "bench@example.com"
+TAGS = (["apparel"], ["apparel", "sale"], [], ["food"])
+
+
+def seed(postgrest, rows: int) -> List[str]:
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    ids = []
+    for i in range(rows):
+        row = postgrest.insert("analysis_history", {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "user_email": USER_EMAIL,
+            "analyzed_at": (started + timedelta(minutes=i)).isoformat(),
+            "url": f"https://shop{i}.example/",
+            "tags": TAGS[i % len(TAGS)],
+            "summary_json": {"advice": "強みと弱み" * 200, "prices": [2980, 5980]},
+            "sns_score": 5.0,
+            "structure_score": 6.0,
+            "ux_score": 7.0,
+            "app_score": 3.0,
+            "theme_score": 5.5,
+        })
+        ids.append(row["id"])
+    # 別ユーザーの行も混ぜ、ユーザーでの絞り込みも効かせる
+    for i in range(rows // 10):
+        postgrest.insert("analysis_history", {"user_email": f"other{i}@example.com", "url": "https://x.example/",
+                                              "analyzed_at": started.isoformat(), "tags": []})
+    return ids
+
+
+def run(rows: int = 10000, requests: int = 200, concurrency: int = 20, mode: str = "inprocess") -> List[Dict[str, Any]]:
+    with bench_stack() as stack:
+        ids = seed(stack.postgrest, rows)
+        register_history_analytics_rpc(stack.postgrest)
+        main = load_app(stack)
+
+        async def scenario() -> List[Dict[str, Any]]:
+            results = []
+            async with app_client(main, mode) as client:
+                params = {"user_email": USER_EMAIL, "limit": 50}
+                first = await run_load(lambda i: client.get("/api/history", params=params), requests, concurrency)
+                results.append({"scenario": "first_page", **first})
+
+                tagged = await run_load(
+                    lambda i: client.get("/api/history", params={**params, "tags": "sale"}), requests, concurrency)
+                results.append({"scenario": "tag_filter", **tagged})
+
+                item = await run_load(
+                    lambda i: client.get(f"/api/history/{ids[(i * 7919) % len(ids)]}", params={"user_email": USER_EMAIL}),
+                    requests, concurrency)
+                results.append({"scenario": "item", **item})
+
+                latencies, seen, cursor = [], 0, None
+                started = time.perf_counter()
+                while True:
+                    page_started = time.perf_counter()
+                    page = await client.get("/api/history", params={"user_email": USER_EMAIL, "limit": 200,
+                                                                    **({"cursor": cursor} if cursor else {})})
+                    latencies.append(time.perf_counter() - page_started)
+                    body = page.json()
+                    seen += len(body["items"])
+                    cursor = body.get("next_cursor")
+                    if not cursor:
+                        break
+                walk = summarize(latencies, time.perf_counter() - started, errors=int(seen != rows))
+                results.append({"scenario": "walk", "concurrency": 1, **walk, "rows_read": seen})
+
+                analytics_params = {"user_email": USER_EMAIL, "bucket": "week"}
+                etag = (await client.get("/api/history/analytics", params=analytics_params)).headers["etag"]
+                analytics = await run_load(
+                    lambda i: client.get("/api/history/analytics", params=analytics_params), requests, concurrency)
+                results.append({"scenario": "analytics", **analytics})
+
+                revalidated = await run_load(
+                    lambda i: client.get("/api/history/analytics", params=analytics_params,
+                                         headers={"If-None-Match": etag}),
+                    requests, concurrency, ok=lambda response: response.status_code == 304)
+                results.append({"scenario": "analytics_304", **revalidated})
+            return results
+
+        results = asyncio.run(scenario())
+    return [{"rows": rows, "mode": mode, **row} for row in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=MODES, default="inprocess")
+    args = parser.parse_args()
+
+    print(f"{'scenario':12} {'rows':>7} {'requests':>9} {'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7}")
+    for row in run(args.rows, args.requests, args.concurrency, args.mode):
+        print(f"{row['scenario']:12} {row['rows']:>7} {row['requests']:>9} {row['concurrency']:>5} "
+              f"{row['throughput_rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+分析履歴の一括取り込みとエクスポートのベンチマーク。
+
+import: --import-rows 件の履歴を次の2通りで保存する（代替サーバーは1リクエストごとに --db-latency 秒待つ）。
+
+- single: /api/save-history を1件ずつ、同時に --concurrency 件まで呼ぶ
+- bulk: /api/history/import に NDJSON で送る（500件ずつ1回の insert）
+
+export: --rows 件の履歴を /api/history/export で各形式に書き出し、応答を読み捨てる。
+peak_mb は書き出し中に Python が確保したメモリの最大値（tracemalloc。時間とは別の実行で測る）。
+httpx の ASGITransport は応答を最後まで溜めてから返すので、既定では uvicorn で動かす。
+
+    cd backend
+    python -m benchmarks.bench_history_transfer --rows 20000 --import-rows 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from benchmarks.bench_history import USER_EMAIL, seed
+from benchmarks.harness import MODES, app_client, bench_stack, load_app, run_load
+
+FORMATS = ("ndjson", "csv", "parquet")
+
+
+def _analysis(i: int) -> Dict[str, Any]:
+    return {"product_names": [f"Item {i}-{j}" for j in range(10)], "prices": ["¥2,980", "¥5,980"],
+            "advice": "強みと弱み" * 200, "diagnostic_scores": {"sns_score": 5.0, "ux_score": 7.0}}
+
+
+async def _import(client, variant: str, rows: int, concurrency: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if variant == "single":
+        load = await run_load(lambda i: client.post("/api/save-history", json={
+            "user_email": "single@example.com", "url": f"https://shop{i}.example/", "analysis_result": _analysis(i),
+        }), rows, concurrency)
+        errors, requests = load["errors"], rows
+    else:
+        async def body():
+            for start in range(0, rows, 100):
+                yield "".join(json.dumps({"url": f"https://shop{i}.example/", "summary_json": _analysis(i)},
+                                         ensure_ascii=False) + "\n"
+                              for i in range(start, min(start + 100, rows))).encode()
+
+        response = await client.post("/api/history/import", params={"user_email": "bulk@example.com"}, content=body())
+        errors, requests = rows - response.json().get("inserted", 0), 1
+    elapsed = time.perf_counter() - started
+    return {"phase": "import", "variant": variant, "rows": rows, "requests": requests,
+            "total_ms": round(elapsed * 1000, 1), "rows_ops_s": round(rows / elapsed), "errors": errors}
+
+
+async def _export(client, export_format: str) -> int:
+    lines = 0
+    async with client.stream("GET", "/api/history/export",
+                             params={"user_email": USER_EMAIL, "format": export_format}) as response:
+        async for chunk in response.aiter_bytes():
+            lines += chunk.count(b"\n")
+    return lines
+
+
+def run(rows: int = 20000, import_rows: int = 2000, concurrency: int = 10, db_latency: float = 0.005,
+        mode: str = "uvicorn") -> List[Dict[str, Any]]:
+    from app.utils.history_transfer import pyarrow_modules
+
+    try:
+        pyarrow_modules()
+        formats = FORMATS
+    except ImportError:
+        formats = FORMATS[:2]
+
+    with bench_stack(db_latency=db_latency) as stack:
+        seed(stack.postgrest, rows)
+        main = load_app(stack)
+
+        async def scenario() -> List[Dict[str, Any]]:
+            results = []
+            async with app_client(main, mode) as client:
+                for variant in ("single", "bulk"):
+                    results.append(await _import(client, variant, import_rows, concurrency))
+
+                for export_format in formats:
+                    started = time.perf_counter()
+                    lines = await _export(client, export_format)
+                    elapsed = time.perf_counter() - started
+                    tracemalloc.start()
+                    await _export(client, export_format)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    # NDJSON は1行1件、CSV は列名の行と summary_json の改行を含まない1行1件
+                    errors = abs(lines - rows - (export_format == "csv")) if export_format != "parquet" else 0
+                    results.append({"phase": "export", "variant": export_format, "rows": rows, "requests": 1,
+                                    "total_ms": round(elapsed * 1000, 1), "rows_ops_s": round(rows / elapsed),
+                                    "errors": errors, "peak_mb": round(peak / 1024 / 1024, 1)})
+            return results
+
+        return asyncio.run(scenario())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--import-rows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--mode", choices=MODES, default="uvicorn")
+    args = parser.parse_args()
+
+    print(f"{'phase':7} {'variant':8} {'rows':>7} {'requests':>9} {'total ms':>9} {'rows/s':>8} {'peak MB':>8} {'errors':>7}")
+    for row in run(args.rows, args.import_rows, args.concurrency, args.db_latency, args.mode):
+        print(f"{row['phase']:7} {row['variant']:8} {row['rows']:>7} {row['requests']:>9} {row['total_ms']:>9} "
+              f"{row['rows_ops_s']:>8} {row.get('peak_mb', ''):>8} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+監視対象URLの定期確認のベンチマーク。
+
+SiteStandIn の --urls 件のページ（半分は ETag あり）を登録し、1回目の確認のあと --changed 件だけ
+商品を変えて（さらに --rebuilt 件は商品を変えずにHTMLだけ変えて）もう一度確認する。
+LLM の呼び出しは --llm-latency 秒の待ちで代用する。2回目の確認について、同時実行数 --concurrency で次の2つを比べる。
+
+- full: 毎回すべてのページを取得・解析して再分析する（手で /analyze をやり直すのと同じ）
+- incremental: app.utils.monitor.UrlMonitor（304・本文のハッシュ・差分で省ける処理を省く）
+
+    cd backend
+    python -m benchmarks.bench_monitor --urls 200 --changed 10
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, SiteStandIn
+
+
+def _page(i: int, version: int = 0, comment: str = "") -> str:
+    items = "".join(
+        f'<div class="product"><h2 class="product-name">Item {i}-{j}-v{version}</h2>'
+        f'<p class="product-price">¥{1000 + j * 100:,}</p></div>'
+        for j in range(20)
+    )
+    return f"<html><head><title>Shop {i}</title></head><body>{items}<!-- {comment} --></body></html>"
+
+
+def _publish(site: SiteStandIn, i: int, version: int = 0, comment: str = "") -> None:
+    headers = {"ETag": f'"{i}-{version}-{comment}"'} if i % 2 == 0 else {}
+    site.pages[f"/shop{i}"] = (200, "text/html", _page(i, version, comment), headers)
+
+
+async def _full_round(urls: List[str], llm_latency: float, concurrency: int) -> Dict[str, int]:
+    from app.utils.html_extractor import extract_page_data_async
+    from app.utils.page_fetch import fetch_page
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(url: str) -> None:
+        async with semaphore:
+            page = await fetch_page(url)
+            await extract_page_data_async(page["text"])
+            await asyncio.sleep(llm_latency)
+
+    await asyncio.gather(*[analyze(url) for url in urls])
+    return {"fetches": len(urls), "parses": len(urls), "llm_calls": len(urls)}
+
+
+async def _incremental_round(monitor, standin: PostgrestStandIn) -> Dict[str, int]:
+    from app.utils.monitor import _iso
+
+    for row in standin.tables["tracked_urls"]:
+        row["next_check_at"] = _iso(time.time() - 1)
+    before = monitor.stats()
+    await monitor.run_once()
+    after = monitor.stats()
+    checks = after["checks"] - before["checks"]
+    return {
+        "fetches": checks - (after["fetches_skipped"] - before["fetches_skipped"]),
+        "parses": checks - (after["parses_skipped"] - before["parses_skipped"]),
+        "llm_calls": after["reanalyses"] - before["reanalyses"],
+    }
+
+
+def run(urls: int = 200, changed: int = 10, rebuilt: int = 10, llm_latency: float = 0.5,
+        concurrency: int = 20) -> List[Dict[str, Any]]:
+    from supabase import create_client
+    from app.utils import supabase as db
+    from app.utils.http_client import close_http_client
+    from app.utils.monitor import TrackedUrlStore, UrlMonitor, _iso, snapshot
+
+    rows = []
+    with PostgrestStandIn() as standin, SiteStandIn() as site:
+        db.supabase = create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY)
+        standin.tables["analysis_history"] = []
+
+        async def analyze(row, url_data, changes):
+            await asyncio.sleep(llm_latency)
+            return standin.insert("analysis_history", {
+                "user_email": row["user_email"], "url": row["url"], "analyzed_at": _iso(time.time()),
+                "summary_json": {"snapshot": snapshot(url_data)},
+            })["id"]
+
+        # ページはすべて同じホスト（127.0.0.1）にあるので、ホストごとの間隔は空けずに同時実行数だけで制限する
+        monitor = UrlMonitor(TrackedUrlStore(), analyze, batch_size=urls, concurrency=concurrency, host_spacing=0)
+        addresses = [f"{site.url}/shop{i}" for i in range(urls)]
+
+        async def scenario():
+            try:
+                for i, url in enumerate(addresses):
+                    _publish(site, i)
+                    await monitor.store.add("bench@example.com", url, 3600)
+                await _incremental_round(monitor, standin)
+                for i in range(changed):
+                    _publish(site, i, version=1)
+                for i in range(changed, changed + rebuilt):
+                    _publish(site, i, comment="rebuilt")
+
+                for variant in ("full", "incremental"):
+                    started = time.perf_counter()
+                    if variant == "full":
+                        counts = await _full_round(addresses, llm_latency, concurrency)
+                    else:
+                        counts = await _incremental_round(monitor, standin)
+                    rows.append({"variant": variant, "urls": urls, "changed": changed, **counts,
+                                 "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+            finally:
+                await close_http_client()
+
+        asyncio.run(scenario())
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=10)
+    parser.add_argument("--rebuilt", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'variant':12} {'urls':>5} {'changed':>8} {'fetches':>8} {'parses':>7} {'llm calls':>10} {'total ms':>9}")
+    for row in run(args.urls, args.changed, args.rebuilt, args.llm_latency, args.concurrency):
+        print(f"{row['variant']:12} {row['urls']:>5} {row['changed']:>8} {row['fetches']:>8} {row['parses']:>7} "
+              f"{row['llm_calls']:>10} {row['total_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
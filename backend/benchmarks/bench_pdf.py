@@ -0,0 +1,93 @@
+"""
+PDFレンダリングの同時実行ベンチマーク（/api/generate-pdf 経由）。
+
+wkhtmltopdf が見つかればそれを、なければ --render-delay 秒かかる代替スクリプトを使う。
+ワーカー数 --workers、待ち行列 --queue-depth のもとで、同時接続数を変えながら
+毎回内容の違うレポート（PDFキャッシュは無効）を --requests 件ずつ生成する。
+
+    cd backend
+    python -m benchmarks.bench_pdf --requests 40 --workers 2 --concurrency 1,2,8
+"""
+import argparse
+import asyncio
+import os
+import shutil
+from typing import Any, Dict, List
+
+from benchmarks.harness import MODES, app_client, bench_stack, load_app, run_load
+from benchmarks.standins import write_fake_wkhtmltopdf
+
+SCORES = {"sns_score": 4.5, "structure_score": 6.0, "ux_score": 7.0, "app_score": 3.0, "theme_score": 5.5}
+
+
+def report(i: int) -> Dict[str, Any]:
+    return {
+        "url": f"https://shop{i}.example/",
+        "product_names": [f"商品{n}" for n in range(10)],
+        "category_links": ["https://shop.example/collections/all"],
+        "prices": [2980, 5980],
+        "advice": "強みは商品数、弱みはレビュー不足です。" * 20,
+        "competitor_summary": "商品数: 10点",
+        "social_links": {},
+        "diagnostic_scores": SCORES,
+    }
+
+
+def run(requests: int = 40, concurrency_levels: List[int] = (1, 2, 8), workers: int = 2, queue_depth: int = 20,
+        render_delay: float = 0.2, mode: str = "inprocess") -> List[Dict[str, Any]]:
+    with bench_stack() as stack:
+        main = load_app(stack)
+        from app.utils import pdf_generator
+
+        renderer = os.environ.get("WKHTMLTOPDF_PATH") or shutil.which("wkhtmltopdf")
+        pdf_generator.WKHTMLTOPDF_PATH = renderer or write_fake_wkhtmltopdf(stack.workdir, render_delay)
+        pdf_generator.PDF_RENDER_WORKERS = workers
+        pdf_generator.PDF_QUEUE_MAX_DEPTH = queue_depth
+
+        async def scenario() -> List[Dict[str, Any]]:
+            results = []
+            async with app_client(main, mode) as client:
+                offset = 0
+                for concurrency in concurrency_levels:
+                    pdf_generator._render_slots = None
+                    before = pdf_generator.pdf_render_stats()
+                    row = await run_load(
+                        lambda i, base=offset: client.post("/api/generate-pdf", json=report(base + i)),
+                        requests, concurrency)
+                    after = pdf_generator.pdf_render_stats()
+                    renders = after["renders"] - before["renders"]
+                    wait = after["queue_wait_seconds_total"] - before["queue_wait_seconds_total"]
+                    results.append({
+                        "renderer": "wkhtmltopdf" if renderer else "stand-in",
+                        "workers": workers,
+                        "mode": mode,
+                        **row,
+                        "rejected": after["rejected"] - before["rejected"],
+                        "queue_wait_avg_ms": round(wait / renders * 1000, 2) if renders else 0.0,
+                    })
+                    offset += requests
+            return results
+
+        return asyncio.run(scenario())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", default="1,2,8", help="同時接続数（カンマ区切り）")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-depth", type=int, default=20)
+    parser.add_argument("--render-delay", type=float, default=0.2)
+    parser.add_argument("--mode", choices=MODES, default="inprocess")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    print(f"{'renderer':12} {'workers':>8} {'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'wait ms':>9} {'rejected':>9} {'errors':>7}")
+    for row in run(args.requests, levels, args.workers, args.queue_depth, args.render_delay, args.mode):
+        print(f"{row['renderer']:12} {row['workers']:>8} {row['concurrency']:>5} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['queue_wait_avg_ms']:>9} {row['rejected']:>9} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
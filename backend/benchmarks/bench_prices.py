@@ -0,0 +1,133 @@
+"""
+価格表記のパースのスループットを計測するベンチマーク。
+
+ストアでよく見る書式（通貨記号、桁区切り、全角数字、価格帯、セール価格と通常価格、税込表記、小数、"万"）を
+混ぜた --count 件の価格文字列を作り、次の方法で数値にした速度と、読み違えた件数（errors）を比べる。
+
+- digits: 変更前の analyze_url と同じく、数字以外を捨てて int にする
+- regex_loop: 1件ずつ NFKC と正規表現で最初の数値を読む（変更前の scoring.parse_prices）
+- item_loop: parse_price_array と同じ規則（価格帯・税込）を1件ずつ適用する
+- batch: app.utils.prices.parse_price_array（全件をまとめて正規表現と NumPy で処理）
+- batch_stats: parse_price_array に加えて中央値・四分位・外れ値の除外までを行う price_statistics
+
+    cd backend
+    python -m benchmarks.bench_prices --count 100000
+"""
+import argparse
+import math
+import random
+import re
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+_FULL_WIDTH = str.maketrans("0123456789,", "０１２３４５６７８９，")
+_LEGACY_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def sample_prices(count: int, seed: int = 0) -> Tuple[List[str], List[float]]:
+    """(価格文字列, 期待する値) を count 件作る。価格帯は下限、税込表記があれば税込の値を期待値とする。"""
+    rng = random.Random(seed)
+    texts, expected = [], []
+    for _ in range(count):
+        price = rng.randrange(300, 50000, 10)
+        kind = rng.randrange(9)
+        if kind == 0:
+            text = f"¥{price:,}"
+        elif kind == 1:
+            text = f"{price:,}円"
+        elif kind == 2:
+            text = f"￥{price:,}".translate(_FULL_WIDTH)
+        elif kind == 3:
+            text = f"¥{price:,}〜¥{price * 2:,}"
+        elif kind == 4:
+            text = f"¥{price:,} ¥{price + 1000:,}"
+        elif kind == 5:
+            tax_included = math.floor(price * 1.1)
+            text, price = f"¥{price:,}(税込¥{tax_included:,})", tax_included
+        elif kind == 6:
+            price = price / 100
+            text = f"${price:.2f}"
+        elif kind == 7:
+            text = f"{price / 10000:g}万円"
+        else:
+            text = f"{price:,}円（税込）"
+        texts.append(text)
+        expected.append(float(price))
+    return texts, expected
+
+
+def digits_only(prices: Sequence[str]) -> List[float]:
+    return [float("".join(filter(str.isdigit, price)) or "nan") for price in prices]
+
+
+def regex_loop(prices: Sequence[str]) -> List[float]:
+    values = []
+    for price in prices:
+        match = _LEGACY_PATTERN.search(unicodedata.normalize("NFKC", price))
+        values.append(float(match.group().replace(",", "")) if match else float("nan"))
+    return values
+
+
+def item_loop(prices: Sequence[str]) -> List[float]:
+    from app.utils.prices import _LINE, _TAX_INCLUDED, _parse_number
+
+    values = []
+    for price in prices:
+        text = unicodedata.normalize("NFKC", price)
+        low, man, high, _, marked = _LINE.match(text).groups()
+        value = _parse_number(low, man) if low else float("nan")
+        if not high and not marked and "税込" in text:
+            match = _TAX_INCLUDED.search(text)
+            if match:
+                value = _parse_number(*(match.group(1, 2) if match.group(1) else match.group(3, 4)))
+        values.append(value)
+    return values
+
+
+def _errors(values: Sequence[float], expected: Sequence[float]) -> int:
+    return sum(1 for value, want in zip(values, expected) if not math.isclose(value, want, rel_tol=1e-9))
+
+
+def _measure(name: str, parse: Callable[[Sequence[str]], Any], texts: List[str], expected: List[float],
+             repeat: int, check: bool = True) -> Dict[str, Any]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        values = parse(texts)
+        best = min(best, time.perf_counter() - started)
+    return {
+        "variant": name,
+        "count": len(texts),
+        "total_ms": round(best * 1000, 1),
+        "parse_ops_s": round(len(texts) / best),
+        "errors": _errors(list(values), expected) if check else 0,
+    }
+
+
+def run(count: int = 100000, repeat: int = 5) -> List[Dict[str, Any]]:
+    from app.utils.prices import parse_price_array, price_statistics
+
+    texts, expected = sample_prices(count)
+    return [
+        _measure("digits", digits_only, texts, expected, repeat),
+        _measure("regex_loop", regex_loop, texts, expected, repeat),
+        _measure("item_loop", item_loop, texts, expected, repeat),
+        _measure("batch", lambda values: parse_price_array(values)[0], texts, expected, repeat),
+        _measure("batch_stats", price_statistics, texts, expected, repeat, check=False),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'variant':12} {'count':>8} {'total ms':>9} {'strings/s':>10} {'errors':>7}")
+    for row in run(args.count, args.repeat):
+        print(f"{row['variant']:12} {row['count']:>8} {row['total_ms']:>9} {row['parse_ops_s']:>10} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Shopify の注文の取り込みと集計のベンチマーク。
+
+analytics: --orders 件の合成注文（顧客の約1割はゲスト、2年分）で、次の集計の時間を比べる。
+errors は loop と numpy の結果が一致しなかった項目の数。
+
+- loop: 注文の dict を1件ずつたどって月ごとの売上・顧客数・リピート顧客を数える
+- numpy: app.utils.shopify.revenue_summary（列ごとの配列をまとめて集計）
+- cohort_ltv / ltv_validation: コホートLTVとその検証（numpy のみ）
+
+ingest: ShopifyStandIn（1ページごとに --latency 秒）から --ingest-orders 件を取り込む時間を比べる。
+
+- sequential: 1ページ受け取って列に変換してから次のページを取得する
+- prefetch: app.utils.shopify.sync_orders（変換中に次のページの取得を進める）
+
+    cd backend
+    python -m benchmarks.bench_shopify --orders 1000000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.standins import ShopifyStandIn
+
+DOMAIN = "bench.myshopify.com"
+
+
+def sample_columns(count: int, seed: int = 0):
+    from app.utils.shopify import OrderColumns
+
+    rng = np.random.default_rng(seed)
+    customers = rng.zipf(1.6, count) % max(count // 3, 1) + 1
+    customers[rng.random(count) < 0.1] = 0
+    seconds = np.sort(rng.integers(0, 2 * 365 * 86400, count))
+    created_at = np.datetime64("2023-01-01T00:00:00") + seconds.astype("timedelta64[s]")
+    totals = np.round(rng.lognormal(8.5, 0.6, count))
+    return OrderColumns(np.arange(1, count + 1, dtype=np.int64), created_at, customers.astype(np.int64), totals, count)
+
+
+def sample_orders(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Admin API の形の注文（ORDER_FIELDS の列）を count 件作る。"""
+    columns = sample_columns(count, seed)
+    return [
+        {"id": int(order_id), "created_at": f"{created_at}+09:00", "total_price": f"{total:.2f}",
+         "customer": {"id": int(customer_id)} if customer_id else None, "cancelled_at": None, "test": False}
+        for order_id, created_at, customer_id, total in zip(
+            columns.ids.tolist(), columns.created_at.astype(str), columns.customer_ids.tolist(), columns.totals.tolist()
+        )
+    ]
+
+
+def loop_summary(orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """revenue_summary と同じ集計を、注文を1件ずつたどって行う。"""
+    months: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+    customer_orders: Dict[int, int] = defaultdict(int)
+    first_month: Dict[int, str] = {}
+    buyers: Dict[str, set] = defaultdict(set)
+    for order in orders:
+        month = order["created_at"][:7]
+        months[month][0] += 1
+        months[month][1] += order["total"]
+        customer_id = order["customer_id"]
+        if customer_id:
+            customer_orders[customer_id] += 1
+            if customer_id not in first_month or month < first_month[customer_id]:
+                first_month[customer_id] = month
+            buyers[month].add(customer_id)
+    return {
+        "total_orders": len(orders),
+        "unique_customers": len(customer_orders),
+        "repeat_customers": sum(1 for count in customer_orders.values() if count >= 2),
+        "monthly_trends": [
+            {"month": month, "orders": months[month][0],
+             "returning_customers": sum(1 for customer_id in buyers[month] if first_month[customer_id] < month)}
+            for month in sorted(months)
+        ],
+    }
+
+
+def _mismatches(expected: Dict[str, Any], actual: Dict[str, Any]) -> int:
+    errors = sum(expected[key] != actual[key] for key in ("total_orders", "unique_customers", "repeat_customers"))
+    trends = [{key: trend[key] for key in ("month", "orders", "returning_customers")} for trend in actual["monthly_trends"]]
+    return errors + (trends != expected["monthly_trends"])
+
+
+def _timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def run_analytics(orders: int, repeat: int) -> List[Dict[str, Any]]:
+    from app.utils.shopify import cohort_ltv, ltv_validation, revenue_summary
+
+    columns = sample_columns(orders)
+    records = [
+        {"created_at": str(created_at), "customer_id": customer_id, "total": total}
+        for created_at, customer_id, total in zip(
+            columns.created_at.astype(str), columns.customer_ids.tolist(), columns.totals.tolist()
+        )
+    ]
+    expected, loop_ms = _timed(loop_summary, records)
+    rows = [{"phase": "analytics", "variant": "loop", "orders": orders, "total_ms": loop_ms, "errors": 0}]
+    for name, fn, args in [("numpy", revenue_summary, (columns,)), ("cohort_ltv", cohort_ltv, (columns, 24)),
+                           ("ltv_validation", ltv_validation, (columns, 3, 12))]:
+        best, result = float("inf"), None
+        for _ in range(repeat):
+            result, elapsed = _timed(fn, *args)
+            best = min(best, elapsed)
+        errors = _mismatches(expected, result) if name == "numpy" else 0
+        rows.append({"phase": "analytics", "variant": name, "orders": orders, "total_ms": best, "errors": errors})
+    return rows
+
+
+async def _ingest_sequential(client) -> int:
+    from app.utils.shopify import OrderColumns
+
+    url, params, parts = f"{client.api_url}/orders.json", {"status": "any", "limit": client.page_size}, []
+    while url:
+        response = await client._get(url, params)
+        parts.append(OrderColumns.from_orders(response.json()["orders"]))
+        url, params = response.links.get("next", {}).get("url"), None
+    return len(OrderColumns.concat(parts))
+
+
+async def _ingest(variant: str, standin: ShopifyStandIn, directory: str) -> int:
+    from app.utils.http_client import close_http_client
+    from app.utils.shopify import ShopifyClient, ShopifyOrderStore, sync_orders
+
+    client = ShopifyClient(DOMAIN, standin.access_token, base_url=standin.url)
+    try:
+        if variant == "sequential":
+            return await _ingest_sequential(client)
+        return (await sync_orders(client, ShopifyOrderStore(directory), "bench@example.com"))["orders"]
+    finally:
+        await close_http_client()
+
+
+def run_ingest(orders: int, latency: float) -> List[Dict[str, Any]]:
+    rows = []
+    with ShopifyStandIn(sample_orders(orders), latency=latency) as standin:
+        for variant in ("sequential", "prefetch"):
+            with tempfile.TemporaryDirectory() as directory:
+                requests_before = standin.requests
+                started = time.perf_counter()
+                ingested = asyncio.run(_ingest(variant, standin, directory))
+                elapsed = time.perf_counter() - started
+            rows.append({
+                "phase": "ingest",
+                "variant": variant,
+                "orders": orders,
+                "pages": standin.requests - requests_before,
+                "total_ms": round(elapsed * 1000, 1),
+                "orders_ops_s": round(ingested / elapsed),
+                "errors": orders - ingested,
+            })
+    return rows
+
+
+def run(orders: int = 1000000, repeat: int = 3, ingest_orders: int = 20000, latency: float = 0.02) -> List[Dict[str, Any]]:
+    return run_analytics(orders, repeat) + run_ingest(ingest_orders, latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ingest-orders", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"{'phase':10} {'variant':15} {'orders':>8} {'total ms':>9} {'orders/s':>9} {'errors':>7}")
+    for row in run(args.orders, args.repeat, args.ingest_orders, args.latency):
+        print(f"{row['phase']:10} {row['variant']:15} {row['orders']:>8} {row['total_ms']:>9} "
+              f"{row.get('orders_ops_s', ''):>9} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
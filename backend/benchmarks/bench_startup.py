@@ -0,0 +1,126 @@
+"""
+アプリの起動時間のプロファイル。
+
+新しいプロセスで `python -X importtime` を使って app.main を import し、次を出す。
+
+- total: app.main の import 全体（import 時の初期化処理を含む）
+- startup: 起動イベント（HTTPクライアント、ジョブキュー、アウトボックスなど）の所要時間
+- パッケージごとの import 時間（self の合計、大きい順に --top 件）
+- ウォームアップの各手順の所要時間（起動後にバックグラウンドで実行される分）
+
+Supabase などの環境変数は既定で外して実行する（--keep-env で残す）。--repeat 回の中央値を使う。
+
+    cd backend
+    python -m benchmarks.bench_startup --top 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 起動時間に影響する外部サービスの設定。外しても app.main は import できなければならない
+SERVICE_ENV = ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY", "ENCRYPTION_KEY")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main as main
+imported = time.perf_counter() - started
+
+async def lifecycle():
+    started = time.perf_counter()
+    await main.app.router.startup()
+    startup = time.perf_counter() - started
+    await main.warmup.wait()
+    await main.app.router.shutdown()
+    return startup
+
+startup = asyncio.run(lifecycle())
+print(json.dumps({"import_s": imported, "startup_s": startup, "warmup": main.warmup.stats()}))
+sys.stdout.flush()
+"""
+
+
+def parse_importtime(stderr: str, module: str = "app.main") -> Dict[str, float]:
+    """
+    -X importtime の出力を、トップレベルのパッケージ（app 配下はモジュール）ごとの self 時間[秒]にまとめる。
+    module の import が終わった後の行（起動イベントやウォームアップでの import）は含めない。
+    """
+    packages: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, _, _, name = match.groups()
+        package = name if name.startswith("app.") else name.split(".")[0]
+        packages[package] += int(self_us) / 1e6
+        if name == module:
+            break
+    return dict(packages)
+
+
+def profile_once(keep_env: bool = False) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {key: value for key, value in os.environ.items() if keep_env or key not in SERVICE_ENV}
+        env.update({
+            "OUTBOX_SQLITE_PATH": os.path.join(workdir, "outbox.sqlite3"),
+            "PYTHONDONTWRITEBYTECODE": "1",
+            "PYTHONPATH": BACKEND_DIR,
+        })
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=workdir, env=env,
+                                   capture_output=True, text=True, timeout=120)
+    if completed.returncode != 0:
+        raise RuntimeError(f"app.main failed to start:\n{completed.stderr[-2000:]}")
+    return {**json.loads(completed.stdout.strip().splitlines()[-1]), "packages": parse_importtime(completed.stderr)}
+
+
+def run(repeat: int = 3, top: int = 15, keep_env: bool = False) -> List[Dict[str, Any]]:
+    profiles = [profile_once(keep_env) for _ in range(repeat)]
+
+    def median_ms(values: List[float]) -> float:
+        return round(statistics.median(values) * 1000, 1)
+
+    rows = [
+        {"phase": "import", "name": "total", "time_ms": median_ms([p["import_s"] for p in profiles])},
+        {"phase": "startup", "name": "total", "time_ms": median_ms([p["startup_s"] for p in profiles])},
+    ]
+    packages = {name for p in profiles for name in p["packages"]}
+    by_package = {name: median_ms([p["packages"].get(name, 0.0) for p in profiles]) for name in packages}
+    for name, time_ms in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        rows.append({"phase": "import", "name": name, "time_ms": time_ms})
+    steps = {name for p in profiles for name in p["warmup"]["steps"]}
+    for name in sorted(steps):
+        results = [p["warmup"]["steps"][name] for p in profiles if name in p["warmup"]["steps"]]
+        rows.append({"phase": "warmup", "name": name, "time_ms": median_ms([r["seconds"] for r in results]),
+                     "errors": sum(not r["ok"] for r in results)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="表示するパッケージの数")
+    parser.add_argument("--keep-env", action="store_true", help="Supabase などの環境変数を外さずに実行する")
+    parser.add_argument("--json", action="store_true", help="表ではなくJSONで出力する")
+    args = parser.parse_args()
+
+    rows = run(args.repeat, args.top, args.keep_env)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'phase':8} {'name':36} {'ms':>9} {'errors':>7}")
+    for row in rows:
+        print(f"{row['phase']:8} {row['name']:36} {row['time_ms']:>9} {row.get('errors', ''):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Supabaseデータ層の並行実行ベンチマーク。
+
+ローカルのPostgREST代替サーバー（応答に --latency 秒かかる）に対して
+--concurrency 件の get_user_settings を同時に実行し、その間のイベントループ遅延を計測する。
+
+- blocking: 変更前と同じく、同期クライアントを async ハンドラ内で直接呼ぶ
+- offloaded: app.utils.supabase の非同期API（専用スレッドプールに逃がす）
+
+    cd backend
+    python -m benchmarks.bench_supabase --concurrency 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, register_user_context_rpc
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> List[float]:
+    """interval ごとに起床し、予定より遅れた時間（秒）を記録する。"""
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval))
+    return lags
+
+
+def seed(standin: PostgrestStandIn, users: int) -> List[str]:
+    register_user_context_rpc(standin)
+    user_ids = []
+    for i in range(users):
+        user_id = f"00000000-0000-0000-0000-{i:012d}"
+        standin.insert("users", {"id": user_id, "created_at": "2026-01-01T00:00:00"})
+        standin.insert("user_settings", {"user_id": user_id, "notion_database_id": f"db-{i}"})
+        user_ids.append(user_id)
+    return user_ids
+
+
+async def run_scenario(name: str, call, user_ids: List[str], concurrency: int) -> Dict[str, Any]:
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0.02)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(user_ids[i % len(user_ids)]) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    lags = await monitor
+    lags.sort()
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "total_s": round(elapsed, 3),
+        "loop_lag_p50_ms": round(statistics.median(lags) * 1000, 2) if lags else 0.0,
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2) if lags else 0.0,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else 0.0,
+    }
+
+
+def run(concurrency: int = 50, latency: float = 0.05) -> List[Dict[str, Any]]:
+    with PostgrestStandIn(latency=latency) as standin:
+        user_ids = seed(standin, 10)
+        os.environ["SUPABASE_URL"] = standin.supabase_url
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = FAKE_SERVICE_ROLE_KEY
+        # 毎回DBに問い合わせる状態を測るため、ユーザーコンテキストのキャッシュは無効にする
+        os.environ.setdefault("USER_CONTEXT_CACHE_MAX_ENTRIES", "0")
+
+        from app.utils import supabase as db
+
+        async def blocking(user_id):
+            return db._get_user_settings(user_id)
+
+        async def offloaded(user_id):
+            return await db.get_user_settings(user_id)
+
+        async def main():
+            return [
+                await run_scenario("blocking", blocking, user_ids, concurrency),
+                await run_scenario("offloaded", offloaded, user_ids, concurrency),
+            ]
+
+        return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"{'scenario':12} {'concurrency':>12} {'total s':>9} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for row in run(args.concurrency, args.latency):
+        print(f"{row['scenario']:12} {row['concurrency']:>12} {row['total_s']:>9} "
+              f"{row['loop_lag_p50_ms']:>11} {row['loop_lag_p99_ms']:>11} {row['loop_lag_max_ms']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+アプリ全体を動かすベンチマーク（bench_analyze / bench_history / bench_pdf）の共通処理。
+
+外部サービスはすべて standins のローカル代替サーバーに向け、FastAPI アプリを
+プロセス内（httpx の ASGITransport）または uvicorn で動かす。
+"""
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, OpenAIStandIn, PostgrestStandIn, SiteStandIn
+
+MODES = ("inprocess", "uvicorn")
+
+
+class Stack:
+    """ベンチマーク中に動かす代替サーバー一式と作業ディレクトリ。"""
+
+    def __init__(self, workdir: str, site: SiteStandIn, openai: OpenAIStandIn, postgrest: PostgrestStandIn):
+        self.workdir = workdir
+        self.site = site
+        self.openai = openai
+        self.postgrest = postgrest
+
+
+@contextmanager
+def bench_stack(site_pages: Optional[Dict[str, Any]] = None, site_latency: float = 0.0,
+                llm_latency: float = 0.0, db_latency: float = 0.0) -> Iterator[Stack]:
+    """
+    代替サーバーを立て、app.main を読み込む前に必要な環境変数をそれらに向ける。
+    SQLite のアウトボックスなどの書き込み先は一時ディレクトリにする。
+    """
+    with tempfile.TemporaryDirectory(prefix="hanno-bench-") as workdir, \
+            SiteStandIn(site_pages, latency=site_latency) as site, \
+            OpenAIStandIn(latency=llm_latency) as openai, \
+            PostgrestStandIn(latency=db_latency) as postgrest:
+        os.environ.update({
+            "SUPABASE_URL": postgrest.supabase_url,
+            "SUPABASE_SERVICE_ROLE_KEY": FAKE_SERVICE_ROLE_KEY,
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_API_BASE": openai.api_base,
+            "ANALYSIS_CACHE_BACKEND": "memory",
+            "JOB_STORE_BACKEND": "memory",
+            "OUTBOX_BACKEND": "sqlite",
+            "OUTBOX_SQLITE_PATH": os.path.join(workdir, "outbox.sqlite3"),
+            "PDF_CACHE_MAX_BYTES": "0",
+        })
+        for name in ("SLACK_WEBHOOK_URL", "NOTION_API_KEY", "NOTION_DATABASE_ID"):
+            os.environ.pop(name, None)
+        yield Stack(workdir, site, openai, postgrest)
+
+
+def load_app(stack: Stack) -> Any:
+    """
+    app.main を読み込み、キャッシュや外部クライアントを stack 向けの新しいものに差し替えて返す。
+    同じプロセスで何度ベンチマークを回しても、前回の状態を持ち越さない。
+    """
+    from supabase import create_client
+    from app import main
+    from app.utils import advice, analysis_cache, pdf_cache
+    from app.utils import supabase as db
+
+    db.supabase = create_client(stack.postgrest.supabase_url, FAKE_SERVICE_ROLE_KEY)
+    # レート制限はかけず、アプリ側の処理だけを測る
+    advice._advice_service = advice.AdviceService(api_base=stack.openai.api_base, rpm_limit=0, tpm_limit=0)
+    analysis_cache._analysis_cache = None
+    pdf_cache._pdf_cache = None
+    main.analysis_flights = type(main.analysis_flights)()
+    return main
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def app_client(main: Any, mode: str = "inprocess", timeout: float = 120.0) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    mode="inprocess": ASGITransport で同じイベントループ上のアプリを直接呼ぶ（ネットワークを通らない）
+    mode="uvicorn": 別スレッドの uvicorn（HTTP/1.1、ループは別）に実際のソケットで接続する
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if mode == "inprocess":
+        await main.app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                yield client
+        finally:
+            await main.app.router.shutdown()
+        return
+
+    if mode != "uvicorn":
+        raise ValueError(f"Unknown mode: {mode} (choose from {', '.join(MODES)})")
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False, lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        await asyncio.sleep(0.02)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await asyncio.to_thread(thread.join, 10)
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """レイテンシ（秒）の一覧を、結果のJSONに載せる集計値（ミリ秒）にまとめる。"""
+    samples = sorted(latencies)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(samples, 0.99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+    }
+
+
+async def run_load(send: Callable[[int], Awaitable[httpx.Response]], total: int, concurrency: int,
+                   ok: Callable[[httpx.Response], bool] = lambda response: response.is_success) -> Dict[str, Any]:
+    """
+    send(i) を i = 0..total-1 について、同時に concurrency 件まで実行する（クローズドループ）。
+    ok が偽を返した応答と例外はエラーとして数える。
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await send(i)
+                if not ok(response):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, total)))])
+    return {"concurrency": concurrency, **summarize(latencies, time.perf_counter() - started, errors)}
@@ -0,0 +1,175 @@
+"""
+ベンチマークをまとめて実行し、結果をJSONに保存する。--baseline を渡すと前回の結果と比べ、
+--threshold（既定15%）を超えて悪化した指標があれば一覧を出して終了コード1で終わる。
+
+各スイートは別プロセスで動かす（環境変数やモジュールの状態を持ち越さないため）。
+
+    cd backend
+    python -m benchmarks.run --output benchmarks/results/main.json
+    python -m benchmarks.run --quick --baseline benchmarks/results/main.json
+
+結果のJSON:
+    {"meta": {...実行環境...}, "suites": {"extract": {"seconds": 1.2, "results": [{...}, ...]}, ...}}
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# スイート名 -> (モジュール, 通常の引数, --quick の引数)
+SUITES: Dict[str, Tuple[str, Dict[str, Any], Dict[str, Any]]] = {
+    "extract": ("benchmarks.bench_extract", {"repeat": 5}, {"repeat": 2}),
+    "crypto": ("benchmarks.bench_crypto", {"iterations": 20000}, {"iterations": 2000}),
+    "prices": ("benchmarks.bench_prices", {"count": 100000, "repeat": 5}, {"count": 20000, "repeat": 2}),
+    "supabase": ("benchmarks.bench_supabase", {"concurrency": 50, "latency": 0.05}, {"concurrency": 20, "latency": 0.02}),
+    "analyze": ("benchmarks.bench_analyze", {"requests": 200, "concurrency": 20}, {"requests": 40, "concurrency": 10}),
+    "history": ("benchmarks.bench_history", {"rows": 10000, "requests": 200, "concurrency": 20},
+                {"rows": 10000, "requests": 40, "concurrency": 10}),
+    "history_transfer": ("benchmarks.bench_history_transfer", {"rows": 20000, "import_rows": 2000},
+                         {"rows": 5000, "import_rows": 500}),
+    "pdf": ("benchmarks.bench_pdf", {"requests": 40}, {"requests": 12}),
+    "startup": ("benchmarks.bench_startup", {"repeat": 3}, {"repeat": 1}),
+    "shopify": ("benchmarks.bench_shopify", {"orders": 1000000, "repeat": 3, "ingest_orders": 20000, "latency": 0.02},
+                {"orders": 200000, "repeat": 1, "ingest_orders": 2000, "latency": 0.01}),
+    "monitor": ("benchmarks.bench_monitor", {"urls": 200, "changed": 10, "llm_latency": 0.5},
+                {"urls": 60, "changed": 5, "rebuilt": 5}),
+}
+
+# 結果の行のうち、数値の比較に使う指標。それ以外の列は行を突き合わせるキーになる
+LOWER_IS_BETTER_SUFFIXES = ("_ms", "_s", "_mb")
+HIGHER_IS_BETTER_SUFFIXES = ("_rps", "_ops_s")
+LOWER_IS_BETTER_COUNTS = ("errors", "rejected")
+
+
+def metric_direction(name: str) -> int:
+    """1: 大きいほど良い、-1: 小さいほど良い、0: 指標ではない（行のキー）。"""
+    if name.endswith(HIGHER_IS_BETTER_SUFFIXES):
+        return 1
+    if name.endswith(LOWER_IS_BETTER_SUFFIXES) or name in LOWER_IS_BETTER_COUNTS:
+        return -1
+    return 0
+
+
+def _row_key(row: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((name, json.dumps(value)) for name, value in row.items()
+                        if metric_direction(name) == 0 and name not in ("requests", "llm_calls", "rows_read")))
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.15) -> List[Dict[str, Any]]:
+    """
+    同じスイート・同じキーの行どうしで指標を比べ、threshold を超えて悪化したものを返す。
+    件数の指標（errors など）は増えたら悪化とみなす。
+    """
+    regressions = []
+    for suite, result in current.get("suites", {}).items():
+        previous = {_row_key(row): row for row in baseline.get("suites", {}).get(suite, {}).get("results", [])}
+        for row in result.get("results", []):
+            old_row = previous.get(_row_key(row))
+            if old_row is None:
+                continue
+            for name, value in row.items():
+                direction = metric_direction(name)
+                old = old_row.get(name)
+                if not direction or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                    continue
+                if name in LOWER_IS_BETTER_COUNTS:
+                    worse = value > old
+                    change = float(value - old)
+                elif old == 0:
+                    continue
+                else:
+                    change = (value - old) / old
+                    worse = -change * direction > threshold
+                if worse:
+                    keys = {k: v for k, v in row.items() if metric_direction(k) == 0}
+                    regressions.append({"suite": suite, "row": keys, "metric": name, "baseline": old,
+                                        "current": value, "change": round(change, 3)})
+    return regressions
+
+
+def _run_suite(module_name: str, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    import importlib
+
+    return importlib.import_module(module_name).run(**options)
+
+
+def run_suite(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    module_name = SUITES[name][0]
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        results = pool.apply(_run_suite, (module_name, options))
+    return {"seconds": round(time.perf_counter() - started, 2), "options": options, "results": results}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(quick: bool, mode: str) -> Dict[str, Any]:
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+        "mode": mode,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default=",".join(SUITES), help="実行するスイート（カンマ区切り）")
+    parser.add_argument("--quick", action="store_true", help="件数を減らして短時間で回す")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess",
+                        help="analyze/history/pdf でアプリを動かす方法")
+    parser.add_argument("--output", default=None, help="結果のJSON（既定: benchmarks/results/<時刻>.json）")
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果のJSON")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.suites.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)} (choose from {', '.join(SUITES)})")
+
+    report = {"meta": environment(args.quick, args.mode), "suites": {}}
+    for name in names:
+        _, options, quick_options = SUITES[name]
+        options = dict(quick_options if args.quick else options)
+        if name in ("analyze", "history", "pdf"):
+            options["mode"] = args.mode
+        print(f"running {name} {options}", flush=True)
+        report["suites"][name] = run_suite(name, options)
+        print(f"  {len(report['suites'][name]['results'])} rows in {report['suites'][name]['seconds']}s", flush=True)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results",
+                                         datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), report, args.threshold)
+        for item in regressions:
+            print(f"REGRESSION {item['suite']} {item['row']} {item['metric']}: "
+                  f"{item['baseline']} -> {item['current']} ({item['change']:+})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
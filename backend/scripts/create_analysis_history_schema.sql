@@ -30,3 +30,7 @@ create policy "Users can insert their own analysis history"
   on public.analysis_history
   for insert
   with check (auth.email() = user_email);
+
+-- 履歴一覧のキーセットページング（user_email ごとに analyzed_at, id の降順）用
+create index if not exists analysis_history_user_email_analyzed_at_idx
+  on public.analysis_history (user_email, analyzed_at desc, id desc);
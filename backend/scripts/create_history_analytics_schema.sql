@@ -0,0 +1,274 @@
+-- 分析履歴の集計（GET /api/history/analytics で使用）
+-- create_analysis_history_schema.sql のあとに実行する。
+-- analysis_history への insert/update/delete のたびにトリガーで集計表を増減させるので、
+-- 集計のときに summary_json や履歴の全行を読まない。日付は Asia/Tokyo の日で区切る。
+
+-- URL のホスト（小文字、先頭の www. を除く）。app/utils/history_analytics.py の domain_of と同じ規則
+create or replace function public.analysis_history_domain(url text)
+returns text as $$
+  select regexp_replace(
+    lower(coalesce(substring(url from '^[A-Za-z][A-Za-z0-9+.-]*://([^/?#:]+)'), url)),
+    '^www\.', ''
+  );
+$$ language sql immutable;
+
+-- 日ごとの件数とスコアの合計。tag = '' はタグに関係なく全件、それ以外はそのタグのついた履歴だけ
+create table if not exists public.analysis_history_daily (
+  user_email text not null,
+  day date not null,
+  tag text not null default '',
+  analyses integer not null default 0,
+  scored integer not null default 0,
+  sns_score_sum float not null default 0,
+  structure_score_sum float not null default 0,
+  ux_score_sum float not null default 0,
+  app_score_sum float not null default 0,
+  theme_score_sum float not null default 0,
+  primary key (user_email, day, tag)
+);
+
+-- ドメインごとの分析回数と最新の分析のスコア
+create table if not exists public.analysis_history_domains (
+  user_email text not null,
+  domain text not null,
+  analyses integer not null default 0,
+  latest_id uuid,
+  latest_url text,
+  latest_at timestamp with time zone,
+  sns_score float,
+  structure_score float,
+  ux_score float,
+  app_score float,
+  theme_score float,
+  primary key (user_email, domain)
+);
+
+-- ユーザーの履歴が変わるたびに増える番号（ETag に使う）
+create table if not exists public.analysis_history_rollup_versions (
+  user_email text primary key,
+  version bigint not null default 0,
+  updated_at timestamp with time zone default now()
+);
+
+alter table public.analysis_history_daily enable row level security;
+alter table public.analysis_history_domains enable row level security;
+alter table public.analysis_history_rollup_versions enable row level security;
+
+-- 1件の履歴を集計表に足す（delta = 1）か引く（delta = -1）
+create or replace function public.apply_analysis_history_rollup(h public.analysis_history, delta integer)
+returns void as $$
+declare
+  v_scored integer := case when coalesce(h.summary_json ? 'diagnostic_scores', false) then 1 else 0 end;
+  v_day date := (coalesce(h.analyzed_at, now()) at time zone 'Asia/Tokyo')::date;
+  v_host text := public.analysis_history_domain(h.url);
+begin
+  insert into public.analysis_history_daily as d (
+    user_email, day, tag, analyses, scored,
+    sns_score_sum, structure_score_sum, ux_score_sum, app_score_sum, theme_score_sum
+  )
+  select h.user_email, v_day, t.tag, delta, delta * v_scored,
+         delta * v_scored * coalesce(h.sns_score, 0), delta * v_scored * coalesce(h.structure_score, 0),
+         delta * v_scored * coalesce(h.ux_score, 0), delta * v_scored * coalesce(h.app_score, 0),
+         delta * v_scored * coalesce(h.theme_score, 0)
+  from (select '' as tag union select distinct unnest(coalesce(h.tags, '{}'))) t
+  on conflict (user_email, day, tag) do update set
+    analyses = d.analyses + excluded.analyses,
+    scored = d.scored + excluded.scored,
+    sns_score_sum = d.sns_score_sum + excluded.sns_score_sum,
+    structure_score_sum = d.structure_score_sum + excluded.structure_score_sum,
+    ux_score_sum = d.ux_score_sum + excluded.ux_score_sum,
+    app_score_sum = d.app_score_sum + excluded.app_score_sum,
+    theme_score_sum = d.theme_score_sum + excluded.theme_score_sum;
+
+  delete from public.analysis_history_daily
+  where user_email = h.user_email and day = v_day
+    and analyses <= 0;
+
+  if delta > 0 then
+    insert into public.analysis_history_domains as d (
+      user_email, domain, analyses, latest_id, latest_url, latest_at,
+      sns_score, structure_score, ux_score, app_score, theme_score
+    ) values (
+      h.user_email, v_host, 1, h.id, h.url, h.analyzed_at,
+      h.sns_score, h.structure_score, h.ux_score, h.app_score, h.theme_score
+    )
+    on conflict (user_email, domain) do update set
+      analyses = d.analyses + 1,
+      latest_id = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.latest_id else d.latest_id end,
+      latest_url = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.latest_url else d.latest_url end,
+      sns_score = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.sns_score else d.sns_score end,
+      structure_score = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.structure_score else d.structure_score end,
+      ux_score = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.ux_score else d.ux_score end,
+      app_score = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.app_score else d.app_score end,
+      theme_score = case when d.latest_at is null or excluded.latest_at >= d.latest_at then excluded.theme_score else d.theme_score end,
+      latest_at = greatest(d.latest_at, excluded.latest_at);
+  else
+    update public.analysis_history_domains set analyses = analyses - 1
+    where user_email = h.user_email and domain = v_host;
+
+    delete from public.analysis_history_domains
+    where user_email = h.user_email and domain = v_host and analyses <= 0;
+
+    -- 最新の分析が消えた（または書き換わった）ときは、残りの履歴から最新を選び直す
+    update public.analysis_history_domains d set
+      latest_id = l.id, latest_url = l.url, latest_at = l.analyzed_at,
+      sns_score = l.sns_score, structure_score = l.structure_score, ux_score = l.ux_score,
+      app_score = l.app_score, theme_score = l.theme_score
+    from (
+      select a.id, a.url, a.analyzed_at, a.sns_score, a.structure_score, a.ux_score, a.app_score, a.theme_score
+      from public.analysis_history a
+      where a.user_email = h.user_email and public.analysis_history_domain(a.url) = v_host
+      order by a.analyzed_at desc, a.id desc
+      limit 1
+    ) l
+    where d.user_email = h.user_email and d.domain = v_host and d.latest_id = h.id;
+  end if;
+end;
+$$ language plpgsql security definer;
+
+create or replace function public.analysis_history_rollup_trigger()
+returns trigger as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform public.apply_analysis_history_rollup(old, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform public.apply_analysis_history_rollup(new, 1);
+  end if;
+
+  insert into public.analysis_history_rollup_versions as v (user_email, version)
+  select distinct email, 1
+  from unnest(array[
+    case when tg_op <> 'INSERT' then old.user_email end,
+    case when tg_op <> 'DELETE' then new.user_email end
+  ]) email
+  where email is not null
+  on conflict (user_email) do update set version = v.version + 1, updated_at = now();
+  return null;
+end;
+$$ language plpgsql security definer;
+
+drop trigger if exists analysis_history_rollup on public.analysis_history;
+create trigger analysis_history_rollup
+  after insert or delete or update of user_email, url, analyzed_at, tags, summary_json,
+    sns_score, structure_score, ux_score, app_score, theme_score
+  on public.analysis_history
+  for each row execute function public.analysis_history_rollup_trigger();
+
+-- 集計表を履歴から作り直す（初回の実行時と、集計表を直したいときに使う）
+create or replace function public.rebuild_analysis_history_rollups()
+returns integer as $$
+declare
+  h public.analysis_history;
+  total integer := 0;
+begin
+  lock table public.analysis_history in share mode;
+  delete from public.analysis_history_daily;
+  delete from public.analysis_history_domains;
+  for h in select * from public.analysis_history order by analyzed_at loop
+    perform public.apply_analysis_history_rollup(h, 1);
+    total := total + 1;
+  end loop;
+  insert into public.analysis_history_rollup_versions as v (user_email, version)
+  select distinct user_email, 1 from public.analysis_history
+  on conflict (user_email) do update set version = v.version + 1, updated_at = now();
+  return total;
+end;
+$$ language plpgsql security definer;
+
+select public.rebuild_analysis_history_rollups();
+
+-- 集計の番号だけを返す（If-None-Match の確認用。集計はしない）
+create or replace function public.get_history_analytics_version(user_email_param text)
+returns bigint as $$
+  select coalesce((select version from public.analysis_history_rollup_versions where user_email = user_email_param), 0);
+$$ language sql stable security definer;
+
+-- 期間 [start_date, end_date) の件数・スコア平均の推移（bucket: day/week/month）、タグごとの平均、
+-- ドメインごとの最新スコア（期間に関係なく、新しい順に domain_limit 件）を返す
+create or replace function public.get_history_analytics(
+  user_email_param text,
+  start_date date default null,
+  end_date date default null,
+  bucket text default 'day',
+  domain_limit integer default 50
+)
+returns json as $$
+  with days as (
+    select *
+    from public.analysis_history_daily
+    where user_email = user_email_param
+      and (start_date is null or day >= start_date)
+      and (end_date is null or day < end_date)
+  ),
+  trend as (
+    select date_trunc(case when bucket in ('day', 'week', 'month') then bucket else 'day' end, day)::date as period,
+           sum(analyses) as analyses, sum(scored) as scored,
+           sum(sns_score_sum) as sns, sum(structure_score_sum) as structure, sum(ux_score_sum) as ux,
+           sum(app_score_sum) as app, sum(theme_score_sum) as theme
+    from days where tag = ''
+    group by 1
+  ),
+  tags as (
+    select tag, sum(analyses) as analyses, sum(scored) as scored,
+           sum(sns_score_sum) as sns, sum(structure_score_sum) as structure, sum(ux_score_sum) as ux,
+           sum(app_score_sum) as app, sum(theme_score_sum) as theme
+    from days where tag <> ''
+    group by tag
+  ),
+  averaged as (
+    select 'trend' as section, period::text as key, analyses, scored,
+           round((sns / nullif(scored, 0))::numeric, 2) as sns_score,
+           round((structure / nullif(scored, 0))::numeric, 2) as structure_score,
+           round((ux / nullif(scored, 0))::numeric, 2) as ux_score,
+           round((app / nullif(scored, 0))::numeric, 2) as app_score,
+           round((theme / nullif(scored, 0))::numeric, 2) as theme_score
+    from trend
+    union all
+    select 'tags', tag, analyses, scored,
+           round((sns / nullif(scored, 0))::numeric, 2), round((structure / nullif(scored, 0))::numeric, 2),
+           round((ux / nullif(scored, 0))::numeric, 2), round((app / nullif(scored, 0))::numeric, 2),
+           round((theme / nullif(scored, 0))::numeric, 2)
+    from tags
+  )
+  select json_build_object(
+    'version', public.get_history_analytics_version(user_email_param),
+    'total_analyses', (select coalesce(sum(analyses), 0) from trend),
+    'trend', (
+      select coalesce(json_agg(json_build_object(
+        'period', key, 'analyses', analyses, 'scored', scored,
+        'average_scores', json_build_object('sns_score', sns_score, 'structure_score', structure_score,
+          'ux_score', ux_score, 'app_score', app_score, 'theme_score', theme_score)
+      ) order by key), '[]'::json)
+      from averaged where section = 'trend'
+    ),
+    'tags', (
+      select coalesce(json_agg(json_build_object(
+        'tag', key, 'analyses', analyses, 'scored', scored,
+        'average_scores', json_build_object('sns_score', sns_score, 'structure_score', structure_score,
+          'ux_score', ux_score, 'app_score', app_score, 'theme_score', theme_score)
+      ) order by analyses desc, key), '[]'::json)
+      from averaged where section = 'tags'
+    ),
+    'domains', (
+      select coalesce(json_agg(json_build_object(
+        'domain', domain, 'analyses', analyses, 'latest_id', latest_id, 'latest_url', latest_url, 'latest_at', latest_at,
+        'latest_scores', json_build_object('sns_score', sns_score, 'structure_score', structure_score,
+          'ux_score', ux_score, 'app_score', app_score, 'theme_score', theme_score)
+      ) order by latest_at desc, domain), '[]'::json)
+      from (
+        select * from public.analysis_history_domains
+        where user_email = user_email_param
+        order by latest_at desc, domain
+        limit domain_limit
+      ) d
+    )
+  );
+$$ language sql stable security definer;
+
+revoke execute on function public.get_history_analytics(text, date, date, text, integer) from public, anon, authenticated;
+grant execute on function public.get_history_analytics(text, date, date, text, integer) to service_role;
+revoke execute on function public.get_history_analytics_version(text) from public, anon, authenticated;
+grant execute on function public.get_history_analytics_version(text) to service_role;
+revoke execute on function public.rebuild_analysis_history_rollups() from public, anon, authenticated;
+grant execute on function public.rebuild_analysis_history_rollups() to service_role;
@@ -0,0 +1,49 @@
+-- Notion/Slack への通知のアウトボックス（app/utils/outbox.py の SupabaseOutboxStore で使用）
+create table if not exists public.outbox_messages (
+  id uuid primary key default uuid_generate_v4(),
+  kind text not null,
+  target text not null,
+  user_id text,
+  payload jsonb not null,
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  next_attempt_at timestamp with time zone not null default now(),
+  claimed_until timestamp with time zone,
+  last_error text,
+  created_at timestamp with time zone not null default now(),
+  delivered_at timestamp with time zone
+);
+
+alter table public.outbox_messages enable row level security;
+
+-- 送信待ちの取り出し用（status = 'pending' の行だけを索引する）
+create index if not exists outbox_messages_due_idx
+  on public.outbox_messages (next_attempt_at, created_at)
+  where status = 'pending';
+
+-- 配送済みの削除用
+create index if not exists outbox_messages_delivered_at_idx
+  on public.outbox_messages (delivered_at)
+  where status = 'delivered';
+
+-- 送信時刻になった行を batch_size 件まで取り出し、lease_seconds 秒のあいだ他のワーカーから隠す。
+-- FOR UPDATE SKIP LOCKED なので、複数のワーカーが同時に呼んでも同じ行を二重に取らない。
+create or replace function public.claim_outbox_messages(batch_size integer, lease_seconds double precision)
+returns setof public.outbox_messages as $$
+  update public.outbox_messages m
+     set claimed_until = now() + make_interval(secs => lease_seconds)
+   where m.id in (
+     select o.id
+       from public.outbox_messages o
+      where o.status = 'pending'
+        and o.next_attempt_at <= now()
+        and (o.claimed_until is null or o.claimed_until < now())
+      order by o.next_attempt_at, o.created_at
+      limit batch_size
+      for update skip locked
+   )
+  returning m.*;
+$$ language sql volatile security definer;
+
+revoke execute on function public.claim_outbox_messages(integer, double precision) from public, anon, authenticated;
+grant execute on function public.claim_outbox_messages(integer, double precision) to service_role;
@@ -0,0 +1,40 @@
+-- 診断スコアをまとめて書き戻す（scripts/rescore_analysis_history.py で使用）
+-- scores: [{"id": ..., "sns_score": ..., "structure_score": ..., "ux_score": ..., "app_score": ..., "theme_score": ...}, ...]
+create or replace function public.rescore_analysis_history(scores jsonb, scoring_version text)
+returns integer as $$
+  with updated as (
+    update public.analysis_history h
+    set sns_score = s.sns_score,
+        structure_score = s.structure_score,
+        ux_score = s.ux_score,
+        app_score = s.app_score,
+        theme_score = s.theme_score,
+        summary_json = case
+          when h.summary_json is null then null
+          else h.summary_json || jsonb_build_object(
+            'diagnostic_scores', jsonb_build_object(
+              'sns_score', s.sns_score,
+              'structure_score', s.structure_score,
+              'ux_score', s.ux_score,
+              'app_score', s.app_score,
+              'theme_score', s.theme_score
+            ),
+            'scoring_version', scoring_version
+          )
+        end
+    from jsonb_to_recordset(scores) as s(
+      id uuid,
+      sns_score float,
+      structure_score float,
+      ux_score float,
+      app_score float,
+      theme_score float
+    )
+    where h.id = s.id
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$ language sql volatile security definer;
+
+revoke execute on function public.rescore_analysis_history(jsonb, text) from public, anon, authenticated;
+grant execute on function public.rescore_analysis_history(jsonb, text) to service_role;
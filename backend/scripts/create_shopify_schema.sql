@@ -0,0 +1,17 @@
+-- 連携した Shopify ストア（app/utils/supabase.py の save_shopify_store などで使用）
+-- access_token は app/utils/crypto.py で暗号化して保存する
+create table if not exists public.shopify_stores (
+  id uuid primary key default uuid_generate_v4(),
+  user_email text not null,
+  store_domain text not null,
+  access_token text not null,
+  connected_at timestamp with time zone not null default now(),
+  unique (user_email, store_domain)
+);
+
+alter table public.shopify_stores enable row level security;
+
+create policy "Users can view their own Shopify stores"
+  on public.shopify_stores
+  for select
+  using (auth.email() = user_email);
@@ -30,3 +30,6 @@ create policy "Users can delete their own settings"
   on public.user_settings
   for delete
   using (auth.uid() = user_id);
+
+create index if not exists user_settings_user_id_idx
+  on public.user_settings (user_id);
@@ -0,0 +1,38 @@
+-- 定期的に再分析する競合ストアのURL（app/utils/monitor.py の TrackedUrlStore で使用）
+create table if not exists public.tracked_urls (
+  id uuid primary key default uuid_generate_v4(),
+  user_email text not null,
+  user_id text,
+  url text not null,
+  interval_seconds integer not null default 604800,
+  active boolean not null default true,
+  next_check_at timestamp with time zone not null default now(),
+  last_checked_at timestamp with time zone,
+  last_changed_at timestamp with time zone,
+  last_status text,
+  last_error text,
+  last_changes jsonb,
+  last_history_id uuid,
+  -- 次回の条件つき GET と、本文が変わったかの判定に使う
+  etag text,
+  last_modified text,
+  body_hash text,
+  created_at timestamp with time zone not null default now(),
+  unique (user_email, url)
+);
+
+alter table public.tracked_urls enable row level security;
+
+create policy "Users can view their own tracked URLs"
+  on public.tracked_urls
+  for select
+  using (auth.email() = user_email);
+
+-- 確認時刻になった行の取り出し用（active な行だけを索引する）
+create index if not exists tracked_urls_due_idx
+  on public.tracked_urls (next_check_at)
+  where active;
+
+-- 最新の分析履歴（URLごと）を引くため
+create index if not exists analysis_history_user_email_url_analyzed_at_idx
+  on public.analysis_history (user_email, url, analyzed_at desc);
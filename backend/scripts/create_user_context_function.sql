@@ -0,0 +1,17 @@
+-- users の登録日時と user_settings の行を1回の呼び出しで返す（app/utils/supabase.py のユーザーコンテキスト取得で使用）
+create or replace function public.get_user_context(user_id_param uuid)
+returns json as $$
+  select json_build_object(
+    'created_at', (select u.created_at from public.users u where u.id = user_id_param),
+    'settings', (
+      select row_to_json(s)
+      from public.user_settings s
+      where s.user_id = user_id_param
+      order by s.updated_at desc
+      limit 1
+    )
+  );
+$$ language sql stable security definer;
+
+revoke execute on function public.get_user_context(uuid) from public, anon, authenticated;
+grant execute on function public.get_user_context(uuid) to service_role;
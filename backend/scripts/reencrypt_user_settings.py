@@ -0,0 +1,108 @@
+"""
+user_settings の暗号化済みキーを、ENCRYPTION_KEYS の先頭（現在の鍵）で暗号化し直す。
+
+鍵のローテーション手順:
+1. 新しい鍵を先頭に追加して ENCRYPTION_KEYS=新しい鍵,古い鍵 でAPIを再起動する
+2. このスクリプトを実行する（何度実行しても安全）
+3. ユーザーコンテキストのキャッシュTTLが過ぎてから、古い鍵を ENCRYPTION_KEYS から外す
+
+    cd backend
+    python -m scripts.reencrypt_user_settings --page-size 500 --concurrency 8
+"""
+import argparse
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from cryptography.fernet import InvalidToken
+
+from app.utils.concurrency import bounded_as_completed
+from app.utils.crypto import reencrypt_api_key
+from app.utils import supabase as db
+
+SECRET_COLUMNS = ["openai_key", "notion_token", "slack_webhook"]
+
+
+def _fetch_page(after_id: Optional[str], page_size: int):
+    query = (
+        db.get_supabase().table("user_settings")
+        .select(",".join(["id"] + SECRET_COLUMNS))
+        .order("id")
+        .limit(page_size)
+    )
+    if after_id:
+        query = query.gt("id", after_id)
+    return query.execute().data or []
+
+
+def _reencrypt_row(row: Dict[str, Any]) -> Tuple[Dict[str, str], int]:
+    """(更新する列, 復号できなかった列の数) を返す。"""
+    changes, unreadable = {}, 0
+    for column in SECRET_COLUMNS:
+        if not row.get(column):
+            continue
+        try:
+            token = reencrypt_api_key(row[column])
+        except (InvalidToken, ValueError):
+            unreadable += 1
+            continue
+        if token is not None:
+            changes[column] = token
+    return changes, unreadable
+
+
+def _update_row(row: Dict[str, Any], changes: Dict[str, str]) -> bool:
+    # 読み取り後に別の更新があった行は上書きしない（次回の実行で処理される）
+    query = db.get_supabase().table("user_settings").update(changes).eq("id", row["id"])
+    for column in changes:
+        query = query.eq(column, row[column])
+    return bool(query.execute().data)
+
+
+async def reencrypt_all(page_size: int = 500, concurrency: int = 8, dry_run: bool = False) -> Dict[str, int]:
+    counts = {"rows": 0, "updated": 0, "current": 0, "skipped": 0, "unreadable": 0, "failed": 0}
+    after_id = None
+
+    async def process(row: Dict[str, Any]) -> str:
+        changes, unreadable = _reencrypt_row(row)
+        counts["unreadable"] += unreadable
+        if not changes:
+            return "current"
+        if dry_run:
+            return "updated"
+        return "updated" if await db.run_db(_update_row, row, changes) else "skipped"
+
+    while True:
+        rows = await db.run_db(_fetch_page, after_id, page_size)
+        if not rows:
+            break
+        async for _, row, outcome, error in bounded_as_completed(rows, process, concurrency):
+            counts["rows"] += 1
+            if error is not None:
+                counts["failed"] += 1
+                print(f"Error re-encrypting user_settings {row['id']}: {str(error)}")
+            else:
+                counts[outcome] += 1
+        after_id = rows[-1]["id"]
+        if len(rows) < page_size:
+            break
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true", help="count rows that would change without writing")
+    args = parser.parse_args()
+
+    counts = asyncio.run(reencrypt_all(args.page_size, args.concurrency, args.dry_run))
+    print(" ".join(f"{key}={value}" for key, value in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+analysis_history の全行を現在のスコアリングモデル（app/config/scoring_weights.json）で採点し直し、
+5つのスコア列に書き戻す。1ページ分の行を NumPy でまとめて採点する。
+
+書き戻しには scripts/create_rescore_function.sql の rescore_analysis_history 関数を使い、
+1ページを1回の呼び出しで更新する。関数がない環境では1行ずつ（summary_json を読み直して）更新する。
+
+    cd backend
+    python -m scripts.rescore_analysis_history --page-size 1000
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.utils.concurrency import bounded_as_completed
+from app.utils.scoring import SCORE_NAMES, get_scoring_model, signals_from_history
+from app.utils import supabase as db
+
+# summary_json 全体（アドバイス本文を含む）は読まず、採点に必要なキーだけを取得する
+HISTORY_SCORING_COLUMNS = [
+    "id", "product_count", "category_count",
+    "signals:summary_json->signals",
+    "social_links:summary_json->social_links",
+    "prices:summary_json->prices",
+    "scoring_version:summary_json->>scoring_version",
+]
+
+
+def _fetch_page(after_id: Optional[str], page_size: int) -> List[Dict[str, Any]]:
+    query = (
+        db.get_supabase().table("analysis_history")
+        .select(",".join(HISTORY_SCORING_COLUMNS))
+        .order("id")
+        .limit(page_size)
+    )
+    if after_id:
+        query = query.gt("id", after_id)
+    return query.execute().data or []
+
+
+def _score_page(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    signals = [
+        signals_from_history({
+            "product_count": row.get("product_count"),
+            "category_count": row.get("category_count"),
+            "summary_json": {
+                "signals": row.get("signals"),
+                "social_links": row.get("social_links"),
+                "prices": row.get("prices"),
+            },
+        })
+        for row in rows
+    ]
+    scores = get_scoring_model().score_batch(signals)
+    return [
+        {"id": row["id"], **{name: float(value) for name, value in zip(SCORE_NAMES, row_scores)}}
+        for row, row_scores in zip(rows, scores)
+    ]
+
+
+def _write_scores_rpc(scores: List[Dict[str, Any]], version: str) -> int:
+    result = db.get_supabase().rpc("rescore_analysis_history", {"scores": scores, "scoring_version": version}).execute()
+    return int(result.data or 0)
+
+
+def _write_score_row(score: Dict[str, Any], version: str) -> int:
+    """
+    1行を更新する。rescore_analysis_history 関数と同じく summary_json の diagnostic_scores と
+    scoring_version も書き換える（summary_json は読み直して、ほかのキーを残したまま書き戻す）。
+    """
+    scores = {name: score[name] for name in SCORE_NAMES}
+    current = (
+        db.get_supabase().table("analysis_history")
+        .select("summary_json")
+        .eq("id", score["id"])
+        .limit(1)
+        .execute()
+    ).data
+    if not current:
+        return 0
+    changes: Dict[str, Any] = dict(scores)
+    summary_json = current[0].get("summary_json")
+    if summary_json is not None:
+        changes["summary_json"] = {**summary_json, "diagnostic_scores": scores, "scoring_version": version}
+    result = db.get_supabase().table("analysis_history").update(changes).eq("id", score["id"]).execute()
+    return len(result.data or [])
+
+
+async def _write_scores(scores: List[Dict[str, Any]], version: str, concurrency: int, use_rpc: bool) -> tuple:
+    """(更新した行数, 次回も rpc を使うか) を返す。"""
+    if use_rpc:
+        try:
+            return await db.run_db(_write_scores_rpc, scores, version), True
+        except Exception as e:
+            print(f"Error calling rescore_analysis_history, falling back to row updates: {str(e)}")
+
+    updated = 0
+    async for _, score, count, error in bounded_as_completed(
+        scores, lambda score: db.run_db(_write_score_row, score, version), concurrency
+    ):
+        if error is not None:
+            print(f"Error rescoring analysis_history {score['id']}: {str(error)}")
+        else:
+            updated += count
+    return updated, False
+
+
+async def rescore_all(page_size: int = 1000, concurrency: int = 8, force: bool = False,
+                      dry_run: bool = False) -> Dict[str, Any]:
+    version = get_scoring_model().version
+    counts: Dict[str, Any] = {"version": version, "rows": 0, "rescored": 0, "current": 0, "updated": 0}
+    scoring_seconds = 0.0
+    after_id, use_rpc = None, True
+
+    while True:
+        rows = await db.run_db(_fetch_page, after_id, page_size)
+        if not rows:
+            break
+        counts["rows"] += len(rows)
+        outdated = [row for row in rows if force or row.get("scoring_version") != version]
+        counts["current"] += len(rows) - len(outdated)
+
+        if outdated:
+            started = time.perf_counter()
+            scores = _score_page(outdated)
+            scoring_seconds += time.perf_counter() - started
+            counts["rescored"] += len(scores)
+            if not dry_run:
+                updated, use_rpc = await _write_scores(scores, version, concurrency, use_rpc)
+                counts["updated"] += updated
+
+        after_id = rows[-1]["id"]
+        if len(rows) < page_size:
+            break
+
+    counts["scoring_ms"] = round(scoring_seconds * 1000, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel row updates when the rpc is unavailable")
+    parser.add_argument("--force", action="store_true", help="also rescore rows already scored with the current version")
+    parser.add_argument("--dry-run", action="store_true", help="score rows without writing them back")
+    args = parser.parse_args()
+
+    counts = asyncio.run(rescore_all(args.page_size, args.concurrency, args.force, args.dry_run))
+    print(" ".join(f"{key}={value}" for key, value in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from app.utils.advice import OPENAI_KEY_LIMITS_IDLE_SECONDS, AdviceService, build_advice_messages, estimate_tokens
+from benchmarks.standins import OpenAIStandIn
+
+URL_DATA = {"product_count": 12, "prices": [2980, 5980], "social_links": {"instagram": "https://instagram.com/shop"}}
+
+
+@pytest.fixture
+def server():
+    with OpenAIStandIn() as standin:
+        yield standin
+
+
+def _service(server, **options):
+    options.setdefault("retry_base_delay", 0.01)
+    return AdviceService(api_base=server.api_base, **options)
+
+
+def test_api_key_is_passed_per_request(server):
+    async def scenario():
+        service = _service(server)
+        return await asyncio.gather(
+            service.complete([{"role": "user", "content": "shop a"}], "sk-user-a"),
+            service.complete([{"role": "user", "content": "shop b"}], "sk-user-b"),
+        )
+
+    advice = asyncio.run(scenario())
+    assert advice == [server.reply, server.reply]
+    assert sorted(auth for _, auth, _ in server.log) == ["Bearer sk-user-a", "Bearer sk-user-b"]
+    assert openai.api_key is None
+
+
+def test_completions_are_cached_by_prompt_hash(server):
+    messages = build_advice_messages(URL_DATA)
+
+    async def scenario():
+        service = _service(server)
+        first = await asyncio.gather(*[service.complete(messages, "sk-test") for _ in range(5)])
+        again = await service.complete(messages, "sk-other")
+        other = await service.complete(build_advice_messages({**URL_DATA, "product_count": 13}), "sk-test")
+        return service, first, again, other
+
+    service, first, again, other = asyncio.run(scenario())
+    assert set(first) == {server.reply} and again == other == server.reply
+    # 同時の5件は1回にまとめ、その後の同じプロンプトはキャッシュから返す
+    assert server.requests == 2
+    stats = service.stats()
+    assert stats["coalescing"]["coalesced"] == 4
+    assert stats["cache"]["hits"] >= 1
+
+
+def test_rate_limited_requests_are_retried(server):
+    server.rate_limited = 2
+
+    async def scenario():
+        service = _service(server)
+        advice = await service.complete([{"role": "user", "content": "retry"}], "sk-test")
+        return service.stats(), advice
+
+    stats, advice = asyncio.run(scenario())
+    assert advice == server.reply
+    assert server.requests == 3
+    assert stats["rate_limited"] == 2 and stats["retries"] == 2 and stats["failures"] == 0
+
+
+def test_retry_budget_is_limited(server):
+    server.rate_limited = 10
+
+    async def scenario():
+        service = _service(server, max_retries=2)
+        with pytest.raises(openai.error.RateLimitError):
+            await service.complete([{"role": "user", "content": "give up"}], "sk-test")
+        return service.stats()
+
+    stats = asyncio.run(scenario())
+    assert server.requests == 3
+    assert stats["failures"] == 1
+
+
+def test_backoff_uses_jitter_without_retry_after():
+    service = AdviceService(retry_base_delay=1.0, retry_max_delay=3.0)
+    delays = [service._retry_delay(attempt, RuntimeError("429")) for attempt in range(6) for _ in range(20)]
+    assert all(0 <= delay <= 3.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_token_reservation_is_settled_with_reported_usage(server):
+    messages = [{"role": "user", "content": "商品" * 50}]
+
+    async def scenario():
+        service = _service(server, max_tokens=400, tpm_limit=100000)
+        await service.complete(messages, "sk-test")
+        return service, service._buckets("sk-test")[1]
+
+    service, tokens = asyncio.run(scenario())
+    used = service.stats()["tokens_used"]
+    # 予約したプロンプト + max_tokens のうち、使わなかった分はバケツに戻る
+    assert 0 < used < estimate_tokens(messages[0]["content"]) + 400
+    assert tokens.capacity - used - 5 <= tokens.tokens <= tokens.capacity
+
+
+def test_stream_yields_tokens_in_order_and_fills_cache():
+    with OpenAIStandIn(token_delay=0.02) as server:
+        messages = build_advice_messages(URL_DATA)
+
+        async def scenario():
+            service = _service(server)
+            arrivals = []
+            async for text in service.stream(messages, "sk-test"):
+                arrivals.append((time.monotonic(), text))
+            cached = await service.complete(messages, "sk-test")
+            return arrivals, cached, service.stats()
+
+        arrivals, cached, stats = asyncio.run(scenario())
+
+    assert "".join(text for _, text in arrivals) == server.reply
+    assert len(arrivals) == len(server.reply_tokens({}))
+    # 最初のトークンは全文が揃う前に届く
+    assert arrivals[-1][0] - arrivals[0][0] >= 0.1
+    assert cached == server.reply and server.requests == 1
+    assert stats["streams"] == 1 and stats["tokens_used"] > 0
+
+
+def test_buckets_of_idle_api_keys_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    service = AdviceService()
+    first = service._buckets("sk-a")
+    service._buckets("sk-b")
+    now[0] += 60
+    assert service._buckets("sk-a") is first and service.stats()["api_keys"] == 2
+
+    # 使われなくなったキーのバケットは、次に新しいキーが来たときに捨てる
+    now[0] += OPENAI_KEY_LIMITS_IDLE_SECONDS
+    service._buckets("sk-c")
+    assert service.stats()["api_keys"] == 1
+    assert service._buckets("sk-a") is not first
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from app.utils.analysis_cache import (
+    AnalysisCache,
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+    normalize_url,
+)
+
+
+def test_normalize_url_drops_noise():
+    assert normalize_url("HTTPS://Shop.Example.com:443/collections/all/?utm_source=x&b=2&a=1#top") == \
+        "https://shop.example.com/collections/all?a=1&b=2"
+    assert normalize_url("http://example.com") == "http://example.com/"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2, max_age=60)
+    return MemoryCacheBackend(max_entries=2, max_age=60)
+
+
+def test_lookup_reports_fresh_stale_and_miss(backend):
+    async def scenario():
+        cache = AnalysisCache(backend, ttl=10)
+        assert await cache.lookup("https://a.example/") == (None, False)
+
+        entry = await cache.store("https://a.example/", {"title": "A", "etag": '"v1"', "body_hash": "h1"}, "advice")
+        assert entry["etag"] == '"v1"'
+        cached, fresh = await cache.lookup("https://A.example")
+        assert fresh and cached["advice"] == "advice"
+
+        await backend.set(entry["url"], {**entry, "stored_at": entry["stored_at"] - 60 + 1})
+        cached, fresh = await cache.lookup("https://a.example/")
+        assert cached is not None and not fresh
+
+        await cache.mark_revalidated(cached, {"etag": '"v2"'})
+        cached, fresh = await cache.lookup("https://a.example/")
+        assert fresh and cached["etag"] == '"v2"' and cached["body_hash"] == "h1"
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["hits"], stats["misses"], stats["stale"], stats["revalidations"]) == (2, 1, 1, 1)
+
+
+def test_lru_eviction(backend):
+    async def scenario():
+        cache = AnalysisCache(backend, ttl=10)
+        await cache.store("https://a.example/", {}, "a")
+        await cache.store("https://b.example/", {}, "b")
+        await cache.lookup("https://a.example/")
+        await cache.store("https://c.example/", {}, "c")
+        return [(await cache.lookup(url))[0] is not None for url in ("https://a.example/", "https://b.example/", "https://c.example/")]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    assert backend.evictions() == 1
+
+
+def test_sample_advice_without_a_key_is_not_cached_or_shared(monkeypatch):
+    from app import main
+    from app.utils import analysis_cache
+
+    monkeypatch.setattr(analysis_cache, "_analysis_cache", AnalysisCache(MemoryCacheBackend(max_entries=10, max_age=60), ttl=60))
+    monkeypatch.setattr(main, "analysis_flights", type(main.analysis_flights)())
+    fetches = []
+
+    async def fetch_url_content(url, cached=None, on_stage=None):
+        fetches.append(url)
+        await asyncio.sleep(0.01)
+        return {"title": "Shop", "product_names": ["Tote"], "prices": ["¥1,000"]}
+
+    class Advice:
+        async def complete(self, messages, api_key):
+            return f"model advice for {api_key}"
+
+    async def resolve_openai_key(user_id=None):
+        return "sk-user" if user_id == "keyed" else None
+
+    monkeypatch.setattr(main, "fetch_url_content", fetch_url_content)
+    monkeypatch.setattr(main, "get_advice_service", lambda: Advice())
+    monkeypatch.setattr(main, "resolve_openai_key", resolve_openai_key)
+
+    async def scenario():
+        url = "https://shop.example/"
+        # 同時に来た鍵のない呼び出しと鍵のある呼び出しは、同じ取得・アドバイスを共有しない
+        keyless, keyed = await asyncio.gather(main.run_analysis(url), main.run_analysis(url, user_id="keyed"))
+        cached, _ = await analysis_cache._analysis_cache.lookup(url)
+        return keyless, keyed, cached
+
+    keyless, keyed, cached = asyncio.run(scenario())
+    assert len(fetches) == 2
+    assert keyed.advice == "model advice for sk-user" and keyless.advice != keyed.advice
+    # キャッシュに残るのはモデルのアドバイスだけ
+    assert cached["advice"] == "model advice for sk-user"
+
+    analysis_cache._analysis_cache = AnalysisCache(MemoryCacheBackend(max_entries=10, max_age=60), ttl=60)
+    asyncio.run(main.run_analysis("https://other.example/"))
+    assert asyncio.run(analysis_cache._analysis_cache.lookup("https://other.example/")) == (None, False)
@@ -0,0 +1,63 @@
+import asyncio
+
+from benchmarks.harness import run_load, summarize
+from benchmarks.run import compare_results, metric_direction
+
+
+def _report(rows):
+    return {"suites": {"analyze": {"results": rows}}}
+
+
+def test_metric_direction_distinguishes_keys_and_metrics():
+    assert metric_direction("p95_ms") == -1 and metric_direction("total_s") == -1
+    assert metric_direction("throughput_rps") == 1 and metric_direction("encrypt_ops_s") == 1
+    assert metric_direction("errors") == -1
+    assert metric_direction("scenario") == 0 and metric_direction("concurrency") == 0
+
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    baseline = _report([
+        {"scenario": "cold", "concurrency": 10, "requests": 40, "p95_ms": 100.0, "throughput_rps": 50.0, "errors": 0},
+        {"scenario": "warm", "concurrency": 10, "requests": 40, "p95_ms": 10.0, "throughput_rps": 500.0, "errors": 0},
+    ])
+    current = _report([
+        # 10%の悪化は許容、スループットは改善
+        {"scenario": "cold", "concurrency": 10, "requests": 80, "p95_ms": 110.0, "throughput_rps": 60.0, "errors": 0},
+        {"scenario": "warm", "concurrency": 10, "requests": 40, "p95_ms": 13.0, "throughput_rps": 400.0, "errors": 2},
+        {"scenario": "new", "concurrency": 10, "requests": 40, "p95_ms": 999.0},
+    ])
+
+    regressions = compare_results(baseline, current, threshold=0.15)
+    assert {(item["row"]["scenario"], item["metric"]) for item in regressions} == {
+        ("warm", "p95_ms"), ("warm", "throughput_rps"), ("warm", "errors"),
+    }
+    assert next(item for item in regressions if item["metric"] == "p95_ms")["change"] == 0.3
+
+
+def test_run_load_respects_concurrency_and_counts_errors():
+    active, peak = 0, 0
+
+    class Response:
+        def __init__(self, ok):
+            self.is_success = ok
+
+    async def send(i):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if i == 3:
+            raise ConnectionError("reset")
+        return Response(i % 5 != 0)
+
+    result = asyncio.run(run_load(send, total=20, concurrency=4))
+    assert peak == 4
+    assert result["requests"] == 20 and result["errors"] == 5
+    assert result["p50_ms"] >= 10 and result["throughput_rps"] > 0
+
+
+def test_summarize_percentiles():
+    summary = summarize([i / 1000 for i in range(1, 101)], elapsed=2.0)
+    assert summary["p50_ms"] == 50.0 and summary["p95_ms"] == 95.0 and summary["p99_ms"] == 99.0
+    assert summary["max_ms"] == 100.0 and summary["throughput_rps"] == 50.0
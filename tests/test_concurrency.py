@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from app.utils.concurrency import TokenBucket, bounded_as_completed
+
+
+def test_respects_global_and_per_key_limits():
+    active = {"total": 0, "a": 0, "b": 0}
+    peaks = {"total": 0, "a": 0, "b": 0}
+
+    async def worker(item):
+        domain, delay = item
+        active["total"] += 1
+        active[domain] += 1
+        peaks["total"] = max(peaks["total"], active["total"])
+        peaks[domain] = max(peaks[domain], active[domain])
+        await asyncio.sleep(delay)
+        active["total"] -= 1
+        active[domain] -= 1
+        if delay == 0:
+            raise ValueError("boom")
+        return domain
+
+    items = [("a", 0.02)] * 6 + [("b", 0.01)] * 6 + [("b", 0)]
+
+    async def collect():
+        return [row async for row in bounded_as_completed(items, worker, limit=3, key=lambda i: i[0], per_key_limit=2)]
+
+    rows = asyncio.run(collect())
+    assert len(rows) == len(items)
+    assert peaks["total"] <= 3 and peaks["a"] <= 2 and peaks["b"] <= 2
+    errors = [row for row in rows if row[3] is not None]
+    assert len(errors) == 1 and errors[0][0] == 12 and isinstance(errors[0][3], ValueError)
+    assert sorted(row[0] for row in rows) == list(range(len(items)))
+
+
+def test_yields_in_completion_order():
+    async def worker(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    async def collect():
+        return [row[2] async for row in bounded_as_completed([0.05, 0.01, 0.03], worker, limit=3)]
+
+    assert asyncio.run(collect()) == [0.01, 0.03, 0.05]
+
+
+def test_token_bucket_waits_for_refill():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600)
+        assert await bucket.acquire(600) == 0
+        started = time.monotonic()
+        await bucket.acquire(3)
+        return time.monotonic() - started
+
+    waited = asyncio.run(scenario())
+    assert 0.25 <= waited < 1.0
+
+
+def test_token_bucket_burst_limits_capacity():
+    async def scenario():
+        bucket = TokenBucket(per_minute=1200, burst=2)
+        started = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # 2件はすぐ、残り2件は 20件/秒 の補充を待つ
+    assert 0.08 <= asyncio.run(scenario()) < 0.5
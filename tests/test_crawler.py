@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from app.utils import http_client
+from app.utils.crawler import crawl_storefront
+from app.utils.html_extractor import extract_page_data
+from benchmarks.standins import SiteStandIn
+
+
+def _html(body: str) -> tuple:
+    return 200, "text/html; charset=utf-8", f'<html><head><meta name="viewport" content="width=device-width"></head><body>{body}</body></html>'
+
+
+def _products(*names: str) -> str:
+    return "".join(f'<div class="product-title">{name}</div><span class="price">¥{1000 * (i + 1):,}</span>'
+                   for i, name in enumerate(names))
+
+
+@pytest.fixture
+def store():
+    with SiteStandIn() as site:
+        site.pages.update({
+            "/": _html('<a class="collection-link" href="/collections/sale">Sale</a>' + _products("Tote", "Cap")),
+            "/robots.txt": (200, "text/plain",
+                            f"User-agent: *\nDisallow: /collections/private\nSitemap: {site.url}/sitemap.xml\n"),
+            "/sitemap.xml": (200, "application/xml",
+                             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                             f"<sitemap><loc>{site.url}/sitemap_pages_1.xml</loc></sitemap>"
+                             f"<sitemap><loc>{site.url}/sitemap_collections_1.xml</loc></sitemap>"
+                             "</sitemapindex>"),
+            "/sitemap_collections_1.xml": (200, "application/xml",
+                                           '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                                           + "".join(f"<url><loc>{site.url}/collections/{name}</loc></url>"
+                                                     for name in ("all", "private"))
+                                           + f"<url><loc>{site.url}/products/scarf</loc></url></urlset>"),
+            "/products.json": lambda query: (200, "application/json", json.dumps({"products": [
+                {"title": "Tote", "variants": [{"price": "4800.00"}, {"price": "3800.00"}]},
+                {"title": "Boots", "variants": [{"price": "15000.00"}]},
+            ] if query.get("page") == "1" else []})),
+            "/collections/sale": _html(_products("Cap", "Scarf", "Belt")),
+            "/collections/all": _html(_products("Tote", "Cap", "Scarf", "Belt", "Socks")),
+            "/collections/private": _html(_products("Secret")),
+            "/products/scarf": _html(_products("Scarf") + '<div class="review">great</div>'),
+        })
+        yield site
+
+
+def _crawl(site, **options):
+    async def scenario():
+        landing = extract_page_data(site.pages["/"][2])
+        try:
+            return await crawl_storefront(site.url + "/", landing, **options)
+        finally:
+            await http_client.close_http_client()
+
+    return asyncio.run(scenario())
+
+
+def test_merges_sitemap_products_json_and_links(store):
+    url_data = _crawl(store, host_delay=0)
+    assert sorted(url_data["product_names"]) == ["Belt", "Boots", "Cap", "Scarf", "Socks", "Tote"]
+    assert url_data["product_count"] == 6
+    assert "3800.00" in url_data["prices"] and "15000.00" in url_data["prices"]
+    assert url_data["has_reviews"] is True
+    assert url_data["crawl"]["pages_fetched"] == 3
+    assert url_data["crawl"]["sources"] == {"links": 1, "sitemap": 3, "products_json": 2}
+
+
+def test_respects_robots_and_page_cap(store):
+    url_data = _crawl(store, host_delay=0, max_pages=1)
+    assert "/collections/private" not in store.paths()
+    assert url_data["crawl"]["disallowed"] == 1
+    assert url_data["crawl"]["truncated"] is True
+    assert url_data["crawl"]["pages_fetched"] == 1
+    # コレクションページを商品ページより先に取得する
+    assert "/products/scarf" not in store.paths()
+
+
+def test_stops_when_byte_budget_is_spent(store):
+    url_data = _crawl(store, host_delay=0, max_bytes=600)
+    assert url_data["crawl"]["truncated"] is True
+    assert url_data["crawl"]["pages_fetched"] < 3
+    assert "Tote" in url_data["product_names"]
+
+
+def test_byte_budget_covers_every_request_and_concurrent_pages(store):
+    filler = "<p>" + "x" * 2000 + "</p>"
+    for path in ("/collections/sale", "/collections/all", "/products/scarf"):
+        store.pages[path] = _html(filler + _products("Item"))
+    store.pages["/sitemap_collections_1.xml"] = (200, "application/xml", store.pages["/sitemap_collections_1.xml"][2]
+                                                 .replace("</urlset>", "<!--" + "y" * 3000 + "--></urlset>"))
+    for max_bytes in (3000, 6000):
+        url_data = _crawl(store, host_delay=0, concurrency=4, max_bytes=max_bytes)
+        # robots.txt・サイトマップ・products.json も含めて、並行して取得しても予算を超えない
+        assert url_data["crawl"]["bytes"] <= max_bytes
+        assert url_data["crawl"]["truncated"] is True
+
+
+def test_spaces_requests_to_the_same_host(store):
+    _crawl(store, host_delay=0.05, concurrency=4)
+    starts = [at for at, _, _ in store.log]
+    # 到着時刻は接続の確立などで前後するので、平均と中央値で間隔を確かめる
+    gaps = sorted(later - earlier for earlier, later in zip(starts, starts[1:]))
+    assert len(gaps) >= 6
+    assert (starts[-1] - starts[0]) / len(gaps) >= 0.04
+    assert gaps[len(gaps) // 2] >= 0.04
+
+
+def test_social_links_found_only_on_crawled_pages_are_kept(store):
+    store.pages["/collections/sale"] = _html('<a href="https://instagram.com/shop">IG</a>' + _products("Cap"))
+    url_data = _crawl(store, host_delay=0)
+    # トップページの空文字で上書きせず、キーはSNSごとに残す
+    assert url_data["social_links"] == {"instagram": "https://instagram.com/shop", "twitter": ""}
+
+
+def test_unreadable_products_json_prices_are_skipped(store):
+    store.pages["/products.json"] = lambda query: (200, "application/json", json.dumps({"products": [
+        {"title": "Tote", "variants": [{"price": "お問い合わせ"}, {"price": "3800.00"}]},
+        {"title": "Boots", "variants": [{"price": "TBD"}]},
+    ] if query.get("page") == "1" else []}))
+    url_data = _crawl(store, host_delay=0)
+    assert "Tote" in url_data["product_names"] and "Boots" in url_data["product_names"]
+    assert "3800.00" in url_data["prices"] and "TBD" not in url_data["prices"]
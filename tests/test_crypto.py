@@ -0,0 +1,71 @@
+import asyncio
+import base64
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.utils import crypto
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn
+
+OLD_KEY = Fernet.generate_key().decode()
+NEW_KEY = Fernet.generate_key().decode()
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    def use(*keys):
+        monkeypatch.setenv("ENCRYPTION_KEYS", ",".join(keys))
+        crypto.reset_crypto()
+
+    yield use
+    crypto.reset_crypto()
+
+
+def test_decrypts_legacy_double_base64_tokens(keys):
+    keys(OLD_KEY)
+    legacy = base64.b64encode(Fernet(OLD_KEY.encode()).encrypt(b"sk-legacy")).decode()
+    assert crypto.decrypt_api_key(legacy) == "sk-legacy"
+    assert crypto.encrypt_api_key("sk-new").startswith("gAAAAA")
+    assert crypto.decrypt_api_key("not a token") is None
+
+
+def test_rotation_keeps_old_tokens_readable_and_reencrypts(keys):
+    keys(OLD_KEY)
+    old_token = crypto.encrypt_api_key("sk-user")
+
+    keys(NEW_KEY, OLD_KEY)
+    assert crypto.decrypt_api_key(old_token) == "sk-user"
+    new_token = crypto.reencrypt_api_key(old_token)
+    assert crypto.reencrypt_api_key(new_token) is None
+
+    keys(NEW_KEY)
+    assert crypto.decrypt_api_key(old_token) is None
+    assert crypto.decrypt_api_key(new_token) == "sk-user"
+
+
+def test_reencrypt_script_moves_every_row_to_the_new_key(keys, monkeypatch):
+    keys(OLD_KEY)
+    legacy = base64.b64encode(Fernet(OLD_KEY.encode()).encrypt(b"sk-legacy")).decode()
+    with PostgrestStandIn() as standin:
+        os.environ.setdefault("SUPABASE_URL", standin.supabase_url)
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+        from app.utils import supabase as db
+        from scripts.reencrypt_user_settings import reencrypt_all
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        for i in range(7):
+            standin.insert("user_settings", {"id": f"row-{i}", "user_id": f"user-{i}",
+                                             "openai_key": crypto.encrypt_api_key(f"sk-{i}"),
+                                             "slack_webhook": legacy if i == 3 else None})
+
+        keys(NEW_KEY, OLD_KEY)
+        counts = asyncio.run(reencrypt_all(page_size=3, concurrency=2))
+        assert counts["rows"] == 7 and counts["updated"] == 7
+        assert asyncio.run(reencrypt_all(page_size=3))["current"] == 7
+
+        keys(NEW_KEY)
+        rows = sorted(standin.tables["user_settings"], key=lambda row: row["id"])
+        assert [crypto.decrypt_api_key(row["openai_key"]) for row in rows] == [f"sk-{i}" for i in range(7)]
+        assert crypto.decrypt_api_key(rows[3]["slack_webhook"]) == "sk-legacy"
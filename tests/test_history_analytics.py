@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, register_history_analytics_rpc
+from app.utils.history_analytics import analytics_etag, domain_of, etag_matches
+
+
+def _row(i, analyzed_at, url, tags=(), scores=None):
+    row = {"id": f"00000000-0000-0000-0000-{i:012d}", "user_email": "owner@example.com", "analyzed_at": analyzed_at,
+           "url": url, "tags": list(tags), "summary_json": {"advice": "x" * 1000}}
+    if scores is not None:
+        row["summary_json"]["diagnostic_scores"] = {}
+        row.update({"sns_score": scores, "structure_score": scores, "ux_score": 5.0, "app_score": 0.0, "theme_score": 5.0})
+    return row
+
+
+def test_domain_and_etag_matching():
+    assert domain_of("https://WWW.Shop.example:8443/items?x=1") == "shop.example"
+    assert domain_of("shop.example") == "shop.example"
+    etag = analytics_etag("owner@example.com", 3, {"bucket": "day"})
+    assert etag.startswith('W/"3-') and etag != analytics_etag("owner@example.com", 4, {"bucket": "day"})
+    assert etag != analytics_etag("owner@example.com", 3, {"bucket": "month"})
+    assert etag_matches(f'"other", {etag[2:]}', etag) and etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('W/"3-0"', etag)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with PostgrestStandIn() as standin:
+        from supabase import create_client
+        from app import main
+        from app.utils import supabase as db
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        register_history_analytics_rpc(standin)
+        for row in [
+            _row(1, "2026-09-30T10:00:00+00:00", "https://www.shop-a.example/", ["apparel"], 6.0),
+            # 2026-10-01 15:30 UTC は日本時間で 10月2日
+            _row(2, "2026-10-01T15:30:00+00:00", "https://shop-a.example/sale", ["apparel", "sale"], 8.0),
+            _row(3, "2026-10-01T01:00:00+00:00", "https://shop-b.example/", ["sale"]),
+        ]:
+            standin.insert("analysis_history", row)
+        standin.insert("analysis_history", {**_row(9, "2026-10-01T00:00:00+00:00", "https://x.example/", [], 1.0),
+                                            "user_email": "other@example.com"})
+
+        def get(**params):
+            headers = params.pop("headers", {})
+
+            async def scenario():
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as http:
+                    return await http.get("/api/history/analytics",
+                                          params={"user_email": "owner@example.com", **params}, headers=headers)
+
+            return asyncio.run(scenario())
+
+        yield standin, get
+
+
+def test_analytics_aggregates_by_period_tag_and_domain(client):
+    standin, get = client
+    response = get()
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_analyses"] == 3
+    assert [(point["period"], point["analyses"], point["scored"]) for point in body["trend"]] == [
+        ("2026-09-30", 1, 1), ("2026-10-01", 1, 0), ("2026-10-02", 1, 1),
+    ]
+    # スコアのない履歴（summary_json に diagnostic_scores がない）は平均に入れない
+    assert body["trend"][1]["average_scores"]["sns_score"] is None
+    assert [(tag["tag"], tag["analyses"], tag["average_scores"]["sns_score"]) for tag in body["tags"]] == [
+        ("apparel", 2, 7.0), ("sale", 2, 8.0),
+    ]
+    assert [(domain["domain"], domain["analyses"], domain["latest_url"], domain["latest_scores"]["sns_score"])
+            for domain in body["domains"]] == [
+        ("shop-a.example", 2, "https://shop-a.example/sale", 8.0), ("shop-b.example", 1, "https://shop-b.example/", None),
+    ]
+
+    october = get(start="2026-10-01", end="2026-11-01", bucket="month", domain_limit=1).json()
+    assert [(point["period"], point["analyses"]) for point in october["trend"]] == [("2026-10-01", 2)]
+    assert october["trend"][0]["average_scores"] == {
+        "sns_score": 8.0, "structure_score": 8.0, "ux_score": 5.0, "app_score": 0.0, "theme_score": 5.0,
+    }
+    assert len(october["domains"]) == 1
+    assert get(bucket="year").status_code == 422
+
+
+def test_analytics_etag_revalidates_until_history_changes(client):
+    standin, get = client
+    first = get()
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = get(headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag and not cached.content
+    assert get(bucket="week", headers={"If-None-Match": etag}).status_code == 200
+
+    standin.insert("analysis_history", _row(4, "2026-10-05T00:00:00+00:00", "https://shop-c.example/", [], 4.0))
+    changed = get(headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert changed.json()["total_analyses"] == 4
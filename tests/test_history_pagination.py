@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn
+
+
+@pytest.fixture
+def db():
+    with PostgrestStandIn() as standin:
+        os.environ.setdefault("SUPABASE_URL", standin.supabase_url)
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+        from app.utils import supabase as db
+
+        original = db.supabase
+        db.supabase = create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY)
+        for i in range(7):
+            standin.insert("analysis_history", {
+                "id": f"00000000-0000-0000-0000-{i:012d}",
+                "user_email": "owner@example.com",
+                # 2件ずつ同じ時刻にして、id によるタイブレークも確認する
+                "analyzed_at": f"2026-10-0{1 + i // 2}T00:00:00+00:00",
+                "url": f"https://shop{i}.example/",
+                "tags": ["apparel"] if i % 2 else [],
+                "summary_json": {"advice": "x" * 1000},
+                "sns_score": 5.0,
+            })
+        standin.insert("analysis_history", {"id": "other", "user_email": "other@example.com",
+                                            "analyzed_at": "2026-10-09T00:00:00+00:00", "url": "https://x/"})
+        yield db
+        db.supabase = original
+
+
+def test_keyset_pages_cover_every_row_once(db):
+    async def collect():
+        seen, cursor = [], None
+        while True:
+            rows, cursor = await db.get_analysis_history("owner@example.com", limit=3, cursor=cursor)
+            seen.extend(rows)
+            if cursor is None:
+                return seen
+
+    rows = asyncio.run(collect())
+    assert [row["id"][-1] for row in rows] == ["6", "5", "4", "3", "2", "1", "0"]
+    assert all("summary_json" not in row for row in rows)
+
+
+def test_projection_tags_and_item_lookup(db):
+    rows, cursor = asyncio.run(db.get_analysis_history(
+        "owner@example.com", tag_filter=["apparel"], fields=["url", "summary_json"]))
+    assert cursor is None
+    assert [row["url"] for row in rows] == ["https://shop5.example/", "https://shop3.example/", "https://shop1.example/"]
+    assert set(rows[0]) == {"id", "analyzed_at", "url", "summary_json"}
+
+    item = asyncio.run(db.get_analysis_history_item("owner@example.com", rows[0]["id"]))
+    assert item["summary_json"]["advice"] == "x" * 1000
+    assert asyncio.run(db.get_analysis_history_item("other@example.com", rows[0]["id"])) is None
+
+
+def test_rejects_bad_cursor_and_fields(db):
+    with pytest.raises(ValueError):
+        asyncio.run(db.get_analysis_history("owner@example.com", cursor="not-a-cursor"))
+    with pytest.raises(ValueError):
+        asyncio.run(db.get_analysis_history("owner@example.com", fields=["password"]))
@@ -0,0 +1,175 @@
+import asyncio
+import csv
+import io
+import json
+
+import httpx
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn
+from app.utils.history_transfer import HistoryImportFailed, import_history_ndjson, ndjson_lines
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def _line(url, **extra):
+    return json.dumps({"url": url, **extra}, ensure_ascii=False).encode() + b"\n"
+
+
+def test_ndjson_lines_joins_chunks_and_skips_long_lines():
+    async def collect():
+        return [item async for item in ndjson_lines(
+            _chunks(b'{"a": 1}\n\n{"b"', b': 2}\n' + b"x" * 10, b"x" * 10 + b'\n{"c": 3}'), max_line_bytes=15)]
+
+    assert asyncio.run(collect()) == [(1, b'{"a": 1}'), (3, b'{"b": 2}'), (4, None), (5, b'{"c": 3}')]
+
+
+def test_import_saves_batches_while_reading_and_reports_bad_lines():
+    body = [
+        _line("https://a.example/", analyzed_at="2025-01-01T00:00:00+00:00", tags=["old"],
+              summary_json={"product_names": ["Tote"], "diagnostic_scores": {"sns_score": 4}}),
+        b"not json\n",
+        _line("https://b.example/", sns_score=11),
+        _line(""),
+        _line("https://c.example/", ux_score=7.5),
+        _line("https://d.example/"),
+    ]
+    batches, active, overlapped = [], 0, []
+
+    async def save_batch(rows):
+        nonlocal active
+        active += 1
+        overlapped.append(active > 1)
+        await asyncio.sleep(0.01)
+        batches.append(rows)
+        active -= 1
+        return len(rows)
+
+    result = asyncio.run(import_history_ndjson("owner@example.com", _chunks(*body), save_batch, batch_size=2))
+    assert (result["inserted"], result["rejected"]) == (3, 3)
+    assert [error["line"] for error in result["errors"]] == [2, 3, 4]
+    assert result["errors"][1]["detail"].startswith("sns_score")
+    assert [[row["url"] for row in rows] for rows in batches] == [["https://a.example/"], ["https://c.example/", "https://d.example/"]]
+    first = batches[0][0]
+    assert (first["user_email"], first["analyzed_at"], first["tags"], first["product_count"], first["sns_score"]) == (
+        "owner@example.com", "2025-01-01T00:00:00+00:00", ["old"], 1, 4)
+    assert batches[1][0]["ux_score"] == 7.5 and "analyzed_at" not in batches[1][0]
+    # 保存は1バッチずつ（前のバッチの保存が終わってから次を保存する）
+    assert not any(overlapped)
+
+    async def failing(rows):
+        if len(rows) == 1:
+            raise RuntimeError("insert failed")
+        return len(rows)
+
+    lines = [_line(f"https://{i}.example/") for i in range(5)]
+    with pytest.raises(HistoryImportFailed) as error:
+        asyncio.run(import_history_ndjson("owner@example.com", _chunks(*lines), failing, batch_size=2))
+    assert (error.value.inserted, error.value.saved_through_line) == (4, 4)
+
+
+def test_import_rejects_summary_fields_of_the_wrong_type_line_by_line():
+    body = [
+        _line("https://a.example/", summary_json={"advice": 5}),
+        _line("https://b.example/", summary_json={"product_names": 3}),
+        _line("https://c.example/", summary_json={"diagnostic_scores": "a"}),
+        _line("https://d.example/", summary_json={"diagnostic_scores": {"sns_score": "abc"}}),
+        _line("https://e.example/", summary_json={"diagnostic_scores": {"ux_score": 6}, "advice": "ok", "extra": [1]}),
+    ]
+    batches = []
+
+    async def save_batch(rows):
+        batches.append(rows)
+        return len(rows)
+
+    result = asyncio.run(import_history_ndjson("owner@example.com", _chunks(*body), save_batch))
+    assert (result["inserted"], result["rejected"]) == (1, 4)
+    assert [error["detail"].split(":")[0] for error in result["errors"]] == [
+        "summary_json.advice", "summary_json.product_names", "summary_json.diagnostic_scores",
+        "summary_json.diagnostic_scores.sns_score",
+    ]
+    row = batches[0][0]
+    # 送られなかったスコアは 0 で埋めず、summary_json は送られた内容のまま残す
+    assert row["summary_json"] == {"advice": "ok", "diagnostic_scores": {"ux_score": 6}, "extra": [1]}
+    assert (row["ux_score"], row["sns_score"]) == (6, 0)
+
+
+@pytest.fixture
+def app_client(monkeypatch):
+    with PostgrestStandIn() as standin:
+        from supabase import create_client
+        from app import main
+        from app.utils import supabase as db
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        monkeypatch.setattr(main, "HISTORY_EXPORT_PAGE_SIZE", 3)
+        standin.tables["analysis_history"] = []
+
+        def call(method, path, **kwargs):
+            async def scenario():
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as http:
+                    return await http.request(method, path, **kwargs)
+
+            return asyncio.run(scenario())
+
+        yield standin, call
+
+
+def test_export_streams_every_page_and_round_trips_through_import(app_client):
+    standin, call = app_client
+    body = b"".join(
+        _line(f"https://shop{i}.example/", analyzed_at=f"2026-10-{i + 1:02d}T00:00:00+00:00", tags=["apparel"] if i % 2 else [],
+              summary_json={"advice": "在庫を増やす", "prices": ["¥1,000"], "diagnostic_scores": {"sns_score": i}})
+        for i in range(8)
+    )
+    imported = call("POST", "/api/history/import", params={"user_email": "old@example.com"}, content=body,
+                    headers={"Content-Type": "application/x-ndjson"})
+    assert imported.status_code == 200 and imported.json()["inserted"] == 8
+
+    exported = call("GET", "/api/history/export", params={"user_email": "old@example.com"})
+    assert exported.status_code == 200 and exported.headers["content-type"] == "application/x-ndjson"
+    assert "hansokunou_history_" in exported.headers["content-disposition"]
+    rows = [json.loads(line) for line in exported.text.splitlines()]
+    # 3件ずつのページを最後までたどる
+    assert [row["url"] for row in rows] == [f"https://shop{i}.example/" for i in reversed(range(8))]
+    assert rows[0]["summary_json"]["advice"] == "在庫を増やす" and rows[0]["sns_score"] == 7
+
+    moved = call("POST", "/api/history/import", params={"user_email": "new@example.com"}, content=exported.content)
+    assert moved.json()["inserted"] == 8
+    again = call("GET", "/api/history/export", params={"user_email": "new@example.com", "fields": "url,analyzed_at,sns_score"})
+    assert [(row["url"], row["analyzed_at"], row["sns_score"]) for row in map(json.loads, again.text.splitlines())] == [
+        (row["url"], row["analyzed_at"], row["sns_score"]) for row in rows
+    ]
+
+    tagged = call("GET", "/api/history/export", params={"user_email": "old@example.com", "format": "csv", "tags": "apparel",
+                                                        "fields": "url,tags,has_advice"})
+    assert tagged.headers["content-type"].startswith("text/csv") and tagged.content.startswith("﻿".encode())
+    table = list(csv.reader(io.StringIO(tagged.content.decode("utf-8-sig"))))
+    assert table[0] == ["id", "analyzed_at", "url", "tags", "has_advice"]
+    assert [row[2:] for row in table[1:3]] == [["https://shop7.example/", '["apparel"]', "true"],
+                                                ["https://shop5.example/", '["apparel"]', "true"]]
+    assert len(table) == 5
+
+    assert call("GET", "/api/history/export", params={"user_email": "old@example.com", "format": "xml"}).status_code == 422
+    assert call("GET", "/api/history/export", params={"user_email": "old@example.com", "fields": "password"}).status_code == 400
+
+
+def test_parquet_export_writes_one_row_group_per_page(app_client):
+    pq = pytest.importorskip("pyarrow.parquet")
+    standin, call = app_client
+    for i in range(7):
+        standin.insert("analysis_history", {"user_email": "owner@example.com", "url": f"https://shop{i}.example/",
+                                            "analyzed_at": f"2026-10-{i + 1:02d}T00:00:00+00:00", "tags": ["a"],
+                                            "product_count": i, "sns_score": 5.0, "summary_json": {"advice": "x"}})
+
+    exported = call("GET", "/api/history/export", params={"user_email": "owner@example.com", "format": "parquet"})
+    assert exported.status_code == 200
+    parquet = pq.ParquetFile(io.BytesIO(exported.content))
+    assert parquet.metadata.num_rows == 7 and parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.column("product_count").to_pylist() == list(reversed(range(7)))
+    assert str(table.schema.field("analyzed_at").type) == "timestamp[us, tz=UTC]"
+    assert json.loads(table.column("summary_json")[0].as_py()) == {"advice": "x"}
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.utils.html_extractor import available_backends, extract_page_data, extract_page_data_async
+from benchmarks.bench_extract import fixture_pages, legacy_extract
+
+LEGACY_KEYS = [
+    "title", "meta_description", "product_names", "prices", "category_links",
+    "product_count", "category_count", "social_links", "has_search",
+    "mobile_friendly", "has_reviews",
+]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize("page", ["storefront_apparel.html", "storefront_minimal.html"])
+def test_single_pass_matches_legacy_select(backend, page):
+    html = fixture_pages()[page]
+    expected = legacy_extract(html)
+    result = extract_page_data(html, backend)
+    assert {key: result[key] for key in LEGACY_KEYS} == expected
+
+
+def test_collects_meta_tags_and_category_urls():
+    html = fixture_pages()["storefront_apparel.html"]
+    result = extract_page_data(html, "bs4")
+    assert result["viewport"] == "width=device-width, initial-scale=1"
+    assert result["meta_tags"]["og:type"] == "website"
+    assert "/collections/sale" in result["category_urls"]
+
+
+def test_async_extraction_runs_off_loop():
+    html = fixture_pages()["storefront_minimal.html"]
+    result = asyncio.run(extract_page_data_async(html))
+    assert result["product_names"] == ["Canvas Tote", "Enamel Mug"]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        extract_page_data("<html></html>", "html5lib")
+
+
+@pytest.mark.parametrize("backend", available_backends())
+@pytest.mark.parametrize("html", ["", " \n\t", "<!-- maintenance -->"])
+def test_blank_pages_give_the_empty_result(backend, html):
+    result = extract_page_data(html, backend)
+    assert result["title"] == "Sample E-commerce Store" and result["product_names"] == []
+    assert result["social_links"] == {"instagram": "", "twitter": ""}
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_xhtml_with_an_xml_declaration_is_parsed(backend):
+    html = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>XHTML Shop</title></head>'
+            '<body><div class="product-title">Tote</div><span class="price">¥4,800</span></body></html>')
+    result = extract_page_data(html, backend)
+    assert (result["title"], result["product_names"], result["prices"]) == ("XHTML Shop", ["Tote"], ["¥4,800"])
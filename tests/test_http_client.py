@@ -0,0 +1,73 @@
+import asyncio
+
+from app.utils import http_client
+from benchmarks.standins import SiteStandIn
+
+
+def test_shared_client_is_reused_until_closed():
+    async def scenario():
+        await http_client.close_http_client()
+        created = http_client.http_client_stats()["clients_created"]
+        try:
+            client = await http_client.start_http_client()
+            assert http_client.get_http_client() is client
+            assert await http_client.start_http_client() is client
+            assert http_client.http_client_stats()["clients_created"] == created + 1
+
+            await http_client.close_http_client()
+            assert client.is_closed
+            # 閉じた後に呼ばれたら作り直す
+            again = http_client.get_http_client()
+            assert again is not client and not again.is_closed
+            assert http_client.http_client_stats()["clients_created"] == created + 2
+        finally:
+            await http_client.close_http_client()
+
+    asyncio.run(scenario())
+
+
+def test_requests_to_one_host_are_capped_and_idle_hosts_are_forgotten(monkeypatch):
+    monkeypatch.setattr(http_client, "HTTP_MAX_CONNECTIONS_PER_HOST", 2)
+    with SiteStandIn({"/": (200, "text/plain", "ok")}, latency=0.1) as site:
+        async def scenario():
+            try:
+                tasks = [asyncio.create_task(http_client.get(f"{site.url}/")) for _ in range(6)]
+                await asyncio.sleep(0.05)
+                assert http_client.http_client_stats()["hosts_tracked"] == 1
+                responses = await asyncio.gather(*tasks)
+                assert [response.status_code for response in responses] == [200] * 6
+                return http_client.http_client_stats()
+            finally:
+                await http_client.close_http_client()
+
+        stats = asyncio.run(scenario())
+
+    # 同時に届くのは2件まで（3件目は1件目の応答が返ってから届く）
+    arrivals = sorted(at for at, _, _ in site.log)
+    assert all(later - earlier >= 0.08 for earlier, later in zip(arrivals, arrivals[2:]))
+    # 終わったホストのセマフォは残さない
+    assert stats["hosts_tracked"] == 0 and stats["requests_in_flight"] == 0
+    assert stats["max_connections_per_host"] == 2
+    if stats["pool_stats_available"]:
+        assert stats["pool_connections"] == stats["pool_idle_connections"] + stats["pool_active_connections"]
+        assert 1 <= stats["pool_connections"] <= 2
+
+
+def test_stats_without_a_client_report_an_empty_pool(monkeypatch):
+    asyncio.run(http_client.close_http_client())
+    stats = http_client.http_client_stats()
+    assert stats["pool_stats_available"] and stats["pool_connections"] == 0 and stats["hosts_tracked"] == 0
+
+    # httpx の内部が変わってプールを読めなくても、/stats は落とさずに pool_* を None にする
+    async def scenario():
+        client = http_client.get_http_client()
+        try:
+            monkeypatch.setattr(client, "_transport", object())
+            return http_client.http_client_stats()
+        finally:
+            monkeypatch.undo()
+            await http_client.close_http_client()
+
+    stats = asyncio.run(scenario())
+    assert not stats["pool_stats_available"] and stats["pool_connections"] is None
+    assert stats["requests_total"] >= 0
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.utils.jobs import JobQueue, MemoryJobStore, QueueFullError, SQLiteJobStore
+
+
+async def fake_pipeline(url, on_stage):
+    for stage in ("fetched", "parsed", "advised", "scored"):
+        await asyncio.sleep(0)
+        await on_stage(stage)
+    if url.endswith("/broken"):
+        raise RuntimeError("fetch failed")
+    return {"url": url}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), retention=60)
+    return MemoryJobStore(max_jobs=100, retention=60)
+
+
+def test_job_runs_and_streams_stage_events(store):
+    async def scenario():
+        queue = JobQueue(store, fake_pipeline, workers=2, max_depth=10)
+        queue.start()
+        ok = await queue.submit("https://shop.example/")
+        broken = await queue.submit("https://shop.example/broken")
+        events = [event async for event in queue.events(ok["id"], poll_interval=0.05)]
+        async for _ in queue.events(broken["id"], poll_interval=0.05):
+            pass
+        await queue.stop()
+        return events, await store.get(ok["id"]), await store.get(broken["id"])
+
+    events, ok, broken = asyncio.run(scenario())
+    assert [e.get("stage") or e.get("status") for e in events] == \
+        ["running", "fetched", "parsed", "advised", "scored", "succeeded"]
+    assert ok["status"] == "succeeded" and ok["result"] == {"url": "https://shop.example/"}
+    assert broken["status"] == "failed" and broken["error"] == "fetch failed"
+
+
+def test_submit_rejects_when_queue_is_full():
+    async def scenario():
+        queue = JobQueue(MemoryJobStore(100, 60), fake_pipeline, workers=1, max_depth=2)
+        await queue.submit("https://a.example/")
+        await queue.submit("https://b.example/")
+        with pytest.raises(QueueFullError):
+            await queue.submit("https://c.example/")
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queue_depth"] == 2 and stats["rejected"] == 1
+
+
+def test_concurrent_submits_reserve_slots_before_saving():
+    class SlowStore(MemoryJobStore):
+        async def save(self, job):
+            await asyncio.sleep(0.01)
+            await super().save(job)
+
+    async def scenario():
+        queue = JobQueue(SlowStore(100, 60), fake_pipeline, workers=1, max_depth=2)
+        results = await asyncio.gather(*[queue.submit(f"https://{i}.example/") for i in range(5)],
+                                       return_exceptions=True)
+        return queue, results
+
+    queue, results = asyncio.run(scenario())
+    assert [type(result) for result in results].count(QueueFullError) == 3
+    assert queue.stats()["queue_depth"] == 2 and queue.stats()["submitted"] == 2
+
+
+def test_jobs_of_a_stopped_process_are_failed_after_their_lease_expires(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def scenario():
+        # ワーカーを動かさずに submit したジョブは、持ち主が止まったので queued のまま残る
+        stopped = JobQueue(SQLiteJobStore(path, retention=60), fake_pipeline, workers=1, max_depth=10, lease=0.3)
+        left = await stopped.submit("https://left.example/")
+
+        queue = JobQueue(SQLiteJobStore(path, retention=60), fake_pipeline, workers=1, max_depth=10, lease=0.3)
+        queue.start()
+        events = [event async for event in queue.events(left["id"], poll_interval=0.05)]
+        fresh = await queue.submit("https://fresh.example/")
+        async for _ in queue.events(fresh["id"], poll_interval=0.05):
+            pass
+        await queue.stop()
+        return events, await queue.get(fresh["id"]), queue.stats()
+
+    events, fresh, stats = asyncio.run(scenario())
+    assert events[-1]["status"] == "failed" and "restarted" in events[-1]["error"]
+    assert fresh["status"] == "succeeded"
+    assert stats["failed"] == 1
+
+
+def test_a_new_process_does_not_fail_jobs_another_live_process_is_running(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def slow_pipeline(url, on_stage):
+        await on_stage("fetched")
+        await asyncio.sleep(1.0)
+        return {"url": url}
+
+    async def scenario():
+        running = JobQueue(SQLiteJobStore(path, retention=60), slow_pipeline, workers=1, max_depth=10, lease=0.3)
+        running.start()
+        job = await running.submit("https://slow.example/")
+        waiting = await running.submit("https://queued.example/")
+        await asyncio.sleep(0.1)
+
+        # ローリング再起動などで、同じファイルを使うプロセスが後から起動する
+        joined = JobQueue(SQLiteJobStore(path, retention=60), slow_pipeline, workers=1, max_depth=10, lease=0.3)
+        joined.start()
+        events = [event async for event in joined.events(job["id"], poll_interval=0.05)]
+        async for _ in running.events(waiting["id"], poll_interval=0.05):
+            pass
+        await asyncio.gather(running.stop(), joined.stop())
+        return events, await joined.get(waiting["id"]), joined.stats()
+
+    events, waiting, stats = asyncio.run(scenario())
+    # リースの数倍の時間がかかっても、持ち主が延長し続けるので failed にされない
+    assert [e.get("stage") or e.get("status") for e in events] == ["running", "fetched", "succeeded"]
+    assert waiting["status"] == "succeeded" and stats["failed"] == 0
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.utils.metrics import (
+    LOOP_LAG_HISTOGRAM, REQUEST_DURATION, REQUESTS, REQUESTS_IN_FLIGHT, STAGE_DURATION, STAGE_ERRORS,
+    Histogram, LoopLagMonitor, MetricsMiddleware, MetricsRegistry, observe_stage, render_metrics,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = Histogram("test_seconds", "Test histogram.", ("stage",), registry, buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "fetch")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Test histogram.", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{stage="fetch",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{stage="fetch",le="1"} 3' in lines
+    assert 'test_seconds_bucket{stage="fetch",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{stage="fetch"} 2.65' in lines
+    assert 'test_seconds_count{stage="fetch"} 4' in lines
+
+
+def test_duplicate_metric_names_are_rejected():
+    registry = MetricsRegistry()
+    Histogram("dup_seconds", "First.", (), registry)
+    with pytest.raises(ValueError):
+        Histogram("dup_seconds", "Second.", (), registry)
+
+
+def test_observe_stage_records_duration_and_errors():
+    before = STAGE_DURATION.count("test_stage")
+
+    async def scenario():
+        with observe_stage("test_stage"):
+            await asyncio.sleep(0.02)
+        with pytest.raises(RuntimeError):
+            with observe_stage("test_stage"):
+                raise RuntimeError("boom")
+
+    asyncio.run(scenario())
+    assert STAGE_DURATION.count("test_stage") == before + 2
+    assert STAGE_DURATION.total("test_stage") >= 0.02
+    assert STAGE_ERRORS.value("test_stage") >= 1
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                await asyncio.sleep(0.02)
+                yield b"x"
+        return StreamingResponse(chunks())
+
+    before = REQUESTS.value("GET", "/items/{item_id}", "200")
+    with TestClient(app) as client:
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+        assert client.get("/missing").status_code == 404
+        assert client.get("/stream").content == b"xxx"
+
+    assert REQUESTS.value("GET", "/items/{item_id}", "200") == before + 2
+    assert REQUESTS.value("GET", "unmatched", "404") >= 1
+    # ストリーミングのレスポンスは最後のチャンクを送り終えるまでを計る
+    assert REQUEST_DURATION.total("GET", "/stream") >= 0.06
+    assert REQUESTS_IN_FLIGHT.value() == 0
+    assert 'hanno_http_requests_total{method="GET",route="/items/{item_id}",status="200"}' in render_metrics()
+
+
+def test_loop_lag_monitor_detects_blocking_calls():
+    before = LOOP_LAG_HISTOGRAM.total()
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    # ループを0.1秒塞いだので、その間に予定していた起床が遅れた分が記録される
+    assert LOOP_LAG_HISTOGRAM.total() - before >= 0.05
+    assert "hanno_event_loop_lag_seconds" in render_metrics()
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, SiteStandIn
+from app.utils.http_client import close_http_client
+from app.utils.monitor import TrackedUrlStore, UrlMonitor, _iso, diff_snapshots, history_snapshot, snapshot, spread_by_host
+
+
+def _page(products, comment=""):
+    items = "".join(
+        f'<div class="product"><h2 class="product-name">{name}</h2><p class="product-price">¥{price:,}</p></div>'
+        for name, price in products
+    )
+    return f"<html><head><title>Shop</title></head><body>{items}<!-- {comment} --></body></html>"
+
+
+def test_diff_reports_only_changed_sections():
+    before = snapshot({"product_names": ["Tote", "Mug"], "prices": ["¥2,000", "¥1,000"],
+                       "category_links": ["/c/bags"], "social_links": {"instagram": "https://instagram.com/a"}})
+    after = snapshot({"product_names": ["Tote", "Cap"], "prices": ["¥2,400", "¥1,000"],
+                      "category_links": ["/c/bags"], "social_links": {"instagram": "https://instagram.com/b",
+                                                                      "twitter": "https://twitter.com/b"}})
+    assert diff_snapshots(before, after) == {
+        "products": {"added": ["Cap"], "removed": ["Mug"]},
+        "prices": {"added": [2400], "removed": [2000], "median": {"before": 1500, "after": 1700},
+                   "max": {"before": 2000, "after": 2400}},
+        "social_links": {"added": {"twitter": "https://twitter.com/b"},
+                         "changed": {"instagram": {"before": "https://instagram.com/a", "after": "https://instagram.com/b"}}},
+    }
+    assert diff_snapshots(before, before) == {}
+
+    # 手動の分析の履歴は10件に切り詰めてあるので、11件目以降の違いは差分にしない
+    names = [f"item {i}" for i in range(12)]
+    manual, limit = history_snapshot({"product_names": names[:10], "prices": [100.0, 200.0]})
+    assert limit == 10
+    assert diff_snapshots(manual, snapshot({"product_names": names, "prices": ["¥100", "¥200"]}), limit) == {}
+
+
+def test_spread_by_host_spaces_checks_of_the_same_host():
+    rows = [{"url": "https://a.example/1"}, {"url": "https://a.example/2"}, {"url": "https://b.example/"},
+            {"url": "https://A.example/3"}]
+    busy_until = {"b.example": 101.0}
+    plan = spread_by_host(rows, 2.0, busy_until, now=100.0)
+    assert [(delay, row["url"]) for delay, row in plan] == [
+        (0.0, "https://a.example/1"), (2.0, "https://a.example/2"), (3.0, "https://b.example/"),
+        (4.0, "https://A.example/3"),
+    ]
+    assert busy_until == {"a.example": 104.0, "b.example": 103.0}
+
+
+@pytest.fixture
+def monitor_env(monkeypatch):
+    with PostgrestStandIn() as db_standin, SiteStandIn() as site:
+        from supabase import create_client
+        from app.utils import supabase as db
+
+        monkeypatch.setattr(db, "supabase", create_client(db_standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        db_standin.tables["analysis_history"] = []
+        analyzed = []
+
+        async def analyze(row, url_data, changes):
+            analyzed.append((row["url"], changes))
+            history = db_standin.insert("analysis_history", {
+                "user_email": row["user_email"], "url": row["url"], "analyzed_at": _iso(time.time()),
+                "summary_json": {"snapshot": snapshot(url_data)},
+            })
+            return history["id"]
+
+        monitor = UrlMonitor(TrackedUrlStore(), analyze, host_spacing=0.05, jitter=0)
+        yield db_standin, site, monitor, analyzed
+
+
+def _round(db_standin, monitor):
+    # 全行を確認時刻にして1回分を確認する
+    for row in db_standin.tables["tracked_urls"]:
+        row["next_check_at"] = _iso(time.time() - 1)
+
+    async def scenario():
+        try:
+            return await monitor.run_once()
+        finally:
+            await close_http_client()
+
+    return asyncio.run(scenario())
+
+
+def test_monitor_skips_unchanged_pages_and_reanalyzes_changes(monitor_env):
+    db_standin, site, monitor, analyzed = monitor_env
+    products = [("Tote", 2000), ("Mug", 1000)]
+    site.pages["/etag"] = (200, "text/html", _page(products), {"ETag": '"v1"'})
+    site.pages["/plain"] = (200, "text/html", _page(products))
+    for path in ("/etag", "/plain"):
+        asyncio.run(monitor.store.add("owner@example.com", site.url + path, 3600))
+
+    started = time.perf_counter()
+    assert _round(db_standin, monitor) == 2
+    # 同じホストの2件は host_spacing だけ間を空ける
+    assert time.perf_counter() - started >= 0.05
+    assert sorted(url for url, _ in analyzed) == [site.url + "/etag", site.url + "/plain"]
+
+    _round(db_standin, monitor)
+    rows = {row["url"]: row for row in db_standin.tables["tracked_urls"]}
+    assert rows[site.url + "/etag"]["last_status"] == "not_modified"
+    assert rows[site.url + "/plain"]["last_status"] == "unchanged_body"
+
+    site.pages["/plain"] = (200, "text/html", _page(products, comment="rebuilt"))
+    _round(db_standin, monitor)
+    assert rows[site.url + "/plain"]["last_status"] == "unchanged_content"
+
+    site.pages["/plain"] = (200, "text/html", _page([("Tote", 2200), ("Mug", 1000), ("Cap", 1500)]))
+    _round(db_standin, monitor)
+    row = rows[site.url + "/plain"]
+    assert row["last_status"] == "changed" and row["last_history_id"]
+    assert row["last_changes"]["products"] == {"added": ["Cap"], "removed": []}
+    assert row["last_changes"]["prices"]["added"] == [2200, 1500]
+    assert len(analyzed) == 3 and row["next_check_at"] > _iso(time.time() + 3000)
+
+    stats = monitor.stats()
+    assert (stats["checks"], stats["fetches_skipped"], stats["parses_skipped"], stats["llm_calls_skipped"],
+            stats["reanalyses"]) == (8, 3, 4, 5, 3)
+
+
+def test_failed_reanalysis_is_retried_on_the_next_check(monitor_env):
+    db_standin, site, monitor, analyzed = monitor_env
+    site.pages["/"] = (200, "text/html", _page([("Tote", 2000)]))
+    original = monitor.analyze
+
+    async def failing(row, url_data, changes):
+        raise RuntimeError("GPT advice failed")
+
+    monitor.analyze = failing
+    row = asyncio.run(monitor.store.add("owner@example.com", site.url + "/", 3600))
+    _round(db_standin, monitor)
+    stored = db_standin.tables["tracked_urls"][0]
+    assert stored["last_status"] == "error" and stored["last_error"] == "GPT advice failed"
+    assert not stored.get("body_hash") and stored["next_check_at"] > _iso(time.time() + 3000)
+
+    async def check_now():
+        try:
+            return await monitor.check({**stored, "id": row["id"]})
+        finally:
+            await close_http_client()
+
+    monitor.analyze = original
+    result = asyncio.run(check_now())
+    assert result["status"] == "changed" and len(analyzed) == 1
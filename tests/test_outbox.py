@@ -0,0 +1,226 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.utils import http_client
+from app.utils.notifications import NotionSender, SlackSender, analysis_payload
+from app.utils.outbox import OutboxDispatcher, SQLiteOutboxStore, SupabaseOutboxStore
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, WebhookStandIn
+
+SCORES = {"sns_score": 4.5, "structure_score": 6.0, "ux_score": 7.0, "app_score": 3.0, "theme_score": 5.5}
+
+
+def _analysis(i: int) -> dict:
+    return {"url": f"https://shop{i}.example/", "competitor_summary": f"商品数: {i}点", "diagnostic_scores": SCORES,
+            "advice": "強み" * 1500}
+
+
+@pytest.fixture
+def hooks():
+    with WebhookStandIn() as standin:
+        yield standin
+
+
+def _dispatcher(store, hooks, **options):
+    async def webhook(user_id):
+        return f"{hooks.url}/slack/{user_id}" if user_id != "nobody" else None
+
+    async def token(user_id):
+        return "secret_token"
+
+    options.setdefault("retry_base_delay", 0.05)
+    options.setdefault("poll_interval", 0.05)
+    return OutboxDispatcher(store, {"slack": SlackSender(webhook), "notion": NotionSender(token, api_url=f"{hooks.url}/v1")}, **options)
+
+
+def _run(scenario):
+    async def wrapped():
+        try:
+            return await scenario()
+        finally:
+            await http_client.close_http_client()
+
+    return asyncio.run(wrapped())
+
+
+def test_slack_messages_are_batched_per_webhook(tmp_path, hooks):
+    store = SQLiteOutboxStore(str(tmp_path / "outbox.sqlite3"), retention=60)
+
+    async def scenario():
+        outbox = _dispatcher(store, hooks)
+        for i in range(5):
+            await outbox.enqueue("slack", "a", analysis_payload(_analysis(i)), "a")
+        for i in range(2):
+            await outbox.enqueue("slack", "b", analysis_payload(_analysis(i)), "b")
+        await outbox.drain()
+        return await outbox.stats()
+
+    stats = _run(scenario)
+    assert [len(body["blocks"]) - 1 for body in hooks.bodies("/slack/a")] == [5]
+    assert [len(body["blocks"]) - 1 for body in hooks.bodies("/slack/b")] == [2]
+    assert "新しい分析結果が 5 件あります" == hooks.bodies("/slack/a")[0]["text"]
+    assert stats["delivered"] == 7 and stats["pending"] == 0 and stats["batches"] == 2
+    assert stats["delivery_latency"]["count"] == 7
+
+
+def test_queued_messages_survive_restart_and_expired_leases(tmp_path, hooks):
+    path = str(tmp_path / "outbox.sqlite3")
+
+    async def scenario():
+        crashed = _dispatcher(SQLiteOutboxStore(path, retention=60), hooks, lease=0.3)
+        await crashed.enqueue("slack", "a", analysis_payload(_analysis(1)), "a")
+        await crashed.enqueue("slack", "a", analysis_payload(_analysis(2)), "a")
+        # 1件を取り出したまま落ちたワーカーを再現する
+        claimed = await crashed.store.claim(1, 0.3, time.time())
+
+        restarted = _dispatcher(SQLiteOutboxStore(path, retention=60), hooks)
+        await restarted.drain()
+        before_lease = len(hooks.log)
+        await asyncio.sleep(0.35)
+        await restarted.drain()
+        return claimed, before_lease, await restarted.stats()
+
+    claimed, before_lease, stats = _run(scenario)
+    assert len(claimed) == 1
+    assert before_lease == 1
+    assert len(hooks.log) == 2
+    assert stats["delivered"] == 2 and stats["pending"] == 0
+
+
+def test_failed_deliveries_back_off_and_give_up_on_permanent_errors(tmp_path, hooks):
+    hooks.failures["/slack/a"] = [500, 429]
+    hooks.failures["/slack/gone"] = [404]
+    store = SQLiteOutboxStore(str(tmp_path / "outbox.sqlite3"), retention=60)
+
+    async def scenario():
+        outbox = _dispatcher(store, hooks, retry_base_delay=0.05)
+        await outbox.enqueue("slack", "a", analysis_payload(_analysis(1)), "a")
+        await outbox.enqueue("slack", "gone", analysis_payload(_analysis(2)), "gone")
+        await outbox.enqueue("slack", "nobody", analysis_payload(_analysis(3)), "nobody")
+        outbox.start()
+        deadline = time.monotonic() + 5
+        while (await outbox.stats())["pending"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await outbox.stop()
+        return await outbox.stats()
+
+    stats = _run(scenario)
+    assert len(hooks.bodies("/slack/a")) == 3
+    assert len(hooks.bodies("/slack/gone")) == 1
+    assert stats["delivered"] == 1 and stats["dead"] == 2 and stats["pending"] == 0
+    assert stats["failed_attempts"] == 4
+
+
+def test_notion_pages_are_rate_limited_per_database(tmp_path, hooks):
+    hooks.failures["/v1/pages"] = [200, 429]
+    store = SQLiteOutboxStore(str(tmp_path / "outbox.sqlite3"), retention=60)
+
+    async def scenario():
+        outbox = _dispatcher(store, hooks, rate_limits={"notion": 600})
+        for i in range(4):
+            await outbox.enqueue("notion", "db-1", analysis_payload(_analysis(i), include_advice=True), "u1")
+        started = time.monotonic()
+        await outbox.dispatch_once()
+        first_round = len(hooks.bodies("/v1/pages"))
+        await asyncio.sleep(0.1)
+        await outbox.drain()
+        return first_round, time.monotonic() - started, await outbox.stats()
+
+    first_round, elapsed, stats = _run(scenario)
+    pages = hooks.bodies("/v1/pages")
+    # 429 を受けたら残りの2件は送らずに再送へ回す
+    assert first_round == 2
+    assert len(pages) == 5 and stats["delivered"] == 4
+    assert all(page["parent"] == {"database_id": "db-1"} for page in pages)
+    assert all(len(block["paragraph"]["rich_text"][0]["text"]["content"]) <= 2000 for page in pages for block in page["children"])
+    headers = hooks.log[0][2]
+    assert headers["Notion-Version"] and headers["Authorization"] == "Bearer secret_token"
+    # 600件/分 = 10件/秒、バースト10なので5回の送信は待たずに済む
+    assert elapsed < 1.0
+
+
+def test_slack_rate_limit_spaces_requests_per_webhook(tmp_path, hooks):
+    store = SQLiteOutboxStore(str(tmp_path / "outbox.sqlite3"), retention=60)
+
+    async def scenario():
+        outbox = _dispatcher(store, hooks, batch_size=1, rate_limits={"slack": 1200})
+        for i in range(4):
+            await outbox.enqueue("slack", "a", analysis_payload(_analysis(i)), "a")
+        started = time.monotonic()
+        await outbox.drain()
+        return time.monotonic() - started
+
+    elapsed = _run(scenario)
+    # 1200件/分 = 20件/秒、バースト20: バーストで吸収される
+    assert len(hooks.log) == 4 and elapsed < 1.0
+
+
+@pytest.fixture
+def supabase_store():
+    with PostgrestStandIn() as standin:
+        os.environ.setdefault("SUPABASE_URL", standin.supabase_url)
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+        from app.utils import supabase as db
+
+        original = db.supabase
+        db.supabase = create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY)
+        standin.tables["outbox_messages"] = []
+        yield standin, SupabaseOutboxStore(retention=60)
+        db.supabase = original
+
+
+def test_supabase_store_claims_without_rpc(supabase_store, hooks):
+    standin, store = supabase_store
+
+    async def scenario():
+        outbox = _dispatcher(store, hooks)
+        for i in range(3):
+            await outbox.enqueue("slack", "a", analysis_payload(_analysis(i)), "a")
+        depth = await outbox.stats()
+        first = await store.claim(2, 60, time.time())
+        second = await store.claim(10, 60, time.time())
+        await store.complete([message["id"] for message in first + second], time.time())
+        return depth, first, second, await outbox.stats()
+
+    depth, first, second, stats = _run(scenario)
+    assert depth["pending"] == 3 and depth["oldest_pending_seconds"] >= 0
+    assert len(first) == 2 and len(second) == 1
+    assert {message["id"] for message in first}.isdisjoint(message["id"] for message in second)
+    assert isinstance(first[0]["created_at"], float) and first[0]["payload"]["url"] == "https://shop0.example/"
+    assert stats["pending"] == 0
+    assert all(row["status"] == "delivered" for row in standin.tables["outbox_messages"])
+
+
+def test_analyze_responds_without_waiting_for_the_outbox_write(monkeypatch):
+    import httpx
+    from app import main
+
+    async def run_analysis(url, on_stage=None, crawl=False, user_id=None):
+        return main.AnalysisResponse(url=url, advice="ok", diagnostic_scores=SCORES)
+
+    queued = []
+
+    async def notify_integrations(analysis_result, user_id=None):
+        # 設定の取得とアウトボックスへの書き込みが遅くても応答は待たない
+        await asyncio.sleep(0.5)
+        queued.append((analysis_result["url"], user_id))
+
+    monkeypatch.setattr(main, "run_analysis", run_analysis)
+    monkeypatch.setattr(main, "notify_integrations", notify_integrations)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            started = time.monotonic()
+            response = await client.post("/analyze", json={"url": "https://shop.example/", "user_id": "u1"})
+            elapsed = time.monotonic() - started
+        assert response.status_code == 200 and queued == []
+        pending = set(main._notification_tasks)
+        await asyncio.gather(*pending)
+        return elapsed, pending
+
+    elapsed, pending = asyncio.run(scenario())
+    assert elapsed < 0.4 and len(pending) == 1
+    assert queued == [("https://shop.example/", "u1")] and not main._notification_tasks
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils import http_client, page_fetch
+from app.utils.page_fetch import PageDeadlineExceeded, PageReader, fetch_page, sniff_charset
+from benchmarks.standins import SiteStandIn
+
+HEAD = '<html><head><title>ショップ</title></head>'
+
+
+def _fetch(url, **kwargs):
+    async def scenario():
+        try:
+            return await fetch_page(url, **kwargs)
+        finally:
+            await http_client.close_http_client()
+
+    return asyncio.run(scenario())
+
+
+def test_sniff_charset_prefers_header_then_bom_then_meta():
+    meta = b'<html><head><meta charset="shift_jis">'
+    assert sniff_charset(meta, "text/html; charset=EUC-JP") == "euc_jp"
+    assert sniff_charset(b"\xef\xbb\xbf" + meta, "text/html") == "utf-8-sig"
+    assert sniff_charset(meta, "text/html") == "shift_jis"
+    assert sniff_charset(b'<meta http-equiv="Content-Type" content="text/html; charset=euc-jp">') == "euc_jp"
+    assert sniff_charset(b"<html>", "text/html; charset=bogus") == "utf-8"
+
+
+def test_reader_finds_head_end_across_chunks_and_decodes_split_characters():
+    html = (HEAD + "<body>" + "商品" * 800 + "</body></html>").encode("utf-8")
+    reader = PageReader("text/html; charset=utf-8", max_bytes=len(html), body_bytes=len(html))
+    split = html.index(b"</head>") + 3
+    # マルチバイト文字の途中でも区切る
+    for chunk in (html[:split], html[split:split + 1001], html[split + 1001:]):
+        reader.feed(chunk)
+    assert reader.head_end == html.index(b"</head>") + len("</head>")
+    assert reader.finish() == html.decode("utf-8")
+    assert reader.stop_reason is None
+
+
+def test_large_page_stops_after_body_budget():
+    body = HEAD + "<body>" + '<div class="product-title">Tote</div>' * 20000 + "</body></html>"
+    with SiteStandIn({"/": (200, "text/html; charset=utf-8", [body[i:i + 8192] for i in range(0, len(body), 8192)])}) as site:
+        before = page_fetch.page_fetch_stats()
+        page = _fetch(site.url + "/", body_bytes=16 * 1024)
+        after = page_fetch.page_fetch_stats()
+
+    assert page["truncated"] is True
+    assert page["text"].startswith(HEAD)
+    # 受信チャンク（httpx は最大 64KiB 単位で渡す）の途中までで止まる
+    assert 16 * 1024 <= page["bytes_read"] <= 16 * 1024 + 64 * 1024 + len(HEAD.encode("utf-8"))
+    assert after["early_stops"] == before["early_stops"] + 1
+    assert after["bytes_saved"] - before["bytes_saved"] > len(body) // 2
+
+
+def test_page_without_head_is_capped_at_max_bytes():
+    body = "<html><body>" + "x" * 100000
+    with SiteStandIn({"/": (200, "text/html", body)}) as site:
+        page = _fetch(site.url + "/", max_bytes=10000)
+    assert page["bytes_read"] == 10000
+    assert page["truncated"] is True
+    assert len(page["text"]) == 10000
+
+
+def test_meta_charset_page_is_decoded():
+    html = '<html><head><meta charset="Shift_JIS"><title>靴のお店</title></head><body>スニーカー</body></html>'
+    with SiteStandIn({"/": (200, "text/html", html.encode("shift_jis"))}) as site:
+        page = _fetch(site.url + "/")
+    assert page["encoding"] == "shift_jis"
+    assert page["text"] == html
+    assert page["truncated"] is False
+
+
+def test_slow_drip_page_hits_total_deadline():
+    chunks = [HEAD] + ["<p>drip</p>"] * 20
+    with SiteStandIn({"/": (200, "text/html", chunks)}, drip=0.1) as site:
+        before = page_fetch.page_fetch_stats()["deadline_exceeded"]
+        with pytest.raises(PageDeadlineExceeded):
+            _fetch(site.url + "/", total_timeout=0.5)
+    assert page_fetch.page_fetch_stats()["deadline_exceeded"] == before + 1
+
+
+def test_error_status_raises_and_not_modified_has_no_body():
+    with SiteStandIn({"/gone": (404, "text/html", "missing"), "/same": (304, "text/html", "")}) as site:
+        with pytest.raises(httpx.HTTPStatusError):
+            _fetch(site.url + "/gone")
+        page = _fetch(site.url + "/same")
+    assert page["status_code"] == 304
+    assert page["body_hash"] is None and page["text"] == ""
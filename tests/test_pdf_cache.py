@@ -0,0 +1,51 @@
+import asyncio
+import io
+import os
+import zipfile
+
+from app.utils.pdf_cache import PdfDiskCache, report_cache_key
+from app.utils.zip_stream import ZipStreamWriter
+
+
+def test_cache_key_ignores_key_order_and_tracks_template_version():
+    report = {"url": "https://shop.example/", "prices": ["1200"], "advice": "a"}
+    reordered = {"advice": "a", "prices": ["1200"], "url": "https://shop.example/"}
+    assert report_cache_key(report, "v1") == report_cache_key(reordered, "v1")
+    assert report_cache_key(report, "v1") != report_cache_key(report, "v2")
+    assert report_cache_key(report, "v1") != report_cache_key({**report, "advice": "b"}, "v1")
+
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    cache = PdfDiskCache(str(tmp_path), max_bytes=250)
+
+    async def scenario():
+        await cache.set("a", b"a" * 100)
+        await cache.set("b", b"b" * 100)
+        assert await cache.get("a") == b"a" * 100
+        await cache.set("c", b"c" * 100)
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    a, b, c = asyncio.run(scenario())
+    assert (a, b, c) == (b"a" * 100, None, b"c" * 100)
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf", "c.pdf"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 200
+
+
+def test_reloads_entries_after_restart(tmp_path):
+    asyncio.run(PdfDiskCache(str(tmp_path), max_bytes=1000).set("key", b"%PDF-1.4"))
+    reopened = PdfDiskCache(str(tmp_path), max_bytes=1000)
+    assert asyncio.run(reopened.get("key")) == b"%PDF-1.4"
+    assert reopened.stats()["hits"] == 1
+
+
+def test_zip_stream_chunks_form_a_valid_archive():
+    writer = ZipStreamWriter()
+    chunks = [writer.add("one.pdf", b"%PDF-1.4" * 100), writer.add("two.pdf", b"%PDF-1.4"), writer.close()]
+    assert all(chunks)
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["one.pdf", "two.pdf"]
+    assert archive.read("two.pdf") == b"%PDF-1.4"
+    assert archive.testzip() is None
+    # PDFは圧縮済みなので、そのまま格納する
+    assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from app.utils import pdf_generator
+
+REPORT = dict(
+    url="https://shop.example/",
+    product_names=["Canvas Tote"],
+    category_links=["Bags"],
+    prices=["2400"],
+    advice="advice",
+)
+
+
+@pytest.fixture
+def fake_wkhtmltopdf(tmp_path, monkeypatch):
+    script = tmp_path / "wkhtmltopdf"
+    script.write_text("#!/bin/sh\ncat > /dev/null\nsleep ${FAKE_PDF_DELAY:-0.05}\nprintf '%%PDF-1.4\\n'\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(pdf_generator, "WKHTMLTOPDF_PATH", str(script))
+    monkeypatch.setattr(pdf_generator, "PDF_RENDER_WORKERS", 1)
+    monkeypatch.setattr(pdf_generator, "PDF_QUEUE_MAX_DEPTH", 1)
+    monkeypatch.setattr(pdf_generator, "_render_slots", None)
+    return script
+
+
+def test_renders_off_loop_and_rejects_when_queue_is_full(fake_wkhtmltopdf):
+    async def scenario():
+        results = await asyncio.gather(
+            *[pdf_generator.render_pdf_report(**REPORT) for _ in range(3)], return_exceptions=True
+        )
+        return results
+
+    results = asyncio.run(scenario())
+    assert [r[:4] for r in results if isinstance(r, bytes)] == [b"%PDF", b"%PDF"]
+    assert sum(isinstance(r, pdf_generator.PdfQueueFullError) for r in results) == 1
+    assert pdf_generator.pdf_render_stats()["queue_wait_seconds_max"] > 0
+
+
+def test_render_timeout_kills_the_process(fake_wkhtmltopdf, monkeypatch):
+    monkeypatch.setenv("FAKE_PDF_DELAY", "5")
+    with pytest.raises(pdf_generator.PdfRenderTimeout):
+        asyncio.run(pdf_generator.render_pdf_report(**REPORT, timeout=0.2))
+
+
+def test_cancelled_render_kills_the_process(fake_wkhtmltopdf, monkeypatch):
+    monkeypatch.setenv("FAKE_PDF_DELAY", "5")
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def spawn(*args, **kwargs):
+        processes.append(await create_subprocess_exec(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", spawn)
+
+    async def scenario():
+        render = asyncio.ensure_future(pdf_generator.render_pdf_report(**REPORT, timeout=10))
+        while not processes:
+            await asyncio.sleep(0.01)
+        render.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await render
+
+    asyncio.run(scenario())
+    # クライアントが切断してもサブプロセスを残さない
+    assert processes[0].returncode is not None
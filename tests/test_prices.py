@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.utils.advice import build_advice_messages
+from app.utils.prices import format_price_range, parse_price_array, parse_prices, price_statistics
+
+
+@pytest.mark.parametrize("text, low, high", [
+    ("¥2,980", 2980, 2980),
+    ("2,980円", 2980, 2980),
+    ("￥１２，８００", 12800, 12800),
+    ("$19.99", 19.99, 19.99),
+    ("1.5万円", 15000, 15000),
+    ("¥2,980〜¥3,980", 2980, 3980),
+    ("2,980円 - 3,980円", 2980, 3980),
+    ("1万〜2万円", 10000, 20000),
+    ("¥5,980 ¥7,980", 5980, 5980),
+    ("¥1,100(税込)", 1100, 1100),
+    ("¥1,000(税込¥1,100)", 1100, 1100),
+    ("¥1,000(税抜)¥1,100(税込)", 1100, 1100),
+    ("税抜 ¥1,000 税込 ¥1,100", 1100, 1100),
+])
+def test_parses_storefront_price_formats(text, low, high):
+    lows, highs = parse_price_array([text])
+    assert (lows[0], highs[0]) == (low, high)
+
+
+def test_batch_keeps_positions_for_unparseable_and_non_string_values():
+    lows, highs = parse_price_array(["売り切れ", None, 2980, "", "line\nbreak ¥500", 12.5, "¥0"])
+    assert np.isnan(lows[[0, 1, 3, 6]]).all() and np.isnan(highs[[0, 1, 3, 6]]).all()
+    assert lows[[2, 4, 5]].tolist() == [2980, 500, 12.5]
+    assert parse_prices(["¥1,200", "soldout", "¥2,400〜¥3,000"]) == [1200, 2400]
+    assert parse_price_array([])[0].size == 0
+
+
+def test_non_ascii_digits_are_not_read_as_prices():
+    lows, _ = parse_price_array(["١٢٣", "¥٥٠٠ ¥1,000", "१२३ 円", "¥2,980"])
+    assert np.isnan(lows[[0, 2]]).all()
+    assert lows[[1, 3]].tolist() == [1000, 2980]
+    assert price_statistics(["١٢٣", "¥2,980"])["count"] == 1
+
+
+def test_statistics_drop_outliers_from_the_range_only():
+    stats = price_statistics(["¥1", "¥2,980", "¥3,980", "¥4,500", "¥5,980〜¥7,980", "¥12,800", "¥980,000", "sold out"])
+    assert stats["count"] == 7 and stats["unparsed"] == 1 and stats["outliers"] == 2
+    assert (stats["min"], stats["max"], stats["median"]) == (2980, 12800, 4500)
+    assert format_price_range(stats) == "2,980円〜12,800円（中央値 4,500円、外れ値2件を除く）"
+
+    # 件数が少なければ外れ値は判定しない
+    assert price_statistics(["¥1", "¥50,000"])["outliers"] == 0
+    assert format_price_range(price_statistics([])) is None
+
+
+def test_advice_prompt_uses_numeric_price_range():
+    prompt = build_advice_messages({"prices": ["¥12,800", "¥2,980", "¥980", "¥5,980"]})[0]["content"]
+    # 文字列の min/max（"¥12,800"〜"¥5,980"）ではなく数値で並べる
+    assert "980円〜12,800円" in prompt and "四分位" in prompt
@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.scoring import (
+    SCORE_NAMES, ScoringModel, extract_signals, get_scoring_model, signal_matrix, signals_from_history,
+)
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn
+
+RICH_STORE = {
+    "social_links": {"instagram": "https://instagram.com/shop", "twitter": "https://x.com/shop",
+                     "facebook": "https://facebook.com/shop", "line": "https://line.me/shop"},
+    "mobile_friendly": True, "has_search": True, "has_reviews": True,
+    "product_count": 240, "category_count": 18, "prices": ["¥1,200", "¥4,800", "¥15,000"],
+}
+BARE_STORE = {"social_links": {}, "product_count": 1, "category_count": 0, "prices": []}
+
+
+def test_scores_are_deterministic_bounded_and_reward_signals():
+    model = get_scoring_model()
+    rich = model.score(extract_signals(RICH_STORE))
+    bare = model.score(extract_signals(BARE_STORE))
+    assert rich == model.score(extract_signals(RICH_STORE))
+    assert all(0 <= value <= 10 for value in [*rich.values(), *bare.values()])
+    assert all(rich[name] > bare[name] for name in SCORE_NAMES)
+
+
+def test_batch_scoring_matches_single_scoring():
+    model = get_scoring_model()
+    rng = np.random.default_rng(0)
+    signals = [
+        {"social_count": int(rng.integers(0, 6)), "mobile_friendly": int(rng.integers(0, 2)),
+         "has_search": int(rng.integers(0, 2)), "has_reviews": int(rng.integers(0, 2)),
+         "product_count": int(rng.integers(0, 500)), "category_count": int(rng.integers(0, 40)),
+         "price_count": 2, "price_min": float(rng.integers(100, 1000)), "price_max": float(rng.integers(1000, 90000))}
+        for _ in range(5000)
+    ]
+    batch = model.score_matrix(signal_matrix(signals))
+    assert batch.shape == (5000, len(SCORE_NAMES))
+    for i in (0, 1234, 4999):
+        assert list(batch[i]) == list(model.score(signals[i]).values())
+
+
+def test_config_rejects_unknown_features_and_history_ignores_placeholder_links():
+    with pytest.raises(ValueError):
+        ScoringModel({"version": "x", "scores": {name: {"weights": {"nope": 1}} for name in SCORE_NAMES}})
+
+    signals = signals_from_history({
+        "product_count": 4,
+        "summary_json": {"social_links": {"instagram": "https://instagram.com/sample_store"}, "prices": [2980, 12800]},
+    })
+    assert signals["social_count"] == 0
+    assert (signals["price_min"], signals["price_max"]) == (2980, 12800)
+
+
+@pytest.mark.parametrize("with_rpc", [True, False])
+def test_rescore_script_writes_back_score_columns(monkeypatch, with_rpc):
+    with PostgrestStandIn() as standin:
+        os.environ.setdefault("SUPABASE_URL", standin.supabase_url)
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+        from app.utils import supabase as db
+        from scripts.rescore_analysis_history import rescore_all
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        for i in range(5):
+            standin.insert("analysis_history", {
+                "id": f"row-{i}", "product_count": 10 * i, "category_count": i,
+                "summary_json": {"advice": "long text", "signals": extract_signals(RICH_STORE if i % 2 else BARE_STORE)},
+                **{name: 0 for name in SCORE_NAMES},
+            })
+
+        if with_rpc:
+            def rescore(params):
+                rows = {row["id"]: row for row in standin.tables["analysis_history"]}
+                for score in params["scores"]:
+                    rows[score["id"]].update({name: score[name] for name in SCORE_NAMES})
+                    rows[score["id"]]["summary_json"].update({
+                        "diagnostic_scores": {name: score[name] for name in SCORE_NAMES},
+                        "scoring_version": params["scoring_version"],
+                    })
+                return len(params["scores"])
+
+            standin.rpcs["rescore_analysis_history"] = rescore
+
+        counts = asyncio.run(rescore_all(page_size=2))
+        assert counts["rows"] == 5 and counts["updated"] == 5
+        rows = {row["id"]: row for row in standin.tables["analysis_history"]}
+        assert rows["row-1"]["sns_score"] == get_scoring_model().score(extract_signals(RICH_STORE))["sns_score"]
+        # 1行ずつ更新するときも、summary_json のスコアとバージョンを関数と同じく書き換える
+        summary_json = rows["row-1"]["summary_json"]
+        assert summary_json["diagnostic_scores"]["sns_score"] == rows["row-1"]["sns_score"]
+        assert summary_json["scoring_version"] == counts["version"] and summary_json["advice"] == "long text"
+        assert asyncio.run(rescore_all(page_size=2))["current"] == 5
@@ -0,0 +1,206 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, ShopifyStandIn
+from app.utils.http_client import close_http_client
+from app.utils.shopify import (
+    OrderColumns, ShopifyClient, ShopifyError, ShopifyOrderStore, cohort_ltv, ltv_validation, revenue_summary,
+    shop_domain, sync_orders,
+)
+
+
+OWNER = "owner@example.com"
+
+
+def _order(order_id, created_at, total, customer_id=None, **extra):
+    return {"id": order_id, "created_at": created_at, "total_price": f"{total:.2f}",
+            "customer": {"id": customer_id} if customer_id else None, "financial_status": "paid", **extra}
+
+
+def _orders(count):
+    return [_order(i, f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00+09:00", 1000 + i, i % 7 + 1)
+            for i in range(1, count + 1)]
+
+
+def _sync(standin, store, **kwargs):
+    async def scenario():
+        client = ShopifyClient("demo.myshopify.com", "shpat_standin", base_url=standin.url, page_size=10,
+                               retry_base_delay=0, **kwargs)
+        try:
+            return await sync_orders(client, store, OWNER, checkpoint_pages=2)
+        finally:
+            await close_http_client()
+
+    return asyncio.run(scenario())
+
+
+def test_sync_pages_through_cursor_and_resumes_from_last_order(tmp_path):
+    store = ShopifyOrderStore(str(tmp_path))
+    with ShopifyStandIn(_orders(35)) as standin:
+        standin.add_orders([_order(36, "2025-02-01T00:00:00+09:00", 500, 1, cancelled_at="2025-02-02T00:00:00+09:00"),
+                            _order(37, "2025-02-01T00:00:00+09:00", 500, 1, test=True)])
+        standin.failures = [429]
+        result = _sync(standin, store)
+        assert (result["pages"], result["orders_fetched"], result["orders"]) == (4, 37, 35)
+        assert result["last_order_id"] == 37
+        # 429 は再試行し、2ページ目以降は Link ヘッダーの page_info でたどる
+        assert len(standin.log) == 5 and "page_info" in standin.log[-1][1]
+        assert "since_id" not in standin.log[-1][1]
+
+        standin.add_orders([_order(38, "2025-03-01T00:00:00+09:00", 2000, 99)])
+        result = _sync(standin, store)
+        assert (result["since_id"], result["orders_fetched"], result["orders"]) == (37, 1, 36)
+        assert standin.log[-1][1]["since_id"] == "37"
+
+    columns = store.load(OWNER, "demo.myshopify.com")
+    assert columns.ids.tolist() == list(range(1, 36)) + [38]
+    assert columns.created_at[0] == np.datetime64("2025-02-02T12:00:00")
+    assert columns.customer_ids[-1] == 99 and columns.totals[-1] == 2000
+
+
+def test_failed_sync_keeps_checkpointed_pages(tmp_path):
+    store = ShopifyOrderStore(str(tmp_path))
+    with ShopifyStandIn(_orders(50)) as standin:
+        # 3ページ目で失敗する（2ページごとのチェックポイントまでは保存される）
+        standin.failures = [200, 200, 500]
+        with pytest.raises(ShopifyError):
+            _sync(standin, store, max_retries=0)
+        assert store.load(OWNER, "demo.myshopify.com").last_order_id == 20
+
+        result = _sync(standin, store)
+        assert result["since_id"] == 20 and result["orders"] == 50
+
+    with ShopifyStandIn(_orders(1), access_token="other") as standin:
+        with pytest.raises(ShopifyError) as error:
+            _sync(standin, ShopifyOrderStore(str(tmp_path / "other")))
+        assert error.value.status_code == 401
+
+
+def test_revenue_summary_counts_repeat_and_returning_customers():
+    columns = OrderColumns.from_orders([
+        _order(1, "2025-01-05T10:00:00+09:00", 1000, 1),
+        _order(2, "2025-01-20T10:00:00+09:00", 3000, 2),
+        _order(3, "2025-02-01T00:30:00+09:00", 2000, 1),
+        _order(4, "2025-02-10T10:00:00+09:00", 500),
+        _order(5, "2025-03-01T10:00:00+09:00", 4000, 3),
+        _order(6, "2025-03-15T10:00:00+09:00", 1000, 3),
+        _order(7, "2025-03-20T10:00:00+09:00", 1500, 2),
+    ])
+    summary = revenue_summary(columns)
+    assert (summary["total_orders"], summary["total_revenue"], summary["aov"]) == (7, 13000, 1857.14)
+    assert (summary["unique_customers"], summary["repeat_customers"], summary["repeat_purchase_rate"]) == (3, 3, 1.0)
+    assert summary["time_period"] == "2025-01〜2025-03"
+    # 2月1日 00:30（現地時刻）は2月に数える。ゲスト購入は注文・売上には含めるが顧客には数えない
+    assert [(m["month"], m["orders"], m["revenue"], m["customers"], m["returning_customers"])
+            for m in summary["monthly_trends"]] == [
+        ("2025-01", 2, 4000, 2, 0), ("2025-02", 2, 2500, 1, 1), ("2025-03", 3, 6500, 2, 1),
+    ]
+
+    # 期間で絞っても、初回購入が期間より前の顧客は returning に数える
+    march = revenue_summary(columns, start="2025-03-01", end="2025-04-01")
+    assert (march["total_orders"], march["unique_customers"], march["repeat_customers"]) == (3, 2, 1)
+    assert march["monthly_trends"][0]["returning_customers"] == 1
+    assert revenue_summary(OrderColumns.empty())["monthly_trends"] == []
+
+
+def test_cohort_ltv_and_leave_one_out_validation():
+    orders, order_id = [], 0
+    # コホートごとに2人。初回購入月に1000円、2か月後に cohort に応じた金額を買う
+    for cohort, later in enumerate([1000, 2000, 1500]):
+        for customer in range(2):
+            customer_id = cohort * 10 + customer + 1
+            order_id += 1
+            orders.append(_order(order_id, f"2025-{1 + cohort:02d}-10T00:00:00+09:00", 1000, customer_id))
+            order_id += 1
+            orders.append(_order(order_id, f"2025-{3 + cohort:02d}-10T00:00:00+09:00", later, customer_id))
+    columns = OrderColumns.from_orders(orders)
+
+    cohorts = cohort_ltv(columns, max_months=3)
+    assert [(c["cohort"], c["customers"]) for c in cohorts] == [("2025-01", 2), ("2025-02", 2), ("2025-03", 2)]
+    assert cohorts[0]["ltv"] == [1000, 1000, 2000, 2000]
+    assert cohorts[2]["ltv"] == [1000, 1000, 2500]
+
+    # 3か月LTV（初回購入月を含む3か月分）を1か月LTVから予測する。
+    # 各コホートの倍率 2, 3, 2.5 のうち他の2つの中央値で予測する
+    validation = ltv_validation(columns, observed_months=1, horizon_months=3)
+    assert validation["actual_ltv"] == 2500
+    assert validation["predicted_ltv"] == pytest.approx((2750 + 2250 + 2500) / 3, abs=0.01)
+    assert 0.9 < validation["accuracy"] <= 1 and len(validation["insights"]) >= 2
+    assert "2025-02（3,000円" in validation["insights"][1]
+    # 2か月分では3コホートとも2か月目の購入がまだなので、倍率は1
+    assert ltv_validation(columns, observed_months=1, horizon_months=2)["actual_ltv"] == 1000
+    assert ltv_validation(columns, observed_months=1, horizon_months=5) is None
+
+
+def test_store_connections_are_saved_with_encrypted_token(monkeypatch):
+    with PostgrestStandIn() as standin:
+        from supabase import create_client
+        from app.utils import supabase as db
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        domain = shop_domain("https://Demo-Shop/")
+        assert domain == "demo-shop.myshopify.com"
+
+        async def scenario():
+            await db.save_shopify_store("owner@example.com", domain, "shpat_old")
+            await db.save_shopify_store("owner@example.com", domain, "shpat_new")
+            return (await db.get_shopify_store("owner@example.com", domain),
+                    await db.get_shopify_stores("owner@example.com"),
+                    await db.get_shopify_store("other@example.com", domain))
+
+        store, stores, other = asyncio.run(scenario())
+        assert store["access_token"] == "shpat_new" and other is None
+        assert [row["store_domain"] for row in stores] == [domain]
+        assert standin.tables["shopify_stores"][0]["access_token"] != "shpat_new"
+
+
+def test_two_users_connecting_the_same_store_do_not_share_orders(monkeypatch, tmp_path):
+    import functools
+
+    import httpx
+    from app import main
+    from app.utils import supabase as db
+    from supabase import create_client
+
+    with PostgrestStandIn() as postgrest, ShopifyStandIn(_orders(30)) as shop:
+        monkeypatch.setattr(db, "supabase", create_client(postgrest.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        monkeypatch.setattr(main, "ShopifyClient", functools.partial(ShopifyClient, base_url=shop.url, retry_base_delay=0))
+        monkeypatch.setattr(main, "shopify_orders", ShopifyOrderStore(str(tmp_path)))
+
+        async def requests():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as http:
+                def connect(user, token):
+                    return http.post("/api/shopify/stores", json={"user_email": user, "store_domain": "demo",
+                                                                  "access_token": token})
+
+                def revenue(user):
+                    return http.get("/api/shopify/revenue-data",
+                                    params={"user_email": user, "store_name": "demo", "sync": "false"})
+
+                # 他人のストアを偽のトークンで連携することはできない
+                bogus = await connect("intruder@example.com", "shpat_bogus")
+                assert (await connect(OWNER, "shpat_standin")).status_code == 200
+                owner_sync = await http.post("/api/shopify/sync", params={"user_email": OWNER, "store_name": "demo"})
+                # 同じストアを正しいトークンで連携した別のユーザーにも、取り込んだ注文は見えない
+                assert (await connect("staff@example.com", "shpat_standin")).status_code == 200
+                staff = await revenue("staff@example.com")
+                disconnected = await http.post("/api/shopify/disconnect",
+                                               json={"user_email": "staff@example.com", "store_domain": "demo"})
+                return bogus, owner_sync, staff, disconnected, await revenue(OWNER)
+
+        async def scenario():
+            try:
+                return await requests()
+            finally:
+                await close_http_client()
+
+        bogus, owner_sync, staff, disconnected, owner = asyncio.run(scenario())
+
+        assert bogus.status_code == 400
+        assert [row["user_email"] for row in postgrest.tables["shopify_stores"]] == [OWNER]
+        assert owner_sync.json()["orders"] == 30
+        assert staff.status_code == 200 and staff.json()["total_orders"] == 0
+        assert disconnected.status_code == 200
+        assert owner.json()["total_orders"] == 30
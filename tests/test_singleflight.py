@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*[flights.do("key", compute) for _ in range(5)])
+        again = await flights.do("key", compute)
+        return flights, results, again
+
+    flights, results, again = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(result == "result" for result, _ in results)
+    assert again == ("result", False)
+    assert flights.stats() == {"leaders": 2, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_propagate_and_cancelled_caller_does_not_cancel_others():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def scenario():
+        flights = SingleFlight()
+        with pytest.raises(RuntimeError):
+            await asyncio.gather(flights.do("a", failing), flights.do("a", failing))
+
+        leader = asyncio.ensure_future(flights.do("b", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("b", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == (42, True)
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_startup import BACKEND_DIR, SERVICE_ENV, parse_importtime
+from app.utils.warmup import Warmup
+
+DEFERRED = ("supabase", "openai", "pdfkit", "jinja2", "bs4")
+
+
+def test_app_imports_without_service_env_or_side_effects(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key not in SERVICE_ENV and key != "OUTBOX_SQLITE_PATH"}
+    env["PYTHONPATH"] = BACKEND_DIR
+    probe = f"import json, sys; import app.main; print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))"
+    completed = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, env=env, capture_output=True, text=True,
+                               timeout=60)
+
+    assert completed.returncode == 0, completed.stderr
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == []
+    # アウトボックスの SQLite ファイルは最初に使うまで作らない
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_warmup_runs_in_background_and_records_failures():
+    calls = []
+
+    def blocking():
+        calls.append("blocking")
+
+    def broken():
+        raise RuntimeError("no credentials")
+
+    async def coroutine():
+        await asyncio.sleep(0.01)
+        calls.append("coroutine")
+
+    async def scenario():
+        warmup = Warmup({"broken": broken, "blocking": blocking, "coroutine": coroutine}, delay=0.05, enabled=True)
+        warmup.start()
+        assert warmup.stats()["status"] == "pending"
+        await warmup.wait()
+        return warmup.stats()
+
+    stats = asyncio.run(scenario())
+    assert calls == ["blocking", "coroutine"]
+    assert stats["status"] == "done"
+    assert stats["steps"]["broken"] == {"ok": False, "seconds": stats["steps"]["broken"]["seconds"],
+                                        "error": "no credentials"}
+    assert stats["steps"]["blocking"]["ok"] and stats["steps"]["coroutine"]["seconds"] >= 0.01
+
+
+def test_disabled_warmup_does_nothing():
+    async def scenario():
+        warmup = Warmup({"step": lambda: None}, enabled=False)
+        warmup.start()
+        await warmup.wait()
+        await warmup.stop()
+        return warmup.stats()
+
+    assert asyncio.run(scenario()) == {"status": "disabled", "seconds": None, "steps": {}}
+
+
+def test_parse_importtime_groups_packages_until_module_is_imported():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |       numpy.core",
+        "import time:       400 |        500 |     numpy",
+        "import time:       300 |        300 |   app.utils.scoring",
+        "import time:        50 |        850 | app.main",
+        "import time:      9000 |       9000 | openai",
+    ])
+    assert parse_importtime(stderr) == {"numpy": 0.0005, "app.utils.scoring": 0.0003, "app.main": 0.00005}
@@ -0,0 +1,71 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.standins import FAKE_SERVICE_ROLE_KEY, PostgrestStandIn, register_user_context_rpc
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    with PostgrestStandIn() as standin:
+        os.environ.setdefault("SUPABASE_URL", standin.supabase_url)
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_ROLE_KEY)
+        from supabase import create_client
+        from app.utils import supabase as db
+        from app.utils.crypto import encrypt_api_key
+
+        register_user_context_rpc(standin)
+        created_at = (datetime.now(timezone.utc) - timedelta(days=10)).isoformat()
+        standin.insert("users", {"id": USER_ID, "created_at": created_at})
+        standin.insert("user_settings", {"user_id": USER_ID, "openai_key": encrypt_api_key("sk-user"),
+                                         "notion_database_id": "db-1"})
+
+        monkeypatch.setattr(db, "supabase", create_client(standin.supabase_url, FAKE_SERVICE_ROLE_KEY))
+        db._user_contexts.clear()
+        yield db, standin
+        db._user_contexts.clear()
+
+
+def test_context_is_loaded_in_one_query_and_cached(db, monkeypatch):
+    db, standin = db
+    decrypted = []
+    original_decrypt = db.decrypt_api_key
+    monkeypatch.setattr(db, "decrypt_api_key", lambda value: decrypted.append(value) or original_decrypt(value))
+
+    async def scenario():
+        settings = await db.get_user_settings(USER_ID)
+        keys = [await db.get_api_key(USER_ID, "openai_key") for _ in range(3)]
+        return settings, keys
+
+    settings, keys = asyncio.run(scenario())
+    assert settings["openai_key"] == "API_KEY_SET"
+    assert settings["notion_database_id"] == "db-1"
+    # timezone 付きの created_at でも試用期間が計算される
+    assert settings["is_trial_active"] is True and settings["trial_days_left"] in (19, 20)
+    assert keys == ["sk-user"] * 3
+    assert standin.requests == 1
+    assert len(decrypted) == 1
+    assert db.user_context_stats()["hits"] >= 3
+
+
+def test_save_invalidates_cached_context(db):
+    db, standin = db
+    from app.models.user_settings import UserSettings
+
+    async def scenario():
+        await db.get_user_settings(USER_ID)
+        await db.save_user_settings(UserSettings(user_id=USER_ID, notion_database_id="db-2"))
+        return await db.get_user_settings(USER_ID)
+
+    assert asyncio.run(scenario())["notion_database_id"] == "db-2"
+
+
+def test_falls_back_to_separate_queries_without_rpc(db):
+    db, standin = db
+    del standin.rpcs["get_user_context"]
+    assert asyncio.run(db.get_api_key(USER_ID, "openai_key")) == "sk-user"
+    assert db.user_context_stats()["rpc_fallbacks"] >= 1